@@ -0,0 +1,349 @@
+"""
+Запуск бота несколькими процессами
+
+    python -m app.cluster --workers 4
+
+Приёмник (этот процесс) получает обновления от Telegram — getUpdates или webhook,
+как настроено BOT_MODE/WEBHOOK_BASE_URL — и пересылает каждое одному из воркеров.
+Воркер выбирается по хэшу tg_id пользователя, поэтому все обновления одного
+пользователя обрабатывает один процесс: его FSM, кэш подписки и прочие кэши по
+пользователю остаются согласованными.
+
+Воркеры — обычные процессы app.main с BOT_MODE=worker: каждый слушает
+WORKER_HOST:WORKER_BASE_PORT+i (тот же обработчик, что и webhook, с ограничением
+параллельности и ожиданием начатых обновлений при остановке) и принимает
+обновления только с секретом CLUSTER_SECRET. Общее между воркерами — блокировки,
+флаги и оповещения об изменениях — идёт через координатор (COORD_BACKEND, для
+нескольких процессов по умолчанию sqlite). Запись в основную БД между процессами
+сериализует сам SQLite (db_lock действует внутри процесса).
+
+Обновления из getUpdates подтверждаются только после передачи воркерам:
+при падении приёмника или недоступном воркере они придут повторно (доставка
+«хотя бы один раз»).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from app.config import (
+    BOT_TOKEN, BOT_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_DRAIN_TIMEOUT, HEALTH_PATH, WORKERS, WORKER_INDEX, WORKER_HOST,
+    WORKER_BASE_PORT, CLUSTER_SECRET, COORD_BACKEND,
+)
+from app.webhook import build_webhook_app, serve_app
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = "/update"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+FORWARD_ATTEMPTS = 5
+POLL_TIMEOUT = 30
+
+
+def update_user_id(update: dict) -> Optional[int]:
+    """tg_id пользователя, к которому относится обновление (None — не удалось определить)"""
+    for kind, payload in update.items():
+        if kind == 'update_id' or not isinstance(payload, dict):
+            continue
+        if kind == 'chat_member':
+            # Вступление/выход из канала — кэш подписки этого пользователя
+            user = (payload.get('new_chat_member') or {}).get('user')
+        else:
+            user = payload.get('from') or payload.get('user')
+        if user:
+            return user.get('id')
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+    return None
+
+
+def shard_for(user_id: Optional[int], workers: int) -> int:
+    if not user_id or workers <= 1:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % workers
+
+
+def worker_url(index: int, host: str = WORKER_HOST, base_port: int = WORKER_BASE_PORT) -> str:
+    return f"http://{host}:{base_port + index}"
+
+
+class UpdateRouter:
+    """Пересылает обновления воркерам по хэшу tg_id"""
+
+    def __init__(self, worker_urls: List[str], secret_token: str, attempts: int = FORWARD_ATTEMPTS):
+        self.worker_urls = worker_urls
+        self.secret_token = secret_token
+        self.attempts = attempts
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.forwarded = [0] * len(worker_urls)
+        self.retries = 0
+        self.failed = 0
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 30))
+
+    async def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.close()
+
+    def worker_for(self, update: dict) -> int:
+        return shard_for(update_user_id(update), len(self.worker_urls))
+
+    async def forward(self, update: dict) -> bool:
+        index = self.worker_for(update)
+        url = self.worker_urls[index] + WORKER_PATH
+        headers = {SECRET_HEADER: self.secret_token}
+        for attempt in range(self.attempts):
+            try:
+                async with self.session.post(url, json=update, headers=headers) as response:
+                    if response.status == 200:
+                        self.forwarded[index] += 1
+                        return True
+                    # 503 — воркер перезапускается или останавливается
+                    logger.warning(f"[CLUSTER] Воркер {index} ответил {response.status} "
+                                   f"на обновление {update.get('update_id')}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"[CLUSTER] Воркер {index} недоступен: {e}")
+            self.retries += 1
+            await asyncio.sleep(0.2 * 2 ** attempt)
+        self.failed += 1
+        logger.error(f"[CLUSTER] Обновление {update.get('update_id')} не доставлено воркеру {index}")
+        return False
+
+    async def forward_batch(self, updates: List[dict]) -> List[dict]:
+        """
+        Пересылает пачку: по каждому воркеру по порядку, воркеры параллельно.
+        Возвращает недоставленные обновления. После первой ошибки остальные
+        обновления этого воркера не отправляются, чтобы не нарушить порядок
+        обновлений пользователя.
+        """
+        by_worker: Dict[int, List[dict]] = defaultdict(list)
+        for update in updates:
+            by_worker[self.worker_for(update)].append(update)
+
+        async def send_all(batch):
+            for position, update in enumerate(batch):
+                if not await self.forward(update):
+                    return batch[position:]
+            return []
+
+        results = await asyncio.gather(*(send_all(batch) for batch in by_worker.values()))
+        return [update for undelivered in results for update in undelivered]
+
+    async def wait_ready(self, timeout: float = 60) -> bool:
+        """Ждёт, пока все воркеры ответят на health"""
+        deadline = time.monotonic() + timeout
+        pending = set(range(len(self.worker_urls)))
+        while pending and time.monotonic() < deadline:
+            for index in list(pending):
+                try:
+                    async with self.session.get(self.worker_urls[index] + HEALTH_PATH) as response:
+                        if response.status == 200:
+                            pending.discard(index)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+            if pending:
+                await asyncio.sleep(0.2)
+        return not pending
+
+    def stats(self) -> dict:
+        return {'workers': len(self.worker_urls), 'forwarded': list(self.forwarded),
+                'retries': self.retries, 'failed': self.failed}
+
+
+# --- приёмник ---
+
+async def poll_updates(bot: Bot, router: UpdateRouter, stop_event: asyncio.Event,
+                       allowed_updates: Optional[List[str]] = None, timeout: int = POLL_TIMEOUT):
+    """
+    getUpdates в цикле. offset сдвигается только за обновления, переданные воркерам
+    подряд с начала пачки; начиная с первого недоставленного Telegram пришлёт их
+    снова, и уже доставленные из них (другим воркерам) пропускаются.
+    """
+    url = bot.session.api.api_url(token=bot.token, method='getUpdates')
+    offset = None
+    delivered = set()  # update_id не меньше offset, уже переданные воркерам
+    stopped = asyncio.create_task(stop_event.wait())
+    try:
+        while not stop_event.is_set():
+            params = {'timeout': timeout}
+            if offset is not None:
+                params['offset'] = offset
+            if allowed_updates is not None:
+                params['allowed_updates'] = json.dumps(allowed_updates)
+            fetch = asyncio.create_task(_get_updates(router.session, url, params))
+            await asyncio.wait({fetch, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            if not fetch.done():
+                fetch.cancel()
+                break
+            try:
+                updates = fetch.result()
+            except Exception as e:
+                logger.error(f"[CLUSTER] Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            if updates:
+                fresh = [update for update in updates if update['update_id'] not in delivered]
+                failed = {update['update_id'] for update in await router.forward_batch(fresh)}
+                delivered.update(update['update_id'] for update in fresh if update['update_id'] not in failed)
+                if failed:
+                    offset = min(failed)
+                    logger.warning(f"[CLUSTER] Не доставлено обновлений: {len(failed)}, "
+                                   f"повтор с update_id={offset}")
+                else:
+                    offset = updates[-1]['update_id'] + 1
+                delivered = {update_id for update_id in delivered if update_id >= offset}
+        if offset is not None:
+            # Подтверждаем доставленное, чтобы Telegram не прислал его снова
+            await _get_updates(router.session, url, {'offset': offset, 'timeout': 0, 'limit': 1})
+    finally:
+        stopped.cancel()
+
+
+async def _get_updates(session: aiohttp.ClientSession, url: str, params: dict) -> List[dict]:
+    async with session.post(url, data=params) as response:
+        data = await response.json()
+    if not data.get('ok'):
+        retry_after = (data.get('parameters') or {}).get('retry_after')
+        if retry_after:
+            await asyncio.sleep(retry_after)
+        raise RuntimeError(data.get('description', 'getUpdates failed'))
+    return data['result']
+
+
+def build_front_app(router: UpdateRouter, secret_token: str, path: str = WEBHOOK_PATH,
+                    health_path: str = HEALTH_PATH) -> web.Application:
+    """Webhook приёмника: проверяет секрет Telegram и пересылает обновление воркеру"""
+    app = web.Application()
+
+    async def receive(request: web.Request) -> web.Response:
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json()
+        if await router.forward(update):
+            return web.json_response({})
+        # Telegram повторит доставку позже
+        return web.Response(status=503, text="Worker unavailable")
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', 'mode': 'cluster', **router.stats()})
+
+    app.router.add_post(path, receive)
+    app.router.add_get(health_path, health)
+    return app
+
+
+def used_update_types() -> List[str]:
+    """Типы обновлений, на которые есть обработчики (для getUpdates/setWebhook)"""
+    from app.handlers import register_user_handlers
+
+    dp = Dispatcher()
+    register_user_handlers(dp)
+    return dp.resolve_used_update_types()
+
+
+async def run_front(bot: Bot, router: UpdateRouter, stop_event: asyncio.Event, allowed_updates: List[str]):
+    if BOT_MODE == "webhook" and WEBHOOK_BASE_URL:
+        secret_token = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        url = WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH
+
+        async def register_webhook():
+            await bot.set_webhook(url, secret_token=secret_token, allowed_updates=allowed_updates,
+                                  max_connections=WEBHOOK_MAX_CONNECTIONS)
+            logger.info(f"[CLUSTER] Webhook {url}, воркеров: {len(router.worker_urls)}")
+
+        await serve_app(build_front_app(router, secret_token), WEBHOOK_HOST, WEBHOOK_PORT, stop_event,
+                        on_started=register_webhook)
+    else:
+        await bot.delete_webhook(drop_pending_updates=False)
+        logger.info(f"[CLUSTER] getUpdates, воркеров: {len(router.worker_urls)}")
+        await poll_updates(bot, router, stop_event, allowed_updates)
+
+
+# --- воркер ---
+
+async def run_worker(dp: Dispatcher, bot: Bot, index: int = WORKER_INDEX, secret_token: str = CLUSTER_SECRET,
+                     host: str = WORKER_HOST, base_port: int = WORKER_BASE_PORT,
+                     stop_event: Optional[asyncio.Event] = None, **handler_kwargs):
+    """Принимает обновления от приёмника до сигнала остановки"""
+    if not secret_token:
+        raise RuntimeError("BOT_MODE=worker запускается через app.cluster (не задан CLUSTER_SECRET)")
+    app = build_webhook_app(dp, bot, secret_token, path=WORKER_PATH, **handler_kwargs)
+
+    async def started():
+        logger.info(f"[CLUSTER] Воркер {index} слушает {host}:{base_port + index}")
+
+    await serve_app(app, host, base_port + index, stop_event, on_started=started)
+
+
+# --- запуск ---
+
+def spawn_workers(workers: int, secret_token: str) -> List[subprocess.Popen]:
+    env = dict(os.environ, BOT_MODE="worker", WORKERS=str(workers), CLUSTER_SECRET=secret_token,
+               COORD_BACKEND="sqlite" if COORD_BACKEND == "local" else COORD_BACKEND)
+    return [subprocess.Popen([sys.executable, "-m", "app.main"], env=dict(env, WORKER_INDEX=str(index)))
+            for index in range(workers)]
+
+
+def stop_workers(processes: List[subprocess.Popen], timeout: float = WEBHOOK_DRAIN_TIMEOUT + 5):
+    for process in processes:
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(max(0.1, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[CLUSTER] Воркер pid={process.pid} не остановился, завершаю принудительно")
+            process.kill()
+
+
+async def run_cluster(workers: int):
+    secret_token = CLUSTER_SECRET or secrets.token_urlsafe(32)
+    processes = spawn_workers(workers, secret_token)
+    router = UpdateRouter([worker_url(index) for index in range(workers)], secret_token)
+    bot = Bot(token=BOT_TOKEN)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    try:
+        await router.start()
+        if not await router.wait_ready():
+            raise RuntimeError("Воркеры не запустились")
+        await run_front(bot, router, stop_event, used_update_types())
+    finally:
+        # Сначала перестаём принимать обновления, потом воркеры дорабатывают начатые
+        await router.close()
+        await bot.session.close()
+        stop_workers(processes)
+        logger.info(f"[CLUSTER] Остановлен: {router.stats()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бот в несколько процессов с раздачей обновлений по tg_id")
+    parser.add_argument('--workers', type=int, default=max(WORKERS, 2))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(run_cluster(args.workers))
+
+
+if __name__ == '__main__':
+    main()
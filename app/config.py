@@ -23,4 +23,128 @@ def validate_config():
 
 # Валидация при импорте
 if __name__ != "__main__":
-    validate_config()
\ No newline at end of file
+    validate_config()
+
+# База данных
+DB_PATH = os.getenv("DB_PATH", "data/users.db")
+DB_READERS = int(os.getenv("DB_READERS", "4"))  # соединений для чтения в пуле
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "30"))
+
+# Профиль SQLite: применяется к каждому соединению пула
+DB_PROFILE = {
+    'journal_mode': os.getenv("DB_JOURNAL_MODE", "WAL"),
+    'synchronous': os.getenv("DB_SYNCHRONOUS", "NORMAL"),  # в WAL NORMAL не теряет целостность
+    'cache_size': int(os.getenv("DB_CACHE_SIZE", "-16000")),  # отрицательное значение — размер в КиБ
+    'mmap_size': int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024))),
+    'temp_store': os.getenv("DB_TEMP_STORE", "MEMORY"),
+    'busy_timeout': int(os.getenv("DB_BUSY_TIMEOUT", "30000")),  # мс
+}
+DB_MAINTENANCE_INTERVAL = int(os.getenv("DB_MAINTENANCE_INTERVAL", "600"))  # сек между wal_checkpoint/optimize
+DB_CHECKPOINT_MODE = os.getenv("DB_CHECKPOINT_MODE", "PASSIVE")
+QUERY_AUDIT_MIN_ROWS = int(os.getenv("QUERY_AUDIT_MIN_ROWS", "1000"))  # порог для аудита планов запросов
+SETTINGS_CACHE_CHECK_INTERVAL = float(os.getenv("SETTINGS_CACHE_CHECK_INTERVAL", "5"))  # сек между сверками версии настроек
+
+# Оценка стоимости таблицы выплат слот-машины (app/utils/slot_simulator.py)
+SLOT_SIM_DAILY_USERS = int(os.getenv("SLOT_SIM_DAILY_USERS", "1000"))  # активных игроков в день
+
+# Рассылки (app/utils/broadcast.py)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # сообщений в секунду на весь бот (лимит Telegram ~30)
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1"))  # сек между сообщениями в один чат
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "200"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "25"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+
+# Кэш проверки подписки на канал (app/utils/subscription.py)
+SUBSCRIPTION_TTL = float(os.getenv("SUBSCRIPTION_TTL", "600"))  # сек для «подписан»
+SUBSCRIPTION_NEGATIVE_TTL = float(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30"))  # сек для «не подписан»
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "100000"))
+
+# Чёрный список (app/utils/blacklist.py)
+BLACKLIST_DB_PATH = os.getenv("BLACKLIST_DB_PATH", "data/blacklist.db")
+
+# Реестр file_id картинок меню (app/utils/media.py)
+MEDIA_UPLOAD_CHAT_ID = int(os.getenv("MEDIA_UPLOAD_CHAT_ID", "0")) or None  # служебный чат для загрузки картинок при старте; не задан — без загрузки
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "15"))
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))  # лимит Telegram для фото
+
+# Режим получения обновлений (app/webhook.py): polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")  # свой Bot API сервер, по умолчанию api.telegram.org
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # https://bot.example.com — без него webhook не включится
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # пусто — случайный секрет при каждом запуске
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "100"))  # обработчиков одновременно
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # соединений от Telegram (1-100)
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "25"))  # сек на завершение обработчиков при остановке
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+
+# Хранилище FSM (app/utils/fsm_storage.py): sqlite, memory или redis://host:port/db
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_DB_PATH = os.getenv("FSM_DB_PATH", "data/fsm.db")
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "50000"))  # ключей в памяти
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", str(24 * 3600)))  # сек без изменений до сброса, 0 — бессрочно
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))  # сек между записями в БД, 0 — сразу
+
+# Координация процессов (app/utils/coordination.py): local — один процесс, sqlite — общий файл
+COORD_BACKEND = os.getenv("COORD_BACKEND", "local")
+COORD_DB_PATH = os.getenv("COORD_DB_PATH", "data/coordination.db")
+COORD_POLL_INTERVAL = float(os.getenv("COORD_POLL_INTERVAL", "1"))  # сек между проверками изменений других процессов
+COORD_LOCK_TTL = float(os.getenv("COORD_LOCK_TTL", "30"))  # сек аренды блокировки, продлевается пока держим
+
+# Несколько процессов (app/cluster.py): приёмник обновлений раздаёт их воркерам по tg_id
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_HOST = os.getenv("WORKER_HOST", "127.0.0.1")
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))  # воркер i слушает WORKER_BASE_PORT + i
+CLUSTER_SECRET = os.getenv("CLUSTER_SECRET", "")  # секрет между приёмником и воркерами, задаёт app.cluster
+
+# Анимация слот-машины (app/utils/slot_animation.py): adaptive, frames, dice или none
+SLOT_ANIMATION = os.getenv("SLOT_ANIMATION", "adaptive")
+SLOT_ANIMATION_FRAMES = int(os.getenv("SLOT_ANIMATION_FRAMES", "3"))  # кадров анимации, без сообщения с результатом
+SLOT_FRAME_DELAY = float(os.getenv("SLOT_FRAME_DELAY", "0.5"))  # сек между кадрами
+SLOT_API_RATE_LIMIT = float(os.getenv("SLOT_API_RATE_LIMIT", "25"))  # запросов/с к Bot API, при которых adaptive оставляет один кадр
+
+# Уведомления админам (app/utils/admin_notify.py): очередь на каждого админа, сводки при всплесках
+ADMIN_NOTIFY_QUEUE_SIZE = int(os.getenv("ADMIN_NOTIFY_QUEUE_SIZE", "500"))  # уведомлений в очереди одного админа
+ADMIN_NOTIFY_DIGEST_WINDOW = float(os.getenv("ADMIN_NOTIFY_DIGEST_WINDOW", "0.5"))  # сек ожидания соседних уведомлений
+ADMIN_NOTIFY_DIGEST_MAX = int(os.getenv("ADMIN_NOTIFY_DIGEST_MAX", "20"))  # уведомлений в одной сводке
+ADMIN_NOTIFY_MAX_ATTEMPTS = int(os.getenv("ADMIN_NOTIFY_MAX_ATTEMPTS", "5"))
+
+# Курсы криптовалют в рублях (app/utils/prices.py): Binance (к USDT) × ЦБ (USD/RUB)
+PRICE_BINANCE_URL = os.getenv("PRICE_BINANCE_URL", "https://api.binance.com")
+PRICE_CBR_URL = os.getenv("PRICE_CBR_URL", "https://www.cbr-xml-daily.ru/daily_json.js")
+PRICE_SYMBOLS = [s.strip().upper() for s in os.getenv("PRICE_SYMBOLS", "TON,NOT,DOGS").split(",") if s.strip()]
+PRICE_CRYPTO_TTL = float(os.getenv("PRICE_CRYPTO_TTL", "30"))  # сек, после — отдаётся старый курс и обновляется в фоне
+PRICE_FIAT_TTL = float(os.getenv("PRICE_FIAT_TTL", "3600"))  # сек для курса ЦБ (меняется раз в день)
+PRICE_CRYPTO_MAX_STALE = float(os.getenv("PRICE_CRYPTO_MAX_STALE", "600"))  # сек, дольше старый курс не отдаётся
+PRICE_FIAT_MAX_STALE = float(os.getenv("PRICE_FIAT_MAX_STALE", str(3 * 24 * 3600)))
+PRICE_TIMEOUT = float(os.getenv("PRICE_TIMEOUT", "5"))  # сек на запрос к источнику
+PRICE_REFRESH_INTERVAL = float(os.getenv("PRICE_REFRESH_INTERVAL", "20"))  # сек между фоновыми обновлениями, 0 — без них
+
+# Трассировка обновлений (app/tracing.py): SQL, Bot API и время обработчиков
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+TRACE_SLOW_UPDATE_MS = float(os.getenv("TRACE_SLOW_UPDATE_MS", "1000"))  # дольше — в лог с разбивкой
+TRACE_REPEATED_SQL = int(os.getenv("TRACE_REPEATED_SQL", "5"))  # одинаковых запросов за обновление — в лог как N+1, 0 — не искать
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # порт /metrics в формате Prometheus (воркеры — +WORKER_INDEX), 0 — не запускать
+
+# Журнал отложенной записи (app/database/journal.py): спины без выигрыша, проигрыши, отметки активности.
+# Выключен по умолчанию — каждая запись коммитится сразу. JOURNAL_ENABLED=1 включает запись пачками:
+# меньше коммитов, события до записи в БД хранятся в файле JOURNAL_PATH (данные рядом с БД)
+JOURNAL_ENABLED = os.getenv("JOURNAL_ENABLED", "0") == "1"
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", "data/write_journal.log")  # воркеры кластера — JOURNAL_PATH.<WORKER_INDEX>
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.2"))  # сек между пачками
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "200"))  # событий, при которых пачка пишется сразу
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "0") == "1"  # fsync каждой строки (по умолчанию — как WAL при synchronous=NORMAL)
+JOURNAL_MAX_PENDING = int(os.getenv("JOURNAL_MAX_PENDING", "5000"))  # длиннее очередь — запись сразу в append()
+
+# Хранение истории спинов slot_machine (app/database/retention.py); 0 дней — шаг выключен.
+# Проход включается явно через SLOT_RETENTION_INTERVAL; свёрнутые проигрыши не восстановить
+SLOT_LOSS_RETENTION_DAYS = int(os.getenv("SLOT_LOSS_RETENTION_DAYS", "30"))  # проигрыши старше — в дневные итоги slot_daily_stats
+SLOT_ARCHIVE_DAYS = int(os.getenv("SLOT_ARCHIVE_DAYS", "90"))  # остальные строки старше — в архив по месяцам (кроме ждущих выплаты)
+SLOT_ARCHIVE_DIR = os.getenv("SLOT_ARCHIVE_DIR", "data/archive")  # slot_machine_YYYY-MM.db
+SLOT_RETENTION_INTERVAL = int(os.getenv("SLOT_RETENTION_INTERVAL", "0"))  # сек между проходами (например 21600), 0 — не запускать
+SLOT_RETENTION_BATCH = int(os.getenv("SLOT_RETENTION_BATCH", "5000"))  # строк на транзакцию — запись бота не ждёт весь проход
+DB_VACUUM_FREE_RATIO = float(os.getenv("DB_VACUUM_FREE_RATIO", "0.2"))  # VACUUM после прохода, если свободных страниц больше этой доли
@@ -1,2 +1,23 @@
-proverka = False  # глобальный флаг проверки подписки
-ref_active = True  # глобальный флаг рефералов
\ No newline at end of file
+"""
+Переключатели админ-панели
+
+Хранятся в координаторе (app/utils/coordination.py), поэтому при нескольких
+процессах бота переключение в одном видно во всех.
+"""
+from app.utils.coordination import coordinator
+
+FLAG_DEFAULTS = {
+    'proverka': False,  # глобальный флаг проверки подписки
+    'ref_active': True,  # глобальный флаг рефералов
+}
+
+
+def is_enabled(name: str) -> bool:
+    return coordinator.flag(name, FLAG_DEFAULTS[name])
+
+
+async def toggle_flag(name: str) -> bool:
+    """Переключает флаг и возвращает новое значение"""
+    value = not is_enabled(name)
+    await coordinator.set_flag(name, value)
+    return value
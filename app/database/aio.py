@@ -0,0 +1,118 @@
+"""
+Асинхронные версии функций app.database.models
+
+Синхронные функции models работают с sqlite3 и блокируют поток, в котором
+вызваны. Здесь они выполняются в пуле потоков, чтобы не останавливать event loop:
+чтение — в нескольких потоках (по числу соединений для чтения в пуле),
+запись — в одном потоке, т.к. соединение для записи всё равно одно.
+Контекст вызывающего (трасса обновления, app/tracing.py) передаётся в поток.
+
+Использование:
+    from app.database import aio as db
+    user = await db.get_user_profile(tg_id)
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import DB_READERS
+from app.database import models
+from app.database.pool import get_pool
+
+_read_executor = ThreadPoolExecutor(max_workers=max(1, DB_READERS), thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+# Функции, которые только читают БД
+READ_FUNCTIONS = (
+    'get_user_profile', 'get_user_profile_by_id', 'get_referrals_count', 'get_all_users',
+    'count_users', 'get_users_page', 'get_user_id_at', 'search_users', 'get_user_referrals',
+    'get_all_pending_withdrawals', 'get_withdrawal_by_id', 'get_withdrawals',
+    'get_order_by_id', 'get_all_orders', 'get_orders_page', 'get_order_status_counts',
+    'get_review_by_id', 'get_all_reviews',
+    'get_support_ticket_by_id', 'get_all_support_tickets',
+    'get_admin_setting', 'get_all_admin_settings', 'get_flag',
+    'get_slot_configs', 'get_user_slot_spins', 'get_slot_attempts', 'get_slot_wins', 'get_slot_win_by_id',
+    'get_slot_user_stats', 'get_slot_daily_stats',
+    'get_activity_rewards', 'get_user_activity', 'get_user_activity_streak', 'get_streaks_for_all_users',
+    'get_user_referral_percent', 'get_user_by_username', 'get_user_share_story_status',
+    'calculate_withdrawal_commission', 'calculate_stars_price',
+    'get_daily_attempts_reset_time', 'should_reset_daily_attempts',
+)
+
+# Функции, которые пишут в БД
+WRITE_FUNCTIONS = (
+    'get_or_create_user', 'update_balance', 'freeze_balance', 'unfreeze_balance',
+    'write_off_frozen_balance', 'remove_balance', 'create_withdrawal', 'update_withdrawal_status',
+    'confirm_withdrawal', 'clear_all_withdrawals_and_frozen',
+    'create_order', 'update_order_status', 'delete_order', 'clear_all_orders',
+    'create_review', 'update_review_status', 'delete_review', 'clear_all_reviews',
+    'create_support_ticket', 'update_support_ticket_status', 'delete_support_ticket',
+    'clear_all_support_tickets',
+    'update_admin_setting', 'set_flag',
+    'add_slot_config', 'delete_slot_config', 'use_slot_spin', 'reset_slot_spins',
+    'create_slot_win', 'play_slot_spin', 'update_slot_win_status', 'update_slot_win_status_with_extra',
+    'delete_slot_win', 'add_ton_slot_win', 'add_stars_to_user', 'add_ton_to_user',
+    'add_activity_reward', 'delete_activity_reward', 'mark_activity', 'claim_activity_reward',
+    'update_user_referral_percent', 'update_user_referral_percent_by_username',
+    'use_share_story', 'reset_share_story',
+    'init_activity_rewards_custom', 'clear_all_calendar_data', 'clear_all_activity_prizes',
+    'clear_all_slot_data', 'clear_all_slot_prizes', 'reset_all_prizes',
+    'delete_user_everywhere_full',
+)
+
+
+async def run_read(func, *args, **kwargs):
+    """Выполняет синхронную функцию чтения в пуле потоков чтения"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_read_executor, context.run, functools.partial(func, *args, **kwargs))
+
+
+def _write_call(func, *args, **kwargs):
+    """
+    Соединение для записи общее: если функция упала посреди транзакции, откатываем
+    сразу, пока db_lock у нас, — иначе незавершённое закоммитит следующая запись.
+    Порядок блокировок тот же, что в журнале: journal.lock, затем db_lock
+    """
+    with models.journal.lock, models.db_lock:
+        try:
+            return func(*args, **kwargs)
+        except BaseException:
+            get_pool().rollback_writer()
+            raise
+
+
+async def run_write(func, *args, **kwargs):
+    """Выполняет синхронную функцию записи в потоке записи"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_write_executor, context.run,
+                                      functools.partial(_write_call, func, *args, **kwargs))
+
+
+def _make_async(name: str, runner):
+    sync_func = getattr(models, name)
+
+    @functools.wraps(sync_func)
+    async def wrapper(*args, **kwargs):
+        # Функция берётся из models в момент вызова, чтобы работали подмены в тестах
+        return await runner(getattr(models, name), *args, **kwargs)
+
+    return wrapper
+
+
+for _name in READ_FUNCTIONS:
+    globals()[_name] = _make_async(_name, run_read)
+for _name in WRITE_FUNCTIONS:
+    globals()[_name] = _make_async(_name, run_write)
+del _name
+
+
+def shutdown(wait: bool = True):
+    """Останавливает пулы потоков (при остановке бота)"""
+    _read_executor.shutdown(wait=wait)
+    _write_executor.shutdown(wait=wait)
+
+
+__all__ = ['run_read', 'run_write', 'shutdown', *READ_FUNCTIONS, *WRITE_FUNCTIONS]
@@ -0,0 +1,148 @@
+"""
+Таблицы рассылок: задания (broadcast_jobs) и результат по каждому получателю
+(broadcast_deliveries). Таблицы создаёт миграция 3.
+
+Получатели выбираются страницами по возрастанию tg_id (индекс UNIQUE(tg_id)),
+уже обработанные в этом задании пропускаются — поэтому задание можно продолжить
+после перезапуска бота с того же места.
+"""
+import datetime
+from typing import List, Optional
+
+from .models import db_lock, get_db_connection, read_connection
+
+JOB_FIELDS = (
+    'id', 'kind', 'text', 'photo_id', 'markup', 'status', 'created_by', 'created_at',
+    'started_at', 'finished_at', 'last_tg_id', 'total', 'delivered', 'failed', 'blocked',
+    'run_seconds',
+)
+
+DELIVERY_STATUSES = ('delivered', 'failed', 'blocked')
+
+
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _job_from_row(row) -> Optional[dict]:
+    return dict(zip(JOB_FIELDS, row)) if row else None
+
+
+def create_broadcast_job(kind: str, text: str, photo_id: Optional[str], markup: Optional[str],
+                         created_by: Optional[int]) -> int:
+    """Создаёт задание рассылки; total — число пользователей на момент создания"""
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users')
+        total = cursor.fetchone()[0]
+        cursor.execute('''INSERT INTO broadcast_jobs (kind, text, photo_id, markup, status, created_by, created_at, total)
+                          VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)''',
+                       (kind, text, photo_id, markup, created_by, _now(), total))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+
+
+def get_broadcast_job(job_id: int) -> Optional[dict]:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {", ".join(JOB_FIELDS)} FROM broadcast_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+    return _job_from_row(row)
+
+
+def get_unfinished_broadcast_jobs() -> List[dict]:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''SELECT {", ".join(JOB_FIELDS)} FROM broadcast_jobs
+                           WHERE status IN ('pending', 'running') ORDER BY id''')
+        rows = cursor.fetchall()
+    return [_job_from_row(row) for row in rows]
+
+
+def get_last_finished_broadcast_job() -> Optional[dict]:
+    """Последнее завершённое задание — по нему оценивается скорость следующей рассылки"""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''SELECT {", ".join(JOB_FIELDS)} FROM broadcast_jobs
+                           WHERE status = 'done' AND run_seconds > 0 ORDER BY id DESC LIMIT 1''')
+        row = cursor.fetchone()
+    return _job_from_row(row)
+
+
+def fetch_broadcast_recipients(job_id: int, after_tg_id: int, limit: int) -> List[int]:
+    """Следующая страница tg_id, которым это задание ещё ничего не отправляло"""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT u.tg_id FROM users u
+                          LEFT JOIN broadcast_deliveries d ON d.job_id = ? AND d.tg_id = u.tg_id
+                          WHERE u.tg_id > ? AND d.tg_id IS NULL
+                          ORDER BY u.tg_id LIMIT ?''', (job_id, after_tg_id, limit))
+        rows = cursor.fetchall()
+    return [row[0] for row in rows]
+
+
+def set_broadcast_job_status(job_id: int, status: str):
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if status == 'running':
+            cursor.execute('''UPDATE broadcast_jobs SET status = ?, started_at = COALESCE(started_at, ?)
+                              WHERE id = ?''', (status, _now(), job_id))
+        elif status in ('done', 'cancelled'):
+            cursor.execute('UPDATE broadcast_jobs SET status = ?, finished_at = ? WHERE id = ?',
+                           (status, _now(), job_id))
+        else:
+            cursor.execute('UPDATE broadcast_jobs SET status = ? WHERE id = ?', (status, job_id))
+        conn.commit()
+        conn.close()
+
+
+def record_broadcast_delivery(job_id: int, tg_id: int, status: str, error: Optional[str] = None,
+                              attempts: int = 1):
+    """
+    Результат для одного получателя, записывается сразу после отправки,
+    чтобы после перезапуска никому не отправить дважды.
+    status: delivered / failed / blocked.
+    """
+    if status not in DELIVERY_STATUSES:
+        raise ValueError(f"Неизвестный статус доставки: {status}")
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT OR IGNORE INTO broadcast_deliveries (job_id, tg_id, status, error, attempts, updated_at)
+                          VALUES (?, ?, ?, ?, ?, ?)''', (job_id, tg_id, status, error, attempts, _now()))
+        if cursor.rowcount:
+            # status проверен по DELIVERY_STATUSES, это имя столбца-счётчика
+            cursor.execute(f'UPDATE broadcast_jobs SET {status} = {status} + 1 WHERE id = ?', (job_id,))
+        conn.commit()
+        conn.close()
+
+
+def advance_broadcast_cursor(job_id: int, last_tg_id: int, run_seconds: float):
+    """
+    Сдвигает курсор задания, когда страница получателей обработана целиком,
+    и добавляет время, затраченное на страницу (по нему считается скорость рассылки)
+    """
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''UPDATE broadcast_jobs SET last_tg_id = MAX(last_tg_id, ?), run_seconds = run_seconds + ?
+                          WHERE id = ?''', (last_tg_id, run_seconds, job_id))
+        conn.commit()
+        conn.close()
+
+
+def get_broadcast_deliveries(job_id: int, status: Optional[str] = None) -> List[tuple]:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        if status:
+            cursor.execute('''SELECT tg_id, status, error, attempts, updated_at FROM broadcast_deliveries
+                              WHERE job_id = ? AND status = ? ORDER BY tg_id''', (job_id, status))
+        else:
+            cursor.execute('''SELECT tg_id, status, error, attempts, updated_at FROM broadcast_deliveries
+                              WHERE job_id = ? ORDER BY tg_id''', (job_id,))
+        rows = cursor.fetchall()
+    return rows
@@ -0,0 +1,330 @@
+"""
+Журнал отложенной записи (write-behind) для неденежных событий
+
+Спины без выигрыша, записи проигрышей (create_slot_win с reward_type "none") и
+отметки активности — большая часть записей в БД, и каждая была отдельной
+транзакцией с коммитом. При включённом журнале такие события:
+  1. дописываются строкой JSON в файл журнала (только добавление; JOURNAL_FSYNC=1 —
+     fsync каждой строки) и в очередь в памяти;
+  2. применяются пачкой в одной транзакции раз в JOURNAL_FLUSH_INTERVAL сек или
+     сразу при накоплении JOURNAL_BATCH_SIZE событий;
+  3. номер последнего применённого события сохраняется в journal_state в той же
+     транзакции, после коммита файл обрезается.
+Если пачка не записывается, события применяются по одному (точка сохранения на
+событие): событие, на котором падает применение, откладывается в файл
+<JOURNAL_PATH>.rejected с текстом ошибки и больше не повторяется, остальные
+записываются. Очередь не длиннее JOURNAL_MAX_PENDING: при переполнении (БД
+недоступна) append() записывает её сразу и передаёт ошибку вызывающему, как
+синхронная запись.
+После падения процесса replay() (вызывается из start()) применяет события из файла
+с номером больше сохранённого: событие не теряется и не применяется дважды.
+
+Ещё не применённые события видны через pending(): чтение попыток слот-машины и
+отметок активности в models учитывает их. Денежные записи (баланс, заморозка,
+выводы, заявки, выигрыши) остаются синхронными. Журнал работает между start() и
+close(); бот запускает его только при JOURNAL_ENABLED=1 (по умолчанию выключен).
+Без него — по умолчанию, в тестах и скриптах — все записи синхронные.
+
+Применение событий регистрируется в models (register), там же — db_lock и
+соединение для записи (bind).
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.config import JOURNAL_PATH, JOURNAL_FLUSH_INTERVAL, JOURNAL_BATCH_SIZE, JOURNAL_FSYNC, JOURNAL_MAX_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+class WriteJournal:
+    def __init__(self, path: str = JOURNAL_PATH, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 batch_size: int = JOURNAL_BATCH_SIZE, fsync: bool = JOURNAL_FSYNC,
+                 max_pending: int = JOURNAL_MAX_PENDING):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(self.batch_size, max_pending)
+        self.fsync = fsync
+        # Добавление, чтение очереди и применение пачки — под одной блокировкой:
+        # проверка «БД + очередь» не видит событие ни дважды, ни ни разу
+        self.lock = threading.RLock()
+        self.active = False
+        self._appliers: Dict[str, Callable] = {}
+        self._db_lock = None
+        self._connect = None
+        self._pending: List[dict] = []
+        self._seq = 0
+        self._file = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.appended = 0
+        self.flushes = 0
+        self.applied = 0
+        self.replayed = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_batch = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def name(self) -> str:
+        """Ключ в journal_state — имя файла журнала"""
+        return os.path.basename(self.path)
+
+    @property
+    def rejected_path(self) -> str:
+        """Файл событий, которые не удалось применить"""
+        return self.path + '.rejected'
+
+    def bind(self, lock, connect):
+        """Блокировка записи и соединение для записи из models"""
+        self._db_lock = lock
+        self._connect = connect
+
+    def register(self, kind: str, applier: Callable):
+        """applier(cursor, event) применяет событие kind в транзакции пачки"""
+        self._appliers[kind] = applier
+
+    # --- добавление и очередь ---
+    def append(self, kind: str, **data) -> dict:
+        """Событие в файл журнала и в очередь на запись в БД"""
+        with self.lock:
+            if not self.active:
+                raise RuntimeError("Журнал отложенной записи не запущен")
+            if len(self._pending) >= self.max_pending:
+                # Фоновая запись не справляется — пишем очередь сразу; если БД недоступна,
+                # событие не принимается и ошибка уходит вызывающему, как при синхронной записи
+                self.flush()
+            self._seq += 1
+            event = {'seq': self._seq, 'kind': kind, **data}
+            self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._pending.append(event)
+            self.appended += 1
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wake()
+        return event
+
+    def pending(self, kind: str, tg_id=None) -> List[dict]:
+        """Ещё не записанные в БД события kind (пользователя tg_id)"""
+        with self.lock:
+            return [event for event in self._pending
+                    if event['kind'] == kind and (tg_id is None or event.get('tg_id') == tg_id)]
+
+    def _wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # event loop уже закрыт
+
+    # --- запись в БД ---
+    def _apply(self, events: List[dict], rejected: Optional[list] = None):
+        """
+        Пачка в одной транзакции. С rejected — каждое событие в своей точке сохранения:
+        упавшее откатывается и попадает в rejected как (событие, ошибка), остальные пишутся
+        """
+        with self._db_lock:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                if rejected is not None:
+                    # RELEASE внешней точки сохранения — это COMMIT, поэтому транзакция явная
+                    cursor.execute('BEGIN')
+                for event in events:
+                    if rejected is None:
+                        self._appliers[event['kind']](cursor, event)
+                        continue
+                    cursor.execute('SAVEPOINT journal_event')
+                    try:
+                        self._appliers[event['kind']](cursor, event)
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO journal_event')
+                        rejected.append((event, e))
+                    cursor.execute('RELEASE journal_event')
+                cursor.execute('''INSERT INTO journal_state (name, last_seq) VALUES (?, ?)
+                                  ON CONFLICT(name) DO UPDATE SET last_seq = excluded.last_seq''',
+                               (self.name, events[-1]['seq']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+
+    def _apply_batch(self, events: List[dict]) -> int:
+        """
+        Применяет события; если пачка падает — по одному, упавшие откладываются в
+        rejected_path. Номер последнего события сохраняется в любом случае: отложенные
+        не повторяются. Возвращает число отложенных
+        """
+        try:
+            self._apply(events)
+            return 0
+        except Exception as e:
+            logger.error(f"[JOURNAL] Ошибка записи пачки из {len(events)} событий: {e}, запись по одному")
+        rejected = []
+        self._apply(events, rejected)
+        if rejected:
+            with open(self.rejected_path, 'a', encoding='utf-8') as f:
+                for event, error in rejected:
+                    f.write(json.dumps({**event, 'error': repr(error)}, ensure_ascii=False) + '\n')
+                    logger.error(f"[JOURNAL] Событие {event['kind']} (seq {event['seq']}) не применено: {error}, "
+                                 f"отложено в {self.rejected_path}")
+            self.rejected += len(rejected)
+        return len(rejected)
+
+    def _truncate(self):
+        if self._file is not None:
+            self._file.truncate(0)
+            self._file.flush()
+
+    def flush(self) -> int:
+        """Применяет накопленные события одной транзакцией. Возвращает их число"""
+        with self.lock:
+            if not self._pending:
+                return 0
+            batch = list(self._pending)
+            started = time.perf_counter()
+            try:
+                rejected = self._apply_batch(batch)
+            except Exception as e:
+                # Не записалась даже по одному (БД недоступна) — очередь и файл остаются
+                self.failures += 1
+                logger.error(f"[JOURNAL] Пачка из {len(batch)} событий не записана: {e}")
+                raise
+            # Пока держим lock, новых событий не было: всё в файле уже в БД или отложено
+            self._pending = []
+            self._truncate()
+            self.flushes += 1
+            self.applied += len(batch) - rejected
+            self.last_batch = len(batch)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+            return len(batch)
+
+    def flush_if(self, predicate: Callable[[dict], bool]) -> int:
+        """Записывает очередь, если в ней есть подходящее событие (перед чтением, которому нужны все записи)"""
+        with self.lock:
+            if any(predicate(event) for event in self._pending):
+                return self.flush()
+            return 0
+
+    def _last_seq(self) -> int:
+        with self._db_lock:
+            conn = self._connect()
+            try:
+                row = conn.execute('SELECT last_seq FROM journal_state WHERE name = ?', (self.name,)).fetchone()
+            finally:
+                conn.close()
+        return row[0] if row else 0
+
+    def replay(self) -> int:
+        """Применяет события из файла, не дошедшие до БД до остановки процесса"""
+        with self.lock:
+            last_seq = self._last_seq()
+            self._seq = max(self._seq, last_seq)
+            if not os.path.exists(self.path):
+                return 0
+            events = []
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # Строка, недописанная при падении, — событие не было подтверждено
+                        logger.warning(f"[JOURNAL] Пропущена повреждённая строка журнала {self.path}")
+                        continue
+                    self._seq = max(self._seq, event['seq'])
+                    if event['seq'] > last_seq:
+                        events.append(event)
+            if events:
+                self._apply_batch(events)
+                self.replayed += len(events)
+                logger.info(f"[JOURNAL] Восстановлено событий из журнала: {len(events)}")
+            with open(self.path, 'w', encoding='utf-8'):
+                pass
+            return len(events)
+
+    # --- фоновая запись ---
+    async def _flush_loop(self):
+        from app.database import aio
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                try:
+                    await aio.run_write(self.flush)
+                except Exception:
+                    # Уже залогировано; события остались в очереди и в файле
+                    await asyncio.sleep(self.flush_interval)
+
+    def start(self, path: Optional[str] = None):
+        """Восстанавливает незаписанные события и включает журнал (после init_db)"""
+        if self.active:
+            return
+        if path:
+            self.path = path
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.replay()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+        self.active = True
+        logger.info(f"[JOURNAL] Журнал отложенной записи: {self.path}, пачка {self.batch_size} "
+                    f"или {self.flush_interval} с")
+
+    async def close(self):
+        """Останавливает фоновую запись и записывает очередь; дальше записи синхронные"""
+        from app.database import aio
+
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not self.active:
+            return
+        try:
+            await aio.run_write(self.flush)
+        except Exception:
+            logger.error("[JOURNAL] Очередь не записана при остановке, события будут восстановлены из файла")
+        with self.lock:
+            self.active = False
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._pending = []
+
+    def stats(self) -> dict:
+        with self.lock:
+            pending = len(self._pending)
+        return {
+            'active': self.active,
+            'pending': pending,
+            'appended': self.appended,
+            'flushes': self.flushes,
+            'applied': self.applied,
+            'replayed': self.replayed,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'last_batch': self.last_batch,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
+
+
+journal = WriteJournal()
@@ -0,0 +1,48 @@
+"""
+file_id картинок, загруженных в Telegram (таблица media_files, миграция 4)
+
+Ключ — URL источника и sha256 содержимого: если по тому же URL выложили другую
+картинку, у неё будет другой хэш и она загрузится заново.
+"""
+import datetime
+from typing import Dict, Optional
+
+from .models import db_lock, get_db_connection, read_connection
+
+
+def get_media_file_id(url: str, content_hash: str) -> Optional[str]:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT file_id FROM media_files WHERE url = ? AND content_hash = ?', (url, content_hash))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_latest_media_file_ids() -> Dict[str, str]:
+    """Последний сохранённый file_id для каждого URL"""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT url, file_id FROM media_files m
+                          WHERE updated_at = (SELECT MAX(updated_at) FROM media_files WHERE url = m.url)''')
+        rows = cursor.fetchall()
+    return dict(rows)
+
+
+def save_media_file(url: str, content_hash: str, file_id: str):
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR REPLACE INTO media_files (url, content_hash, file_id, updated_at) VALUES (?, ?, ?, ?)',
+                       (url, content_hash, file_id, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        conn.commit()
+        conn.close()
+
+
+def delete_media_file(url: str, file_id: str):
+    """Удаляет file_id, который Telegram больше не принимает"""
+    with db_lock:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM media_files WHERE url = ? AND file_id = ?', (url, file_id))
+        conn.commit()
+        conn.close()
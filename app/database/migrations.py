@@ -0,0 +1,225 @@
+"""
+Версионированные миграции схемы
+
+Номер применённой миграции хранится в PRAGMA user_version файла БД.
+Каждая миграция применяется один раз, в своей транзакции; новые миграции
+добавляются в конец MIGRATIONS со следующим номером.
+"""
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    (1, "Вторичные индексы для частых фильтров", [
+        # get_referrals_count, get_unclaimed_referrals_count, claim_referral_bonus
+        'CREATE INDEX IF NOT EXISTS idx_users_referrer_id ON users(referrer_id)',
+        # get_user_by_username ищет по LOWER(username)
+        'CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users(LOWER(username))',
+        'CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)',
+        # выигрыши пользователя (get_slot_wins_async с user_id) и по статусу (get_slot_wins)
+        'CREATE INDEX IF NOT EXISTS idx_slot_machine_user_status_created ON slot_machine(user_id, status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_slot_machine_status_created ON slot_machine(status, created_at)',
+        # mark_activity, get_user_activity, get_user_activity_streak
+        'CREATE INDEX IF NOT EXISTS idx_activity_calendar_user_date_type ON activity_calendar(user_id, date, activity_type)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_withdrawals_status ON withdrawals(status)',
+        'CREATE INDEX IF NOT EXISTS idx_withdrawals_user_id ON withdrawals(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_support_tickets_status ON support_tickets(status)',
+        # delete_user_everywhere_full удаляет записи пользователя по user_id
+        'CREATE INDEX IF NOT EXISTS idx_support_tickets_user_id ON support_tickets(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_reviews_user_id ON reviews(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_referral_attempts_referred ON referral_attempts_given(referred_user_id)',
+    ]),
+    (2, "Счётчик версии admin_settings для кэша настроек", [
+        '''CREATE TABLE IF NOT EXISTS admin_settings_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )''',
+        'INSERT OR IGNORE INTO admin_settings_version (id, version) VALUES (1, 0)',
+        # Триггеры ловят любые изменения, в том числе из сторонних скриптов
+        '''CREATE TRIGGER IF NOT EXISTS trg_admin_settings_version_ins AFTER INSERT ON admin_settings
+           BEGIN UPDATE admin_settings_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_admin_settings_version_upd AFTER UPDATE ON admin_settings
+           BEGIN UPDATE admin_settings_version SET version = version + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_admin_settings_version_del AFTER DELETE ON admin_settings
+           BEGIN UPDATE admin_settings_version SET version = version + 1 WHERE id = 1; END''',
+    ]),
+    (3, "Задания рассылок и результаты доставки", [
+        '''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            text TEXT,
+            photo_id TEXT,
+            markup TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_by INTEGER,
+            created_at TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            last_tg_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            run_seconds REAL NOT NULL DEFAULT 0
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status)',
+        '''CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            tg_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            updated_at TEXT,
+            PRIMARY KEY (job_id, tg_id)
+        )''',
+    ]),
+    (4, "file_id загруженных в Telegram картинок меню", [
+        '''CREATE TABLE IF NOT EXISTS media_files (
+            url TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            updated_at TEXT,
+            PRIMARY KEY (url, content_hash)
+        )''',
+    ]),
+    (5, "Счётчики заявок по статусам и индексы для очереди заявок", [
+        # get_orders_page: фильтр по статусу/типу и keyset по id
+        'CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_type ON orders(order_type)',
+        '''CREATE TABLE IF NOT EXISTS order_status_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''INSERT OR REPLACE INTO order_status_counts (status, count)
+           SELECT COALESCE(status, ''), COUNT(*) FROM orders GROUP BY COALESCE(status, '')''',
+        # Триггеры ловят любые изменения, в том числе из сторонних скриптов
+        '''CREATE TRIGGER IF NOT EXISTS trg_order_status_counts_ins AFTER INSERT ON orders
+           BEGIN
+               INSERT INTO order_status_counts (status, count) VALUES (COALESCE(NEW.status, ''), 1)
+               ON CONFLICT(status) DO UPDATE SET count = count + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_order_status_counts_del AFTER DELETE ON orders
+           BEGIN
+               UPDATE order_status_counts SET count = count - 1 WHERE status = COALESCE(OLD.status, '');
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_order_status_counts_upd AFTER UPDATE OF status ON orders
+           WHEN OLD.status IS NOT NEW.status
+           BEGIN
+               UPDATE order_status_counts SET count = count - 1 WHERE status = COALESCE(OLD.status, '');
+               INSERT INTO order_status_counts (status, count) VALUES (COALESCE(NEW.status, ''), 1)
+               ON CONFLICT(status) DO UPDATE SET count = count + 1;
+           END''',
+    ]),
+    (6, "Сводная статистика слот-машины по пользователям", [
+        # Ведётся в транзакции спина (_record_slot_stats), экраны статистики читают одну строку.
+        # last_results — JSON последних SLOT_STATS_LAST_RESULTS спинов, новые первыми
+        '''CREATE TABLE IF NOT EXISTS slot_user_stats (
+            user_id INTEGER PRIMARY KEY,
+            spins INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            biggest_type TEXT,
+            biggest_amount REAL,
+            biggest_value REAL NOT NULL DEFAULT 0,
+            last_results TEXT,
+            last_spin_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )''',
+        # Заполнение по уже сыгранным спинам; ценность выигрыша — как SLOT_WIN_VALUE в models.py
+        '''INSERT OR REPLACE INTO slot_user_stats
+               (user_id, spins, wins, biggest_type, biggest_amount, biggest_value, last_results, last_spin_at)
+           WITH valued AS (
+               SELECT id, user_id, reward_type, reward_amount, created_at,
+                      CASE WHEN is_win THEN 1 ELSE 0 END AS is_win,
+                      CASE WHEN NOT is_win THEN 0
+                           WHEN reward_type = 'money' THEN reward_amount
+                           WHEN reward_type = 'stars' THEN reward_amount * 2
+                           WHEN reward_type = 'ton' THEN reward_amount * 1000
+                           ELSE 0 END AS value
+               FROM slot_machine WHERE user_id IS NOT NULL
+           ), best AS (
+               SELECT user_id, reward_type, reward_amount, value,
+                      ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY value DESC, id) AS rn
+               FROM valued WHERE value > 0
+           )
+           SELECT v.user_id, COUNT(*), SUM(v.is_win), b.reward_type, b.reward_amount, COALESCE(b.value, 0),
+                  (SELECT json_group_array(json_object(
+                              'id', r.id, 'combination', r.combination, 'reward_type', r.reward_type,
+                              'reward_amount', r.reward_amount, 'is_win', CASE WHEN r.is_win THEN 1 ELSE 0 END,
+                              'created_at', r.created_at))
+                   FROM (SELECT * FROM slot_machine WHERE user_id = v.user_id ORDER BY id DESC LIMIT 10) r),
+                  MAX(v.created_at)
+           FROM valued v LEFT JOIN best b ON b.user_id = v.user_id AND b.rn = 1
+           GROUP BY v.user_id''',
+    ]),
+    (7, "Последнее применённое событие журнала отложенной записи", [
+        # name — имя файла журнала (у каждого воркера свой); обновляется в транзакции пачки
+        '''CREATE TABLE IF NOT EXISTS journal_state (
+            name TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL DEFAULT 0
+        )''',
+    ]),
+    (8, "Дневные итоги проигрышей слот-машины и индекс для очистки истории спинов", [
+        # Проигрыши старше SLOT_LOSS_RETENTION_DAYS сворачиваются сюда (app/database/retention.py)
+        '''CREATE TABLE IF NOT EXISTS slot_daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            losses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )''',
+        # Старые проигрыши и старые строки для архива — по is_win и дате
+        'CREATE INDEX IF NOT EXISTS idx_slot_machine_win_created ON slot_machine(is_win, created_at)',
+    ]),
+    (9, "Индекс для фильтра очереди заявок по дате", [
+        # get_orders_page с date_from/date_to без статуса; по статусу и id хватает idx_orders_status
+        'CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at)',
+    ]),
+    (10, "Счётчик пользователей и индекс по id для базы пользователей в админке", [
+        # count_users читает одну строку вместо COUNT(*) по всей таблице
+        '''CREATE TABLE IF NOT EXISTS users_count (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            count INTEGER NOT NULL DEFAULT 0
+        )''',
+        'INSERT OR REPLACE INTO users_count (id, count) SELECT 1, COUNT(*) FROM users',
+        # Триггеры ловят любые изменения, в том числе из сторонних скриптов
+        '''CREATE TRIGGER IF NOT EXISTS trg_users_count_ins AFTER INSERT ON users
+           BEGIN UPDATE users_count SET count = count + 1 WHERE id = 1; END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_users_count_del AFTER DELETE ON users
+           BEGIN UPDATE users_count SET count = count - 1 WHERE id = 1; END''',
+        # get_user_id_at: OFFSET идёт по компактному индексу, а не по строкам таблицы
+        'CREATE INDEX IF NOT EXISTS idx_users_id ON users(id)',
+    ]),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> int:
+    """
+    Применяет недостающие миграции. Вызывается из init_db под db_lock,
+    после создания таблиц. Возвращает номер версии схемы.
+    """
+    version = get_schema_version(conn)
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        try:
+            conn.execute('BEGIN')
+            for sql in statements:
+                conn.execute(sql)
+            # PRAGMA не принимает параметры, number — константа из MIGRATIONS
+            conn.execute(f'PRAGMA user_version = {int(number)}')
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.error(f"[DB] Ошибка миграции {number} ({description}): {e}")
+            raise
+        version = number
+        logger.info(f"[DB] Применена миграция {number}: {description}")
+    return version
@@ -5,14 +5,39 @@ import datetime
 import json
 import sqlite3
 import threading
+import time
+from contextlib import contextmanager
 from typing import Tuple, Optional, Dict, List
-import aiosqlite
 import logging
 
+from .pool import get_pool, connect_async
+from .migrations import apply_migrations
+from .journal import journal
+from . import retention
+from .settings_cache import settings_cache, read_settings_version
+
+# Сериализует запись через общее соединение пула
 db_lock = threading.RLock()
 
 def get_db_connection():
-    return sqlite3.connect('data/users.db', timeout=30)
+    """Соединение для записи (общее для процесса, вызывать под db_lock)"""
+    return get_pool().writer()
+
+def get_read_connection():
+    """Соединение только для чтения из пула, db_lock не требуется"""
+    return get_pool().reader()
+
+@contextmanager
+def read_connection():
+    """get_read_connection() для блока with: на выходе соединение возвращается в пул"""
+    conn = get_read_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+# Журнал отложенной записи применяет пачки через то же соединение записи
+journal.bind(db_lock, get_db_connection)
 
 def migrate_users_table():
     with db_lock:
@@ -129,6 +154,13 @@ def init_db():
     migrate_users_table()
     migrate_orders_table()  # Добавляю миграцию таблицы orders
     migrate_support_tickets_table()  # Добавляю миграцию таблицы поддержки
+    with db_lock:
+        _create_tables()
+    _slot_configs_changed()
+    _users_count['value'] = None
+
+def _create_tables():
+    """Таблицы, начальные данные и миграции схемы (вызывать под db_lock)"""
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -370,6 +402,8 @@ def init_db():
         ''', (combo, reward_type, reward_amount, chance, emoji, name))
     
     conn.commit()
+    # Индексы и прочие версионированные изменения схемы
+    apply_migrations(conn)
     conn.close()
 
 
@@ -401,6 +435,7 @@ def get_or_create_user(tg_id, full_name, username, reg_date, referrer_id=None):
             cursor.execute('''INSERT INTO users (tg_id, full_name, username, reg_date, referrer_id) VALUES (?, ?, ?, ?, ?)''',
                            (tg_id, full_name, username, reg_date, referrer_id))
             conn.commit()
+            _users_count['value'] = None
             cursor.execute('SELECT id, tg_id, full_name, username, reg_date, balance, frozen, referrer_id FROM users WHERE tg_id=?', (tg_id,))
             user = cursor.fetchone()
         conn.close()
@@ -518,8 +553,7 @@ def create_withdrawal(tg_id, amount, requisites="", type="withdraw", extra=None)
 
 # --- Получение всех заявок (любого типа) ---
 def get_all_pending_withdrawals():
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT w.id, w.user_id, w.amount, w.status, w.created_at, w.requisites, w.type, w.extra, u.tg_id, u.full_name, u.username
@@ -529,7 +563,6 @@ def get_all_pending_withdrawals():
             ORDER BY w.created_at DESC
         ''')
         rows = cursor.fetchall()
-        conn.close()
         if not rows:
             return []
         result = []
@@ -553,8 +586,7 @@ def get_all_pending_withdrawals():
 
 # --- Получение заявки по ID ---
 def get_withdrawal_by_id(withdrawal_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             SELECT w.id, w.user_id, w.amount, w.status, w.created_at, w.requisites, w.type, w.extra, u.tg_id, u.full_name, u.username
@@ -563,7 +595,6 @@ def get_withdrawal_by_id(withdrawal_id):
             WHERE w.id = ?
         ''', (withdrawal_id,))
         row = cursor.fetchone()
-        conn.close()
         if not row:
             return None
         return {
@@ -591,12 +622,10 @@ def update_withdrawal_status(withdrawal_id, status):
 
 # --- Профиль ---
 def get_user_profile(tg_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, tg_id, full_name, username, reg_date, balance, frozen, referrer_id FROM users WHERE tg_id=?''', (tg_id,))
         user = cursor.fetchone()
-        conn.close()
         if user:
             return {
                 'id': user[0],
@@ -611,29 +640,117 @@ def get_user_profile(tg_id):
         return None
 
 def get_referrals_count(tg_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE tg_id=?', (tg_id,))
         user = cursor.fetchone()
         if not user:
-            conn.close()
             return 0
         user_id = user[0]
         cursor.execute('SELECT COUNT(*) FROM users WHERE referrer_id=?', (user_id,))
         count = cursor.fetchone()[0]
-        conn.close()
         return count
 
 def get_all_users():
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM users')
         users = cursor.fetchall()
-        conn.close()
         return users
 
+# --- Просмотр базы пользователей в админке ---
+USERS_COUNT_TTL = 60  # сек, столько живёт закэшированное число пользователей
+_users_count = {'value': None, 'counted_at': 0.0}
+
+def count_users(max_age: float = USERS_COUNT_TTL):
+    """Число пользователей из users_count (ведётся триггерами); перечитывается не чаще раза в max_age секунд"""
+    now = time.monotonic()
+    if _users_count['value'] is None or now - _users_count['counted_at'] >= max_age:
+        with read_connection() as conn:
+            row = conn.execute('SELECT count FROM users_count WHERE id = 1').fetchone()
+            _users_count['value'] = row[0] if row else 0
+        _users_count['counted_at'] = now
+    return _users_count['value']
+
+def _user_page_row(row):
+    return {
+        'id': row[0],
+        'tg_id': row[1],
+        'username': row[2],
+        'reg_date': row[3],
+        'balance': row[4],
+        'referrer_id': row[5],
+        'referrals': row[6],
+    }
+
+def get_users_page(after_id=0, limit=5, before_id=None):
+    """
+    Страница пользователей по возрастанию id (keyset): следующие за after_id
+    или, если задан before_id, предыдущие перед ним. Число приглашённых
+    считается одним сгруппированным подзапросом на страницу.
+    """
+    if before_id is not None:
+        page_sql = 'SELECT id, tg_id, username, reg_date, balance, referrer_id FROM users WHERE id < ? ORDER BY id DESC LIMIT ?'
+        params = (before_id, limit)
+    else:
+        page_sql = 'SELECT id, tg_id, username, reg_date, balance, referrer_id FROM users WHERE id > ? ORDER BY id LIMIT ?'
+        params = (after_id, limit)
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''WITH page AS ({page_sql})
+                           SELECT page.id, page.tg_id, page.username, page.reg_date, page.balance, page.referrer_id,
+                                  COALESCE(refs.cnt, 0)
+                           FROM page
+                           LEFT JOIN (SELECT referrer_id, COUNT(*) AS cnt FROM users
+                                      WHERE referrer_id IN (SELECT id FROM page) GROUP BY referrer_id) refs
+                                  ON refs.referrer_id = page.id
+                           ORDER BY page.id''', params)
+        return [_user_page_row(row) for row in cursor.fetchall()]
+
+def get_user_id_at(position):
+    """
+    id пользователя на позиции position (с 0) по возрастанию id — начало страницы
+    при переходе по номеру. OFFSET проходит position записей индекса idx_users_id
+    """
+    with read_connection() as conn:
+        row = conn.execute('SELECT id FROM users ORDER BY id LIMIT 1 OFFSET ?', (position,)).fetchone()
+        return row[0] if row else None
+
+def search_users(query, limit=10):
+    """
+    Поиск пользователей: число — по tg_id, иначе по username без учёта регистра
+    (сначала точное совпадение, затем по началу). Использует индексы
+    users(tg_id) и users(LOWER(username)).
+    """
+    query = query.strip().lstrip('@')
+    if not query:
+        return []
+    columns = 'id, tg_id, username, reg_date, balance, referrer_id, 0'
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        if query.isdigit():
+            cursor.execute(f'SELECT {columns} FROM users WHERE tg_id = ?', (int(query),))
+            rows = cursor.fetchall()
+        else:
+            rows = []
+        prefix = query.lower()
+        # Верхняя граница диапазона: префикс с увеличенным последним символом
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        cursor.execute(f'''SELECT {columns} FROM users
+                           WHERE LOWER(username) >= ? AND LOWER(username) < ?
+                           ORDER BY LOWER(username) = ? DESC, LOWER(username) LIMIT ?''',
+                       (prefix, upper, prefix, limit))
+        found = {row[0] for row in rows}
+        rows += [row for row in cursor.fetchall() if row[0] not in found]
+        return [_user_page_row(row) for row in rows[:limit]]
+
+def get_user_referrals(user_id):
+    """Приглашённые пользователем (users.id): [(username, tg_id, balance)]"""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT username, tg_id, balance FROM users WHERE referrer_id = ? ORDER BY id', (user_id,))
+        return cursor.fetchall()
+
 def clear_all_withdrawals_and_frozen():
     with db_lock:
         conn = get_db_connection()
@@ -723,13 +840,11 @@ def create_order(user_id, order_type, amount, status, file_id=None, extra_data=N
         return order_id
 
 def get_order_by_id(order_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id 
                           FROM orders WHERE id = ?''', (order_id,))
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -749,15 +864,62 @@ def get_all_orders():
     # Выполняем миграцию перед получением данных
     migrate_orders_table()
     
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id 
                           FROM orders ORDER BY created_at DESC''')
         rows = cursor.fetchall()
-        conn.close()
         return rows
 
+def get_orders_page(status=None, order_type=None, tg_id=None, date_from=None, date_to=None,
+                    before_id=None, after_id=None, limit=5):
+    """
+    Страница заявок, новые первыми (keyset по id): старше before_id или, если
+    задан after_id, новее него. Фильтры: статус, тип, пользователь (tg_id),
+    дата создания с date_from по date_to включительно ('YYYY-MM-DD').
+    Строки — как в get_all_orders.
+    """
+    conditions, params = [], []
+    if status:
+        conditions.append('status = ?')
+        params.append(status)
+    if order_type:
+        conditions.append('order_type = ?')
+        params.append(order_type)
+    if tg_id is not None:
+        conditions.append('user_id IN (SELECT id FROM users WHERE tg_id = ?)')
+        params.append(tg_id)
+    if date_from:
+        conditions.append('created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        # created_at хранится как 'YYYY-MM-DD HH:MM:SS'
+        conditions.append('created_at < ?')
+        params.append(date_to + '~')
+    if after_id is not None:
+        conditions.append('id > ?')
+        params.append(after_id)
+        order = 'ASC'
+    else:
+        if before_id is not None:
+            conditions.append('id < ?')
+            params.append(before_id)
+        order = 'DESC'
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''SELECT id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id
+                           FROM orders {where} ORDER BY id {order} LIMIT ?''', (*params, limit))
+        rows = cursor.fetchall()
+    return rows[::-1] if order == 'ASC' else rows
+
+def get_order_status_counts():
+    """Число заявок по статусам из order_status_counts (ведётся триггерами)"""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, count FROM order_status_counts WHERE count > 0')
+        return dict(cursor.fetchall())
+
 
 
 def delete_order(order_id):
@@ -862,13 +1024,11 @@ def create_review(user_id, content, file_id=None, status="pending"):
         return review_id
 
 def get_review_by_id(review_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, user_id, content, status, created_at, file_id, admin_msg_id, channel_msg_id 
                           FROM reviews WHERE id = ?''', (review_id,))
         row = cursor.fetchone()
-        conn.close()
         
         if row:
             return {
@@ -887,13 +1047,11 @@ def get_all_reviews():
     # Выполняем миграцию перед получением данных
     migrate_reviews_table()
     
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, user_id, content, status, created_at, file_id, admin_msg_id, channel_msg_id 
                           FROM reviews ORDER BY created_at DESC''')
         rows = cursor.fetchall()
-        conn.close()
         return rows
 
 def update_review_status(review_id, status=None, admin_msg_id=None, channel_msg_id=None):
@@ -938,13 +1096,11 @@ def clear_all_reviews():
         conn.close()
 
 def get_withdrawals(tg_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users WHERE tg_id=?', (tg_id,))
         user = cursor.fetchone()
         if not user:
-            conn.close()
             return []
         user_id = user[0]
         cursor.execute('''
@@ -953,7 +1109,6 @@ def get_withdrawals(tg_id):
             ORDER BY created_at DESC
         ''', (user_id,))
         rows = cursor.fetchall()
-        conn.close()
         return rows
 
 def confirm_withdrawal(tg_id, amount):
@@ -972,12 +1127,10 @@ def confirm_withdrawal(tg_id, amount):
             conn.close()
 
 def get_user_profile_by_id(user_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT id, tg_id, full_name, username, reg_date, balance, frozen, referrer_id FROM users WHERE id=?''', (user_id,))
         user = cursor.fetchone()
-        conn.close()
         if user:
             return {
                 'id': user[0],
@@ -1051,12 +1204,10 @@ def update_support_ticket_status(ticket_id, status=None, reply=None, replied_at=
         conn.close()
 
 def get_support_ticket_by_id(ticket_id):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, user_id, username, full_name, message, status, created_at, channel_msg_id, reply, replied_at FROM support_tickets WHERE id=?', (ticket_id,))
         row = cursor.fetchone()
-        conn.close()
         if not row:
             return None
         return {
@@ -1073,15 +1224,13 @@ def get_support_ticket_by_id(ticket_id):
         }
 
 def get_all_support_tickets(status=None):
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         if status:
             cursor.execute('SELECT * FROM support_tickets WHERE status=? ORDER BY created_at DESC', (status,))
         else:
             cursor.execute('SELECT * FROM support_tickets ORDER BY created_at DESC')
         rows = cursor.fetchall()
-        conn.close()
         return rows
 
 def delete_support_ticket(ticket_id):
@@ -1106,13 +1255,12 @@ def clear_all_support_tickets():
 
 # --- АДМИНСКИЕ НАСТРОЙКИ ---
 def get_admin_setting(key, default=""):
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM admin_settings WHERE key = ?", (key,))
-        row = cursor.fetchone()
-        conn.close()
-        return row[0] if row else default
+    """Значение настройки админки (из кэша в памяти, см. settings_cache.py)"""
+    return settings_cache.get(key, default)
+
+def get_settings_cache_stats():
+    """Счётчики кэша настроек: hits, misses, reloads, version_checks"""
+    return settings_cache.stats()
 
 def update_admin_setting(key, value):
     """Обновляет значение настройки админки"""
@@ -1120,28 +1268,51 @@ def update_admin_setting(key, value):
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('''INSERT OR REPLACE INTO admin_settings (key, value) VALUES (?, ?)''', (key, value))
+        # Значение перечитывается, чтобы в кэше был тот же тип, что вернёт SELECT
+        cursor.execute('SELECT value FROM admin_settings WHERE key = ?', (key,))
+        stored = cursor.fetchone()[0]
+        version = read_settings_version(conn)
         conn.commit()
         conn.close()
+    settings_cache.written(key, stored, version)
 
 def get_all_admin_settings():
     """Получает все настройки админки"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT key, value, description FROM admin_settings ORDER BY key')
         result = cursor.fetchall()
-        conn.close()
         return result
 
 # --- СЛОТ-МАШИНА ---
+# Версия slot_config в этом процессе: увеличивается при каждом изменении конфигураций,
+# по ней app.utils.slot_machine понимает, что таблицу выплат пора пересобрать
+_slot_config_version = 0
+# Вызываются после изменения slot_config этим процессом (оповещение других процессов)
+_slot_config_listeners = []
+
+def get_slot_config_version():
+    return _slot_config_version
+
+def invalidate_slot_configs():
+    """Сбрасывает таблицу выплат процесса (например, призы изменил другой процесс)"""
+    global _slot_config_version
+    _slot_config_version += 1
+
+def on_slot_configs_changed(callback):
+    _slot_config_listeners.append(callback)
+
+def _slot_configs_changed():
+    invalidate_slot_configs()
+    for callback in _slot_config_listeners:
+        callback()
+
 def get_slot_configs():
     """Получает все конфигурации слот-машины"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, combination, reward_type, reward_amount, chance_percent, emoji, name FROM slot_config ORDER BY chance_percent DESC')
         result = cursor.fetchall()
-        conn.close()
         return result
 
 def add_slot_config(combination, reward_type, reward_amount, chance_percent, emoji, name):
@@ -1153,6 +1324,7 @@ def add_slot_config(combination, reward_type, reward_amount, chance_percent, emo
                          VALUES (?, ?, ?, ?, ?, ?)''', (combination, reward_type, reward_amount, chance_percent, emoji, name))
         conn.commit()
         conn.close()
+    _slot_configs_changed()
 
 def delete_slot_config(config_id):
     """Удаляет конфигурацию слот-машины"""
@@ -1162,15 +1334,14 @@ def delete_slot_config(config_id):
         cursor.execute('DELETE FROM slot_config WHERE id = ?', (config_id,))
         conn.commit()
         conn.close()
+    _slot_configs_changed()
 
 def get_user_slot_spins(tg_id):
     """Получает количество использованных спинов пользователя"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT slot_spins_used, slot_last_reset FROM users WHERE tg_id = ?', (tg_id,))
         result = cursor.fetchone()
-        conn.close()
         return result if result else (0, None)
 
 def use_slot_spin(tg_id):
@@ -1183,17 +1354,53 @@ def use_slot_spin(tg_id):
         conn.close()
 
 def reset_slot_spins(tg_id):
-    """Сбрасывает спинны пользователя"""
+    """Сбрасывает спинны пользователя; время сброса хранится с точностью до секунды"""
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('UPDATE users SET slot_spins_used = 0, slot_last_reset = ? WHERE tg_id = ?', 
-                      (datetime.datetime.now().strftime("%Y-%m-%d"), tg_id))
+                      (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), tg_id))
         conn.commit()
         conn.close()
 
+# Статистика слотов (slot_user_stats): сколько последних спинов хранить и «ценность»
+# выигрыша в условных единицах для выбора самого крупного
+SLOT_STATS_LAST_RESULTS = 10
+SLOT_WIN_VALUE = {"money": 1, "stars": 2, "ton": 1000}
+
+def _record_slot_stats(cursor, user_id, win_id, combination, reward_type, reward_amount, is_win, created_at):
+    """Учитывает спин в slot_user_stats; вызывается в транзакции, записавшей спин"""
+    cursor.execute('SELECT spins, wins, biggest_value, last_results FROM slot_user_stats WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    spins, wins, biggest_value, last_results = row if row else (0, 0, 0, None)
+    results = json.loads(last_results) if last_results else []
+    results.insert(0, {'id': win_id, 'combination': combination, 'reward_type': reward_type,
+                       'reward_amount': reward_amount, 'is_win': int(bool(is_win)), 'created_at': created_at})
+    value = reward_amount * SLOT_WIN_VALUE.get(reward_type, 0) if is_win else 0
+    cursor.execute('''INSERT INTO slot_user_stats
+                          (user_id, spins, wins, biggest_type, biggest_amount, biggest_value, last_results, last_spin_at)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                      ON CONFLICT(user_id) DO UPDATE SET
+                          spins = excluded.spins, wins = excluded.wins,
+                          biggest_type = CASE WHEN excluded.biggest_value > biggest_value
+                                              THEN excluded.biggest_type ELSE biggest_type END,
+                          biggest_amount = CASE WHEN excluded.biggest_value > biggest_value
+                                                THEN excluded.biggest_amount ELSE biggest_amount END,
+                          biggest_value = MAX(biggest_value, excluded.biggest_value),
+                          last_results = excluded.last_results, last_spin_at = excluded.last_spin_at''',
+                   (user_id, spins + 1, wins + bool(is_win),
+                    reward_type if value > 0 else None, reward_amount if value > 0 else None, value,
+                    json.dumps(results[:SLOT_STATS_LAST_RESULTS], ensure_ascii=False), created_at))
+
 def create_slot_win(tg_id, combination, reward_type, reward_amount, is_win):
-    """Создает запись о выигрыше в слот-машине с правильным статусом"""
+    """
+    Создает запись о выигрыше в слот-машине с правильным статусом.
+    Проигрыш (reward_type "none") при запущенном журнале записывается пачкой — id не возвращается
+    """
+    if reward_type == "none" and journal.active:
+        journal.append('slot_result', tg_id=tg_id, combination=combination, reward_amount=reward_amount,
+                       is_win=bool(is_win), created_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        return None
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1206,18 +1413,249 @@ def create_slot_win(tg_id, combination, reward_type, reward_amount, is_win):
             # Звезды и TON требуют подтверждения админа, поэтому статус "pending"
             status = "pending"
 
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+        user = cursor.fetchone()
+        user_id = user[0] if user else None
         cursor.execute('''INSERT INTO slot_machine (user_id, combination, reward_type, reward_amount, is_win, status, created_at)
-                         VALUES ((SELECT id FROM users WHERE tg_id = ?), ?, ?, ?, ?, ?, ?)''',
-                      (tg_id, combination, reward_type, reward_amount, is_win, status, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                      (user_id, combination, reward_type, reward_amount, is_win, status, now))
         win_id = cursor.lastrowid
+        if user_id is not None:
+            _record_slot_stats(cursor, user_id, win_id, combination, reward_type, reward_amount, is_win, now)
         conn.commit()
         conn.close()
         return win_id
 
-def get_slot_wins(status="pending"):
-    """Получает все выигрыши слот-машины с определенным статусом"""
+def get_slot_attempts(tg_id):
+    """
+    Попытки слот-машины: (использованные стандартные, бонусные).
+    Если попытки не сбрасывались сегодня, использованные считаются нулём —
+    как после сброса в меню слот-машины.
+    """
+    with journal.lock:
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?', (tg_id,))
+            row = cursor.fetchone()
+            cursor.execute('SELECT attempts FROM bonus_attempts WHERE user_id = ?', (tg_id,))
+            bonus = cursor.fetchone()
+        return _attempts_with_pending(tg_id, row, bonus)
+
+def _attempts_with_pending(tg_id, row, bonus):
+    """(использованные стандартные, бонусные) по строкам БД и спинам, ещё не записанным из журнала"""
+    today = datetime.date.today().isoformat()
+    attempts_used = (row[0] if row and row[1] == today else 0) or 0
+    bonus_attempts = (bonus[0] if bonus else 0) or 0
+    for event in journal.pending('slot_spin', tg_id):
+        if event['attempt'] == 'bonus':
+            bonus_attempts -= 1
+        elif event['date'] == today:
+            attempts_used += 1
+    return attempts_used, max(0, bonus_attempts)
+
+def _apply_slot_loss(cursor, tg_id, combination, reward_amount, is_win, created_at):
+    cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+    user = cursor.fetchone()
+    user_id = user[0] if user else None
+    cursor.execute('''INSERT INTO slot_machine (user_id, combination, reward_type, reward_amount, is_win, status, created_at)
+                      VALUES (?, ?, 'none', ?, ?, 'pending', ?)''',
+                   (user_id, combination, reward_amount, is_win, created_at))
+    if user_id is not None:
+        _record_slot_stats(cursor, user_id, cursor.lastrowid, combination, "none", reward_amount, is_win, created_at)
+
+def _apply_slot_spin(cursor, event):
+    """Спин без выигрыша из журнала: списание попытки и запись в slot_machine"""
+    tg_id = event['tg_id']
+    if event['attempt'] == 'bonus':
+        cursor.execute('UPDATE bonus_attempts SET attempts = attempts - 1 WHERE user_id = ? AND attempts > 0',
+                       (tg_id,))
+    else:
+        cursor.execute('''INSERT INTO roulette_attempts (user_id, attempts_used, last_reset) VALUES (?, 1, ?)
+                          ON CONFLICT(user_id) DO UPDATE SET
+                              attempts_used = CASE WHEN last_reset = excluded.last_reset
+                                                   THEN attempts_used + 1 ELSE 1 END,
+                              last_reset = excluded.last_reset
+                          WHERE (last_reset IS NULL OR excluded.last_reset >= last_reset)
+                            AND (last_reset IS NOT excluded.last_reset OR attempts_used < ?)''',
+                       (tg_id, event['date'], event['daily_attempts']))
+    if cursor.rowcount == 0:
+        # Попытки изменили мимо журнала (админ, сброс) или спин вчерашний, а сегодняшняя
+        # строка уже есть — её не трогаем; спин уже сыгран, записываем его
+        logging.warning(f"[JOURNAL] Попытка для спина seq {event['seq']} пользователя {tg_id} не списана")
+    _apply_slot_loss(cursor, tg_id, event['combination'], 0, False, event['created_at'])
+
+def _apply_slot_result(cursor, event):
+    """Проигрыш из create_slot_win"""
+    _apply_slot_loss(cursor, event['tg_id'], event['combination'], event['reward_amount'],
+                     event['is_win'], event['created_at'])
+
+journal.register('slot_spin', _apply_slot_spin)
+journal.register('slot_result', _apply_slot_result)
+
+def play_slot_spin(tg_id, daily_attempts, roll):
+    """
+    Один спин слот-машины одной транзакцией записи:
+    списание попытки (сначала бонусной), roll() -> (тройка, конфигурация или None),
+    запись в slot_machine, начисление денег или заявка на звёзды/TON.
+
+    Попытка списывается условным UPDATE, поэтому два одновременных нажатия
+    не потратят больше попыток, чем есть. Возвращает словарь со status:
+    'ok', 'no_attempts' или 'no_user'.
+
+    При запущенном журнале спин без выигрыша не пишется сразу, а уходит в журнал
+    (win_id None); выигрыш записывается синхронно после записи очереди журнала.
+    """
+    if journal.active:
+        return _play_slot_spin_journaled(tg_id, daily_attempts, roll)
+    return _play_slot_spin_now(tg_id, daily_attempts, roll)
+
+def _play_slot_spin_journaled(tg_id, daily_attempts, roll):
+    today = datetime.date.today().isoformat()
+    # Под блокировкой журнала очередь не записывается в БД: БД + очередь согласованы
+    with journal.lock:
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+            user = cursor.fetchone()
+            cursor.execute('SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?', (tg_id,))
+            row = cursor.fetchone()
+            cursor.execute('SELECT attempts FROM bonus_attempts WHERE user_id = ?', (tg_id,))
+            bonus = cursor.fetchone()
+        if not user:
+            return {'status': 'no_user'}
+        attempts_used, bonus_attempts = _attempts_with_pending(tg_id, row, bonus)
+        if bonus_attempts > 0:
+            attempt = 'bonus'
+        elif attempts_used < daily_attempts:
+            attempt = 'daily'
+        else:
+            return {'status': 'no_attempts'}
+
+        triple, config = roll()
+        if config:
+            # Выигрыш — деньги или заявка: очередь в БД, затем обычная транзакция спина
+            journal.flush()
+            return _play_slot_spin_now(tg_id, daily_attempts, lambda: (triple, config))
+
+        journal.append('slot_spin', tg_id=tg_id, attempt=attempt, date=today, daily_attempts=daily_attempts,
+                       combination=''.join(triple), created_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    if attempt == 'bonus':
+        bonus_attempts -= 1
+    else:
+        attempts_used += 1
+    return {
+        'status': 'ok',
+        'triple': tuple(triple),
+        'config': None,
+        'win_id': None,
+        'order_id': None,
+        'attempts_used': attempts_used,
+        'bonus_attempts': bonus_attempts,
+    }
+
+def _play_slot_spin_now(tg_id, daily_attempts, roll):
+    today = datetime.date.today().isoformat()
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     with db_lock:
         conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+            user = cursor.fetchone()
+            if not user:
+                return {'status': 'no_user'}
+            user_id = user[0]
+
+            cursor.execute('UPDATE bonus_attempts SET attempts = attempts - 1 WHERE user_id = ? AND attempts > 0',
+                           (tg_id,))
+            if cursor.rowcount == 0:
+                if daily_attempts <= 0:
+                    conn.rollback()
+                    return {'status': 'no_attempts'}
+                # Сброс за новый день и списание — одним запросом
+                cursor.execute('''INSERT INTO roulette_attempts (user_id, attempts_used, last_reset) VALUES (?, 1, ?)
+                                  ON CONFLICT(user_id) DO UPDATE SET
+                                      attempts_used = CASE WHEN last_reset = excluded.last_reset
+                                                           THEN attempts_used + 1 ELSE 1 END,
+                                      last_reset = excluded.last_reset
+                                  WHERE last_reset IS NOT excluded.last_reset OR attempts_used < ?''',
+                               (tg_id, today, daily_attempts))
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return {'status': 'no_attempts'}
+
+            triple, config = roll()
+            order_id = None
+            if config:
+                config_id, combination, reward_type, reward_amount, chance_percent, emoji, name = config
+                combination = ''.join(triple)
+            else:
+                combination, reward_type, reward_amount = ''.join(triple), "none", 0
+            # Статус как в create_slot_win: деньги зачисляются сразу, остальное ждёт админа
+            status = "completed" if reward_type == "money" else "pending"
+            cursor.execute('''INSERT INTO slot_machine (user_id, combination, reward_type, reward_amount, is_win, status, created_at)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, combination, reward_type, reward_amount, bool(config), status, now))
+            win_id = cursor.lastrowid
+            _record_slot_stats(cursor, user_id, win_id, combination, reward_type, reward_amount, bool(config), now)
+
+            if config and reward_type == "money":
+                cursor.execute('UPDATE users SET balance = COALESCE(balance, 0) + ? WHERE id = ?', (reward_amount, user_id))
+            elif config and reward_type in ("stars", "ton"):
+                order_type, label = ("slot_win", "Звезды") if reward_type == "stars" else ("slot_ton", "TON")
+                cursor.execute('''INSERT INTO orders (user_id, order_type, amount, status, created_at, extra_data)
+                                  VALUES (?, ?, ?, 'pending', ?, ?)''',
+                               (user_id, order_type, reward_amount, now,
+                                json.dumps(f"{label} за слот: {combination} ({name})")))
+                order_id = cursor.lastrowid
+
+            cursor.execute('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (tg_id,))
+            row = cursor.fetchone()
+            cursor.execute('SELECT attempts FROM bonus_attempts WHERE user_id = ?', (tg_id,))
+            bonus = cursor.fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return {
+        'status': 'ok',
+        'triple': tuple(triple),
+        'config': config,
+        'win_id': win_id,
+        'order_id': order_id,
+        'attempts_used': (row[0] if row else 0) or 0,
+        'bonus_attempts': (bonus[0] if bonus else 0) or 0,
+    }
+
+def get_slot_user_stats(tg_id):
+    """
+    Статистика слотов пользователя одной строкой slot_user_stats: спины, выигрыши,
+    процент, самый крупный выигрыш и последние спины (новые первыми)
+    """
+    if journal.active:
+        journal.flush_if(lambda event: event['kind'] in ('slot_spin', 'slot_result') and event['tg_id'] == tg_id)
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''SELECT spins, wins, biggest_type, biggest_amount, last_results, last_spin_at
+                          FROM slot_user_stats WHERE user_id = (SELECT id FROM users WHERE tg_id = ?)''', (tg_id,))
+        row = cursor.fetchone()
+    spins, wins, biggest_type, biggest_amount, last_results, last_spin_at = row or (0, 0, None, None, None, None)
+    return {
+        'spins': spins,
+        'wins': wins,
+        'win_rate': wins / spins * 100 if spins else 0.0,
+        'biggest_type': biggest_type,
+        'biggest_amount': biggest_amount,
+        'last_results': json.loads(last_results) if last_results else [],
+        'last_spin_at': last_spin_at,
+    }
+
+def get_slot_wins(status="pending"):
+    """Получает все выигрыши слот-машины с определенным статусом"""
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT sm.id, sm.user_id, u.tg_id, u.full_name, sm.combination, sm.reward_type, 
                          sm.reward_amount, sm.is_win, sm.created_at, sm.status, sm.admin_msg_id
@@ -1225,9 +1663,69 @@ def get_slot_wins(status="pending"):
                          JOIN users u ON sm.user_id = u.id 
                          WHERE sm.status = ? ORDER BY sm.created_at DESC''', (status,))
         result = cursor.fetchall()
-        conn.close()
+        # Ждущие выплаты не архивируются — очередь админа читает только основную БД
+        if status != "pending":
+            result = _merge_slot_rows(result, _archived_slot_wins('status = ?', (status,)))
         return result
 
+def _archived_slot_wins(where, params=(), last_column='admin_msg_id'):
+    """
+    Строки slot_machine из архива (app/database/retention.py) в форме выборок get_slot_wins:
+    tg_id и имя — из users, строки удалённых пользователей пропускаются, как при JOIN
+    """
+    rows = retention.archived_slot_rows(where, params)
+    if not rows:
+        return []
+    user_ids = list({row['user_id'] for row in rows if row['user_id'] is not None})
+    users = {}
+    with read_connection() as conn:
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            cursor = conn.execute(f'SELECT id, tg_id, full_name FROM users WHERE id IN ({",".join("?" * len(chunk))})',
+                                  chunk)
+            users.update((row[0], row[1:]) for row in cursor.fetchall())
+    return [(row['id'], row['user_id'], *users[row['user_id']], row['combination'], row['reward_type'],
+             row['reward_amount'], row['is_win'], row['created_at'], row['status'], row[last_column])
+            for row in rows if row['user_id'] in users]
+
+def _merge_slot_rows(live, archived):
+    """Основная выборка и строки архива: без повторов по id (копия в основной БД главнее), новые первыми"""
+    if not archived:
+        return live
+    live_ids = {row[0] for row in live}
+    merged = list(live) + [row for row in archived if row[0] not in live_ids]
+    merged.sort(key=lambda row: row[8] or '', reverse=True)
+    return merged
+
+def get_slot_daily_stats(tg_id, days=30):
+    """
+    Спины пользователя по дням за последние days дней, новые первыми: [(день, спинов, выигрышей)].
+    Складывает основную БД, дневные итоги свёрнутых проигрышей и архив
+    """
+    first = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
+        user = cursor.fetchone()
+        if not user:
+            return []
+        user_id = user[0]
+        cursor.execute('''SELECT id, substr(created_at, 1, 10), is_win FROM slot_machine
+                          WHERE user_id = ? AND created_at >= ?''', (user_id, first))
+        spins = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute('SELECT day, losses FROM slot_daily_stats WHERE user_id = ? AND day >= ?', (user_id, first))
+        rolled_up = cursor.fetchall()
+    for row in retention.archived_slot_rows('user_id = ? AND created_at >= ?', (user_id, first), since=first):
+        spins.setdefault(row['id'], (row['created_at'][:10], row['is_win']))
+    days_stats = {}
+    for day, is_win in spins.values():
+        total, wins = days_stats.get(day, (0, 0))
+        days_stats[day] = (total + 1, wins + bool(is_win))
+    for day, losses in rolled_up:
+        total, wins = days_stats.get(day, (0, 0))
+        days_stats[day] = (total + losses, wins)
+    return [(day, total, wins) for day, (total, wins) in sorted(days_stats.items(), reverse=True)]
+
 def update_slot_win_status(win_id, status, admin_msg_id=None):
     """Обновляет статус выигрыша слот-машины"""
     with db_lock:
@@ -1263,8 +1761,7 @@ def update_slot_win_status_with_extra(win_id, status, extra_data=None, admin_msg
 
 def get_slot_win_by_id(win_id):
     """Получает выигрыш слот-машины по ID"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''SELECT sm.id, sm.user_id, u.tg_id, u.full_name, sm.combination, sm.reward_type,
                          sm.reward_amount, sm.is_win, sm.created_at, sm.status, sm.extra_data
@@ -1272,18 +1769,18 @@ def get_slot_win_by_id(win_id):
                          JOIN users u ON sm.user_id = u.id
                          WHERE sm.id = ?''', (win_id,))
         result = cursor.fetchone()
-        conn.close()
+        if result is None:
+            archived = _archived_slot_wins('id = ?', (win_id,), last_column='extra_data')
+            result = archived[0] if archived else None
         return result
 
 # --- КАЛЕНДАРЬ АКТИВНОСТИ ---
 def get_activity_rewards():
     """Получает все награды активности"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT id, days_required, reward_type, reward_amount, description FROM activity_rewards ORDER BY days_required')
         result = cursor.fetchall()
-        conn.close()
         return result
 
 def add_activity_reward(days_required, reward_type, reward_amount, description):
@@ -1307,22 +1804,61 @@ def delete_activity_reward(reward_id):
 
 def get_user_activity(tg_id, date=None):
     """Получает активность пользователя за определенную дату"""
-    with db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        if date:
-            cursor.execute('''SELECT * FROM activity_calendar 
-                             WHERE user_id = (SELECT id FROM users WHERE tg_id = ?) AND date = ?''', (tg_id, date))
-        else:
-            cursor.execute('''SELECT * FROM activity_calendar 
-                             WHERE user_id = (SELECT id FROM users WHERE tg_id = ?) 
-                             ORDER BY date DESC LIMIT 30''', (tg_id,))
-        result = cursor.fetchall()
-        conn.close()
+    with journal.lock:
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            if date:
+                cursor.execute('''SELECT * FROM activity_calendar 
+                                 WHERE user_id = (SELECT id FROM users WHERE tg_id = ?) AND date = ?''', (tg_id, date))
+            else:
+                cursor.execute('''SELECT * FROM activity_calendar 
+                                 WHERE user_id = (SELECT id FROM users WHERE tg_id = ?) 
+                                 ORDER BY date DESC LIMIT 30''', (tg_id,))
+            result = cursor.fetchall()
+        pending = journal.pending('activity', tg_id)
+    if not pending:
         return result
+    # Отметки из журнала — строки той же формы, id ещё не назначен
+    result += [(None, None, event['date'], event['activity_type'], None, None, 0, event['created_at'])
+               for event in pending if date is None or event['date'] == date]
+    if date is None:
+        result = sorted(result, key=lambda row: row[2] or '', reverse=True)[:30]
+    return result
+
+def _activity_dates_pending(tg_id=None):
+    """Даты отметок активности, ещё не записанных из журнала: {tg_id: {дата, ...}}"""
+    dates = {}
+    for event in journal.pending('activity', tg_id):
+        dates.setdefault(event['tg_id'], set()).add(event['date'])
+    return dates
+
+def _apply_activity(cursor, event):
+    """Отметка активности из журнала; повтор за ту же дату не записывается"""
+    cursor.execute('''INSERT INTO activity_calendar (user_id, date, activity_type, created_at)
+                      SELECT id, ?, ?, ? FROM users u WHERE tg_id = ?
+                      AND NOT EXISTS (SELECT 1 FROM activity_calendar
+                                      WHERE user_id = u.id AND date = ? AND activity_type = ?)''',
+                   (event['date'], event['activity_type'], event['created_at'], event['tg_id'],
+                    event['date'], event['activity_type']))
+
+journal.register('activity', _apply_activity)
 
 def mark_activity(tg_id, date, activity_type="daily"):
-    """Отмечает активность пользователя"""
+    """Отмечает активность пользователя (при запущенном журнале — пачкой через журнал)"""
+    if journal.active:
+        with journal.lock:
+            if any(event['date'] == date and event['activity_type'] == activity_type
+                   for event in journal.pending('activity', tg_id)):
+                return
+            with read_connection() as conn:
+                existing = conn.execute('''SELECT COUNT(*) FROM activity_calendar
+                                           WHERE user_id = (SELECT id FROM users WHERE tg_id = ?)
+                                           AND date = ? AND activity_type = ?''',
+                                        (tg_id, date, activity_type)).fetchone()[0]
+            if existing == 0:
+                journal.append('activity', tg_id=tg_id, date=date, activity_type=activity_type,
+                               created_at=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        return
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1342,57 +1878,91 @@ def mark_activity(tg_id, date, activity_type="daily"):
 
         conn.close()
 
+# Серия считается не глубже года назад
+STREAK_MAX_DAYS = 365
+
+def _streak_window(today=None):
+    """Границы окна дат для подсчёта серии: (самая ранняя дата, сегодня)"""
+    import datetime
+    today = today or datetime.date.today()
+    first = today - datetime.timedelta(days=STREAK_MAX_DAYS - 1)
+    return first.strftime("%Y-%m-%d"), today.strftime("%Y-%m-%d")
+
+def streak_from_dates(dates_desc, today=None):
+    """
+    Текущая серия по датам активности (строки YYYY-MM-DD по убыванию, без повторов).
+    Серия — дни подряд, заканчивающиеся вчера, плюс сегодня, если сегодня есть активность.
+    """
+    import datetime
+    today = today or datetime.date.today()
+    expected = today - datetime.timedelta(days=1)
+    first = today - datetime.timedelta(days=STREAK_MAX_DAYS - 1)
+    streak = 0
+    for date_str in dates_desc:
+        try:
+            day = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            continue
+        if day < first:
+            break
+        if day == today:
+            streak += 1
+        elif day == expected:
+            streak += 1
+            expected -= datetime.timedelta(days=1)
+        elif day < expected:
+            break
+    return streak
+
 def get_user_activity_streak(tg_id):
     """Получает текущую серию активности пользователя (непрерывную)"""
     import datetime
 
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
 
-        # Получаем пользователя
-        cursor.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,))
-        user_result = cursor.fetchone()
-        if not user_result:
-            conn.close()
-            return 0
-
-        user_id = user_result[0]
-        today = datetime.datetime.now()
-        today_str = today.strftime("%Y-%m-%d")
-        streak = 0
-
-        # Сначала проверяем, есть ли активность сегодня
-        cursor.execute('''SELECT COUNT(*) FROM activity_calendar
-                         WHERE user_id = ? AND date = ?''', (user_id, today_str))
-        today_result = cursor.fetchone()
-
-        # Если есть активность сегодня, включаем её в streak
-        if today_result and today_result[0] > 0:
-            streak = 1
-            start_day = 1  # Начинаем проверку с вчерашнего дня
-        else:
-            start_day = 1  # Начинаем проверку с вчерашнего дня
-
-        # Проверяем активность за предыдущие дни подряд
-        for i in range(start_day, 365):  # Максимум год назад
-            check_date = today - datetime.timedelta(days=i)
-            date_str = check_date.strftime("%Y-%m-%d")
-
-            cursor.execute('''SELECT COUNT(*) FROM activity_calendar
-                             WHERE user_id = ? AND date = ?''', (user_id, date_str))
-            result = cursor.fetchone()
+        today = datetime.date.today()
+        first, last = _streak_window(today)
+        # Одна выборка дат за окно вместо запроса на каждый день; отметки из журнала — к ним
+        with journal.lock:
+            cursor.execute('''SELECT DISTINCT a.date FROM activity_calendar a
+                              JOIN users u ON u.id = a.user_id
+                              WHERE u.tg_id = ? AND a.date BETWEEN ? AND ?
+                              ORDER BY a.date DESC''', (tg_id, first, last))
+            dates = [row[0] for row in cursor.fetchall()]
+            pending = _activity_dates_pending(tg_id).get(tg_id)
+        if pending:
+            dates = sorted(set(dates) | {date for date in pending if first <= date <= last}, reverse=True)
+        return streak_from_dates(dates, today)
 
-            if result and result[0] > 0:
-                streak += 1
-            else:
-                break  # Прерываем серию при первом пропуске
-
-        conn.close()
-        return streak
+def get_streaks_for_all_users():
+    """
+    Текущие серии всех пользователей одним запросом: {tg_id: streak}.
+    В словаре только пользователи с активностью за последний год; серия 0 возможна.
+    """
+    import datetime
+    import itertools
+
+    today = datetime.date.today()
+    first, last = _streak_window(today)
+    with journal.lock:
+        with read_connection() as conn:
+            rows = conn.execute('''SELECT u.tg_id, a.date FROM activity_calendar a
+                                    JOIN users u ON u.id = a.user_id
+                                    WHERE a.date BETWEEN ? AND ?
+                                    GROUP BY a.user_id, a.date
+                                    ORDER BY a.user_id, a.date DESC''', (first, last)).fetchall()
+        pending = _activity_dates_pending()
+    dates = {tg_id: [row[1] for row in group] for tg_id, group in itertools.groupby(rows, key=lambda row: row[0])}
+    for tg_id, extra in pending.items():
+        dates[tg_id] = sorted(set(dates.get(tg_id, [])) | {date for date in extra if first <= date <= last},
+                              reverse=True)
+    return {tg_id: streak_from_dates(user_dates, today) for tg_id, user_dates in dates.items()}
 
 def claim_activity_reward(tg_id, reward_id):
     """Получает награду за активность"""
+    # Награда считается по дням в БД — сначала отметки из журнала
+    journal.flush()
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1437,12 +2007,10 @@ def claim_activity_reward(tg_id, reward_id):
 # --- РЕФЕРАЛЬНЫЕ ПРОЦЕНТЫ ---
 def get_user_referral_percent(tg_id):
     """Получает процент рефералов пользователя"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT referral_percent FROM users WHERE tg_id = ?', (tg_id,))
         result = cursor.fetchone()
-        conn.close()
         return result[0] if result else 5.0
 
 def update_user_referral_percent(tg_id, percent):
@@ -1456,14 +2024,12 @@ def update_user_referral_percent(tg_id, percent):
 
 def get_user_by_username(username):
     """Получить пользователя по юзернейму (поиск без учета регистра)"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         # Убираем @ если есть и приводим к нижнему регистру
         clean_username = username.lstrip('@').lower()
         cursor.execute('SELECT id, tg_id, full_name, username, referral_percent FROM users WHERE LOWER(username) = ?', (clean_username,))
         result = cursor.fetchone()
-        conn.close()
         if result:
             return {
                 'id': result[0],
@@ -1522,26 +2088,27 @@ def get_daily_attempts_reset_time():
     return reset_time
 
 def should_reset_daily_attempts(tg_id):
-    """Проверить, нужно ли сбросить дневные попытки"""
+    """Проверить, нужно ли сбросить дневные попытки: последний сброс был до последней границы сброса"""
     import datetime
     last_reset = get_user_slot_spins(tg_id)[1]
     if not last_reset:
         return True
     
-    last_reset_date = datetime.datetime.fromisoformat(last_reset)
-    reset_time = get_daily_attempts_reset_time()
+    # Старые записи хранят только дату — fromisoformat читает её как полночь
+    last_reset_at = datetime.datetime.fromisoformat(last_reset)
+    # get_daily_attempts_reset_time() — следующий сброс, прошедший был на сутки раньше.
+    # Сравниваем время целиком: сброс сегодня до часа сброса тоже устарел
+    previous_reset = get_daily_attempts_reset_time() - datetime.timedelta(days=1)
     
-    return last_reset_date.date() < reset_time.date()
+    return last_reset_at < previous_reset
 
 # --- ПОДЕЛИТЬСЯ ИСТОРИЕЙ ---
 def get_user_share_story_status(tg_id):
     """Получает статус использования истории пользователя"""
-    with db_lock:
-        conn = get_db_connection()
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT share_story_used, share_story_last_reset FROM users WHERE tg_id = ?', (tg_id,))
         result = cursor.fetchone()
-        conn.close()
         return result if result else (0, None)
 
 def use_share_story(tg_id):
@@ -1571,6 +2138,7 @@ def delete_slot_win(win_id):
         cursor.execute('DELETE FROM slot_machine WHERE id = ?', (win_id,))
         conn.commit()
         conn.close()
+    retention.delete_archived('id = ?', (win_id,))
 
 def init_activity_rewards_custom():
     """Инициализация наград календаря активности по новому списку"""
@@ -1600,8 +2168,7 @@ def create_roulette_tables():
     asyncio.run(_create_roulette_tables_async())
 
 async def _create_roulette_tables_async():
-    import aiosqlite
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS roulette_config (
                 id INTEGER PRIMARY KEY,
@@ -1675,8 +2242,7 @@ def init_roulette_configs():
     asyncio.run(_init_roulette_configs_async())
 
 async def _init_roulette_configs_async():
-    import aiosqlite
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         await db.execute("DELETE FROM roulette_config")
         configs = [
             ("🍒🍒🍒", "money", 5, 17.0, "🍒", "5₽"),
@@ -1730,13 +2296,13 @@ def add_ton_to_user(tg_id, ton_amount):
 
 # Асинхронные функции рулетки
 async def get_user_roulette_attempts(user_id: int):
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         cursor = await db.execute("SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?", (user_id,))
         row = await cursor.fetchone()
         return row if row else (0, None)
 
 async def use_roulette_attempt(user_id: int):
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         row = await db.execute("SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?", (user_id,))
         data = await row.fetchone()
         today = datetime.date.today().isoformat()
@@ -1747,7 +2313,7 @@ async def use_roulette_attempt(user_id: int):
         await db.commit()
 
 async def reset_roulette_attempts(user_id: int):
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         today = datetime.date.today().isoformat()
         await db.execute("REPLACE INTO roulette_attempts (user_id, attempts_used, last_reset) VALUES (?, ?, ?)", (user_id, 0, today))
         await db.commit()
@@ -1757,7 +2323,7 @@ async def add_referral_bonus_for_order_async(user_id: int, order_amount: float,
     Асинхронно начисляет реферальный бонус пригласившему за подтвержденный заказ
     """
     try:
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Получаем профиль пользователя
             cursor = await db.execute('SELECT referrer_id FROM users WHERE id = ?', (user_id,))
             user_row = await cursor.fetchone()
@@ -1810,7 +2376,7 @@ async def check_referral_attempts_given_async(user_id: int, referrer_id: int) ->
     Асинхронно проверяет, были ли уже начислены попытки за этого реферала
     """
     try:
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Проверяем, было ли уже начисление
             cursor = await db.execute('SELECT id FROM referral_attempts_given WHERE referrer_id = ? AND referred_user_id = ?', 
                                      (referrer_id, user_id))
@@ -1827,7 +2393,7 @@ async def mark_referral_attempts_given_async(user_id: int, referrer_id: int, att
     Асинхронно отмечает, что попытки за этого реферала уже были начислены
     """
     try:
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Записываем начисление
             await db.execute('''
                 INSERT OR REPLACE INTO referral_attempts_given 
@@ -1901,6 +2467,8 @@ def check_and_reset_activity_streak(user_id):
 
 def clear_all_calendar_data():
     """Очищает всю историю активности пользователей (таблица activity_calendar)"""
+    # Иначе отметки из журнала запишутся уже после очистки
+    journal.flush()
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1921,14 +2489,19 @@ def clear_all_activity_prizes():
 
 def clear_all_slot_data():
     """Очищает всю историю выигрышей и спинов слот-машины (таблица slot_machine)"""
+    # Иначе отметки из журнала запишутся уже после очистки
+    journal.flush()
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM slot_machine')
+        cursor.execute('DELETE FROM slot_user_stats')
+        cursor.execute('DELETE FROM slot_daily_stats')
         cursor.execute('UPDATE users SET slot_spins_used = 0, slot_last_reset = NULL')
         conn.commit()
         conn.close()
-        return True
+    retention.clear_archives()
+    return True
 
 def clear_all_slot_prizes():
     """Очищает все призы слот-машины (таблица slot_config)"""
@@ -1938,7 +2511,8 @@ def clear_all_slot_prizes():
         cursor.execute('DELETE FROM slot_config')
         conn.commit()
         conn.close()
-        return True
+    _slot_configs_changed()
+    return True
 
 def reset_all_prizes():
     """Восстанавливает все призы слот-машины и активности"""
@@ -1994,11 +2568,13 @@ def reset_all_prizes():
             return False
         finally:
             conn.close()
+            _slot_configs_changed()
 
 def delete_user_everywhere_full(tg_id):
     """
     Полностью удаляет пользователя и все связанные с ним данные из всех таблиц
     """
+    journal.flush()
     with db_lock:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -2020,6 +2596,9 @@ def delete_user_everywhere_full(tg_id):
             # Дополнительные таблицы (проверяем существование)
             try:
                 cursor.execute('DELETE FROM slot_machine WHERE user_id=?', (user_id,))
+                cursor.execute('DELETE FROM slot_user_stats WHERE user_id=?', (user_id,))
+                cursor.execute('DELETE FROM slot_daily_stats WHERE user_id=?', (user_id,))
+                retention.delete_archived('user_id = ?', (user_id,))
             except sqlite3.OperationalError:
                 pass  # Таблица не существует
 
@@ -2059,7 +2638,7 @@ def delete_user_everywhere_full(tg_id):
 
 async def get_referral_attempts(user_id: int) -> int:
     """Возвращает текущее количество использованных попыток (может быть отрицательным)"""
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         row = await db.execute("SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?", (user_id,))
         data = await row.fetchone()
         return data[0] if data else 0
@@ -2069,13 +2648,12 @@ async def inc_referral_attempts(user_id: int, attempts: int = 2, db=None):
     Инкрементирует попытки пригласившему пользователю (делает attempts_used более отрицательным)
     :param user_id: ID пользователя
     :param attempts: Сколько попыток добавить (по умолчанию 2)
-    :param db: (опционально) открытое соединение aiosqlite.Connection
+    :param db: (опционально) открытое соединение aiosqlite (connect_async)
     """
     try:
         close_db = False
         if db is None:
-            import aiosqlite
-            db = await aiosqlite.connect('data/users.db')
+            db = await connect_async('data/users.db')
             close_db = True
         
         cursor = await db.execute("SELECT attempts_used, last_reset FROM roulette_attempts WHERE user_id = ?", (user_id,))
@@ -2106,7 +2684,7 @@ async def get_unclaimed_referrals_count(referrer_id: int) -> int:
     Возвращает количество неактивированных рефералов для пользователя
     """
     try:
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Получаем всех рефералов пользователя
             cursor = await db.execute('SELECT id FROM users WHERE referrer_id = ?', (referrer_id,))
             all_referrals = await cursor.fetchall()
@@ -2141,8 +2719,7 @@ async def claim_referral_bonus(referrer_id: int) -> tuple[bool, int, int]:
     Возвращает: (успех, количество активированных рефералов, общее количество попыток)
     """
     try:
-        import aiosqlite
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Получаем всех рефералов пользователя
             cursor = await db.execute('SELECT id FROM users WHERE referrer_id = ?', (referrer_id,))
             all_referrals = await cursor.fetchall()
@@ -2186,7 +2763,7 @@ async def claim_referral_bonus(referrer_id: int) -> tuple[bool, int, int]:
         return False, 0, 0
 
 async def get_roulette_configs():
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         cursor = await db.execute('SELECT id, combination, reward_type, reward_amount, chance_percent, emoji, name FROM roulette_config ORDER BY chance_percent DESC')
         result = await cursor.fetchall()
         return result
@@ -2232,7 +2809,7 @@ def update_order_status(order_id, status=None, admin_msg_id=None, extra_data=Non
 
 async def get_slot_wins_async(user_id=None, status=None):
     """Асинхронно получает выигрыши слот-машины из БД"""
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         if user_id is not None and status is not None:
             # Фильтр по user_id и статусу
             query = '''SELECT sm.id, sm.user_id, u.tg_id, u.full_name, sm.combination, sm.reward_type,
@@ -2266,7 +2843,28 @@ async def get_slot_wins_async(user_id=None, status=None):
                        ORDER BY sm.created_at DESC'''
             cursor = await db.execute(query)
 
-        return await cursor.fetchall()
+        result = await cursor.fetchall()
+    # История из архива; ждущие выплаты не архивируются
+    if status == "pending" or not retention.archive_files():
+        return result
+    from . import aio
+    archived = await aio.run_read(_archived_slot_wins_of, user_id, status)
+    return _merge_slot_rows(result, archived)
+
+def _archived_slot_wins_of(tg_id=None, status=None):
+    """Строки архива с фильтрами get_slot_wins_async"""
+    where, params = [], []
+    if tg_id is not None:
+        with read_connection() as conn:
+            user = conn.execute('SELECT id FROM users WHERE tg_id = ?', (tg_id,)).fetchone()
+        if not user:
+            return []
+        where.append('user_id = ?')
+        params.append(user[0])
+    if status is not None:
+        where.append('status = ?')
+        params.append(status)
+    return _archived_slot_wins(' AND '.join(where) or '1', tuple(params))
 
 # Пример использования:
 # await add_slot_attempts(123456789, 5)  # Добавить 5 попыток пользователю с ID 123456789
@@ -2279,11 +2877,13 @@ __all__ = [
     'get_flag',
     'set_flag',
     'get_admin_setting',
+    'get_settings_cache_stats',
     'add_stars_to_user',
     'add_ton_to_user',
     'add_ton_slot_win',
     'reset_user_activity',
     'check_and_reset_activity_streak',
+    'get_streaks_for_all_users',
     'get_user_roulette_attempts',
     'use_roulette_attempt',
     'reset_roulette_attempts',
@@ -0,0 +1,312 @@
+"""
+Пул соединений SQLite
+
+Одно долгоживущее соединение для записи и небольшой пул соединений для чтения.
+Соединения не открываются заново на каждый вызов: close() у выданного
+соединения возвращает его в пул, а не закрывает файл БД.
+
+Курсоры выданных соединений и aiosqlite-соединения connect_async() записывают
+каждый запрос со временем выполнения в трассу текущего обновления (app/tracing.py).
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from typing import Optional
+
+import aiosqlite
+
+from app.config import DB_PATH, DB_READERS, DB_TIMEOUT
+from app.tracing import record_sql
+from .profile import apply_profile
+
+logger = logging.getLogger(__name__)
+
+
+class StatementCounter:
+    """
+    Число SQL-запросов по всем соединениям пулов (trace callback sqlite3): бенчмарки
+    и метрики. Считается всё, что выполнил SQLite, включая BEGIN/COMMIT и тела триггеров;
+    commits — отдельно число COMMIT (каждый — запись в WAL и синхронизация)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.commits = 0
+
+    def __call__(self, sql: str):
+        with self._lock:
+            self.count += 1
+            if sql.startswith('COMMIT'):
+                self.commits += 1
+
+
+statement_counter = StatementCounter()
+
+
+class TracedCursor:
+    """Курсор sqlite3: время запроса и выборки строк — в трассу обновления"""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self._cursor = cursor
+        self._sql = ''
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _run(self, method, sql: str, *args):
+        self._sql = sql
+        started = time.perf_counter()
+        try:
+            method(sql, *args)
+        finally:
+            record_sql(sql, time.perf_counter() - started)
+        return self
+
+    def execute(self, sql: str, parameters=()):
+        return self._run(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self._run(self._cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):
+        return self._run(self._cursor.executescript, sql_script)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            # Для SELECT основная работа SQLite часто идёт при выборке строк, а не в execute
+            record_sql(self._sql, time.perf_counter() - started, statement=False)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+
+
+class PooledConnection:
+    """Соединение, выданное пулом. close() возвращает его в пул"""
+
+    def __init__(self, conn: sqlite3.Connection, release):
+        self._conn = conn
+        # finalize гарантирует возврат соединения, даже если close() не был вызван
+        # (например, функция упала с исключением до conn.close())
+        self._finalizer = weakref.finalize(self, release, conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self) -> TracedCursor:
+        return TracedCursor(self._conn.cursor())
+
+    def execute(self, sql: str, parameters=()) -> TracedCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> TracedCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str) -> TracedCursor:
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            self._conn.commit()
+        finally:
+            record_sql('COMMIT', time.perf_counter() - started)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self):
+        """Возвращает соединение в пул (повторный вызов ничего не делает)"""
+        self._finalizer()
+
+
+class ConnectionPool:
+    """
+    Пул соединений к одному файлу БД.
+
+    writer() — общее соединение для записи. Сериализация записи остаётся за
+    вызывающим кодом (db_lock в models), вложенные вызовы получают то же
+    соединение. Незакоммиченная транзакция откатывается, когда закрывается
+    последнее выданное соединение — как при закрытии отдельного sqlite3.connect.
+
+    reader() — соединение только для чтения (PRAGMA query_only), до `readers`
+    штук; при исчерпании пула вызывающий ждёт освобождения соединения.
+
+    К каждому новому соединению применяется профиль PRAGMA (см. profile.py),
+    profile=None — профиль из конфига.
+    """
+
+    def __init__(self, path: str = DB_PATH, readers: int = DB_READERS, timeout: float = DB_TIMEOUT,
+                 profile: Optional[dict] = None):
+        self.path = path
+        self.readers = max(1, readers)
+        self.timeout = timeout
+        self.profile = profile
+        self._state_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_leases = 0
+        self._idle_readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers = []
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        apply_profile(conn, self.profile, readonly=readonly)
+        conn.set_trace_callback(statement_counter)
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    # --- запись ---
+    def writer(self) -> PooledConnection:
+        with self._state_lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            self._writer_leases += 1
+            conn = self._writer
+        return PooledConnection(conn, self._release_writer)
+
+    def _release_writer(self, conn: sqlite3.Connection):
+        with self._state_lock:
+            self._writer_leases = max(0, self._writer_leases - 1)
+            last = self._writer_leases == 0 and conn is self._writer
+        if last and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error as e:
+                logger.error(f"[DB] Ошибка отката незавершённой транзакции: {e}")
+
+    def rollback_writer(self):
+        """Откатывает незавершённую транзакцию соединения для записи (вызывать под db_lock)"""
+        with self._state_lock:
+            conn = self._writer
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+
+    # --- чтение ---
+    def reader(self) -> PooledConnection:
+        try:
+            conn = self._idle_readers.get_nowait()
+        except queue.Empty:
+            with self._state_lock:
+                create = len(self._all_readers) < self.readers
+                if create:
+                    conn = self._connect(readonly=True)
+                    self._all_readers.append(conn)
+            if not create:
+                try:
+                    conn = self._idle_readers.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError("Нет свободных соединений для чтения") from None
+        return PooledConnection(conn, self._release_reader)
+
+    def _release_reader(self, conn: sqlite3.Connection):
+        if conn not in self._all_readers:
+            return  # пул был закрыт, пока соединение было выдано
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle_readers.put(conn)
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'writer_open': self._writer is not None,
+            'writer_leases': self._writer_leases,
+            'readers_open': len(self._all_readers),
+            'readers_idle': self._idle_readers.qsize(),
+            'readers_max': self.readers,
+        }
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        with self._state_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._writer_leases = 0
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers = []
+            self._idle_readers = queue.LifoQueue()
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Возвращает общий пул соединений (создаётся при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def configure_pool(path: str = DB_PATH, readers: int = DB_READERS, timeout: float = DB_TIMEOUT,
+                   profile: Optional[dict] = None) -> ConnectionPool:
+    """Пересоздаёт общий пул (другой файл БД, размер пула, профиль). Старые соединения закрываются"""
+    global _pool
+    with _pool_lock:
+        old = _pool
+        _pool = ConnectionPool(path, readers, timeout, profile)
+        if old is not None:
+            old.close()
+    return _pool
+
+
+# Методы sqlite3, которые aiosqlite выполняет в своём потоке: запросы и выборка строк
+_ASYNC_STATEMENTS = ('execute', 'executemany', 'executescript', '_execute_fetchall', '_execute_insert')
+_ASYNC_FETCHES = ('fetchone', 'fetchmany', 'fetchall')
+
+
+class TracedAsyncConnection(aiosqlite.Connection):
+    """aiosqlite-соединение: время запросов и выборки строк — в трассу обновления"""
+
+    async def _execute(self, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super()._execute(fn, *args, **kwargs)
+        finally:
+            name = getattr(fn, '__name__', '')
+            if name in _ASYNC_STATEMENTS and args:
+                record_sql(args[0], time.perf_counter() - started)
+            elif name == 'commit':
+                record_sql('COMMIT', time.perf_counter() - started)
+            elif name in _ASYNC_FETCHES:
+                record_sql('', time.perf_counter() - started, statement=False)
+
+
+def connect_async(database: str = DB_PATH, iter_chunk_size: int = 64, **kwargs) -> TracedAsyncConnection:
+    """Как aiosqlite.connect, но запросы видны в трассе обновления и в statement_counter"""
+
+    def connector() -> sqlite3.Connection:
+        conn = sqlite3.connect(database, **kwargs)
+        conn.set_trace_callback(statement_counter)
+        return conn
+
+    return TracedAsyncConnection(connector, iter_chunk_size)
@@ -0,0 +1,114 @@
+"""
+Профиль SQLite: PRAGMA, применяемые к каждому соединению, и обслуживание БД
+
+Значения берутся из DB_PROFILE в app.config (переменные окружения DB_JOURNAL_MODE,
+DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_TEMP_STORE, DB_BUSY_TIMEOUT).
+"""
+import asyncio
+import logging
+import sqlite3
+from typing import Optional
+
+from app.config import DB_PROFILE, DB_MAINTENANCE_INTERVAL, DB_CHECKPOINT_MODE
+
+logger = logging.getLogger(__name__)
+
+# Порядок важен: busy_timeout должен действовать уже при смене journal_mode
+PROFILE_PRAGMAS = ('busy_timeout', 'journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+# journal_mode хранится в самом файле БД, его меняет только соединение для записи
+_WRITER_ONLY_PRAGMAS = ('journal_mode',)
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+
+def _pragma_value(name: str, value) -> str:
+    """Проверяет значение PRAGMA: только целые числа и слова (значения приходят из окружения)"""
+    text = str(value).strip()
+    if text.lstrip('-').isdigit() or text.isalpha():
+        return text
+    raise ValueError(f"Недопустимое значение PRAGMA {name}: {value!r}")
+
+
+def apply_profile(conn: sqlite3.Connection, profile: Optional[dict] = None, readonly: bool = False):
+    """Применяет PRAGMA профиля к соединению"""
+    profile = DB_PROFILE if profile is None else profile
+    for name in PROFILE_PRAGMAS:
+        if name not in profile or profile[name] is None:
+            continue
+        if readonly and name in _WRITER_ONLY_PRAGMAS:
+            continue
+        conn.execute(f"PRAGMA {name} = {_pragma_value(name, profile[name])}")
+
+
+def effective_settings(conn: sqlite3.Connection) -> dict:
+    """Возвращает фактические значения PRAGMA профиля для соединения"""
+    settings = {}
+    for name in PROFILE_PRAGMAS:
+        row = conn.execute(f"PRAGMA {name}").fetchone()
+        settings[name] = row[0] if row else None
+    return settings
+
+
+def profile_report(conn: sqlite3.Connection, profile: Optional[dict] = None) -> str:
+    """Отчёт для лога при старте: запрошенное и фактическое значение каждой настройки"""
+    profile = DB_PROFILE if profile is None else profile
+    lines = ["[DB] Профиль SQLite:"]
+    for name, actual in effective_settings(conn).items():
+        wanted = profile.get(name)
+        mark = "" if wanted is None or str(wanted).lower() == str(actual).lower() else f" (запрошено {wanted})"
+        lines.append(f"  {name} = {actual}{mark}")
+    return "\n".join(lines)
+
+
+def log_profile_report():
+    """Пишет в лог фактические настройки соединения для записи"""
+    from .models import db_lock, get_db_connection
+
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            report = profile_report(conn)
+        finally:
+            conn.close()
+    logger.info(report)
+
+
+def run_maintenance(mode: str = DB_CHECKPOINT_MODE) -> dict:
+    """
+    Перенос WAL в основной файл (wal_checkpoint) и PRAGMA optimize.
+    Возвращает {'busy', 'log_frames', 'checkpointed'} из wal_checkpoint.
+    """
+    from .models import db_lock, get_db_connection
+
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Неизвестный режим wal_checkpoint: {mode}")
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            # optimize может записать статистику (ANALYZE) — до checkpoint, чтобы она не осталась в WAL
+            conn.execute("PRAGMA optimize")
+            busy, log_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        finally:
+            conn.close()
+    return {'busy': busy, 'log_frames': log_frames, 'checkpointed': checkpointed}
+
+
+async def maintenance_loop(interval: int = DB_MAINTENANCE_INTERVAL):
+    """Фоновая задача: периодический wal_checkpoint/optimize (при нескольких процессах — в одном)"""
+    from . import aio
+    from app.utils.coordination import coordinator, LockNotAcquired
+
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with coordinator.lock('db_maintenance'):
+                result = await aio.run_write(run_maintenance)
+            logger.info(f"[DB] wal_checkpoint: {result}")
+        except LockNotAcquired:
+            pass
+        except Exception as e:
+            logger.error(f"[DB] Ошибка обслуживания БД: {e}")
@@ -0,0 +1,293 @@
+"""
+Аудит планов запросов models.py
+
+Находит в исходнике models.py все SQL-запросы (строковые литералы и f-строки
+SELECT/INSERT/UPDATE/DELETE/REPLACE/WITH), выполняет для каждого EXPLAIN QUERY PLAN
+на указанной БД и сообщает о полных просмотрах (SCAN) таблиц, в которых больше
+min_rows строк. f-строки собираются целиком: локальные переменные со строками
+подставляются всеми вариантами, прочие выражения — из SQL_FRAGMENTS.
+
+Запуск:
+    python -m app.database.query_audit --db data/users.db --min-rows 1000
+
+Код возврата 1, если найдены полные просмотры вне ALLOWED_FULL_SCANS или запросы,
+которые не удалось разобрать (кроме ALLOWED_MISSING_TABLES и ALLOWED_ERRORS).
+"""
+import argparse
+import ast
+import itertools
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.config import DB_PATH, QUERY_AUDIT_MIN_ROWS
+
+MODELS_PATH = Path(__file__).with_name('models.py')
+
+_SQL_START = re.compile(r'^(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\s', re.IGNORECASE)
+
+# Функции, которым полный просмотр нужен по смыслу: выгрузка или очистка всей таблицы,
+# разовые миграции
+ALLOWED_FULL_SCANS = {
+    'migrate_users_table', 'migrate_orders_table', 'migrate_reviews_table',
+    'get_all_users', 'get_all_orders', 'get_all_reviews', 'get_all_support_tickets',
+    'get_all_admin_settings', 'get_slot_configs', 'get_activity_rewards',
+    'get_slot_wins_async', 'get_roulette_configs', 'get_streaks_for_all_users',
+    'clear_all_withdrawals_and_frozen', 'clear_all_orders', 'clear_all_reviews',
+    'clear_all_support_tickets', 'clear_all_calendar_data', 'clear_all_activity_prizes',
+    'clear_all_slot_data', 'clear_all_slot_prizes', 'reset_all_prizes',
+    'reset_slot_spins', 'reset_share_story',
+}
+
+# Таблицы, которых в схеме init_db нет: к ним обращаются старый код в try/except
+# и сама миграция users (users_new живёт только внутри неё)
+ALLOWED_MISSING_TABLES = {'user_activity', 'roulette_history', 'users_new'}
+# Прочие ошибки разбора, которые код ловит сам: (функция, ошибка)
+ALLOWED_ERRORS = {
+    # activity_rewards — награды по дням без user_id, удаление в try/except ничего не делает
+    ('delete_user_everywhere_full', 'no such column: user_id'),
+}
+
+# Подстановки для выражений в f-строках SQL: (функция, выражение) -> варианты фрагмента.
+# Локальные переменные, которым в той же функции присваиваются строки, подставляются сами
+SQL_FRAGMENTS = {
+    ('migrate_users_table', 'fields_str'): ['id, tg_id, full_name, username, reg_date, balance, frozen, referrer_id'],
+    # get_orders_page: без фильтров, каждый фильтр и типичные сочетания с keyset по id
+    ('get_orders_page', "' AND '.join(conditions)"): [
+        'status = ?', 'order_type = ?', 'status = ? AND order_type = ?',
+        'user_id IN (SELECT id FROM users WHERE tg_id = ?)',
+        'created_at >= ? AND created_at < ?', 'id > ?', 'id < ?', 'status = ? AND id < ?',
+    ],
+    ('update_review_status', "', '.join(updates)"): ['status = ?, admin_msg_id = ?, channel_msg_id = ?'],
+    ('update_support_ticket_status', "', '.join(fields)"): ['status=?, reply=?, replied_at=?, channel_msg_id=?'],
+    ('update_order_status', "', '.join(updates)"): ['status = ?, admin_msg_id = ?, extra_data = ?'],
+    ('_archived_slot_wins', "','.join('?' * len(chunk))"): ['?,?,?'],
+}
+
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_NOT_ALIAS = {
+    'WHERE', 'JOIN', 'ON', 'ORDER', 'GROUP', 'LIMIT', 'LEFT', 'INNER', 'CROSS', 'SET',
+    'VALUES', 'USING', 'HAVING', 'UNION', 'SELECT', 'AND', 'OR', 'DEFAULT',
+}
+_SCAN = re.compile(r'^SCAN (\w+)')
+_UNBOUNDED = re.compile(r'\b(?:WHERE|JOIN|GROUP\s+BY)\b', re.IGNORECASE)
+_LIMIT = re.compile(r'\bLIMIT\s+(?:\?|\d+)(?:\s+OFFSET\s+(?:\?|\d+))?\s*$', re.IGNORECASE)
+_MISSING_TABLE = re.compile(r'^no such table: (\w+)$')
+
+
+class Statement:
+    """SQL-запрос из исходника models.py; error — почему f-строку не удалось собрать"""
+
+    def __init__(self, function: Optional[str], lineno: int, sql: str, error: Optional[str] = None):
+        self.function = function
+        self.lineno = lineno
+        self.sql = sql
+        self.error = error
+
+    def __repr__(self):
+        return f"<Statement {self.function}:{self.lineno}>"
+
+
+class _Unrendered(Exception):
+    """Выражению в f-строке нечего подставить"""
+
+
+def _string_assignments(function_node) -> Dict[str, list]:
+    """Присваивания локальным переменным функции: имя -> узлы значений"""
+    assignments: Dict[str, list] = {}
+    for node in ast.walk(function_node):
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            assignments.setdefault(node.targets[0].id, []).append(node.value)
+    return assignments
+
+
+def _render(node, function: Optional[str], assignments: Dict[str, list], depth: int = 0) -> List[str]:
+    """Все варианты строки, которую даёт узел (литерал, f-строка, условное выражение)"""
+    if depth > 10:
+        raise _Unrendered(ast.unparse(node))
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.IfExp):
+        return (_render(node.body, function, assignments, depth + 1)
+                + _render(node.orelse, function, assignments, depth + 1))
+    if isinstance(node, ast.JoinedStr):
+        parts = [_render(value, function, assignments, depth + 1) for value in node.values]
+        return list(dict.fromkeys(''.join(combo) for combo in itertools.product(*parts)))
+    if isinstance(node, ast.FormattedValue):
+        source = ast.unparse(node.value)
+        if (function, source) in SQL_FRAGMENTS:
+            return list(SQL_FRAGMENTS[(function, source)])
+        if isinstance(node.value, ast.Name) and node.value.id in assignments:
+            variants = []
+            for value in assignments[node.value.id]:
+                variants += _render(value, function, assignments, depth + 1)
+            return list(dict.fromkeys(variants))
+        raise _Unrendered(source)
+    raise _Unrendered(ast.unparse(node))
+
+
+def _is_sql_fstring(node) -> bool:
+    head = node.values[0] if node.values else None
+    return (isinstance(head, ast.Constant) and isinstance(head.value, str)
+            and bool(_SQL_START.match(head.value.lstrip())))
+
+
+def collect_statements(path: Path = MODELS_PATH) -> List[Statement]:
+    """
+    Собирает все SQL-запросы из файла с указанием функции и строки.
+    f-строка даёт по запросу на каждый вариант подстановки; если подставить
+    нечего, запрос возвращается с error и аудит считает его пропущенным.
+    """
+    tree = ast.parse(Path(path).read_text(encoding='utf-8'))
+    statements = []
+    seen = set()
+
+    def add(function, lineno, sql, error=None):
+        sql = sql.strip()
+        if (lineno, sql) not in seen:
+            seen.add((lineno, sql))
+            statements.append(Statement(function, lineno, sql, error))
+
+    def visit(node, function, assignments):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                visit(child, child.name, _string_assignments(child))
+                continue
+            if isinstance(child, ast.JoinedStr):
+                if _is_sql_fstring(child):
+                    try:
+                        for sql in _render(child, function, assignments):
+                            add(function, child.lineno, sql)
+                    except _Unrendered as e:
+                        add(function, child.lineno, ast.unparse(child), f"нет подстановки для {{{e}}}")
+                continue
+            if isinstance(child, ast.Constant) and isinstance(child.value, str):
+                if _SQL_START.match(child.value.strip()):
+                    add(function, child.lineno, child.value)
+            visit(child, function, assignments)
+
+    visit(tree, None, {})
+    return statements
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """Сопоставляет псевдонимы таблиц (sm, u, w) с именами таблиц"""
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in _NOT_ALIAS:
+            aliases[alias] = table
+    return aliases
+
+
+def bounded_scan(sql: str, plan: List[str]) -> bool:
+    """
+    Просмотр без условий по порядку индекса с LIMIT в конце: SQLite останавливается
+    после LIMIT (+ OFFSET) строк, сколько бы их ни было в таблице. С WHERE, JOIN,
+    GROUP BY или сортировкой во временном B-дереве это уже не так.
+    """
+    return (bool(_LIMIT.search(sql)) and not _UNBOUNDED.search(sql)
+            and not any(detail.startswith('USE TEMP B-TREE') for detail in plan))
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """Возвращает строки EXPLAIN QUERY PLAN (параметры подставляются как NULL)"""
+    params = (None,) * sql.count('?')
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def audit(conn: sqlite3.Connection, min_rows: int = QUERY_AUDIT_MIN_ROWS,
+          statements: Optional[List[Statement]] = None,
+          allowed: Optional[set] = None) -> dict:
+    """
+    Проверяет запросы и возвращает {'checked', 'skipped', 'expected', 'bounded', 'allowed', 'violations'}.
+    violations / allowed / bounded — списки (statement, table, rows, detail),
+    bounded — просмотры, которые читают не больше LIMIT + OFFSET строк (см. bounded_scan),
+    skipped — (statement, error) для запросов, которые не удалось собрать или разобрать,
+    expected — такие же пары для ошибок из ALLOWED_MISSING_TABLES и ALLOWED_ERRORS.
+    """
+    statements = collect_statements() if statements is None else statements
+    allowed = ALLOWED_FULL_SCANS if allowed is None else allowed
+    row_counts: Dict[str, int] = {}
+    report = {'checked': 0, 'skipped': [], 'expected': [], 'bounded': [],
+              'allowed': [], 'violations': []}
+
+    def count_rows(table):
+        if table not in row_counts:
+            row_counts[table] = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        return row_counts[table]
+
+    for statement in statements:
+        if statement.error:
+            report['skipped'].append((statement, statement.error))
+            continue
+        try:
+            plan = explain(conn, statement.sql)
+        except sqlite3.Error as e:
+            missing = _MISSING_TABLE.match(str(e))
+            expected = ((missing and missing.group(1) in ALLOWED_MISSING_TABLES)
+                        or (statement.function, str(e)) in ALLOWED_ERRORS)
+            report['expected' if expected else 'skipped'].append((statement, str(e)))
+            continue
+        report['checked'] += 1
+        aliases = table_aliases(statement.sql)
+        for detail in plan:
+            match = _SCAN.match(detail)
+            if not match or match.group(1) in ('CONSTANT', 'SUBQUERY'):
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if table.startswith('sqlite_'):
+                continue
+            try:
+                rows = count_rows(table)
+            except sqlite3.Error:
+                continue
+            if rows <= min_rows:
+                continue
+            if bounded_scan(statement.sql, plan):
+                target = 'bounded'
+            else:
+                target = 'allowed' if statement.function in allowed else 'violations'
+            report[target].append((statement, table, rows, detail))
+    return report
+
+
+def format_report(report: dict, min_rows: int) -> str:
+    lines = [f"[AUDIT] Проверено запросов: {report['checked']}, пропущено: {len(report['skipped'])}, "
+             f"ожидаемых ошибок: {len(report['expected'])}, порог строк: {min_rows}"]
+    for statement, table, rows, detail in report['violations']:
+        lines.append(f"  ❌ {statement.function}:{statement.lineno} — {detail} ({table}: {rows} строк)")
+    for statement, table, rows, detail in report['allowed']:
+        lines.append(f"  ⚪ {statement.function}:{statement.lineno} — {detail} ({table}: {rows} строк, допустимо)")
+    for statement, table, rows, detail in report['bounded']:
+        lines.append(f"  ⚪ {statement.function}:{statement.lineno} — {detail} ({table}: {rows} строк, не больше LIMIT + OFFSET)")
+    for statement, error in report['skipped']:
+        lines.append(f"  ⏭ {statement.function}:{statement.lineno} — {error}")
+    if not report['violations']:
+        lines.append("[AUDIT] Полных просмотров больших таблиц не найдено")
+    if report['skipped']:
+        lines.append("[AUDIT] Есть запросы, которые не удалось проверить")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN для всех запросов models.py")
+    parser.add_argument('--db', default=DB_PATH, help="файл БД (по умолчанию DB_PATH)")
+    parser.add_argument('--min-rows', type=int, default=QUERY_AUDIT_MIN_ROWS,
+                        help="полный просмотр таблицы с большим числом строк считается ошибкой")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(f'file:{args.db}?mode=ro', uri=True)
+    try:
+        report = audit(conn, args.min_rows)
+    finally:
+        conn.close()
+    print(format_report(report, args.min_rows))
+    return 1 if report['violations'] or report['skipped'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""
+Хранение истории спинов slot_machine: дневные итоги, архив по месяцам, сжатие БД
+
+Каждый спин — строка slot_machine, и без очистки таблица растёт без конца.
+Проход run_retention():
+  1. проигрыши старше SLOT_LOSS_RETENTION_DAYS сворачиваются в slot_daily_stats
+     (пользователь, день, число проигрышей) и удаляются — кроме комбинации в них
+     ничего нет;
+  2. остальные строки старше SLOT_ARCHIVE_DAYS переносятся в архив
+     SLOT_ARCHIVE_DIR/slot_machine_YYYY-MM.db (месяц по created_at) с теми же id.
+     Выигрыши, ждущие выплаты (status pending), остаются в основной БД;
+  3. ANALYZE (PRAGMA optimize) и VACUUM, если свободных страниц больше
+     DB_VACUUM_FREE_RATIO.
+Проход выключен по умолчанию (SLOT_RETENTION_INTERVAL=0) и включается явно.
+Свёртка необратима: от проигрыша остаётся только счётчик за день, сами строки
+(комбинация, время) не восстановить; архивные строки остаются в файлах архива.
+
+Строки переносятся пачками по SLOT_RETENTION_BATCH, каждая — своя транзакция под
+db_lock. Архив записывается раньше удаления из основной БД: после падения строка
+может оказаться в обоих местах, но не потеряется; чтение берёт основную копию.
+
+Чтение истории в models (get_slot_wins, get_slot_wins_async, get_slot_win_by_id,
+get_slot_daily_stats) дополняет выборку строками архива через archived_slot_rows();
+список файлов архива кэшируется до изменения каталога, выборка за период открывает
+только файлы нужных месяцев.
+Сводная статистика пользователя (slot_user_stats) от очистки не зависит.
+"""
+import asyncio
+import datetime
+import glob
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.config import (
+    SLOT_LOSS_RETENTION_DAYS, SLOT_ARCHIVE_DAYS, SLOT_ARCHIVE_DIR, SLOT_RETENTION_INTERVAL,
+    SLOT_RETENTION_BATCH, DB_VACUUM_FREE_RATIO,
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'combination', 'reward_type', 'reward_amount', 'is_win',
+                   'created_at', 'status', 'admin_msg_id', 'extra_data')
+_SELECT_COLUMNS = ', '.join(ARCHIVE_COLUMNS)
+_ARCHIVE_SCHEMA = '''CREATE TABLE IF NOT EXISTS slot_machine (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    combination TEXT,
+    reward_type TEXT,
+    reward_amount REAL,
+    is_win BOOLEAN,
+    created_at TEXT,
+    status TEXT,
+    admin_msg_id INTEGER,
+    extra_data TEXT
+)'''
+_ARCHIVE_INDEX = 'CREATE INDEX IF NOT EXISTS idx_slot_machine_user ON slot_machine(user_id, created_at)'
+
+
+def archive_path(month: str, directory: Optional[str] = None) -> str:
+    """Файл архива за месяц YYYY-MM (каталог по умолчанию — SLOT_ARCHIVE_DIR)"""
+    return os.path.join(directory or SLOT_ARCHIVE_DIR, f"slot_machine_{month}.db")
+
+
+# каталог -> (mtime каталога в нс, файлы архива); сверяется с mtime при каждом обращении,
+# так что файлы, созданные другим процессом, тоже видны
+_archive_listing: Dict[str, Tuple[int, List[str]]] = {}
+# Листинг каталога, изменённого меньше секунды назад, не кэшируется: на ФС с грубым
+# временем новый файл мог появиться, не изменив mtime
+_LISTING_SETTLE_NS = 1_000_000_000
+
+
+def archive_files(directory: Optional[str] = None) -> List[str]:
+    """Файлы архива, новые первыми"""
+    directory = directory or SLOT_ARCHIVE_DIR
+    try:
+        mtime = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    cached = _archive_listing.get(directory)
+    if cached and cached[0] == mtime:
+        return list(cached[1])
+    files = sorted(glob.glob(os.path.join(directory, 'slot_machine_*.db')), reverse=True)
+    if time.time_ns() - mtime > _LISTING_SETTLE_NS:
+        _archive_listing[directory] = (mtime, files)
+    return list(files)
+
+
+def archive_month(path: str) -> str:
+    """Месяц YYYY-MM файла архива"""
+    return os.path.basename(path)[len('slot_machine_'):-len('.db')]
+
+
+def _open_archive(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute(_ARCHIVE_SCHEMA)
+    conn.execute(_ARCHIVE_INDEX)
+    return conn
+
+
+def archived_slot_rows(where: str = '1', params: tuple = (), directory: Optional[str] = None,
+                       since: Optional[str] = None) -> List[dict]:
+    """
+    Строки архивов по условию на столбцы slot_machine (where — SQL из кода, не из ввода),
+    словарями ARCHIVE_COLUMNS. since — начало периода (created_at не раньше): файлы
+    более ранних месяцев не открываются, само условие по дате задаёт where
+    """
+    rows = []
+    for path in archive_files(directory):
+        if since and archive_month(path) < since[:7]:
+            continue
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        try:
+            cursor = conn.execute(f'SELECT {_SELECT_COLUMNS} FROM slot_machine WHERE {where}', params)
+            rows.extend(dict(zip(ARCHIVE_COLUMNS, row)) for row in cursor.fetchall())
+        except sqlite3.OperationalError as e:
+            logger.error(f"[RETENTION] Не прочитан архив {path}: {e}")
+        finally:
+            conn.close()
+    return rows
+
+
+def delete_archived(where: str, params: tuple = (), directory: Optional[str] = None) -> int:
+    """Удаляет строки архивов по условию (удаление пользователя или выигрыша)"""
+    deleted = 0
+    for path in archive_files(directory):
+        conn = _open_archive(path)
+        try:
+            deleted += conn.execute(f'DELETE FROM slot_machine WHERE {where}', params).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+    return deleted
+
+
+def clear_archives(directory: Optional[str] = None) -> int:
+    """Удаляет все файлы архива (полная очистка истории слот-машины)"""
+    files = archive_files(directory)
+    for path in files:
+        os.remove(path)
+    return len(files)
+
+
+def _cutoff(days: int, now: datetime.datetime) -> str:
+    return (now - datetime.timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def rollup_losses(days: int = SLOT_LOSS_RETENTION_DAYS, batch: int = SLOT_RETENTION_BATCH,
+                  now: Optional[datetime.datetime] = None) -> int:
+    """Проигрыши старше days дней — в slot_daily_stats. Возвращает число свёрнутых строк"""
+    from .models import db_lock, get_db_connection
+
+    if days <= 0:
+        return 0
+    cutoff = _cutoff(days, now or datetime.datetime.now())
+    total = 0
+    while True:
+        with db_lock:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id FROM slot_machine WHERE is_win = 0 AND created_at < ? LIMIT ?',
+                               (cutoff, batch))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    return total
+                placeholders = ','.join('?' * len(ids))
+                cursor.execute(f'''INSERT INTO slot_daily_stats (user_id, day, losses)
+                                   SELECT user_id, substr(created_at, 1, 10), COUNT(*) FROM slot_machine
+                                   WHERE id IN ({placeholders}) AND user_id IS NOT NULL
+                                   GROUP BY user_id, substr(created_at, 1, 10)
+                                   ON CONFLICT(user_id, day) DO UPDATE SET losses = losses + excluded.losses''',
+                               ids)
+                cursor.execute(f'DELETE FROM slot_machine WHERE id IN ({placeholders})', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        total += len(ids)
+        if len(ids) < batch:
+            return total
+
+
+def archive_rows(days: int = SLOT_ARCHIVE_DAYS, batch: int = SLOT_RETENTION_BATCH,
+                 now: Optional[datetime.datetime] = None, directory: Optional[str] = None) -> int:
+    """Строки старше days дней (кроме ждущих выплаты) — в архив по месяцам. Возвращает число строк"""
+    from .models import db_lock, get_db_connection, read_connection
+
+    if days <= 0:
+        return 0
+    cutoff = _cutoff(days, now or datetime.datetime.now())
+    os.makedirs(directory or SLOT_ARCHIVE_DIR, exist_ok=True)
+    total = 0
+    last_id = 0
+    while True:
+        with read_connection() as conn:
+            rows = conn.execute(f'''SELECT {_SELECT_COLUMNS} FROM slot_machine
+                                    WHERE is_win IN (0, 1) AND created_at < ? AND id > ?
+                                    AND NOT (is_win = 1 AND COALESCE(status, 'pending') = 'pending')
+                                    ORDER BY id LIMIT ?''', (cutoff, last_id, batch)).fetchall()
+        if not rows:
+            return total
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row[6][:7], []).append(row)
+        # Сначала архив: при падении строка останется и в основной БД, но не пропадёт
+        for month, month_rows in by_month.items():
+            archive = _open_archive(archive_path(month, directory))
+            try:
+                archive.executemany(f'INSERT OR REPLACE INTO slot_machine ({_SELECT_COLUMNS}) '
+                                    f'VALUES ({",".join("?" * len(ARCHIVE_COLUMNS))})', month_rows)
+                archive.commit()
+            finally:
+                archive.close()
+        ids = [row[0] for row in rows]
+        with db_lock:
+            conn = get_db_connection()
+            try:
+                # Статус мог смениться, пока строки писались в архив, — ждущие выплаты не удаляем
+                conn.execute(f'''DELETE FROM slot_machine WHERE id IN ({",".join("?" * len(ids))})
+                                 AND NOT (is_win = 1 AND COALESCE(status, 'pending') = 'pending')''', ids)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+        total += len(ids)
+        last_id = ids[-1]
+        if len(rows) < batch:
+            return total
+
+
+def compact(free_ratio: float = DB_VACUUM_FREE_RATIO) -> dict:
+    """ANALYZE через PRAGMA optimize и VACUUM, если свободных страниц больше free_ratio"""
+    from .models import db_lock, get_db_connection
+
+    with db_lock:
+        conn = get_db_connection()
+        try:
+            conn.execute('PRAGMA optimize')
+            page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+            freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            vacuumed = bool(page_count) and free_ratio > 0 and freelist / page_count > free_ratio
+            if vacuumed:
+                conn.execute('VACUUM')
+                conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+    return {'pages': page_count, 'free_pages': freelist, 'vacuumed': vacuumed}
+
+
+def run_retention(now: Optional[datetime.datetime] = None) -> dict:
+    """Полный проход: итоги проигрышей, архив, сжатие"""
+    result = {
+        'rolled_up': rollup_losses(now=now),
+        'archived': archive_rows(now=now),
+    }
+    result.update(compact())
+    return result
+
+
+async def retention_loop(interval: int = SLOT_RETENTION_INTERVAL):
+    """Фоновая задача: периодический проход (при нескольких процессах — в одном)"""
+    from app.utils.coordination import coordinator, LockNotAcquired
+
+    if interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with coordinator.lock('slot_retention'):
+                # Отдельный поток, а не поток записи aio: между пачками db_lock свободен,
+                # и запись бота не стоит в очереди за всем проходом
+                result = await asyncio.to_thread(run_retention)
+            logger.info(f"[RETENTION] История спинов: {result}")
+        except LockNotAcquired:
+            pass
+        except Exception as e:
+            logger.error(f"[RETENTION] Ошибка очистки истории спинов: {e}")
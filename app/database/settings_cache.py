@@ -0,0 +1,118 @@
+"""
+Кэш настроек админки (таблица admin_settings) в памяти процесса
+
+Все строки загружаются одним запросом при первом обращении. update_admin_setting
+обновляет кэш сразу после записи в БД (write-through). Любое изменение
+admin_settings — в том числе из другого процесса бота или из скриптов — увеличивает
+счётчик в admin_settings_version (триггеры, миграция 2). Процесс сверяет свой номер
+версии с БД не чаще раза в SETTINGS_CACHE_CHECK_INTERVAL секунд и перечитывает
+таблицу, если номер изменился. В БД без migration 2 (нет admin_settings_version)
+кэш не используется: каждое обращение читает таблицу заново.
+"""
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config import SETTINGS_CACHE_CHECK_INTERVAL
+
+
+def read_settings_version(conn) -> Optional[int]:
+    """Номер версии admin_settings; None — таблицы версий нет, кэшировать нельзя"""
+    try:
+        row = conn.execute('SELECT version FROM admin_settings_version WHERE id = 1').fetchone()
+    except sqlite3.OperationalError as e:
+        if 'no such table' not in str(e):
+            raise
+        return None
+    return row[0] if row else 0
+
+
+class SettingsCache:
+    """Словарь key -> value из admin_settings с проверкой версии"""
+
+    def __init__(self, check_interval: float = SETTINGS_CACHE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._values: Optional[Dict[str, str]] = None
+        self._version = -1
+        self._checked_at = 0.0
+        self._pool = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.version_checks = 0
+
+    def _load(self, pool):
+        conn = pool.reader()
+        try:
+            # Версия и данные читаются в одной транзакции, чтобы не разойтись
+            conn.execute('BEGIN')
+            version = read_settings_version(conn)
+            values = dict(conn.execute('SELECT key, value FROM admin_settings').fetchall())
+            conn.rollback()
+        finally:
+            conn.close()
+        self._values = values
+        self._version = version
+        self._checked_at = time.monotonic()
+        self._pool = pool
+        self.reloads += 1
+
+    def _is_stale(self, pool) -> bool:
+        if self._values is None or self._version is None or pool is not self._pool:
+            return True
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return False
+        conn = pool.reader()
+        try:
+            version = read_settings_version(conn)
+        finally:
+            conn.close()
+        self.version_checks += 1
+        self._checked_at = time.monotonic()
+        return version != self._version
+
+    def get(self, key: str, default=""):
+        from .pool import get_pool
+
+        pool = get_pool()
+        with self._lock:
+            if self._is_stale(pool):
+                self.misses += 1
+                self._load(pool)
+            else:
+                self.hits += 1
+            return self._values.get(key, default)
+
+    def written(self, key: str, value, version: int):
+        """
+        Запись прошла в БД и получила номер version. Если до неё кэш был
+        актуален (version — следующий номер), обновляем значение на месте,
+        иначе кто-то писал параллельно — перечитаем при следующем обращении.
+        """
+        with self._lock:
+            if self._values is not None and None not in (version, self._version) and version == self._version + 1:
+                self._values[key] = value
+                self._version = version
+            else:
+                self._values = None
+
+    def invalidate(self):
+        with self._lock:
+            self._values = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'reloads': self.reloads,
+            'version_checks': self.version_checks,
+            'version': self._version,
+            'keys': len(self._values) if self._values is not None else 0,
+        }
+
+
+settings_cache = SettingsCache()
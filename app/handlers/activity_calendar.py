@@ -24,6 +24,8 @@ from app.utils.activity_calendar import (
     get_current_date
 )
 from app.utils.misc import notify_admins
+from app.utils.subscription import check_subscription
+from app.database import aio
 
 router = Router()
 
@@ -34,15 +36,6 @@ CHANNEL_ID = -1002680464877
 CHANNEL_USERNAME = "@legal_stars"
 CHANNEL_LINK = "https://t.me/legal_stars"
 
-async def check_subscription(user_id: int, bot: Bot) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        return member.status not in ['left', 'kicked']
-    except Exception as e:
-        logging.error(f"Ошибка проверки подписки: {e}")
-        return False
-
 async def show_subscription_message(call: CallbackQuery, bot: Bot):
     """Показывает сообщение о необходимости подписки"""
     text = (
@@ -368,19 +361,20 @@ async def admin_activity_stats_handler(callback: types.CallbackQuery):
         return
     
     # Получаем общую статистику активности
-    from app.database.models import get_all_users
-    
-    users = get_all_users()
+    users = await aio.get_all_users()
+    # Серии всех пользователей одним запросом
+    streaks = await aio.get_streaks_for_all_users()
     total_users = len(users)
     active_users = 0
     total_streaks = 0
+    user_streaks = []
     
     for user in users:
-        user_id = user[1]  # tg_id
-        streak = get_user_activity_streak(user_id)
+        streak = streaks.get(user[1], 0)  # tg_id
         if streak > 0:
             active_users += 1
             total_streaks += streak
+            user_streaks.append((user[2], streak))  # full_name, streak
     
     avg_streak = total_streaks / active_users if active_users > 0 else 0
     
@@ -391,13 +385,6 @@ async def admin_activity_stats_handler(callback: types.CallbackQuery):
     text += f"📊 Средняя серия: {avg_streak:.1f} дней\n\n"
     
     # Топ пользователей по активности
-    user_streaks = []
-    for user in users:
-        user_id = user[1]
-        streak = get_user_activity_streak(user_id)
-        if streak > 0:
-            user_streaks.append((user[2], streak))  # full_name, streak
-    
     user_streaks.sort(key=lambda x: x[1], reverse=True)
     
     if user_streaks:
@@ -416,9 +403,8 @@ async def admin_activity_users_handler(callback: types.CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    from app.database.models import get_all_users
-    
-    users = get_all_users()
+    users = await aio.get_all_users()
+    streaks = await aio.get_streaks_for_all_users()
     
     text = "👥 <b>Активность пользователей</b>\n\n"
     
@@ -427,7 +413,7 @@ async def admin_activity_users_handler(callback: types.CallbackQuery):
         full_name = user[2]
         username = user[3]
         
-        streak = get_user_activity_streak(user_id)
+        streak = streaks.get(user_id, 0)
         
         user_info = f"@{username}" if username else f"ID {user_id}"
         
@@ -3,6 +3,7 @@
 """
 import logging
 import json
+import datetime
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -10,9 +11,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from app.config import ADMINS
+from app.database import aio
 from app.database.models import (
     get_all_pending_withdrawals, get_withdrawal_by_id, update_withdrawal_status,
-    get_all_orders, get_order_by_id, update_order_status, delete_order, clear_all_orders,
+    get_order_by_id, update_order_status, delete_order, clear_all_orders,
     get_all_reviews, update_review_status, delete_review, clear_all_reviews,
     get_user_profile_by_id, add_stars_to_user, add_ton_to_user, update_balance,
     add_referral_bonus_for_order_async, get_flag, get_all_users, get_review_by_id
@@ -202,51 +204,23 @@ async def process_amount(message: types.Message, state: FSMContext):
 # Остальные обработчики остаются без изменений...
 
 @router.message(Command("orders"))
-async def show_orders(message: types.Message):
+async def show_orders(message: types.Message, state: FSMContext):
     if not await check_admin_access(show_orders, message):
         return
     
     try:
-        orders = get_all_orders()
-        if not orders:
-            await message.answer("📋 Нет активных заявок.")
-            return
-            
-        text = "📋 <b>Активные заявки:</b>\n\n"
-        for order in orders[:10]:
-            order_id, user_id, order_type, amount, status, created_at, file_id, extra_data = order
-            type_emoji = {
-                "withdraw": "💰",
-                "premium": "⭐",
-                "stars": "🌟",
-                "crypto": "₿",
-                "activity_reward": "🎁",
-                "slot_win": "🎰"
-            }.get(order_type, "📋")
-            
-            type_label = {
-                "activity_reward": "Календарь активности",
-                "slot_win": "Рулетка",
-                "withdraw": "Вывод",
-                "premium": "Премиум",
-                "stars": "Звёзды",
-                "crypto": "Крипта"
-            }.get(order_type, order_type)
-            
-            text += (
-                f"{type_emoji} <b>Заявка #{order_id}</b>\n"
-                f"👤 Пользователь: ID {user_id}\n"
-                f"📊 Тип: {type_label}\n"
-                f"💰 Сумма: <b>{amount}</b>\n"
-                f"📝 Статус: {status}\n"
-                f"⏰ Время: {created_at}\n"
-                f"Описание: {extra_data}\n\n"
-            )
-            
-        if len(orders) > 10:
-            text += f"... и еще {len(orders) - 10} заявок"
-            
-        await message.answer(text, parse_mode="HTML")
+        filters = parse_order_filters(message.text.partition(" ")[2])
+    except ValueError:
+        await message.answer(
+            "❌ Неверный фильтр.\n"
+            "Формат: /orders [pending|completed|rejected] [тип] [user=ID] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД]"
+        )
+        return
+        
+    try:
+        await state.update_data(orders_filter=filters)
+        text, kb = await build_orders_page(filters)
+        await message.answer(text, parse_mode="HTML", reply_markup=kb)
     except Exception as e:
         logging.error(f"Error in show_orders: {e}")
         await message.answer("❌ Ошибка при получении списка заявок")
@@ -568,82 +542,182 @@ async def clear_reviews(message: types.Message):
         logging.error(f"Error in clear_reviews: {e}")
         await message.answer("❌ Ошибка при очистке отзывов")
 
-@router.callback_query(F.data == "admin_orders_page:0")
-async def admin_orders_first_page(callback: types.CallbackQuery):
-    await admin_orders_page_callback(callback)
+ORDERS_PAGE_SIZE = 5
+ORDER_STATUS_LABELS = {"pending": "⏳ Ожидают", "completed": "✅ Выполнены", "rejected": "❌ Отклонены"}
+ORDER_TYPE_ICONS = {
+    "premium": "⭐️", "stars": "🌟", "crypto": "🪙",
+    "withdraw": "💸", "slot_win": "🎰", "slot_ton": "🎰", "activity_reward": "🎁"
+}
+
+def parse_order_filters(args):
+    """
+    Фильтры очереди заявок из аргументов /orders:
+    статус (pending/completed/rejected), тип заявки, user=<tg_id>,
+    from=YYYY-MM-DD, to=YYYY-MM-DD. Неверный аргумент — ValueError.
+    """
+    filters = {}
+    for arg in (args or "").split():
+        key, _, value = arg.partition("=")
+        if not value:
+            filters["status" if key in ORDER_STATUS_LABELS else "order_type"] = key
+        elif key == "user":
+            filters["tg_id"] = int(value)
+        elif key in ("from", "to"):
+            datetime.datetime.strptime(value, "%Y-%m-%d")
+            filters["date_from" if key == "from" else "date_to"] = value
+        else:
+            raise ValueError(arg)
+    return filters
+
+def format_order_filters(filters):
+    parts = []
+    if filters.get("status"):
+        parts.append(ORDER_STATUS_LABELS.get(filters["status"], filters["status"]))
+    if filters.get("order_type"):
+        parts.append(f"тип {filters['order_type']}")
+    if filters.get("tg_id") is not None:
+        parts.append(f"пользователь {filters['tg_id']}")
+    if filters.get("date_from"):
+        parts.append(f"с {filters['date_from']}")
+    if filters.get("date_to"):
+        parts.append(f"по {filters['date_to']}")
+    return ", ".join(parts)
+
+def format_order_row(order):
+    order_id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id = order
+    icon = ORDER_TYPE_ICONS.get(order_type, "❔")
+    stat = {"pending": "⏳", "completed": "✅", "rejected": "❌"}.get(status, "❔")
+    text = f"{icon} ЗАКАЗ #{order_id} {stat}\nID: {user_id}\n"
+
+    try:
+        amount_f = float(amount)
+        text += f"💰 Сумма: {amount_f:.2f}₽\n"
+    except Exception:
+        text += f"💰 Сумма: {amount}\n"
+
+    text += f"📊 Тип: {order_type}\n"
+
+    try:
+        extra = json.loads(extra_data) if extra_data else {}
+        if order_type == 'premium':
+            text += f"📅 Период: {extra.get('period','-')}\n"
+            text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
+        elif order_type == 'stars':
+            text += f"⭐ Количество: {extra.get('amount','-')}\n"
+            text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
+        elif order_type == 'crypto':
+            text += f"🪙 Монета: {extra.get('coin','-')}\n"
+            text += f"📊 Количество: {extra.get('amount','-')}\n"
+            text += f"🏦 Кошелёк: {extra.get('wallet','-')}\n"
+        elif order_type == 'withdraw':
+            text += f"💳 Реквизиты: {extra.get('requisites','-')}\n"
+    except Exception:
+        pass
+
+    return text + f"⏰ Время: {created_at}\n\n"
+
+async def build_orders_page(filters, page=0, before_id=None, after_id=None):
+    """
+    Текст и клавиатура страницы очереди заявок. Страницы листаются по id
+    (keyset), фильтры и выборка — в SQL, на экран читается ORDERS_PAGE_SIZE + 1 строк.
+    """
+    counts = await aio.get_order_status_counts()
+    rows = await aio.get_orders_page(**filters, before_id=before_id, after_id=after_id,
+                                     limit=ORDERS_PAGE_SIZE + 1)
+    if after_id is not None:
+        # Назад: строки ближе к курсору — в конце списка, за ними есть ещё более новые
+        has_older, orders = True, rows[-ORDERS_PAGE_SIZE:]
+    else:
+        has_older, orders = len(rows) > ORDERS_PAGE_SIZE, rows[:ORDERS_PAGE_SIZE]
+
+    total = counts.get(filters["status"], 0) if filters.get("status") else sum(counts.values())
+    text = "<b>ЗАЯВКИ</b>\n" + " · ".join(
+        f"{label}: {counts.get(status, 0)}" for status, label in ORDER_STATUS_LABELS.items()
+    ) + f" · Всего: {sum(counts.values())}\n"
+    if filters:
+        text += f"🔎 Фильтр: {format_order_filters(filters)}\n"
+    if set(filters) <= {"status"}:
+        text += f"Стр. {page + 1} из {max(1, (total + ORDERS_PAGE_SIZE - 1) // ORDERS_PAGE_SIZE)}\n\n"
+    else:
+        text += f"Стр. {page + 1}\n\n"
+    if orders:
+        text += "".join(format_order_row(order) for order in orders)
+    else:
+        text += "📋 Нет заявок."
+
+    status_buttons = [
+        InlineKeyboardButton(
+            text=f"{label.split()[0]} {counts.get(status, 0)}" + (" •" if filters.get("status") == status else ""),
+            callback_data=f"admin_orders_status:{status}"
+        )
+        for status, label in ORDER_STATUS_LABELS.items()
+    ]
+    status_buttons.append(InlineKeyboardButton(text="Все", callback_data="admin_orders_status:all"))
+    nav_buttons = []
+    if page > 0 and orders:
+        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_orders_page:{page-1}:>{orders[0][0]}"))
+    if has_older and orders:
+        nav_buttons.append(InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"admin_orders_page:{page+1}:<{orders[-1][0]}"))
+    nav_buttons.append(InlineKeyboardButton(text="🏠 В меню", callback_data="admin_panel"))
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        status_buttons,
+        nav_buttons,
+        [InlineKeyboardButton(text="📝 Отзывы", callback_data="admin_reviews")],
+    ])
+    return text, kb
+
+async def show_orders_queue(callback: types.CallbackQuery, filters, page=0, before_id=None, after_id=None):
+    text, kb = await build_orders_page(filters, page, before_id, after_id)
+    await callback.message.delete()
+    await callback.message.answer(text, parse_mode="HTML", reply_markup=kb)
+
+@router.callback_query(F.data == "admin_orders")
+async def admin_orders_callback(callback: types.CallbackQuery, state: FSMContext):
+    if not await check_admin_access(admin_orders_callback, callback):
+        return
+
+    try:
+        await state.update_data(orders_filter={})
+        await show_orders_queue(callback, {})
+    except Exception as e:
+        logging.error(f"Error in admin_orders_callback: {e}")
+        await callback.answer("❌ Ошибка при загрузке заявок")
+
+@router.callback_query(F.data.startswith("admin_orders_status:"))
+async def admin_orders_status_callback(callback: types.CallbackQuery, state: FSMContext):
+    if not await check_admin_access(admin_orders_status_callback, callback):
+        return
+
+    try:
+        status = callback.data.split(":", 1)[1]
+        filters = dict((await state.get_data()).get("orders_filter") or {})
+        filters.pop("status", None)
+        if status in ORDER_STATUS_LABELS:
+            filters["status"] = status
+        await state.update_data(orders_filter=filters)
+        await show_orders_queue(callback, filters)
+    except Exception as e:
+        logging.error(f"Error in admin_orders_status_callback: {e}")
+        await callback.answer("❌ Ошибка при загрузке заявок")
 
 @router.callback_query(F.data.startswith("admin_orders_page:"))
-async def admin_orders_page_callback(callback: types.CallbackQuery):
+async def admin_orders_page_callback(callback: types.CallbackQuery, state: FSMContext):
     if not await check_admin_access(admin_orders_page_callback, callback):
         return
-    
+
     try:
-        page = int(callback.data.split(":")[1])
-        orders = get_all_orders()
-        per_page = 5
-        total_pages = (len(orders) + per_page - 1) // per_page
-        start = page * per_page
-        end = start + per_page
-        orders_page = orders[start:end]
-        
-        if not orders_page:
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")],
-            ])
-            await callback.message.answer("📋 Нет заявок.", reply_markup=kb)
-            return
-            
-        text = f"<b>ЗАЯВКИ (стр. {page+1} из {total_pages}):</b>\n\n"
-        status_emoji = {"pending": "⏳", "completed": "✅", "rejected": "❌"}
-        type_icons = {
-            "premium": "⭐️", "stars": "🌟", "crypto": "🪙", 
-            "withdraw": "💸", "slot_win": "🎰", "activity_reward": "🎁"
-        }
-        
-        for order in orders_page:
-            order_id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id = order
-            icon = type_icons.get(order_type, "❔")
-            stat = status_emoji.get(status, "❔")
-            text += f"{icon} ЗАКАЗ #{order_id} {stat}\nID: {user_id}\n"
-            
-            try:
-                amount_f = float(amount)
-                text += f"💰 Сумма: {amount_f:.2f}₽\n"
-            except Exception:
-                text += f"💰 Сумма: {amount}\n"
-                
-            text += f"📊 Тип: {order_type}\n"
-            
-            try:
-                extra = json.loads(extra_data) if extra_data else {}
-                if order_type == 'premium':
-                    text += f"📅 Период: {extra.get('period','-')}\n"
-                    text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
-                elif order_type == 'stars':
-                    text += f"⭐ Количество: {extra.get('amount','-')}\n"
-                    text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
-                elif order_type == 'crypto':
-                    text += f"🪙 Монета: {extra.get('coin','-')}\n"
-                    text += f"📊 Количество: {extra.get('amount','-')}\n"
-                    text += f"🏦 Кошелёк: {extra.get('wallet','-')}\n"
-                elif order_type == 'withdraw':
-                    text += f"💳 Реквизиты: {extra.get('requisites','-')}\n"
-            except Exception:
-                pass
-                
-            text += f"⏰ Время: {created_at}\n\n"
-            
-        nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_orders_page:{page-1}"))
-        if (page + 1) < total_pages:
-            nav_buttons.append(InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"admin_orders_page:{page+1}"))
-            
-        nav_buttons.append(InlineKeyboardButton(text="🏠 В меню", callback_data="admin_panel"))
-        
-        kb = InlineKeyboardMarkup(inline_keyboard=[nav_buttons])
-        await callback.message.delete()
-        await callback.message.answer(text, parse_mode="HTML", reply_markup=kb)
+        # admin_orders_page:{стр}:<{id} — старше id, :>{id} — новее id; без курсора — первая страница
+        parts = callback.data.split(":")
+        page = int(parts[1])
+        before_id = after_id = None
+        if len(parts) > 2 and parts[2][:1] == "<":
+            before_id = int(parts[2][1:])
+        elif len(parts) > 2 and parts[2][:1] == ">":
+            after_id = int(parts[2][1:])
+        else:
+            page = 0
+        filters = (await state.get_data()).get("orders_filter") or {}
+        await show_orders_queue(callback, filters, page, before_id, after_id)
     except Exception as e:
         logging.error(f"Error in admin_orders_page_callback: {e}")
-        await callback.answer("❌ Ошибка при загрузке страницы заявок")
\ No newline at end of file
+        await callback.answer("❌ Ошибка при загрузке страницы заявок")
@@ -9,7 +9,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from app.config import ADMINS
+from app.config import ADMINS, SLOT_SIM_DAILY_USERS
 from app.database.models import (
     get_admin_setting, update_admin_setting, get_all_admin_settings,
     get_slot_configs, add_slot_config, delete_slot_config,
@@ -19,10 +19,13 @@ from app.database.models import (
     update_user_referral_percent_by_username,
     delete_user_everywhere_full
 )
+from app.database.pool import connect_async
 from app.keyboards.main import (
     admin_settings_kb, admin_ui_settings_kb, admin_price_settings_kb,
     admin_stars_settings_kb, admin_slot_settings_kb, admin_activity_settings_kb
 )
+from app.utils.slot_simulator import format_cost_preview
+from app.utils.media import media_registry
 
 router = Router()
 
@@ -302,11 +305,10 @@ async def admin_slot_attempts_stats(callback: types.CallbackQuery):
         await callback.answer("❌ Доступ запрещен")
         return
     
-    import aiosqlite
     from datetime import datetime
     
     try:
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             # Получаем топ пользователей по отрицательным попыткам (бонусные попытки)
             cursor = await db.execute("""
                 SELECT u.tg_id, u.username, ra.attempts_used 
@@ -475,6 +477,8 @@ async def process_setting_value(message: types.Message, state: FSMContext):
             return
         
         update_admin_setting(setting_key, value)
+        # Новую картинку загружаем в Telegram сразу, а не при первом показе меню
+        media_registry.schedule_resolve(message.bot, value)
         await message.answer(f"✅ Фото для {setting_key} обновлено!")
         await state.clear()
         
@@ -788,7 +792,16 @@ async def process_slot_chance(message: types.Message, state: FSMContext):
         return
     await state.update_data(chance=chance)
     await state.set_state(AdminSettingStates.waiting_for_slot_emoji)
-    text = "🎰 <b>Эмодзи комбинации</b>\n\n"
+    text = ""
+    try:
+        # Стоимость новой комбинации видна до сохранения
+        data = await state.get_data()
+        candidate = (None, data.get('combination'), data.get('reward_type'), data.get('amount'), chance, None, "Новая")
+        spins_per_user = int(get_admin_setting('slot_daily_attempts', '5'))
+        text += format_cost_preview(get_slot_configs(), candidate, SLOT_SIM_DAILY_USERS, spins_per_user) + "\n\n"
+    except Exception as e:
+        logging.error(f"[SLOT] Ошибка оценки стоимости комбинации: {e}")
+    text += "🎰 <b>Эмодзи комбинации</b>\n\n"
     text += "Отправьте эмодзи для комбинации:"
     await message.answer(text, reply_markup=types.InlineKeyboardMarkup(
         inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_slot_settings")]]
@@ -7,12 +7,18 @@ from aiogram import Router, types
 from aiogram.filters import Command
 
 from app.config import ADMINS
-from app.database.models import get_user_profile, get_all_orders, get_user_activity
+from app.database.models import get_user_profile, get_all_orders, get_user_activity, get_settings_cache_stats
 from app.utils.activity_calendar import (
     get_user_activity_streak, get_current_month_activities,
     get_activity_rewards, format_activity_stats, mark_activity
 )
 from app.utils.slot_machine import get_user_slot_stats, get_last_slot_results
+from app.utils.subscription import subscription_service
+from app.utils.media import media_registry
+from app.utils.fsm_storage import fsm_storage, SQLiteStorage
+from app.utils.admin_notify import admin_notifier
+from app.utils.prices import price_oracle
+from app.tracing import metrics
 
 router = Router()
 
@@ -79,9 +85,9 @@ async def debug_slot(message: types.Message):
                 if not res:
                     continue
                 try:
-                    win_id, user_id, tg_id_db, full_name, combination, reward_type, reward_amount, is_win, created_at, status = res[:10]
+                    reward_type, reward_amount = res['reward_type'], res['reward_amount']
                     reward_text = f"{reward_amount}⭐" if reward_type == "stars" else (f"{reward_amount}₽" if reward_type == "money" else "-")
-                    text += f"{created_at}: {combination} | {reward_text} | {'WIN' if is_win else 'LOSE'} | {status}\n"
+                    text += f"{res['created_at']}: {res['combination']} | {reward_text} | {'WIN' if res['is_win'] else 'LOSE'} | #{res['id']}\n"
                 except Exception as e_row:
                     text += f"Ошибка в строке: {e_row}\n"
         else:
@@ -90,6 +96,59 @@ async def debug_slot(message: types.Message):
     except Exception as e:
         await message.answer(f"<b>Ошибка debug_slot:</b> {e}", parse_mode="HTML")
 
+@router.message(Command("debug_cache"))
+async def debug_cache(message: types.Message):
+    if not message.from_user or not is_admin(message.from_user.id):
+        return
+    sub = subscription_service.stats()
+    settings = get_settings_cache_stats()
+    text = "<b>DEBUG CACHE</b>\n\n"
+    text += (f"Подписка: попаданий {sub['hits']}, промахов {sub['misses']} "
+             f"(hit ratio {sub['hit_ratio']:.1%}), объединено {sub['coalesced']}\n"
+             f"Запросов get_chat_member: {sub['api_calls']} (ошибок {sub['api_errors']}), "
+             f"chat_member обновлений: {sub['updates']}, в кэше: {sub['cached']}\n")
+    text += (f"\nНастройки: hit ratio {settings['hit_ratio']:.1%}, перечитываний {settings['reloads']}, "
+             f"версия {settings['version']}\n")
+    media = media_registry.stats()
+    text += (f"\nКартинки: file_id {media['hits']}, по URL {media['misses']} "
+             f"(hit ratio {media['hit_ratio']:.1%}), загружено {media['uploads']}, известно {media['known']}\n")
+    if isinstance(fsm_storage, SQLiteStorage):
+        fsm = fsm_storage.stats()
+        text += (f"\nFSM: в кэше {fsm['cached']} (hit ratio {fsm['hit_ratio']:.1%}), "
+                 f"ждут записи {fsm['dirty']}, записей в БД {fsm['flushes']}\n")
+    notify = admin_notifier.stats()
+    text += (f"\nУведомления админам: в очередях {notify['queued']} (макс. {notify['max_depth']}), "
+             f"отправлено {notify['sent']}, сводок {notify['digests']}, вытеснено {notify['dropped']}, "
+             f"ошибок {notify['failed']}, задержка p50 {notify['latency_p50']:.2f} с / "
+             f"p95 {notify['latency_p95']:.2f} с\n")
+    prices = price_oracle.stats()
+    ages = ", ".join(f"{key} {age:.0f} с" for key, age in prices['ages'].items()) or "нет"
+    text += (f"\nКурсы: из кэша {prices['hits']}, устаревших {prices['stale_hits']}, "
+             f"ожиданий источника {prices['misses']}, запросов {prices['fetches']} "
+             f"(ошибок {prices['errors']}); возраст: {ages}\n")
+    await message.answer(text, parse_mode="HTML")
+
+@router.message(Command("debug_trace"))
+async def debug_trace(message: types.Message):
+    """Самые медленные обработчики и SQL/Bot API на обновление (app/tracing.py)"""
+    if not message.from_user or not is_admin(message.from_user.id):
+        return
+    handlers = sorted(metrics.handlers().items(), key=lambda item: -item[1]['avg_ms'])
+    if not handlers:
+        await message.answer("Трасс пока нет (TRACE_ENABLED=0 или не было обновлений).")
+        return
+    text = "<b>DEBUG TRACE</b> — среднее время, SQL и Bot API на обновление\n\n"
+    for (router_name, handler, callback), stats in handlers[:15]:
+        text += (f"<code>{router_name}:{handler}</code>{f' [{callback}]' if callback else ''}: "
+                 f"{stats['updates']} обн., {stats['avg_ms']:.0f} мс, SQL {stats['sql_per_update']}, "
+                 f"API {stats['api_per_update']}")
+        if stats['repeated_sql']:
+            text += f", N+1 {stats['repeated_sql']}"
+        if stats['slow']:
+            text += f", медленных {stats['slow']}"
+        text += "\n"
+    await message.answer(text, parse_mode="HTML")
+
 @router.message(Command("debug_activity_orders"))
 async def debug_activity_orders(message: types.Message):
     if not is_admin(message.from_user.id):
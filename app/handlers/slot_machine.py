@@ -13,6 +13,7 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.types.message import Message
 
+from app.database import aio as db
 from app.database.models import get_slot_configs
 from app.config import ADMINS
 from app.database.models import (
@@ -23,13 +24,18 @@ from app.database.models import (
     get_user_roulette_attempts, use_roulette_attempt, reset_roulette_attempts, get_roulette_configs
 )
 from app.keyboards.main import slot_machine_kb, slot_win_admin_kb
+from app.utils.subscription import check_subscription
 from app.utils.slot_machine import (
     format_slot_result, generate_slot_result, check_win_combination,
-    animate_slot_machine, process_slot_win, notify_admins_slot_win
+    process_slot_win, notify_admins_slot_win, spin
 )
+from app.utils.slot_animation import get_slot_animation
 
 router = Router()
 
+# Стратегия анимации вращения (SLOT_ANIMATION)
+slot_animation = get_slot_animation()
+
 # Эмодзи для слот-машины (используются для анимации)
 SLOT_EMOJIS = ["🍒", "🍋", "🍊", "🍇", "⭐️", "💎", "🔔", "💰", "🎰", "7️⃣"]
 
@@ -41,15 +47,6 @@ CHANNEL_LINK = "https://t.me/legal_stars"
 def is_admin(user_id: int) -> bool:
     return user_id in ADMINS
 
-async def check_subscription(user_id: int, bot: Bot) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        return member.status not in ['left', 'kicked']
-    except Exception as e:
-        logging.error(f"Ошибка проверки подписки: {e}")
-        return False
-
 async def show_subscription_message(call: CallbackQuery, bot: Bot):
     """Показывает сообщение о необходимости подписки"""
     text = (
@@ -74,48 +71,24 @@ async def show_subscription_message(call: CallbackQuery, bot: Bot):
 
 async def get_user_attempts(user_id: int) -> Tuple[int, int]:
     """Возвращает (использованные попытки, бонусные попытки)"""
-    async with aiosqlite.connect('data/users.db') as db:
-        # Стандартные попытки
-        cursor = await db.execute(
-            "SELECT attempts_used FROM roulette_attempts WHERE user_id = ?",
-            (user_id,)
-        )
-        attempts_used = (await cursor.fetchone() or [0])[0]
-        
-        # Бонусные попытки
-        cursor = await db.execute(
-            "SELECT attempts FROM bonus_attempts WHERE user_id = ?",
-            (user_id,)
-        )
-        bonus_attempts = (await cursor.fetchone() or [0])[0]
-        
-    return attempts_used, bonus_attempts
-
-async def use_slot_attempt(user_id: int) -> bool:
-    """Использует одну попытку (сначала бонусные, потом стандартные)"""
-    async with aiosqlite.connect('data/users.db') as db:
-        # Проверяем бонусные попытки
-        cursor = await db.execute(
-            "SELECT attempts FROM bonus_attempts WHERE user_id = ?",
-            (user_id,)
-        )
-        bonus = (await cursor.fetchone() or [0])[0]
-        
-        if bonus > 0:
-            # Используем бонусную попытку
-            await db.execute(
-                "UPDATE bonus_attempts SET attempts = attempts - 1 WHERE user_id = ?",
-                (user_id,)
-            )
-        else:
-            # Используем стандартную попытку
-            await db.execute(
-                "UPDATE roulette_attempts SET attempts_used = attempts_used + 1 WHERE user_id = ?",
-                (user_id,)
-            )
-        
-        await db.commit()
-        return True
+    return await db.get_slot_attempts(user_id)
+
+
+def no_attempts_screen() -> Tuple[str, InlineKeyboardMarkup]:
+    text = (
+        "🎰 <b>СЛОТ-МАШИНА</b> 🎰\n\n"
+        "🔴 <b>У вас закончились попытки!</b>\n\n"
+        f"🔄 Попытки обновятся в 00:00 по МСК\n\n"
+        f"💡 Вы можете получить бонусные попытки:\n"
+        f"• Приглашая друзей\n"
+        f"• За ежедневный вход\n"
+        f"• За выполнение заданий"
+    )
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="slot_machine")],
+        [InlineKeyboardButton(text="🔄 Проверить попытки", callback_data="spin_slot")]
+    ])
+    return text, kb
 
 @router.callback_query(F.data == "slot_machine")
 async def slot_machine_menu(callback: types.CallbackQuery):
@@ -150,7 +123,7 @@ async def slot_machine_menu(callback: types.CallbackQuery):
         # 5. Сброс попыток если нужно
         slot_data = get_user_slot_spins(user_id)
         last_reset = slot_data[1] if slot_data else None
-        if should_reset_daily_attempts(last_reset):
+        if should_reset_daily_attempts(user_id):
             reset_slot_spins(user_id)
             attempts_used = 0
         
@@ -305,102 +278,56 @@ async def spin_slot_machine(callback: types.CallbackQuery):
             await show_subscription_message(callback, callback.bot)
             return
 
-        # Получаем текущие попытки
+        # Без попыток анимацию не запускаем (окончательно проверяет spin())
         attempts_used, bonus_attempts = await get_user_attempts(user_id)
         daily_attempts = int(get_admin_setting('slot_daily_attempts', '5'))
-        remaining_standard = max(0, daily_attempts - attempts_used)
-        total_available = remaining_standard + bonus_attempts
-        
-        if total_available <= 0:
-            text = (
-                "🎰 <b>СЛОТ-МАШИНА</b> 🎰\n\n"
-                "🔴 <b>У вас закончились попытки!</b>\n\n"
-                f"🔄 Попытки обновятся в 00:00 по МСК\n\n"
-                f"💡 Вы можете получить бонусные попытки:\n"
-                f"• Приглашая друзей\n"
-                f"• За ежедневный вход\n"
-                f"• За выполнение заданий"
-            )
-            
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="⬅️ Назад", callback_data="slot_machine")],
-                [InlineKeyboardButton(text="🔄 Проверить попытки", callback_data="spin_slot")]
-            ])
-            
+        if max(0, daily_attempts - attempts_used) + bonus_attempts <= 0:
+            text, kb = no_attempts_screen()
             try:
                 await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
             except:
                 await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
             return
-        
-        # Используем попытку (сначала бонусные)
-        await use_slot_attempt(user_id)
-        
-        # Создаем сообщение с анимацией
-        anim_message = await callback.message.answer(
-            "🎰 <b>СЛОТ-МАШИНА КРУТИТСЯ...</b> 🎰\n\n"
-            "        ┌─────────────┐\n"
-            "        │  🎰  │  🎰  │  🎰  │\n"
-            "        └─────────────┘\n\n"
-            "🎯 Подготовка к вращению..."
-        )
-
-        # Используем правильную анимацию и генерацию из utils
-        slot1, slot2, slot3 = await animate_slot_machine(anim_message, callback)
 
-        # Проверяем выигрышную комбинацию используя БД
-        win_config = await check_win_combination(slot1, slot2, slot3)
-
-        if win_config:
-            # Обрабатываем выигрыш используя правильную логику из utils
-            config_id, combination, reward_type, reward_amount, chance_percent, emoji, prize_name = win_config
-
-            # Обрабатываем выигрыш через правильную функцию
-            reward_text, win_id = await process_slot_win(user_id, win_config)
-
-            # Формируем текст выигрыша используя правильный формат
-            result_text = format_slot_result(
-                slot1, slot2, slot3, True, reward_text, prize_name, reward_type
-            )
+        # Списание, результат, запись и начисление — одна транзакция; анимация
+        # останавливает барабаны на уже известном результате
+        anim = await slot_animation.begin(callback.message)
+        result = await spin(user_id, dice_value=anim.dice_value)
+        if not result.ok:
+            # Попытки кончились между проверкой и спином (двойное нажатие)
+            text, kb = no_attempts_screen()
+            await slot_animation.finish(anim, text, kb)
+            return
+        # Кадры идут в фоне, пока готовится итог и уведомление админам
+        reveal = asyncio.create_task(slot_animation.reveal(anim, result.triple))
 
-            # Отправляем уведомление админам только для stars и ton (деньги начисляются автоматически)
-            if reward_type in ["stars", "ton"]:
-                try:
-                    await notify_admins_slot_win(user_id, combination, reward_type, reward_amount, callback.bot)
-                except Exception as e:
-                    logging.error(f"Ошибка уведомления админам: {e}")
-        else:
-            # Создаем запись о проигрыше
-            combination = slot1 + slot2 + slot3
-            create_slot_win(user_id, combination, "none", 0, False)
+        result_text = format_slot_result(
+            *result.triple, result.is_win, result.reward_text, result.prize_name, result.reward_type
+        )
+        # Уведомление админам только для stars и ton (деньги начисляются автоматически)
+        if result.reward_type in ["stars", "ton"]:
+            try:
+                await notify_admins_slot_win(user_id, result.combination, result.reward_type,
+                                             result.reward_amount, callback.bot, win_id=result.win_id)
+            except Exception as e:
+                logging.error(f"Ошибка уведомления админам: {e}")
 
-            # Формируем текст проигрыша
-            result_text = format_slot_result(slot1, slot2, slot3, False)
-        
-        # Обновляем информацию о попытках
-        attempts_used, bonus_attempts = await get_user_attempts(user_id)
-        remaining_standard = max(0, daily_attempts - attempts_used)
-        total_remaining = remaining_standard + bonus_attempts
-        
         result_text += (
             f"\n\n🎯 <b>Осталось попыток:</b>\n"
-            f"• Стандартные: {remaining_standard}/{daily_attempts}\n"
-            f"• Бонусные: {bonus_attempts}\n"
-            f"• Всего: {total_remaining}"
+            f"• Стандартные: {result.remaining_standard}/{daily_attempts}\n"
+            f"• Бонусные: {result.bonus_attempts}\n"
+            f"• Всего: {result.remaining}"
         )
-        
+
         # Клавиатура результата
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🎰 Крутить ещё раз", callback_data="spin_slot")],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="slot_machine")]
         ])
-        
-        try:
-            await anim_message.edit_text(result_text, reply_markup=kb, parse_mode="HTML")
-        except Exception as e:
-            logging.error(f"Ошибка отображения результата: {e}")
-            await callback.message.answer(result_text, reply_markup=kb, parse_mode="HTML")
-    
+
+        await reveal
+        await slot_animation.finish(anim, result_text, kb)
+
     except Exception as e:
         logging.error(f"Ошибка в слот-машине: {e}", exc_info=True)
         await callback.answer("⚠️ Произошла ошибка при обработке запроса. Попробуйте позже.", show_alert=True)
@@ -890,47 +817,23 @@ async def slot_stats_handler(callback: types.CallbackQuery):
     try:
         user_id = callback.from_user.id
 
-        # Получаем все выигрыши пользователя из БД
-        user_wins = await get_slot_wins_async(user_id=user_id)  # Получаем выигрыши пользователя
-
-        # Считаем статистику
-        total_spins = len(user_wins)  # Общее количество вращений (включая проигрыши)
-        winning_spins = len([win for win in user_wins if win[7] in (True, 1)])  # win[7] = is_win
-
-        # Находим самый крупный выигрыш
-        biggest_win = 0
-        biggest_win_type = ""
-        for win in user_wins:
-            if win[7] in (True, 1):  # Если выигрыш (sm.is_win)
-                reward_amount = win[6]  # sm.reward_amount
-                reward_type = win[5]    # sm.reward_type
-
-                # Конвертируем в условные единицы для сравнения
-                if reward_type == "money":
-                    value = reward_amount
-                elif reward_type == "stars":
-                    value = reward_amount * 2  # Условно звезды дороже
-                elif reward_type == "ton":
-                    value = reward_amount * 1000  # TON самый дорогой
-                else:
-                    value = 0
-
-                if value > biggest_win:
-                    biggest_win = value
-                    if reward_type == "money":
-                        biggest_win_type = f"{int(reward_amount)}₽"
-                    elif reward_type == "stars":
-                        biggest_win_type = f"{int(reward_amount)}⭐️"
-                    elif reward_type == "ton":
-                        biggest_win_type = f"{reward_amount} TON"
-
-        win_rate = (winning_spins / total_spins * 100) if total_spins > 0 else 0
+        # Одна строка slot_user_stats, обновляется вместе с каждым спином
+        stats = await db.get_slot_user_stats(user_id)
+        biggest_type, biggest_amount = stats['biggest_type'], stats['biggest_amount']
+        if biggest_type == "money":
+            biggest_win_type = f"{int(biggest_amount)}₽"
+        elif biggest_type == "stars":
+            biggest_win_type = f"{int(biggest_amount)}⭐️"
+        elif biggest_type == "ton":
+            biggest_win_type = f"{biggest_amount} TON"
+        else:
+            biggest_win_type = ""
 
         text = (
             "📊 <b>Ваша статистика в слотах</b>\n\n"
-            f"🎰 Всего вращений: {total_spins}\n"
-            f"🏆 Выигрышных вращений: {winning_spins}\n"
-            f"📈 Процент выигрышей: {win_rate:.1f}%\n"
+            f"🎰 Всего вращений: {stats['spins']}\n"
+            f"🏆 Выигрышных вращений: {stats['wins']}\n"
+            f"📈 Процент выигрышей: {stats['win_rate']:.1f}%\n"
             f"💰 Самый крупный выигрыш: {biggest_win_type if biggest_win_type else 'Нет выигрышей'}\n\n"
             f"🍀 Удачи в следующих играх!"
         )
@@ -13,6 +13,7 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
 import html
 
 from app.database.models import get_user_roulette_attempts
@@ -34,6 +35,9 @@ from app.utils.misc import is_admin
 
 # Импортируем константы каналов
 from app.constants import CHANNEL_ID, CHANNEL_USERNAME, CHANNEL_LINK
+from app.utils.subscription import check_subscription
+from app.utils.fsm_storage import fsm_storage
+from app.config_flags import is_enabled
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -43,34 +47,35 @@ class SupportStates(StatesGroup):
     waiting_for_message = State()
     waiting_for_admin_reply = State()
 
-# Словарь для хранения активных сессий админов
-admin_sessions = {}
+# Активные сессии ответа на тикет хранятся в хранилище FSM отдельно от состояния
+# админа (свой destiny), поэтому переживают перезапуск и не мешают другим сценариям
+ADMIN_SESSION_DESTINY = "support_reply"
 
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMINS
 
-async def check_subscription(user_id: int, bot: Bot) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        # Проверяем по CHANNEL_ID (надежнее)
-        try:
-            member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-            if member.status not in ['left', 'kicked']:
-                return True
-        except Exception as e:
-            logging.warning(f"Ошибка проверки по ID: {e}")
+def _admin_session_key(bot: Bot, admin_id: int) -> StorageKey:
+    return StorageKey(bot_id=bot.id, chat_id=admin_id, user_id=admin_id, destiny=ADMIN_SESSION_DESTINY)
 
-        # Если по ID не сработало, проверяем по USERNAME
-        try:
-            member = await bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
-            return member.status not in ['left', 'kicked']
-        except Exception as e:
-            logging.error(f"Ошибка проверки подписки для {user_id}: {e}")
-            return False
-            
-    except Exception as e:
-        logging.error(f"Критическая ошибка в check_subscription: {e}")
-        return False
+
+async def start_admin_session(bot: Bot, admin_id: int, ticket: dict):
+    """Запоминает, на какой тикет админ отвечает следующим сообщением"""
+    await fsm_storage.set_data(_admin_session_key(bot, admin_id), {
+        'ticket_id': ticket['id'],
+        'user_id': ticket['user_id'],
+        'username': ticket['username'],
+        'full_name': ticket['full_name'],
+        'message': ticket['message']
+    })
+
+
+async def get_admin_session(bot: Bot, admin_id: int) -> Optional[dict]:
+    return await fsm_storage.get_data(_admin_session_key(bot, admin_id)) or None
+
+
+async def end_admin_session(bot: Bot, admin_id: int):
+    await fsm_storage.set_data(_admin_session_key(bot, admin_id), {})
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMINS
 
 async def show_subscription_message(call: CallbackQuery, bot: Bot):
     """Показывает сообщение о необходимости подписки"""
@@ -110,8 +115,7 @@ async def support_menu(callback: types.CallbackQuery, bot: Bot):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(callback.from_user.id, bot):
+    if is_enabled('proverka') and not await check_subscription(callback.from_user.id, bot):
         await show_subscription_message(callback, bot)
         return
 
@@ -190,8 +194,7 @@ async def support_menu_no_delete(callback: types.CallbackQuery, bot: Bot):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(callback.from_user.id, bot):
+    if is_enabled('proverka') and not await check_subscription(callback.from_user.id, bot):
         await show_subscription_message(callback, bot)
         return
 
@@ -387,13 +390,8 @@ async def reply_ticket_handler(callback: types.CallbackQuery):
             return
         
         # Сохраняем сессию админа
-        admin_sessions[callback.from_user.id] = {
-            'ticket_id': ticket_id,
-            'user_id': ticket['user_id'],
-            'username': ticket['username'],
-            'full_name': ticket['full_name'],
-            'message': ticket['message']
-        }
+        if callback.bot:
+            await start_admin_session(callback.bot, callback.from_user.id, ticket)
         
         # Получаем профиль пользователя для получения Telegram ID
         user_profile = get_user_profile_by_id(ticket['user_id'])
@@ -483,26 +481,26 @@ async def handle_admin_reply(message: types.Message, state: FSMContext):
         admin_id = message.from_user.id
 
         # ВАЖНО: Проверяем, есть ли активная сессия - если нет, то НЕ обрабатываем
-        if admin_id not in admin_sessions:
+        session = await get_admin_session(message.bot, admin_id) if message.bot else None
+        if not session:
             # Если нет активной сессии поддержки, просто игнорируем сообщение
             # Это позволит другим обработчикам (например, admin_settings) обработать сообщение
             return
         
-        session = admin_sessions[admin_id]
         ticket_id = session['ticket_id']
         
         # Проверяем, что тикет еще существует
         ticket = get_support_ticket_by_id(ticket_id)
         if not ticket:
             await message.answer("❌ Тикет не найден или был удален.")
-            del admin_sessions[admin_id]
+            await end_admin_session(message.bot, admin_id)
             return
         
         # Получаем профиль пользователя
         user_profile = get_user_profile_by_id(session['user_id'])
         if not user_profile:
             await message.answer("❌ Профиль пользователя не найден.")
-            del admin_sessions[admin_id]
+            await end_admin_session(message.bot, admin_id)
             return
 
         # Отправляем ответ пользователю
@@ -529,12 +527,12 @@ async def handle_admin_reply(message: types.Message, state: FSMContext):
                 await message.answer("✅ Ответ отправлен пользователю")
                 
                 # Удаляем сессию
-                del admin_sessions[admin_id]
+                await end_admin_session(message.bot, admin_id)
                 
         except Exception as e:
             logger.error(f"[SUPPORT] Ошибка отправки ответа пользователю: {e}")
             await message.answer("❌ Ошибка отправки ответа. Пользователь мог заблокировать бота.")
-            del admin_sessions[admin_id]
+            await end_admin_session(message.bot, admin_id)
             
     except Exception as e:
         logger.error(f"[SUPPORT] Ошибка в handle_admin_reply: {e}")
@@ -9,9 +9,9 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram import Dispatcher, types
 from app.configprem import PREMIUM_PRICES
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram import Bot
 from app.database import models
+from app.database import aio
 import asyncio
 import datetime
 import json
@@ -20,8 +20,7 @@ import re
 import traceback
 from typing import Optional
 
-import aiohttp
-import aiosqlite
+from app.database.pool import connect_async
 import sqlite3
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
@@ -31,7 +30,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from app.config import ADMINS
 from app.constants import CHANNEL_ID, CHANNEL_USERNAME, CHANNEL_LINK, REVIEWS_CHANNEL, REVIEW_CHANNEL_ID, PREMIUM_FIXED_PRICES, STARS_PRICES, CRYPTO_PRICES
 from app.utils.misc import is_admin
-from app.config_flags import ref_active, proverka
+from app.config_flags import is_enabled, toggle_flag
 from app.database.models import (
     get_or_create_user, get_user_profile, get_referrals_count, get_all_users,
     update_balance, freeze_balance, unfreeze_balance, create_withdrawal,
@@ -61,6 +60,10 @@ from app.keyboards.main import (
 )
 from app.utils.activity_calendar import mark_today_activity, get_current_date
 from app.utils.misc import notify_admins, process_referral_bonus
+from app.utils.broadcast import create_broadcast, estimate_eta, format_duration, measured_rate
+from app.utils.subscription import check_subscription, handle_chat_member_update
+from app.utils.blacklist import blacklist, respond_blacklisted
+from app.utils.prices import get_crypto_rub_price, PriceUnavailable
 from app.handlers.admin import router as admin_router
 
 router = Router()
@@ -130,7 +133,6 @@ class RemoveBalanceFSM(StatesGroup):
     waiting_for_amount = State()
     confirm = State()
 
-storage = MemoryStorage()
 
 
 
@@ -155,31 +157,6 @@ async def delete_previous_message(call: types.CallbackQuery):
         logging.warning(f"Не удалось удалить сообщение: {e}")
 
 
-# Функция проверки подписки на канал
-
-async def check_subscription(user_id: int, bot: Bot) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        # Проверяем по CHANNEL_ID (надежнее)
-        try:
-            member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-            if member.status not in ['left', 'kicked']:
-                return True
-        except Exception as e:
-            logging.warning(f"Ошибка проверки по ID: {e}")
-
-        # Если по ID не сработало, проверяем по USERNAME
-        try:
-            member = await bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
-            return member.status not in ['left', 'kicked']
-        except Exception as e:
-            logging.error(f"Ошибка проверки подписки для {user_id}: {e}")
-            return False
-            
-    except Exception as e:
-        logging.error(f"Критическая ошибка в check_subscription: {e}")
-        return False
-
 async def show_subscription_message(call: CallbackQuery, bot: Bot):
     """Показывает сообщение о необходимости подписки"""
     text = (
@@ -208,7 +185,7 @@ async def show_subscription_message(call: CallbackQuery, bot: Bot):
         
 async def add_slot_attempts(user_id: int, additional_attempts: int):
     """Добавляет дополнительные попытки для слот-машины"""
-    async with aiosqlite.connect('data/users.db') as db:
+    async with connect_async('data/users.db') as db:
         # Добавляем поле для бонусных попыток
         await db.execute(
             """CREATE TABLE IF NOT EXISTS bonus_attempts (
@@ -272,7 +249,7 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
     # Проверяем, есть ли deep link для ответа на тикет
     if command.args and command.args.startswith("reply_"):
         # Импортируем необходимые модули для поддержки
-        from app.handlers.support import admin_sessions
+        from app.handlers.support import start_admin_session
         from app.database.models import get_support_ticket_by_id
         import html
 
@@ -290,13 +267,7 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
                 return
 
             # Сохраняем сессию админа
-            admin_sessions[message.from_user.id] = {
-                'ticket_id': ticket_id,
-                'user_id': ticket['user_id'],
-                'username': ticket['username'],
-                'full_name': ticket['full_name'],
-                'message': ticket['message']
-            }
+            await start_admin_session(message.bot, message.from_user.id, ticket)
 
             # Получаем профиль пользователя для получения Telegram ID
             from app.database.models import get_user_profile_by_id
@@ -324,8 +295,8 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
             return
 
     # Обычная обработка команды /start
-    MAIN_PHOTO = get_admin_setting('main_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
-    MAIN_DESCRIPTION = get_admin_setting('main_description', DEFAULT_MAIN_DESCRIPTION)
+    MAIN_PHOTO = await aio.get_admin_setting('main_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
+    MAIN_DESCRIPTION = await aio.get_admin_setting('main_description', DEFAULT_MAIN_DESCRIPTION)
 
     if not message.from_user:
         await message.answer("Ошибка: не удалось определить пользователя.")
@@ -336,7 +307,7 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
     username = message.from_user.username
 
     # Проверяем, есть ли уже пользователь
-    user = get_user_profile(tg_id)
+    user = await aio.get_user_profile(tg_id)
 
     if not user:
         # Обрабатываем реферальную ссылку
@@ -345,7 +316,7 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
             try:
                 referrer_tg_id = int(command.args.replace("ref_", ""))
                 # Получаем ID пригласившего по его tg_id
-                referrer_profile = get_user_profile(referrer_tg_id)
+                referrer_profile = await aio.get_user_profile(referrer_tg_id)
                 if referrer_profile and referrer_tg_id != tg_id:  # Нельзя пригласить самого себя
                     referrer_id = referrer_profile['id']
                     logging.info(f"[REFERRAL] Новый пользователь {tg_id} приглашен пользователем {referrer_tg_id}")
@@ -354,12 +325,12 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
 
         # Создаем нового пользователя с referrer_id
         reg_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        get_or_create_user(tg_id, full_name, username, reg_date, referrer_id)
+        await aio.get_or_create_user(tg_id, full_name, username, reg_date, referrer_id)
 
         # Уведомляем админов
         referral_info = ""
         if referrer_id:
-            referrer_profile = get_user_profile_by_id(referrer_id)
+            referrer_profile = await aio.get_user_profile_by_id(referrer_id)
             if referrer_profile:
                 referral_info = f"\n👥 Приглашен: @{referrer_profile.get('username', 'нет')} (ID: {referrer_profile['tg_id']})"
 
@@ -437,12 +408,12 @@ async def main_menu_handler(call: types.CallbackQuery):
             except:
                 pass
 
-        MAIN_PHOTO = get_admin_setting('main_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
-        MAIN_DESCRIPTION = get_admin_setting('main_description', DEFAULT_MAIN_DESCRIPTION)
+        MAIN_PHOTO = await aio.get_admin_setting('main_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
+        MAIN_DESCRIPTION = await aio.get_admin_setting('main_description', DEFAULT_MAIN_DESCRIPTION)
 
         await delete_previous_message(call)
 
-        if proverka and not await check_subscription(call.from_user.id, call.bot):
+        if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
             await show_subscription_message(call, call.bot)
             return
 
@@ -475,7 +446,7 @@ async def main_menu_handler_no_delete(call: types.CallbackQuery):
 
         # НЕ удаляем предыдущее сообщение (рассылку)
 
-        if proverka and not await check_subscription(call.from_user.id, call.bot):
+        if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
             await show_subscription_message(call, call.bot)
             return
 
@@ -512,9 +483,14 @@ async def errors_handler(error_event: types.ErrorEvent):
     logging.error(f"Update: {error_event.update}\nException: {error_event.exception}")
     return True
 
+@router.chat_member(F.chat.id == CHANNEL_ID)
+async def channel_member_updated(update: types.ChatMemberUpdated):
+    """Вступление/выход из канала: обновляем кэш подписок (бот должен быть админом канала)"""
+    handle_chat_member_update(update)
+
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_handler(callback: types.CallbackQuery):
-    is_subscribed = await check_subscription(callback.from_user.id, callback.bot)
+    is_subscribed = await check_subscription(callback.from_user.id, callback.bot, force=True)
     
     if is_subscribed:
         await callback.answer("✅ Подписка подтверждена!")
@@ -555,7 +531,7 @@ async def check_subscription_handler(callback: types.CallbackQuery):
 @router.callback_query(F.data.startswith("check_sub_"))
 async def check_subscription_for_section(callback: types.CallbackQuery):
     """Проверка подписки для конкретного раздела"""
-    is_subscribed = await check_subscription(callback.from_user.id, callback.bot)
+    is_subscribed = await check_subscription(callback.from_user.id, callback.bot, force=True)
 
     if is_subscribed:
         # Извлекаем оригинальный callback_data
@@ -763,8 +739,7 @@ async def tg_premium_menu(call: types.CallbackQuery):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(call.from_user.id, call.bot):
+    if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
         await show_subscription_message(call, call.bot)
         return
         
@@ -1582,7 +1557,7 @@ async def adminmenu(message: types.Message):
         await message.answer("Нет доступа.")
         return
     users_count = len(get_all_users())
-    from app.config_flags import proverka, ref_active
+    proverka, ref_active = is_enabled('proverka'), is_enabled('ref_active')
     from app.keyboards.main import admin_panel_kb
     text = (
         f"<b>Панель администратора:</b>\n"
@@ -1594,7 +1569,7 @@ async def adminmenu(message: types.Message):
     await message.answer(text, parse_mode="HTML", reply_markup=kb)
 
 def get_admin_panel_text_and_kb_actual():
-    from app.config_flags import proverka, ref_active
+    proverka, ref_active = is_enabled('proverka'), is_enabled('ref_active')
     from app.database.models import get_all_users
     from app.keyboards.main import admin_panel_kb
     users_count = len(get_all_users())
@@ -1613,14 +1588,8 @@ async def toggle_check(callback: types.CallbackQuery):
         await callback.answer("Нет доступа.")
         return
     
-    # Импортируем и изменяем глобальный флаг
-    from app.config_flags import proverka
-    global proverka
-    proverka = not proverka
-    
-    # Обновляем значение в модуле config_flags
-    import app.config_flags
-    app.config_flags.proverka = proverka
+    # Флаг общий для всех процессов бота
+    proverka = await toggle_flag('proverka')
     
     # Обновляем сообщение с админ-панелью
     try:
@@ -1638,11 +1607,7 @@ async def toggle_ref(callback: types.CallbackQuery):
     if callback.from_user.id not in ADMINS:
         await callback.answer("Нет доступа.")
         return
-    global ref_active
-    from app.config_flags import ref_active
-    ref_active = not ref_active
-    import app.config_flags
-    app.config_flags.ref_active = ref_active
+    await toggle_flag('ref_active')
     try:
         await callback.message.delete()
     except Exception:
@@ -1653,7 +1618,7 @@ async def toggle_ref(callback: types.CallbackQuery):
 @router.callback_query(F.data == "state_proverka_on")
 async def cb_proverka_on(callback: types.CallbackQuery):
     from app.database.models import get_all_users
-    from app.config_flags import proverka, ref_active
+    proverka, ref_active = is_enabled('proverka'), is_enabled('ref_active')
     user_count = len(get_all_users())
     check_emoji = "✅" if proverka else "⛔️"
     ref_emoji = "✅" if ref_active else "⛔️"
@@ -1774,45 +1739,6 @@ async def waiturl2(message: types.Message, state: FSMContext):
     )
     await state.set_state(Form.photo_id)
 
-async def send_message_to_user(bot, tg_id, message_text, markup):
-    try:
-        await bot.send_message(tg_id, message_text, reply_markup=markup)
-    except Exception as e:
-        print(f"[ERR] Не удалось отправить сообщение {tg_id}: {e}")
-
-async def send_photo_to_user(bot, tg_id, photo_id, caption, markup):
-    try:
-        await bot.send_photo(tg_id, photo=photo_id, caption=caption, reply_markup=markup)
-    except Exception as e:
-        print(f"[ERR] Не удалось отправить фото {tg_id}: {e}")
-
-async def broadcast_message(bot, message_text, markup):
-    from app.database.models import get_all_users
-    users = get_all_users()
-    user_ids = [row[1] for row in users]  # tg_id
-    batch_size = 30
-    for i in range(0, len(user_ids), batch_size):
-        batch = user_ids[i:i + batch_size]
-        await asyncio.gather(*(send_message_to_user(bot, tg_id, message_text, markup) for tg_id in batch))
-        await asyncio.sleep(1)
-
-async def broadcast_photo(bot, photo_id, caption, markup):
-    from app.database.models import get_all_users
-    users = get_all_users()
-    user_ids = [row[1] for row in users]  # tg_id
-    batch_size = 30
-    for i in range(0, len(user_ids), batch_size):
-        batch = user_ids[i:i + batch_size]
-        await asyncio.gather(*(send_photo_to_user(bot, tg_id, photo_id, caption, markup) for tg_id in batch))
-        await asyncio.sleep(1)
-
-def estimate_broadcast_time(user_count: int, batch_size: int = 30, delay: float = 1.0) -> str:
-    total_batches = (user_count + batch_size - 1) // batch_size
-    estimated_seconds = total_batches * delay + total_batches * 1.5  # 1.5 сек на отправку
-    minutes = int(estimated_seconds // 60)
-    seconds = int(estimated_seconds % 60)
-    return f"{minutes} мин {seconds} сек" if minutes > 0 else f"{seconds} сек"
-
 @router.message(Form.photo_id)
 async def buttonlink(message: types.Message, state: FSMContext):
     data = await state.get_data()
@@ -1864,23 +1790,13 @@ async def buttonlink(message: types.Message, state: FSMContext):
     # Создаем клавиатуру с кнопками (в одну строку)
     markup = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
 
-    from app.database.models import get_all_users
-    user_count = len(get_all_users())
-
-    # Локальная функция для расчета времени рассылки
-    def estimate_broadcast_time_local(user_count: int, batch_size: int = 30, delay: float = 1.0) -> str:
-        total_batches = (user_count + batch_size - 1) // batch_size
-        estimated_seconds = total_batches * delay + total_batches * 1.5  # 1.5 сек на отправку
-        minutes = int(estimated_seconds // 60)
-        seconds = int(estimated_seconds % 60)
-        return f"{minutes} мин {seconds} сек" if minutes > 0 else f"{seconds} сек"
+    previous_rate = await aio.run_read(measured_rate)
 
-    estimated_time = estimate_broadcast_time_local(user_count)
-    
     if message.text and message.text.lower() == 'безфото':
+        job = await create_broadcast(message.bot, message_text, markup, created_by=message.from_user.id)
         await message.answer(
-            f"🚀 Начинаю рассылку без фото...\n👥 Пользователей: {user_count}\n⏱ Примерное время: {estimated_time}")
-        asyncio.create_task(broadcast_message(message.bot, message_text, markup))
+            f"🚀 Начинаю рассылку без фото...\n👥 Пользователей: {job['total']}\n"
+            f"⏱ Примерное время: {format_duration(estimate_eta(job, previous_rate))}")
         await message.answer("✅ Рассылка запущена.")
         await state.clear()
         return
@@ -1892,17 +1808,20 @@ async def buttonlink(message: types.Message, state: FSMContext):
             caption=message_text, 
             reply_markup=markup
         )
+        job = await create_broadcast(message.bot, message_text, markup, photo_id=photo_id,
+                                     created_by=message.from_user.id)
         await message.answer(
-            f"🚀 Начинаю рассылку с фото...\n👥 Пользователей: {user_count}\n⏱ Примерное время: {estimated_time}")
-        asyncio.create_task(broadcast_photo(message.bot, photo_id, message_text, markup))
+            f"🚀 Начинаю рассылку с фото...\n👥 Пользователей: {job['total']}\n"
+            f"⏱ Примерное время: {format_duration(estimate_eta(job, previous_rate))}")
         await message.answer("✅ Рассылка с фото запущена.")
         await state.clear()
         return
         
     # Если нет фото и не указано 'безфото', отправляем просто текст
+    job = await create_broadcast(message.bot, message_text, markup, created_by=message.from_user.id)
     await message.answer(
-        f"🚀 Начинаю рассылку без фото...\n👥 Пользователей: {user_count}\n⏱ Примерное время: {estimated_time}")
-    asyncio.create_task(broadcast_message(message.bot, message_text, markup))
+        f"🚀 Начинаю рассылку без фото...\n👥 Пользователей: {job['total']}\n"
+        f"⏱ Примерное время: {format_duration(estimate_eta(job, previous_rate))}")
     await message.answer("✅ Рассылка запущена.")
     await state.clear()
 
@@ -1952,14 +1871,9 @@ async def handle_activity(callback: types.CallbackQuery):
     await activity_menu_from_main_no_delete(callback, callback.bot)
 
 @router.callback_query(F.data == 'profile')
-async def handle_profile(callback: types.CallbackQuery):
+async def handle_profile(callback: types.CallbackQuery, state: FSMContext):
     """Обработчик кнопки profile - НЕ удаляет сообщение рассылки"""
     await callback.answer()
-    # Создаем пустой FSMContext для совместимости
-    from aiogram.fsm.context import FSMContext
-    from aiogram.fsm.storage.memory import MemoryStorage
-    storage = MemoryStorage()
-    state = FSMContext(storage=storage, key=f"user:{callback.from_user.id}")
     await profile_menu_no_delete(callback, callback.bot, state)
 
 @router.callback_query(F.data == 'support')
@@ -1975,39 +1889,40 @@ async def handle_support(callback: types.CallbackQuery):
 async def admin_db_start(callback: types.CallbackQuery, state: FSMContext):
     await render_db_page(callback.message, 0)
 
-async def render_db_page(message, page: int):
-    from app.database.models import get_all_users
-    users = get_all_users()
-    per_page = 5
-    total_users = len(users)
-    total_pages = (total_users + per_page - 1) // per_page
+DB_PAGE_SIZE = 5
+
+async def render_db_page(message, page: int, after_id: int = None, before_id: int = None):
+    """
+    Страница базы пользователей. Страницы листаются по id (keyset): кнопки несут
+    id последней/первой строки, при переходе по номеру начало страницы ищется один раз.
+    """
+    total_users = await aio.count_users()
+    total_pages = (total_users + DB_PAGE_SIZE - 1) // DB_PAGE_SIZE
     if page < 0 or page >= total_pages:
         await message.answer(f"❗ Всего страниц: {total_pages}. Укажите число от 1 до {total_pages}.")
         return
-    start = page * per_page
-    end = start + per_page
-    users_page = users[start:end]
+    if after_id is None and before_id is None:
+        first_id = await aio.get_user_id_at(page * DB_PAGE_SIZE)
+        after_id = first_id - 1 if first_id is not None else 0
+    users_page = await aio.get_users_page(after_id=after_id, limit=DB_PAGE_SIZE, before_id=before_id)
+    if not users_page:
+        await message.answer("❗ Страница пуста.")
+        return
     text = f"<b>📦 База данных (стр. {page + 1} из {total_pages})</b>\n\n"
     for user in users_page:
-        tg_id = user[1]
-        username = user[3] or '—'
-        balance = user[5] if len(user) > 5 else 0
-        regdate = user[4] or '—'
-        ref_id = user[7] if len(user) > 7 else None
-        # Считаем сколько пригласил
-        from app.database.models import get_referrals_count
-        ref_count = get_referrals_count(tg_id)
-        text += (f"👤 ID: <code>{tg_id}</code>\n"
-                 f"📛 Username: @{username}\n"
-                 f"💰 Баланс: {balance:.2f}₽\n"
-                 f"📅 Регистрация: {regdate}\n"
-                 f"🔗 Пригласил: <code>{ref_id or '—'}</code>\n"
-                 f"👥 Приглашено: {ref_count}\n\n")
+        text += (f"👤 ID: <code>{user['tg_id']}</code>\n"
+                 f"📛 Username: @{user['username'] or '—'}\n"
+                 f"💰 Баланс: {user['balance'] or 0:.2f}₽\n"
+                 f"📅 Регистрация: {user['reg_date'] or '—'}\n"
+                 f"🔗 Пригласил: <code>{user['referrer_id'] or '—'}</code>\n"
+                 f"👥 Приглашено: {user['referrals']}\n\n")
     nav_buttons = []
     if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_db_page:{page - 1}"))
+        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад",
+                                                callback_data=f"admin_db_page:{page - 1}:<{users_page[0]['id']}"))
     if (page + 1) < total_pages:
-        nav_buttons.append(InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"admin_db_page:{page + 1}"))
+        nav_buttons.append(InlineKeyboardButton(text="➡️ Вперёд",
+                                                callback_data=f"admin_db_page:{page + 1}:>{users_page[-1]['id']}"))
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         nav_buttons,
         [InlineKeyboardButton(text="🔢 Перейти к странице", callback_data="admin_db_goto")],
@@ -2018,9 +1933,17 @@ async def render_db_page(message, page: int):
 
 @router.callback_query(F.data.startswith("admin_db_page:"))
 async def handle_db_page(callback: types.CallbackQuery):
-    page = int(callback.data.split(":")[1])
+    # admin_db_page:<страница>[:>id | :<id]
+    parts = callback.data.split(":")
+    page = int(parts[1])
+    after_id = before_id = None
+    if len(parts) > 2 and parts[2][1:].isdigit():
+        if parts[2][0] == '>':
+            after_id = int(parts[2][1:])
+        elif parts[2][0] == '<':
+            before_id = int(parts[2][1:])
     await callback.message.delete()
-    await render_db_page(callback.message, page)
+    await render_db_page(callback.message, page, after_id=after_id, before_id=before_id)
 
 @router.callback_query(F.data == "admin_db_goto")
 async def ask_page_number(callback: types.CallbackQuery, state: FSMContext):
@@ -2051,49 +1974,27 @@ async def admin_db_search_query(message: types.Message, state: FSMContext):
     if query.startswith('@'):
         query = query[1:]  # Убираем @ если есть
 
-    from app.database.models import get_all_users, get_user_profile, get_referrals_count
-    users = get_all_users()
-    found_user = None
-    for user in users:
-        tg_id = str(user[1])
-        username = user[3] or ''
-        if query.isdigit() and tg_id == query:
-            found_user = user
-            break
-        elif query.lower() in username.lower():
-            found_user = user
-            break
-    if not found_user:
+    found = await aio.search_users(query)
+    if not found:
         await message.answer("❗ Пользователь не найден.")
         await state.clear()
         return
+    found_user = found[0]
     # Получаем подробную информацию о пользователе
-    tg_id = found_user[1]
-    username = found_user[3] or '—'
-    balance = found_user[5] if len(found_user) > 5 else 0
-    regdate = found_user[4] or 'None'
-    ref_id = found_user[7] if len(found_user) > 7 else None
+    tg_id = found_user['tg_id']
+    username = found_user['username'] or '—'
+    balance = found_user['balance'] or 0
+    regdate = found_user['reg_date'] or 'None'
+    ref_id = found_user['referrer_id']
     # Получаем username пригласившего
     inviter = '—'
     if ref_id:
-        inviter_profile = None
-        for u in users:
-            if u[0] == ref_id:
-                inviter_profile = u
-                break
+        inviter_profile = await aio.get_user_profile_by_id(ref_id)
         if inviter_profile:
-            if isinstance(inviter_profile, dict):
-                inviter = f"@{inviter_profile['username']}" if inviter_profile['username'] else f"ID: {inviter_profile['tg_id']}"
-            else:
-                inviter = f"@{inviter_profile[3]}" if inviter_profile[3] else f"ID: {inviter_profile[1]}"
+            inviter = f"@{inviter_profile['username']}" if inviter_profile['username'] else f"ID: {inviter_profile['tg_id']}"
     # Получаем рефералов
-    from app.database.models import get_all_users
-    referrals = []
-    for u in users:
-        if u[7] == found_user[0]:
-            ref_username = u[3] or f"ID: {u[1]}"
-            ref_balance = u[5] if len(u) > 5 else 0
-            referrals.append((ref_username, ref_balance))
+    referrals = [(ref_username or f"ID: {ref_tg_id}", ref_balance or 0)
+                 for ref_username, ref_tg_id, ref_balance in await aio.get_user_referrals(found_user['id'])]
     # Формируем текст
     text = (
         f"<b>🔍 Найден пользователь</b>\n\n"
@@ -2109,6 +2010,9 @@ async def admin_db_search_query(message: types.Message, state: FSMContext):
             text += f"  └ @{ref_username}: {ref_balance:.2f}₽\n"
     else:
         text += "  —"
+    if len(found) > 1:
+        others = ", ".join(f"@{u['username']}" if u['username'] else str(u['tg_id']) for u in found[1:])
+        text += f"\n\n<b>Также найдены:</b> {others}"
     # Кнопки управления
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Добавить баланс", callback_data="add_balance"), InlineKeyboardButton(text="Убрать баланс", callback_data="remove_balance")],
@@ -2118,59 +2022,23 @@ async def admin_db_search_query(message: types.Message, state: FSMContext):
     await state.clear()
 
 async def get_blacklist():
-    rows = []
-    async with aiosqlite.connect('data/blacklist.db') as db:
-        await db.execute('CREATE TABLE IF NOT EXISTS blacklist (tg_id INTEGER PRIMARY KEY, reason TEXT, date_added TEXT)')
-        await db.commit()
-        async with db.execute('SELECT tg_id, reason, date_added FROM blacklist') as cursor:
-            rows = await cursor.fetchall()
-    return rows
+    return await blacklist.rows()
 
 async def add_to_blacklist(tg_id, reason):
-    async with aiosqlite.connect('data/blacklist.db') as db:
-        await db.execute('''CREATE TABLE IF NOT EXISTS blacklist (tg_id INTEGER PRIMARY KEY, reason TEXT, date_added TEXT)''')
-        await db.execute('INSERT OR REPLACE INTO blacklist (tg_id, reason, date_added) VALUES (?, ?, ?)', (tg_id, reason, datetime.datetime.now().strftime('%Y-%m-%d')))
-        await db.commit()
+    await blacklist.add(tg_id, reason)
 
 async def remove_from_blacklist(tg_id):
-    async with aiosqlite.connect('data/blacklist.db') as db:
-        await db.execute('DELETE FROM blacklist WHERE tg_id = ?', (tg_id,))
-        await db.commit()
+    await blacklist.remove(tg_id)
 
 async def is_blacklisted(tg_id):
     """Проверяет, находится ли пользователь в черном списке"""
-    async with aiosqlite.connect('data/blacklist.db') as db:
-        await db.execute('CREATE TABLE IF NOT EXISTS blacklist (tg_id INTEGER PRIMARY KEY, reason TEXT, date_added TEXT)')
-        await db.commit()
-        async with db.execute('SELECT reason FROM blacklist WHERE tg_id = ?', (tg_id,)) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else None
+    return await blacklist.get_reason(tg_id)
 
 async def check_blacklist_and_respond(user_id, message_or_callback):
     """Универсальная функция проверки черного списка с отправкой сообщения"""
     blacklist_reason = await is_blacklisted(user_id)
     if blacklist_reason:
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="📞 Связаться", url="https://t.me/legal_stars")],
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
-        ])
-
-        blacklist_message = (
-            f"🚫 <b>Доступ ограничен</b>\n\n"
-            f"Вы находитесь в черном списке.\n"
-            f"📝 Причина: {blacklist_reason}\n\n"
-            f"Для решения вопроса обратитесь в поддержку."
-        )
-
-        if hasattr(message_or_callback, 'message'):  # CallbackQuery
-            try:
-                await message_or_callback.message.delete()
-            except Exception:
-                pass
-            await message_or_callback.message.answer(blacklist_message, reply_markup=kb, parse_mode="HTML")
-        else:  # Message
-            await message_or_callback.answer(blacklist_message, reply_markup=kb, parse_mode="HTML")
-
+        await respond_blacklisted(message_or_callback, blacklist_reason)
         return True
     return False
 
@@ -2185,7 +2053,7 @@ async def show_blacklist(callback: types.CallbackQuery):
     if not rows:
         text += "\nПока что пусто ✅"
     else:
-        async with aiosqlite.connect("data/users.db") as users_db:
+        async with connect_async("data/users.db") as users_db:
             for tg_id, reason, date in rows:
                 cursor = await users_db.execute("SELECT username FROM users WHERE tg_id = ?", (tg_id,))
                 user = await cursor.fetchone()
@@ -2195,7 +2063,7 @@ async def show_blacklist(callback: types.CallbackQuery):
     buttons = []
     if rows:
         for tg_id, reason, date in rows:
-            async with aiosqlite.connect("data/users.db") as users_db:
+            async with connect_async("data/users.db") as users_db:
                 cursor = await users_db.execute("SELECT username FROM users WHERE tg_id = ?", (tg_id,))
                 user = await cursor.fetchone()
                 username = f"@{user[0]}" if user and user[0] else f"ID:{tg_id}"
@@ -2232,7 +2100,7 @@ async def ask_blacklist_reason(message: types.Message, state: FSMContext):
 
     if text.startswith("@"):  # username
         username = text[1:]
-        async with aiosqlite.connect("data/users.db") as db:
+        async with connect_async("data/users.db") as db:
             cursor = await db.execute("SELECT tg_id FROM users WHERE username = ?", (username,))
             row = await cursor.fetchone()
             if row:
@@ -2300,7 +2168,7 @@ async def unban_user_from_blacklist(callback: types.CallbackQuery):
         tg_id = int(callback.data.split("_")[-1])
 
         # Получаем информацию о пользователе
-        async with aiosqlite.connect("data/users.db") as db:
+        async with connect_async("data/users.db") as db:
             cursor = await db.execute("SELECT username FROM users WHERE tg_id = ?", (tg_id,))
             user = await cursor.fetchone()
             username_display = f"@{user[0]}" if user and user[0] else f"ID: {tg_id}"
@@ -2376,7 +2244,7 @@ async def process_user_deletion(message: types.Message, state: FSMContext):
 
     try:
         # Ищем пользователя в базе данных
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             if search_type == "username":
                 cursor = await db.execute('SELECT tg_id, username, full_name, balance FROM users WHERE LOWER(username) = ?', (username,))
             else:
@@ -2435,7 +2303,7 @@ async def confirm_user_deletion(callback: types.CallbackQuery):
         tg_id = int(callback.data.split("_")[-1])
 
         # Получаем информацию о пользователе перед удалением
-        async with aiosqlite.connect('data/users.db') as db:
+        async with connect_async('data/users.db') as db:
             cursor = await db.execute('SELECT username, full_name FROM users WHERE tg_id = ?', (tg_id,))
             user = await cursor.fetchone()
 
@@ -2812,8 +2680,7 @@ async def crypto_menu(call: types.CallbackQuery):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(call.from_user.id, call.bot):
+    if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
         await show_subscription_message(call, call.bot)
         return
         
@@ -2878,7 +2745,11 @@ async def process_ton_amount(message: types.Message, state: FSMContext):
     if amount < 0.2:
         await message.answer("Минимум для покупки: 0.2 TON", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="crypto")]]))
         return
-    price_rub = await get_crypto_rub_price('TON')
+    try:
+        price_rub = await get_crypto_rub_price('TON')
+    except PriceUnavailable:
+        await message.answer("⚠️ Не удалось получить курс TON. Попробуйте позже.", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="crypto")]]))
+        return
     total = amount * price_rub * 1.20  # +20%
     await state.update_data(coin='TON', amount=amount, total=total)
     text = f"💱 Вы хотите купить {amount} TON\n💰 Сумма покупки: {total:.6f} RUB\n\nПродолжить покупку?"
@@ -2900,7 +2771,11 @@ async def process_not_amount(message: types.Message, state: FSMContext):
     if amount < 500:
         await message.answer("Минимум для покупки: 500 NOT", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="crypto")]]))
         return
-    price_rub = await get_crypto_rub_price('NOT')
+    try:
+        price_rub = await get_crypto_rub_price('NOT')
+    except PriceUnavailable:
+        await message.answer("⚠️ Не удалось получить курс NOT. Попробуйте позже.", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="crypto")]]))
+        return
     total = amount * price_rub * 1.18  # +18%
     await state.update_data(coin='NOT', amount=amount, total=total)
     text = f"💱 Вы хотите купить {amount} NOT\n💰 Сумма покупки: {total:.6f} RUB\n\nПродолжить покупку?"
@@ -2922,7 +2797,11 @@ async def process_dogs_amount(message: types.Message, state: FSMContext):
     if amount < 5000:
         await message.answer("💸 Введите сумму для вывода (минимум 500₽):", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="profile")]]))
         return
-    price_rub = await get_crypto_rub_price('DOGS')
+    try:
+        price_rub = await get_crypto_rub_price('DOGS')
+    except PriceUnavailable:
+        await message.answer("⚠️ Не удалось получить курс DOGS. Попробуйте позже.", reply_markup=types.InlineKeyboardMarkup(inline_keyboard=[[types.InlineKeyboardButton(text="⬅️ Назад", callback_data="crypto")]]))
+        return
     total = amount * price_rub * 1.15  # +15%
     await state.update_data(coin='DOGS', amount=amount, total=total)
     text = f"💱 Вы хотите купить {amount} DOGS\n💰 Сумма покупки: {total:.6f} RUB\n\nПродолжить покупку?"
@@ -3163,18 +3042,6 @@ async def crypto_other(call: types.CallbackQuery):
     
     await call.message.answer(text, reply_markup=kb)
 
-async def get_crypto_rub_price(symbol):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'https://api.binance.com/api/v3/ticker/price?symbol={symbol}USDT') as resp:
-            data = await resp.json()
-            price_usdt = float(data['price'])
-        async with session.get('https://www.cbr-xml-daily.ru/daily_json.js') as resp:
-            text = await resp.text()
-            data = json.loads(text)
-            usd_rub = float(data['Valute']['USD']['Value'])
-        price_rub = price_usdt * usd_rub
-        return price_rub
-
 @router.callback_query(F.data == "stars")
 async def stars_menu(call: types.CallbackQuery):
     await delete_previous_message(call)
@@ -3254,7 +3121,7 @@ async def withdraw_amount(message: types.Message, state: FSMContext):
         return
 
     # Получаем баланс из базы
-    async with aiosqlite.connect("data/users.db") as db:
+    async with connect_async("data/users.db") as db:
         cursor = await db.execute("SELECT balance FROM users WHERE tg_id = ?", (message.from_user.id,))
         result = await cursor.fetchone()
         if not result:
@@ -3504,7 +3371,7 @@ async def profile_menu(call: types.CallbackQuery, bot: Bot, state: FSMContext):
 
     try:
         # Получаем данные пользователя
-        user = get_user_profile(call.from_user.id)
+        user = await aio.get_user_profile(call.from_user.id)
         if not user:
             await call.message.answer(
                 "Профиль не найден.", 
@@ -3518,8 +3385,8 @@ async def profile_menu(call: types.CallbackQuery, bot: Bot, state: FSMContext):
         reg_date = user['reg_date'] or "не указана"
         
         # Получаем настройки профиля из админ панели
-        profile_description = get_admin_setting('profile_description', '🚀 <b>Ваш профиль</b>\n\nЗдесь вы можете посмотреть информацию о своем аккаунте, балансе и истории операций.')
-        profile_photo = get_admin_setting('profile_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
+        profile_description = await aio.get_admin_setting('profile_description', '🚀 <b>Ваш профиль</b>\n\nЗдесь вы можете посмотреть информацию о своем аккаунте, балансе и истории операций.')
+        profile_photo = await aio.get_admin_setting('profile_photo', 'https://imgur.com/a/TkOPe7c.jpeg')
 
         # Формируем текст
         text = (
@@ -3531,10 +3398,10 @@ async def profile_menu(call: types.CallbackQuery, bot: Bot, state: FSMContext):
         )
 
         # Добавляем реферальную информацию, если включено
-        if ref_active:
+        if is_enabled('ref_active'):
             from app.database.models import get_unclaimed_referrals_count
 
-            referrals = get_referrals_count(user['tg_id'])
+            referrals = await aio.get_referrals_count(user['tg_id'])
             bot_username = (await bot.me()).username
             ref_link = f"https://t.me/{bot_username}?start=ref_{user['tg_id']}"
 
@@ -4294,79 +4161,7 @@ async def order_delete(callback: types.CallbackQuery):
     except Exception as e:
         await callback.answer(f"❌ Ошибка: {str(e)}")
 
-# Новый постраничный обработчик для заявок
-@router.callback_query(lambda c: c.data.startswith("admin_orders"))
-async def admin_orders_callback(callback: types.CallbackQuery):
-    await callback.message.delete()
-    from app.database.models import get_all_orders, get_all_reviews
-    import json
-    
-    orders = get_all_orders()
-    reviews = get_all_reviews()
-    
-    if not orders and not reviews:
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")],
-        ])
-        await callback.message.answer("📋 Нет активных заявок и отзывов.", reply_markup=kb)
-        return
-    
-    text = "📋 <b>Все заявки и отзывы:</b>\n\n"
-    
-    # Заказы
-    if orders:
-        text += "🛍️ <b>ЗАКАЗЫ:</b>\n"
-        type_icons = {"premium": "⭐️", "stars": "🌟", "crypto": "🦙", "withdraw": "💸"}
-        for order in orders:
-            order_id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id = order
-            icon = type_icons.get(order_type, "❔")
-            status_emoji = {"pending": "⏳", "completed": "✅", "rejected": "❌"}
-            status_icon = status_emoji.get(status, "❔")
-            
-            text += f"{icon} <b>Заказ #{order_id}</b> {status_icon}\n"
-            text += f"👤 ID: <code>{user_id}</code>\n"
-            try:
-                amount_f = float(amount)
-                text += f"💰 Сумма: <b>{amount_f:.2f}₽</b>\n"
-            except Exception:
-                text += f"💰 Сумма: <b>{amount}₽</b>\n"
-            text += f"📦 Тип: {order_type}\n"
-            if extra_data:
-                try:
-                    extra = json.loads(extra_data)
-                    if order_type == 'premium':
-                        text += f"📅 Период: {extra.get('period','?')}\n"
-                        text += f"🎁 Получатель: {extra.get('recipient','?')}\n"
-                    elif order_type == 'stars':
-                        text += f"⭐ Количество: {extra.get('amount','?')}\n"
-                        text += f"🎁 Получатель: {extra.get('recipient','?')}\n"
-                    elif order_type == 'crypto':
-                        text += f"🦙 Монета: {extra.get('coin','?')}\n"
-                        text += f"📊 Количество: {extra.get('amount','?')}\n"
-                        text += f"🏦 Кошелёк: {extra.get('wallet','?')}\n"
-                    elif order_type == 'withdraw':
-                        text += f"💳 Реквизиты: {extra.get('requisites','?')}\n"
-                except Exception:
-                    pass
-            text += f"⏰ Время: {created_at}\n\n"
-    
-    # Отзывы
-    if reviews:
-        text += "📝 <b>ОТЗЫВЫ:</b>\n"
-        for review in reviews:
-            review_id, user_id, content, status, created_at, file_id, admin_msg_id, channel_msg_id = review
-            status_emoji = {"pending": "⏳", "published": "✅", "rejected": "❌"}
-            status_icon = status_emoji.get(status, "❔")
-            
-            text += f"📝 <b>Отзыв #{review_id}</b> {status_icon}\n"
-            text += f"👤 ID: <code>{user_id}</code>\n"
-            text += f"📄 Статус: {status}\n"
-            text += f"⏰ Время: {created_at}\n\n"
-    
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_panel")],
-    ])
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=kb)
+# Очередь заявок (admin_orders, admin_orders_page:*) — в app/handlers/admin.py
 
 @router.callback_query(F.data == "admin_clear_orders")
 async def admin_clear_orders_callback(callback: types.CallbackQuery):
@@ -4453,117 +4248,19 @@ async def cancel_receipt_upload(message: Message, state: FSMContext):
 
 
 async def check_subscription_required(user_id: int, bot) -> bool:
-    from app.config_flags import proverka
+    proverka = is_enabled('proverka')
     # Если проверка выключена - пропускаем
     if not proverka:
         return True
         
     # Если проверка включена - проверяем подписку
-    try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        return member.status not in ['left', 'kicked']
-    except Exception:
-        return False
+    return await check_subscription(user_id, bot)
 
 # В начало каждого хендлера (crypto_menu, stars_menu, tg_premium_menu) добавь:
 # if not await check_subscription_required(call.from_user.id, call.bot):
 #     await show_subscription_message(call, call.bot)
 #     return
 
-# Обработчик первой кнопки "Все заявки"
-@router.callback_query(F.data == "admin_orders_0")
-async def admin_orders_first(callback: types.CallbackQuery):
-    # Удаляем старый обработчик, чтобы не было конфликтов
-    pass
-
-# Обработчик листания страниц заявок
-@router.callback_query(F.data.startswith("admin_orders_page:"))
-async def admin_orders_page_callback(callback: types.CallbackQuery):
-    page = int(callback.data.split(":")[1])
-    await callback.message.delete()
-    await render_orders_page(callback, page)
-
-async def render_orders_page(callback, page: int):
-    from app.database.models import get_all_orders
-    orders = get_all_orders()
-    per_page = 5
-    total_orders = len(orders)
-    total_pages = (total_orders + per_page - 1) // per_page
-    
-    if page < 0 or page >= total_pages:
-        await callback.bot.send_message(callback.from_user.id, f"❗️ Всего страниц: {total_pages}. Укажите число от 1 до {total_pages}.")
-        return
-        
-    start = page * per_page
-    end = start + per_page
-    orders_page = orders[start:end]
-    
-    text = f"<b>ЗАЯВКИ (стр. {page + 1} из {total_pages}):</b>\n\n"
-    status_emoji = {"pending": "⏳", "completed": "✅", "rejected": "❌"}
-    type_icons = {"premium": "⭐️", "stars": "🌟", "crypto": "🦙", "withdraw": "💸", "slot_win": "🎰", "activity_reward": "🎁"}
-    
-    for order in orders_page:
-        order_id, user_id, order_type, amount, status, created_at, file_id, extra_data, admin_msg_id = order
-        icon = type_icons.get(order_type, "❔")
-        stat = status_emoji.get(status, "❔")
-        
-        text += f"{icon} ЗАКАЗ #{order_id} {stat}\nID: {user_id}\n"
-        
-        try:
-            amount_f = float(amount)
-            text += f"💰 Сумма: {amount_f:.2f}₽\n"
-        except Exception:
-            text += f"💰 Сумма: {amount}\n"
-            
-        text += f"📊 Тип: {order_type}\n"
-        
-        try:
-            extra = json.loads(order['extra_data']) if order['extra_data'] else {}
-            
-            # Добавляем отображение времени подтверждения для завершенных заказов
-            if order['status'] == 'completed' and 'confirmed_at' in extra:
-                text += f"🕒 Подтверждён: {extra['confirmed_at']}\n"
-                
-        except json.JSONDecodeError:
-            pass
-                
-            # Остальные детали заказа...
-            if order_type == 'premium':
-                if 'period' in extra:
-                    text += f"📅 Период: {extra.get('period','-')}\n"
-                if 'recipient' in extra:
-                    text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
-            elif order_type == 'stars':
-                if 'amount' in extra:
-                    text += f"⭐ Количество: {extra.get('amount','-')}\n"
-                if 'recipient' in extra:
-                    text += f"🎁 Получатель: {extra.get('recipient','-')}\n"
-            elif order_type == 'crypto':
-                if 'coin' in extra:
-                    text += f"🦙 Монета: {extra.get('coin','-')}\n"
-                if 'amount' in extra:
-                    text += f"📊 Количество: {extra.get('amount','-')}\n"
-                if 'wallet' in extra:
-                    text += f"🏦 Кошелёк: {extra.get('wallet','-')}\n"
-            elif order_type == 'withdraw':
-                if 'requisites' in extra:
-                    text += f"💳 Реквизиты: {extra.get('requisites','-')}\n"
-                    
-        except Exception as e:
-            logging.warning(f"[render_orders_page] extra_data parse error: {e}")
-            
-        text += f"⏰ Создан: {created_at}\n\n"
-        
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"admin_orders_page:{page-1}"))
-    if (page + 1) < total_pages:
-        nav_buttons.append(InlineKeyboardButton(text="➡️ Вперёд", callback_data=f"admin_orders_page:{page+1}"))
-    nav_buttons.append(InlineKeyboardButton(text="🏠 В меню", callback_data="admin_panel"))
-    
-    kb = InlineKeyboardMarkup(inline_keyboard=[nav_buttons])
-    await callback.bot.send_message(callback.from_user.id, text, parse_mode="HTML", reply_markup=kb)
-
 @router.message(Command("clear_calendar"))
 async def clear_calendar_command(message: types.Message):
     if message.from_user.id not in ADMINS:
@@ -4672,8 +4369,7 @@ async def tg_premium_menu_no_delete(call: types.CallbackQuery):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(call.from_user.id, call.bot):
+    if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
         await show_subscription_message(call, call.bot)
         return
 
@@ -4693,8 +4389,7 @@ async def crypto_menu_no_delete(call: types.CallbackQuery):
         return
 
     # Проверка подписки (только если включена в настройках)
-    from app.config_flags import proverka
-    if proverka and not await check_subscription(call.from_user.id, call.bot):
+    if is_enabled('proverka') and not await check_subscription(call.from_user.id, call.bot):
         await show_subscription_message(call, call.bot)
         return
 
@@ -4781,7 +4476,7 @@ async def profile_menu_no_delete(call: types.CallbackQuery, bot: Bot, state: FSM
         )
 
         # Добавляем реферальную информацию, если включено
-        if ref_active:
+        if is_enabled('ref_active'):
             from app.database.models import get_unclaimed_referrals_count
 
             referrals = get_referrals_count(user['tg_id'])
@@ -260,7 +260,8 @@ def admin_slot_settings_kb():
 
 def admin_panel_kb():
     """Компактная клавиатура админ-панели"""
-    from app.config_flags import proverka, ref_active
+    from app.config_flags import is_enabled
+    proverka, ref_active = is_enabled('proverka'), is_enabled('ref_active')
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
@@ -8,11 +8,30 @@ from pathlib import Path
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from app.config import BOT_TOKEN
+from app.config import (
+    BOT_TOKEN, BOT_MODE, TELEGRAM_API_URL, WEBHOOK_BASE_URL, WORKER_INDEX, TRACE_ENABLED,
+    METRICS_PORT, JOURNAL_ENABLED, JOURNAL_PATH,
+)
 from app.handlers import register_user_handlers
-from app.database import init_db
+from app.database import init_db, aio, models
+from app.database.pool import get_pool
+from app.database.journal import journal
+from app.database.profile import log_profile_report, maintenance_loop
+from app.database.retention import retention_loop
+from app.utils.broadcast import resume_broadcasts
+from app.utils.blacklist import blacklist
+from app.utils.fsm_storage import fsm_storage
+from app.utils.coordination import coordinator
+from app.utils.admin_notify import admin_notifier
+from app.utils.prices import price_oracle
+from app.middlewares import ApiRateMiddleware, ApiTracingMiddleware, BlacklistMiddleware, setup_tracing
+from app.tracing import start_metrics_server
+from app.utils.media import media_registry, MediaRequestMiddleware
+from app.webhook import run_webhook
+from app.cluster import run_worker
 
 # Настройка логирования
 def setup_logging():
@@ -52,39 +71,121 @@ def setup_logging():
     
     return logger
 
+def build_dispatcher(storage=None) -> Dispatcher:
+    """
+    Диспетчер со всеми обработчиками и middleware. Роутеры подключаются к
+    диспетчеру один раз, поэтому в одном процессе — один вызов (бот или бенчмарк)
+    """
+    dp = Dispatcher(storage=storage)
+    if TRACE_ENABLED:
+        # SQL, Bot API и время обработчика на каждое обновление (app/tracing.py)
+        setup_tracing(dp)
+    # Чёрный список проверяется до всех обработчиков
+    dp.message.outer_middleware(BlacklistMiddleware())
+    dp.callback_query.outer_middleware(BlacklistMiddleware())
+    register_user_handlers(dp)
+    return dp
+
 async def main():
     """Главная функция запуска бота"""
     # Настраиваем логирование
     logger = setup_logging()
+    maintenance_task = None
+    retention_task = None
+    prewarm_task = None
+    metrics_runner = None
+    bot = None
     
     try:
         # Инициализируем базу данных
         logger.info("Инициализация базы данных...")
         init_db()
         logger.info("База данных инициализирована")
+        log_profile_report()
+        # Спины без выигрыша и отметки активности пишутся пачками; незаписанное до остановки — из файла журнала
+        if JOURNAL_ENABLED:
+            journal.start(path=f"{JOURNAL_PATH}.{WORKER_INDEX}" if BOT_MODE == "worker" else JOURNAL_PATH)
+        # Общее состояние процессов бота; изменения других процессов сбрасывают кэши этого
+        await coordinator.start()
+        coordinator.on_change('blacklist', blacklist.reload)
+        coordinator.on_change('slot_config', models.invalidate_slot_configs)
+        models.on_slot_configs_changed(lambda: coordinator.notify('slot_config'))
+        maintenance_task = asyncio.create_task(maintenance_loop())
+        # Старые спины: проигрыши — в дневные итоги, остальное — в архив по месяцам
+        retention_task = asyncio.create_task(retention_loop())
+        await blacklist.load()
+        media_registry.load()
+        # Курсы TON/NOT/DOGS обновляются в фоне, ввод суммы берёт их из кэша
+        price_oracle.start()
         
         # Создаем бота и диспетчер
         logger.info("Создание бота и диспетчера...")
+        # Свой Bot API сервер (локальный telegram-bot-api или заглушка для бенчмарков)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
         bot = Bot(
             token=BOT_TOKEN, 
+            session=session,
             default=DefaultBotProperties(parse_mode="HTML")
         )
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
-        
-        # Регистрируем обработчики
+        # Фото по URL отправляются через file_id из реестра
+        bot.session.middleware(MediaRequestMiddleware())
+        # Скорость запросов к Bot API — по ней адаптивная анимация слотов уменьшает число кадров
+        bot.session.middleware(ApiRateMiddleware())
+        if TRACE_ENABLED:
+            bot.session.middleware(ApiTracingMiddleware())
+        # /metrics для Prometheus; воркеры кластера — на METRICS_PORT + WORKER_INDEX
+        metrics_runner = await start_metrics_server(
+            port=METRICS_PORT + WORKER_INDEX if METRICS_PORT and BOT_MODE == "worker" else METRICS_PORT)
+        # file_id картинок меню: загрузка в MEDIA_UPLOAD_CHAT_ID (если задан), одним процессом кластера
+        prewarm_task = asyncio.create_task(media_registry.prewarm(bot))
+        # Состояния FSM сохраняются между перезапусками (FSM_STORAGE)
         logger.info("Регистрация обработчиков...")
-        register_user_handlers(dp)
+        dp = build_dispatcher(fsm_storage)
         logger.info("Обработчики зарегистрированы")
         
+        # Продолжаем рассылки, прерванные остановкой бота
+        resumed = await resume_broadcasts(bot)
+        if resumed:
+            logger.info(f"Продолжено рассылок: {resumed}")
+        
         # Запускаем бота
         logger.info("🤖 Бот запущен и готов к работе!")
-        await dp.start_polling(bot)
+        if BOT_MODE == "worker":
+            # Обновления раздаёт приёмник app.cluster
+            logger.info(f"Воркер {WORKER_INDEX}")
+            await run_worker(dp, bot)
+        elif BOT_MODE == "webhook" and WEBHOOK_BASE_URL:
+            await run_webhook(dp, bot)
+        else:
+            if BOT_MODE == "webhook":
+                logger.warning("BOT_MODE=webhook, но WEBHOOK_BASE_URL не задан — работаю через polling")
+            # getUpdates не работает, пока установлен webhook; накопившиеся обновления сохраняются
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске бота: {e}")
         raise
     finally:
+        if maintenance_task is not None:
+            maintenance_task.cancel()
+        if retention_task is not None:
+            retention_task.cancel()
+        if prewarm_task is not None:
+            prewarm_task.cancel()
+        # Досылаем уведомления админам (сессия бота откроется заново, если уже закрыта)
+        await admin_notifier.close()
+        await price_oracle.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if bot is not None:
+            await bot.session.close()
+        await blacklist.close()
+        await fsm_storage.close()
+        await coordinator.close()
+        await journal.close()
+        aio.shutdown(wait=True)
+        get_pool().close()
         logger.info("Бот остановлен")
 
 if __name__ == "__main__":
@@ -0,0 +1,8 @@
+"""
+Middleware диспетчера и сессии бота
+"""
+from .api_rate import ApiRateMiddleware, api_rate
+from .blacklist import BlacklistMiddleware
+from .tracing import ApiTracingMiddleware, setup_tracing
+
+__all__ = ['ApiRateMiddleware', 'ApiTracingMiddleware', 'BlacklistMiddleware', 'api_rate', 'setup_tracing']
@@ -0,0 +1,52 @@
+"""
+Скорость запросов бота к Bot API
+
+Request middleware сессии бота: каждый вызов метода Bot API отмечается в счётчике
+по секундам. api_rate.rate() — среднее число запросов в секунду за последние
+window секунд; по нему, например, анимация слот-машины уменьшает число кадров,
+когда бот близок к лимитам Telegram.
+"""
+import time
+from collections import deque
+from typing import Deque, List
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+
+class ApiRateMeter:
+    """Скользящее окно запросов по секундам"""
+
+    def __init__(self, window: int = 5):
+        self.window = window
+        self._buckets: Deque[List[int]] = deque()  # [секунда, запросов]
+        self.total = 0
+
+    def hit(self, now: float = None):
+        second = int(time.monotonic() if now is None else now)
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1][1] += 1
+        else:
+            self._buckets.append([second, 1])
+        self.total += 1
+        self._trim(second)
+
+    def _trim(self, second: int):
+        while self._buckets and self._buckets[0][0] <= second - self.window:
+            self._buckets.popleft()
+
+    def rate(self, now: float = None) -> float:
+        second = int(time.monotonic() if now is None else now)
+        self._trim(second)
+        return sum(count for _, count in self._buckets) / self.window
+
+
+api_rate = ApiRateMeter()
+
+
+class ApiRateMiddleware(BaseRequestMiddleware):
+    def __init__(self, meter: ApiRateMeter = api_rate):
+        self.meter = meter
+
+    async def __call__(self, make_request, bot, method):
+        self.meter.hit()
+        return await make_request(bot, method)
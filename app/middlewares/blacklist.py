@@ -0,0 +1,33 @@
+"""
+Проверка чёрного списка до обработчиков
+
+Регистрируется как outer middleware на message и callback_query: заблокированный
+пользователь получает сообщение о блокировке, обработчик не вызывается.
+Администраторы не проверяются.
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.config import ADMINS
+from app.utils.blacklist import Blacklist, blacklist as default_blacklist, respond_blacklisted
+
+
+class BlacklistMiddleware(BaseMiddleware):
+    def __init__(self, blacklist: Blacklist = default_blacklist):
+        self.blacklist = blacklist
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, 'from_user', None)
+        if user is not None and user.id not in ADMINS:
+            reason = await self.blacklist.get_reason(user.id)
+            if reason:
+                await respond_blacklisted(event, reason)
+                return None
+        return await handler(event, data)
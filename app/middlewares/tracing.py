@@ -0,0 +1,77 @@
+"""
+Трассировка обновлений и вызовов Bot API (app/tracing.py)
+
+UpdateTracingMiddleware — outer middleware dp.update: заводит трассу обновления
+и завершает её после обработки. HandlerLabelMiddleware — inner middleware
+событий: записывает в трассу роутер и обработчик, выбранные фильтрами.
+ApiTracingMiddleware — request middleware сессии бота: время каждого вызова
+Bot API. setup_tracing(dp) регистрирует middleware диспетчера.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject, Update
+
+from app.tracing import UpdateTrace, callback_prefix, current_trace, finish_trace, record_api
+
+
+class UpdateTracingMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query.data if event.callback_query is not None else None
+        trace = UpdateTrace(event.update_id, event.event_type, callback_prefix(callback) if callback else '')
+        token = current_trace.set(trace)
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            current_trace.reset(token)
+            finish_trace(trace, error=error)
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = current_trace.get()
+        handler_object = data.get('handler')
+        if trace is not None and handler_object is not None:
+            # Роутеры бота безымянные — роутером считается модуль обработчика (app.handlers.user -> user)
+            callback = handler_object.callback
+            trace.router = getattr(callback, '__module__', '').rsplit('.', 1)[-1]
+            trace.handler = getattr(callback, '__name__', type(callback).__name__)
+        return await handler(event, data)
+
+
+class ApiTracingMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        error = False
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            error = True
+            raise
+        finally:
+            record_api(method.__api_method__, time.perf_counter() - started, error)
+
+
+def setup_tracing(dp: Dispatcher):
+    """Трасса на каждое обновление; inner middleware диспетчера действуют и во вложенных роутерах"""
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    labels = HandlerLabelMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ('update', 'error'):
+            observer.middleware(labels)
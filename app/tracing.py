@@ -0,0 +1,385 @@
+"""
+Трассировка обработки обновлений
+
+Каждое обновление получает UpdateTrace (contextvar current_trace, его выставляет
+UpdateTracingMiddleware из app/middlewares/tracing.py). В трассу пишутся:
+  - SQL-запросы со временем выполнения: курсоры пула sqlite3 (app/database/pool.py)
+    и aiosqlite-соединения connect_async — record_sql;
+  - вызовы Bot API со временем ответа — record_api (ApiTracingMiddleware сессии бота);
+  - роутер (модуль обработчика), обработчик и префикс callback_data.
+По окончании обновления (finish_trace):
+  - агрегаты по обработчикам попадают в metrics; render_prometheus() — текстовый
+    формат Prometheus, start_metrics_server() отдаёт его по HTTP на METRICS_PORT;
+  - обновление дольше TRACE_SLOW_UPDATE_MS логируется с разбивкой по SQL и Bot API;
+  - запрос, повторённый за обновление TRACE_REPEATED_SQL раз и больше (N+1),
+    логируется сразу, даже если обновление быстрое.
+Контекст передаётся в потоки aio.run_read/run_write. Фоновые задачи, созданные
+обработчиком и пережившие обновление, в его трассу уже не пишут.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from app.config import TRACE_SLOW_UPDATE_MS, TRACE_REPEATED_SQL, METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы времени обработки обновления, сек
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сочетаний роутер/обработчик/префикс больше этого — остальные считаются как other
+MAX_LABELS = 1000
+SQL_LABEL_LENGTH = 160
+
+current_trace: ContextVar[Optional['UpdateTrace']] = ContextVar('current_trace', default=None)
+
+
+def _normalize_sql(sql: str) -> str:
+    return ' '.join(sql.split())[:SQL_LABEL_LENGTH]
+
+
+def callback_prefix(data: str) -> str:
+    """Префикс callback_data без параметров: stars_pay_sbp_50_85 -> stars_pay_sbp, admin_orders_page:1:<5 -> admin_orders_page"""
+    parts = []
+    for part in data.split(':', 1)[0].split('_'):
+        if any(ch.isdigit() for ch in part):
+            break
+        parts.append(part)
+    return '_'.join(parts) or 'other'
+
+
+class UpdateTrace:
+    """SQL-запросы, вызовы Bot API и время одного обновления"""
+
+    def __init__(self, update_id: int, event_type: str = '', callback: str = ''):
+        self.update_id = update_id
+        self.event_type = event_type
+        self.callback = callback
+        self.router = ''
+        self.handler = ''
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.api_count = 0
+        self.api_seconds = 0.0
+        self.statements: Dict[str, List] = {}  # запрос -> [раз, сек]
+        self.api_methods: Dict[str, List] = {}  # метод -> [раз, сек]
+        # Запросы из потоков пула aio и из event loop могут прийти одновременно
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.duration is not None
+
+    @property
+    def labels(self) -> Tuple[str, str, str]:
+        return self.router or '-', self.handler or 'unhandled', self.callback
+
+    def add_sql(self, sql: str, seconds: float, statement: bool = True):
+        with self._lock:
+            if self.finished:
+                return
+            self.sql_seconds += seconds
+            if not statement:
+                return
+            self.sql_count += 1
+            entry = self.statements.setdefault(_normalize_sql(sql), [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_api(self, method: str, seconds: float):
+        with self._lock:
+            if self.finished:
+                return
+            self.api_count += 1
+            self.api_seconds += seconds
+            entry = self.api_methods.setdefault(method, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def finish(self) -> float:
+        with self._lock:
+            self.duration = time.perf_counter() - self.started
+        return self.duration
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int, float]]:
+        """Запросы, выполненные threshold раз и больше, — признак N+1"""
+        if threshold <= 0:
+            return []
+        found = [(sql, count, seconds) for sql, (count, seconds) in self.statements.items() if count >= threshold]
+        return sorted(found, key=lambda item: -item[1])
+
+    def breakdown(self, top: int = 5) -> str:
+        """Разбивка времени для лога: SQL, Bot API, остальное и самые дорогие запросы"""
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started
+        other = max(0.0, duration - self.sql_seconds - self.api_seconds)
+        text = (f"SQL {self.sql_count} запр. {self.sql_seconds * 1000:.0f} мс, "
+                f"Bot API {self.api_count} выз. {self.api_seconds * 1000:.0f} мс, прочее {other * 1000:.0f} мс")
+        if self.api_methods:
+            methods = sorted(self.api_methods.items(), key=lambda item: -item[1][1])
+            text += "; Bot API: " + ", ".join(f"{method} {count}× {seconds * 1000:.0f} мс"
+                                              for method, (count, seconds) in methods[:top])
+        if self.statements:
+            statements = sorted(self.statements.items(), key=lambda item: -item[1][1])
+            text += "; SQL: " + "; ".join(f"{count}× {seconds * 1000:.1f} мс {sql}"
+                                          for sql, (count, seconds) in statements[:top])
+        return text
+
+
+def record_sql(sql: str, seconds: float, statement: bool = True):
+    """Запрос (statement=False — только время выборки строк) в трассу текущего обновления"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_sql(sql, seconds, statement)
+
+
+def record_api(method: str, seconds: float, error: bool = False):
+    """Вызов Bot API: в общие счётчики по методам и в трассу текущего обновления"""
+    metrics.observe_api(method, seconds, error)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_api(method, seconds)
+
+
+class _HandlerStats:
+    def __init__(self, buckets: int):
+        self.buckets = [0] * buckets
+        self.count = 0
+        self.seconds = 0.0
+        self.sql = 0
+        self.sql_seconds = 0.0
+        self.api = 0
+        self.api_seconds = 0.0
+        self.errors = 0
+        self.slow = 0
+        self.repeated_sql = 0
+
+
+class TraceMetrics:
+    """
+    Агрегаты трасс по (роутер, обработчик, префикс callback_data) и вызовы Bot API
+    по методам. Сторонние показатели (пул БД, уведомления админам, курсы)
+    подключаются через register_collector
+    """
+
+    def __init__(self, buckets=BUCKETS, max_labels: int = MAX_LABELS):
+        self.bucket_bounds = tuple(buckets)
+        self.max_labels = max_labels
+        self._handlers: Dict[Tuple[str, str, str], _HandlerStats] = {}
+        self._api: Dict[str, List] = {}  # метод -> [раз, сек, ошибок]
+        self._collectors: List[Callable[[], list]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, trace: UpdateTrace, error: bool = False, slow: bool = False, repeated: bool = False):
+        key = trace.labels
+        with self._lock:
+            stats = self._handlers.get(key)
+            if stats is None:
+                if len(self._handlers) >= self.max_labels:
+                    key = ('other', 'other', 'other')
+                stats = self._handlers.setdefault(key, _HandlerStats(len(self.bucket_bounds)))
+            for i, bound in enumerate(self.bucket_bounds):
+                if trace.duration <= bound:
+                    stats.buckets[i] += 1
+            stats.count += 1
+            stats.seconds += trace.duration
+            stats.sql += trace.sql_count
+            stats.sql_seconds += trace.sql_seconds
+            stats.api += trace.api_count
+            stats.api_seconds += trace.api_seconds
+            stats.errors += int(error)
+            stats.slow += int(slow)
+            stats.repeated_sql += int(repeated)
+
+    def observe_api(self, method: str, seconds: float, error: bool = False):
+        with self._lock:
+            entry = self._api.setdefault(method, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += int(error)
+
+    def register_collector(self, collector: Callable[[], list]):
+        """collector() -> [(имя, тип, описание, [(метки, значение), ...]), ...]"""
+        self._collectors.append(collector)
+
+    def handlers(self) -> Dict[Tuple[str, str, str], dict]:
+        """Сводка по обработчикам: обновлений, среднее время, SQL и Bot API на обновление"""
+        with self._lock:
+            items = list(self._handlers.items())
+        return {
+            key: {
+                'updates': stats.count,
+                'avg_ms': round(stats.seconds / stats.count * 1000, 1),
+                'sql_per_update': round(stats.sql / stats.count, 2),
+                'api_per_update': round(stats.api / stats.count, 2),
+                'errors': stats.errors,
+                'slow': stats.slow,
+                'repeated_sql': stats.repeated_sql,
+            }
+            for key, stats in items if stats.count
+        }
+
+    def reset(self):
+        with self._lock:
+            self._handlers.clear()
+            self._api.clear()
+
+    def render(self) -> str:
+        """Все показатели в текстовом формате Prometheus"""
+        with self._lock:
+            handlers = [(key, _copy_stats(stats)) for key, stats in self._handlers.items()]
+            api = [(method, list(entry)) for method, entry in self._api.items()]
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        def by_handler(name, kind, help_text, attr):
+            family(name, kind, help_text, [(_handler_labels(key), getattr(stats, attr)) for key, stats in handlers])
+
+        lines.append("# HELP bot_update_duration_seconds Время обработки обновления, сек")
+        lines.append("# TYPE bot_update_duration_seconds histogram")
+        for key, stats in handlers:
+            labels = _handler_labels(key)
+            # Счётчики корзин уже накопительные: обновление учтено во всех корзинах с le >= его времени
+            for bound, count in zip(self.bucket_bounds, stats.buckets):
+                lines.append(f"bot_update_duration_seconds_bucket{_format_labels({**labels, 'le': str(bound)})} {count}")
+            lines.append(f"bot_update_duration_seconds_bucket{_format_labels({**labels, 'le': '+Inf'})} {stats.count}")
+            lines.append(f"bot_update_duration_seconds_sum{_format_labels(labels)} {_format_value(stats.seconds)}")
+            lines.append(f"bot_update_duration_seconds_count{_format_labels(labels)} {stats.count}")
+
+        by_handler('bot_update_sql_statements_total', 'counter', "SQL-запросов при обработке обновлений", 'sql')
+        by_handler('bot_update_sql_seconds_total', 'counter', "Время SQL-запросов при обработке обновлений, сек",
+                   'sql_seconds')
+        by_handler('bot_update_api_calls_total', 'counter', "Вызовов Bot API при обработке обновлений", 'api')
+        by_handler('bot_update_api_seconds_total', 'counter', "Время вызовов Bot API при обработке обновлений, сек",
+                   'api_seconds')
+        by_handler('bot_update_errors_total', 'counter', "Обновлений, завершившихся исключением", 'errors')
+        by_handler('bot_update_slow_total', 'counter', "Обновлений дольше TRACE_SLOW_UPDATE_MS", 'slow')
+        by_handler('bot_update_repeated_sql_total', 'counter',
+                   "Обновлений с повторяющимся запросом (N+1)", 'repeated_sql')
+        family('bot_api_requests_total', 'counter', "Вызовов Bot API по методам",
+               [({'method': method}, entry[0]) for method, entry in api])
+        family('bot_api_request_seconds_total', 'counter', "Время вызовов Bot API по методам, сек",
+               [({'method': method}, entry[1]) for method, entry in api])
+        family('bot_api_errors_total', 'counter', "Вызовов Bot API с ошибкой",
+               [({'method': method}, entry[2]) for method, entry in api])
+        for collector in self._collectors:
+            try:
+                for name, kind, help_text, samples in collector():
+                    family(name, kind, help_text, samples)
+            except Exception as e:
+                logger.error(f"[TRACE] Ошибка сборщика метрик {getattr(collector, '__name__', collector)}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _copy_stats(stats: _HandlerStats) -> _HandlerStats:
+    copy = _HandlerStats(0)
+    copy.__dict__.update(stats.__dict__)
+    copy.buckets = list(stats.buckets)
+    return copy
+
+
+def _handler_labels(key: Tuple[str, str, str]) -> dict:
+    return {'router': key[0], 'handler': key[1], 'callback': key[2]}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def _runtime_metrics() -> list:
+    """Пул БД, журнал отложенной записи, скорость Bot API, очереди уведомлений админам и кэш курсов"""
+    from app.database.journal import journal
+    from app.database.pool import get_pool, statement_counter
+    from app.middlewares.api_rate import api_rate
+    from app.utils.admin_notify import admin_notifier
+    from app.utils.prices import price_oracle
+
+    pool = get_pool().stats()
+    writes = journal.stats()
+    notify = admin_notifier.stats()
+    prices = price_oracle.stats()
+    return [
+        ('bot_db_statements_total', 'counter', "SQL-запросов на соединениях пула, включая BEGIN/COMMIT и триггеры",
+         [({}, statement_counter.count)]),
+        ('bot_db_commits_total', 'counter', "Коммитов на соединениях пула", [({}, statement_counter.commits)]),
+        ('bot_journal_pending', 'gauge', "Событий журнала, ещё не записанных в БД", [({}, writes['pending'])]),
+        ('bot_journal_applied_total', 'counter', "Событий журнала, записанных в БД пачками",
+         [({}, writes['applied'])]),
+        ('bot_journal_flushes_total', 'counter', "Записей пачек журнала в БД", [({}, writes['flushes'])]),
+        ('bot_journal_rejected_total', 'counter', "Событий журнала, отложенных в .rejected из-за ошибки применения",
+         [({}, writes['rejected'])]),
+        ('bot_db_readers_open', 'gauge', "Открытых соединений для чтения", [({}, pool['readers_open'])]),
+        ('bot_db_readers_idle', 'gauge', "Свободных соединений для чтения", [({}, pool['readers_idle'])]),
+        ('bot_api_rate', 'gauge', "Запросов к Bot API в секунду (скользящее окно)", [({}, api_rate.rate())]),
+        ('bot_admin_notify_queued', 'gauge', "Уведомлений админам в очередях", [({}, notify['queued'])]),
+        ('bot_admin_notify_sent_total', 'counter', "Отправлено уведомлений админам", [({}, notify['sent'])]),
+        ('bot_admin_notify_dropped_total', 'counter', "Уведомлений админам, вытесненных из очереди",
+         [({}, notify['dropped'])]),
+        ('bot_admin_notify_failed_total', 'counter', "Уведомлений админам, не доставленных после повторов",
+         [({}, notify['failed'])]),
+        ('bot_price_requests_total', 'counter', "Запросов курса по результату кэша",
+         [({'result': 'hit'}, prices['hits']), ({'result': 'stale'}, prices['stale_hits']),
+          ({'result': 'miss'}, prices['misses'])]),
+        ('bot_price_fetch_errors_total', 'counter', "Ошибок запросов к источникам курсов", [({}, prices['errors'])]),
+    ]
+
+
+metrics = TraceMetrics()
+metrics.register_collector(_runtime_metrics)
+
+
+def finish_trace(trace: UpdateTrace, error: bool = False, registry: TraceMetrics = metrics,
+                 slow_ms: float = TRACE_SLOW_UPDATE_MS, repeated_sql: int = TRACE_REPEATED_SQL) -> UpdateTrace:
+    """Завершает трассу: агрегаты, лог медленного обновления и повторяющихся запросов"""
+    duration = trace.finish()
+    router, handler, callback = trace.labels
+    where = f"{router}:{handler}" + (f" [{callback}]" if callback else "")
+    repeated = trace.repeated(repeated_sql)
+    for sql, count, seconds in repeated:
+        logger.warning(f"[TRACE] N+1 в обновлении {trace.update_id} ({where}): {count}× {seconds * 1000:.1f} мс {sql}")
+    slow = slow_ms > 0 and duration * 1000 >= slow_ms
+    if slow:
+        logger.warning(f"[TRACE] Медленное обновление {trace.update_id} ({where}) "
+                       f"{duration * 1000:.0f} мс: {trace.breakdown()}")
+    registry.observe(trace, error=error, slow=slow, repeated=bool(repeated))
+    return trace
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT,
+                               registry: TraceMetrics = metrics) -> Optional[web.AppRunner]:
+    """HTTP GET /metrics в формате Prometheus; port=0 — сервер не запускается"""
+    if not port:
+        return None
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"[TRACE] Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,242 @@
+"""
+Уведомления админам в фоне
+
+notify_admins() кладёт уведомление в очередь каждого админа и сразу возвращается:
+обработчик пользователя не ждёт отправок. На каждого админа — своя задача-отправитель,
+админы получают уведомления параллельно.
+  - Очередь админа ограничена ADMIN_NOTIFY_QUEUE_SIZE. При переполнении вытесняется
+    самое старое информационное уведомление (без кнопок и файла); уведомления с
+    кнопками (заказы, выигрыши) вытесняются только если других не осталось.
+  - Информационные уведомления, накопившиеся за ADMIN_NOTIFY_DIGEST_WINDOW, уходят
+    одной сводкой (до ADMIN_NOTIFY_DIGEST_MAX штук и не длиннее лимита сообщения).
+  - На TelegramRetryAfter отправитель ждёт указанное время и повторяет, сетевые
+    ошибки и 5xx повторяются с паузой до ADMIN_NOTIFY_MAX_ATTEMPTS раз.
+  - stats(): глубина очередей, отправлено/сводок/вытеснено/ошибок и задержка от
+    постановки в очередь до доставки (p50/p95/max).
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from app.config import (
+    ADMINS, ADMIN_NOTIFY_QUEUE_SIZE, ADMIN_NOTIFY_DIGEST_WINDOW, ADMIN_NOTIFY_DIGEST_MAX,
+    ADMIN_NOTIFY_MAX_ATTEMPTS,
+)
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 4096
+DIGEST_SEPARATOR = "\n\n— — —\n\n"
+
+
+class Notification:
+    """Одно уведомление в очереди админа"""
+
+    def __init__(self, text: str, reply_markup=None, parse_mode=None, document=None, document_caption=None):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.document = document
+        self.document_caption = document_caption
+        self.created_at = time.monotonic()
+
+    @property
+    def digestible(self) -> bool:
+        """Можно объединить в сводку: без кнопок и файла"""
+        return self.reply_markup is None and self.document is None
+
+
+class _AdminQueue:
+    def __init__(self, admin_id: int):
+        self.admin_id = admin_id
+        self.items: Deque[Notification] = deque()
+        self.wakeup = asyncio.Event()
+        self.busy = False
+        self.task: Optional[asyncio.Task] = None
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class AdminNotifier:
+    def __init__(self, admins=None, queue_size: int = ADMIN_NOTIFY_QUEUE_SIZE,
+                 digest_window: float = ADMIN_NOTIFY_DIGEST_WINDOW, digest_max: int = ADMIN_NOTIFY_DIGEST_MAX,
+                 max_attempts: int = ADMIN_NOTIFY_MAX_ATTEMPTS):
+        self.admins = list(ADMINS if admins is None else admins)
+        self.queue_size = max(1, queue_size)
+        self.digest_window = digest_window
+        self.digest_max = max(1, digest_max)
+        self.max_attempts = max(1, max_attempts)
+        self._bot = None
+        self._loop = None
+        self._queues: Dict[int, _AdminQueue] = {}
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.enqueued = 0
+        self.sent = 0
+        self.digests = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+
+    def _ensure_started(self, bot):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._queues:
+            return
+        # Первый вызов или новый event loop (перезапуск, тесты) — очереди создаются заново
+        self._bot = bot
+        self._loop = loop
+        self._queues = {admin_id: _AdminQueue(admin_id) for admin_id in self.admins}
+        for queue in self._queues.values():
+            queue.task = asyncio.create_task(self._worker(queue))
+
+    def enqueue(self, bot, text: str, reply_markup=None, parse_mode=None, document=None,
+                document_caption=None) -> int:
+        """Ставит уведомление в очереди всех админов, возвращает число очередей"""
+        if not self.admins:
+            logger.warning("Список администраторов пуст")
+            return 0
+        self._ensure_started(bot)
+        for queue in self._queues.values():
+            self._put(queue, Notification(text, reply_markup, parse_mode, document, document_caption))
+        self.enqueued += 1
+        return len(self._queues)
+
+    def _put(self, queue: _AdminQueue, notification: Notification):
+        if len(queue.items) >= self.queue_size:
+            victim = next((item for item in queue.items if item.digestible), None)
+            if victim is None and notification.digestible:
+                victim = notification
+            elif victim is None:
+                victim = queue.items[0]
+            if victim is not notification:
+                queue.items.remove(victim)
+                queue.items.append(notification)
+            self.dropped += 1
+            logger.warning(f"[NOTIFY] Очередь админа {queue.admin_id} переполнена, уведомление вытеснено")
+        else:
+            queue.items.append(notification)
+        queue.wakeup.set()
+
+    async def _worker(self, queue: _AdminQueue):
+        while True:
+            if not queue.items:
+                queue.wakeup.clear()
+                await queue.wakeup.wait()
+                continue
+            if queue.items[0].digestible and self.digest_window > 0 and len(queue.items) < self.digest_max:
+                # Ждём соседние уведомления, чтобы отправить их одной сводкой
+                await asyncio.sleep(self.digest_window)
+            batch = self._take(queue)
+            queue.busy = True
+            try:
+                await self._deliver(queue.admin_id, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"[NOTIFY] Ошибка отправки уведомления админу {queue.admin_id}: {e}")
+            finally:
+                queue.busy = False
+
+    def _take(self, queue: _AdminQueue) -> List[Notification]:
+        first = queue.items.popleft()
+        batch = [first]
+        if not first.digestible:
+            return batch
+        length = len(first.text)
+        while queue.items and len(batch) < self.digest_max:
+            item = queue.items[0]
+            length += len(DIGEST_SEPARATOR) + len(item.text)
+            if not item.digestible or item.parse_mode != first.parse_mode or length > MESSAGE_LIMIT - 100:
+                break
+            batch.append(queue.items.popleft())
+        return batch
+
+    async def _send(self, admin_id: int, batch: List[Notification]):
+        if len(batch) > 1:
+            text = f"🗂 Сводка: {len(batch)} уведомлений{DIGEST_SEPARATOR}" + DIGEST_SEPARATOR.join(
+                item.text for item in batch)
+            await self._bot.send_message(admin_id, text, parse_mode=batch[0].parse_mode)
+            return
+        item = batch[0]
+        if item.document:
+            await self._bot.send_document(admin_id, item.document, caption=item.document_caption,
+                                          reply_markup=item.reply_markup, parse_mode=item.parse_mode)
+        else:
+            await self._bot.send_message(admin_id, item.text, reply_markup=item.reply_markup,
+                                         parse_mode=item.parse_mode)
+
+    async def _deliver(self, admin_id: int, batch: List[Notification]):
+        attempts = 0
+        while True:
+            try:
+                await self._send(admin_id, batch)
+                break
+            except TelegramRetryAfter as e:
+                # Ожидание по требованию Telegram не считается попыткой
+                self.retries += 1
+                logger.warning(f"[NOTIFY] RetryAfter {e.retry_after} с для админа {admin_id}")
+                await asyncio.sleep(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    raise
+                self.retries += 1
+                await asyncio.sleep(min(2 ** attempts, 30))
+        now = time.monotonic()
+        self.sent += len(batch)
+        if len(batch) > 1:
+            self.digests += 1
+        self._latencies.extend(now - item.created_at for item in batch)
+        logger.debug(f"Уведомление отправлено админу {admin_id} ({len(batch)} шт.)")
+
+    def pending(self) -> int:
+        return sum(len(queue.items) + queue.busy for queue in self._queues.values())
+
+    async def flush(self, timeout: float = 10) -> bool:
+        """Ждёт, пока очереди опустеют. False — не успели за timeout"""
+        deadline = time.monotonic() + timeout
+        while self.pending():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def close(self, timeout: float = 10):
+        """Досылает очереди (до timeout) и останавливает отправителей"""
+        if not self._queues or self._loop is not asyncio.get_running_loop():
+            return
+        if not await self.flush(timeout):
+            logger.warning(f"[NOTIFY] Не доставлено уведомлений при остановке: {self.pending()}")
+        tasks = [queue.task for queue in self._queues.values() if queue.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queues = {}
+
+    def stats(self) -> dict:
+        latencies = list(self._latencies)
+        depth = {admin_id: len(queue.items) for admin_id, queue in self._queues.items()}
+        return {
+            'depth': depth,
+            'queued': sum(depth.values()),
+            'max_depth': max(depth.values(), default=0),
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'digests': self.digests,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'retries': self.retries,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p95': _percentile(latencies, 95),
+            'latency_max': max(latencies, default=0.0),
+        }
+
+
+admin_notifier = AdminNotifier()
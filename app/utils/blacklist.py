@@ -0,0 +1,136 @@
+"""
+Чёрный список пользователей
+
+Хранится в отдельном файле BLACKLIST_DB_PATH (data/blacklist.db). Одно соединение
+aiosqlite открывается при старте бота (load()), там же один раз создаётся таблица и
+весь список читается в словарь tg_id -> (reason, date_added). Проверка — поиск в
+словаре; добавление и удаление пишутся в БД и сразу в словарь (write-through).
+Другие процессы бота узнают об изменении через тему 'blacklist' координатора и
+перечитывают список (reload).
+"""
+import asyncio
+import datetime
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.config import BLACKLIST_DB_PATH
+from app.utils.coordination import coordinator
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = 'CREATE TABLE IF NOT EXISTS blacklist (tg_id INTEGER PRIMARY KEY, reason TEXT, date_added TEXT)'
+
+
+class Blacklist:
+    """Чёрный список в памяти поверх постоянного соединения с БД"""
+
+    def __init__(self, path: str = BLACKLIST_DB_PATH):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._entries: Dict[int, Tuple[str, str]] = {}
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._db is not None
+
+    async def load(self):
+        """Открывает соединение, создаёт таблицу и читает список (вызывается при старте)"""
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._db is not None:
+                return
+            db = await aiosqlite.connect(self.path)
+            await db.execute(SCHEMA)
+            await db.commit()
+            self._entries = await self._read(db)
+            self._db = db
+            logger.info(f"[BLACKLIST] Загружено записей: {len(self._entries)}")
+
+    @staticmethod
+    async def _read(db) -> Dict[int, Tuple[str, str]]:
+        async with db.execute('SELECT tg_id, reason, date_added FROM blacklist') as cursor:
+            rows = await cursor.fetchall()
+        return {tg_id: (reason, date_added) for tg_id, reason, date_added in rows}
+
+    async def reload(self):
+        """Перечитывает список (его изменил другой процесс бота)"""
+        if self._db is None:
+            await self.load()
+            return
+        self._entries = await self._read(self._db)
+        logger.info(f"[BLACKLIST] Список перечитан, записей: {len(self._entries)}")
+
+    async def close(self):
+        if self._db is not None:
+            db, self._db = self._db, None
+            await db.close()
+
+    async def _ensure_loaded(self):
+        if self._db is None:
+            await self.load()
+
+    def reason_for(self, tg_id: int) -> Optional[str]:
+        """Причина блокировки или None. Только словарь, список должен быть загружен"""
+        entry = self._entries.get(tg_id)
+        return entry[0] if entry else None
+
+    async def get_reason(self, tg_id: int) -> Optional[str]:
+        await self._ensure_loaded()
+        return self.reason_for(tg_id)
+
+    async def rows(self) -> List[Tuple[int, str, str]]:
+        await self._ensure_loaded()
+        return [(tg_id, reason, date_added) for tg_id, (reason, date_added) in self._entries.items()]
+
+    async def add(self, tg_id: int, reason: str):
+        await self._ensure_loaded()
+        date_added = datetime.datetime.now().strftime('%Y-%m-%d')
+        await self._db.execute('INSERT OR REPLACE INTO blacklist (tg_id, reason, date_added) VALUES (?, ?, ?)',
+                               (tg_id, reason, date_added))
+        await self._db.commit()
+        self._entries[tg_id] = (reason, date_added)
+        await coordinator.publish('blacklist')
+
+    async def remove(self, tg_id: int):
+        await self._ensure_loaded()
+        await self._db.execute('DELETE FROM blacklist WHERE tg_id = ?', (tg_id,))
+        await self._db.commit()
+        self._entries.pop(tg_id, None)
+        await coordinator.publish('blacklist')
+
+    def __len__(self):
+        return len(self._entries)
+
+
+blacklist = Blacklist()
+
+
+def blacklist_text(reason: str) -> str:
+    return (
+        f"🚫 <b>Доступ ограничен</b>\n\n"
+        f"Вы находитесь в черном списке.\n"
+        f"📝 Причина: {reason}\n\n"
+        f"Для решения вопроса обратитесь в поддержку."
+    )
+
+
+async def respond_blacklisted(message_or_callback, reason: str):
+    """Сообщение заблокированному пользователю (на Message или CallbackQuery)"""
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📞 Связаться", url="https://t.me/legal_stars")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="main_menu")]
+    ])
+    text = blacklist_text(reason)
+    if hasattr(message_or_callback, 'message'):  # CallbackQuery
+        try:
+            await message_or_callback.message.delete()
+        except Exception:
+            pass
+        await message_or_callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+    else:  # Message
+        await message_or_callback.answer(text, reply_markup=kb, parse_mode="HTML")
@@ -0,0 +1,286 @@
+"""
+Рассылки
+
+Задание рассылки хранится в БД (app/database/broadcasts.py). Исполнитель берёт
+получателей страницами по tg_id, отправляет с ограничением скорости (общий лимит
+бота и интервал на чат), на TelegramRetryAfter приостанавливает всю отправку на
+указанное Telegram время и повторяет. Результат по каждому получателю пишется
+сразу, поэтому после перезапуска resume_broadcasts() продолжает задание без
+повторных отправок. Задание выполняется под блокировкой координатора: при
+нескольких процессах бота его продолжит только один.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+    TelegramRetryAfter, TelegramServerError,
+)
+from aiogram.types import InlineKeyboardMarkup
+
+from app.config import (
+    BROADCAST_RATE, BROADCAST_PER_CHAT_INTERVAL, BROADCAST_PAGE_SIZE,
+    BROADCAST_CONCURRENCY, BROADCAST_MAX_ATTEMPTS,
+)
+from app.database import aio
+from app.database import broadcasts as db
+from app.utils.coordination import coordinator, LockNotAcquired
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Token bucket на весь бот (rate сообщений в секунду) и минимальный интервал
+    между сообщениями в один чат. pause() останавливает выдачу токенов
+    (после RetryAfter от Telegram).
+    """
+
+    def __init__(self, rate: float = BROADCAST_RATE, per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.per_chat_interval = per_chat_interval
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._chat_last: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        self._tokens = 0.0
+
+    def _refill(self, now: float):
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    async def acquire(self, chat_id: Optional[int] = None):
+        # Интервал на чат выдерживается до общего токена, чтобы не занимать токен ожиданием
+        if chat_id is not None and self.per_chat_interval > 0:
+            last = self._chat_last.get(chat_id)
+            if last is not None:
+                wait = last + self.per_chat_interval - self._clock()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+        async with self._lock:
+            while True:
+                now = self._clock()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+        if chat_id is not None and self.per_chat_interval > 0:
+            self._chat_last[chat_id] = self._clock()
+            if len(self._chat_last) > 10000:
+                threshold = self._clock() - self.per_chat_interval
+                self._chat_last = {k: v for k, v in self._chat_last.items() if v > threshold}
+
+
+# Один ограничитель на процесс: параллельные рассылки делят лимит бота
+limiter = RateLimiter()
+
+# Запущенные в этом процессе задания: job_id -> asyncio.Task
+_running: Dict[int, asyncio.Task] = {}
+
+
+def _markup_to_json(markup: Optional[InlineKeyboardMarkup]) -> Optional[str]:
+    return markup.model_dump_json(exclude_none=True) if markup else None
+
+
+def _markup_from_json(data: Optional[str]) -> Optional[InlineKeyboardMarkup]:
+    return InlineKeyboardMarkup.model_validate_json(data) if data else None
+
+
+async def _send(bot, job: dict, tg_id: int, markup) -> None:
+    if job['kind'] == 'photo':
+        await bot.send_photo(tg_id, photo=job['photo_id'], caption=job['text'], reply_markup=markup)
+    else:
+        await bot.send_message(tg_id, job['text'], reply_markup=markup)
+
+
+async def deliver(bot, job: dict, tg_id: int, markup, rate_limiter: RateLimiter = None) -> tuple:
+    """
+    Отправляет одному получателю с повторами.
+    Возвращает (status, error, attempts), status: delivered / failed / blocked.
+    """
+    rate_limiter = rate_limiter or limiter
+    error = None
+    attempts = 0
+    while attempts < BROADCAST_MAX_ATTEMPTS:
+        attempts += 1
+        await rate_limiter.acquire(tg_id)
+        try:
+            await _send(bot, job, tg_id, markup)
+            return 'delivered', None, attempts
+        except TelegramRetryAfter as e:
+            # Лимит превышен: стоит весь бот, а не только этот чат
+            logger.warning(f"[BROADCAST] RetryAfter {e.retry_after} с (задание {job['id']})")
+            rate_limiter.pause(e.retry_after)
+            attempts -= 1  # ожидание по требованию Telegram не считается попыткой
+            error = str(e)
+        except TelegramForbiddenError as e:
+            return 'blocked', str(e), attempts
+        except TelegramBadRequest as e:
+            return 'failed', str(e), attempts
+        except (TelegramNetworkError, TelegramServerError) as e:
+            error = str(e)
+            await asyncio.sleep(min(2 ** attempts, 10))
+        except Exception as e:
+            return 'failed', str(e), attempts
+    return 'failed', error, attempts
+
+
+class Progress:
+    """Скорость рассылки, измеренная по обработанным получателям"""
+
+    def __init__(self, job: dict):
+        self.total = job['total']
+        self.processed = job['delivered'] + job['failed'] + job['blocked']
+        self.run_seconds = job['run_seconds']
+
+    @property
+    def rate(self) -> float:
+        return self.processed / self.run_seconds if self.run_seconds > 0 else 0.0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.total - self.processed)
+
+    def eta_seconds(self, fallback_rate: float = BROADCAST_RATE) -> float:
+        rate = self.rate or fallback_rate
+        return self.remaining / rate if rate > 0 else 0.0
+
+
+def measured_rate() -> float:
+    """Скорость последней завершённой рассылки, получателей в секунду (0 — нет данных)"""
+    job = db.get_last_finished_broadcast_job()
+    return Progress(job).rate if job else 0.0
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes} мин"
+    return f"{minutes} мин {seconds} сек" if minutes > 0 else f"{seconds} сек"
+
+
+def estimate_eta(job: dict, previous_rate: float = 0.0) -> float:
+    """
+    Оценка оставшегося времени: по скорости этого задания, если оно уже шло,
+    иначе по скорости прошлой рассылки (measured_rate()), иначе по настроенному лимиту.
+    """
+    fallback = min(previous_rate, BROADCAST_RATE) if previous_rate > 0 else BROADCAST_RATE
+    return Progress(job).eta_seconds(fallback)
+
+
+async def run_job(bot, job_id: int, rate_limiter: RateLimiter = None,
+                  page_size: int = BROADCAST_PAGE_SIZE, concurrency: int = BROADCAST_CONCURRENCY) -> Optional[dict]:
+    """Выполняет (или продолжает) задание рассылки до конца; возвращает итоговое задание.
+    None — задание уже выполняет другой процесс"""
+    try:
+        async with coordinator.lock(f"broadcast:{job_id}"):
+            return await _run_job(bot, job_id, rate_limiter, page_size, concurrency)
+    except LockNotAcquired:
+        logger.info(f"[BROADCAST] Задание {job_id} выполняет другой процесс")
+        return None
+
+
+async def _run_job(bot, job_id: int, rate_limiter: Optional[RateLimiter], page_size: int, concurrency: int) -> dict:
+    rate_limiter = rate_limiter or limiter
+    job = await aio.run_read(db.get_broadcast_job, job_id)
+    if not job or job['status'] not in ('pending', 'running'):
+        return job
+    markup = _markup_from_json(job['markup'])
+    await aio.run_write(db.set_broadcast_job_status, job_id, 'running')
+    logger.info(f"[BROADCAST] Задание {job_id}: старт с tg_id > {job['last_tg_id']}")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def send_one(tg_id):
+        async with semaphore:
+            status, error, attempts = await deliver(bot, job, tg_id, markup, rate_limiter)
+        await aio.run_write(db.record_broadcast_delivery, job_id, tg_id, status, error, attempts)
+
+    cursor = job['last_tg_id']
+    while True:
+        page = await aio.run_read(db.fetch_broadcast_recipients, job_id, cursor, page_size)
+        if not page:
+            break
+        started = time.monotonic()
+        await asyncio.gather(*(send_one(tg_id) for tg_id in page))
+        cursor = page[-1]
+        await aio.run_write(db.advance_broadcast_cursor, job_id, cursor, time.monotonic() - started)
+
+    await aio.run_write(db.set_broadcast_job_status, job_id, 'done')
+    job = await aio.run_read(db.get_broadcast_job, job_id)
+    logger.info(f"[BROADCAST] Задание {job_id} завершено: доставлено {job['delivered']}, "
+                f"ошибок {job['failed']}, заблокировали бота {job['blocked']}, "
+                f"скорость {Progress(job).rate:.1f}/с")
+    return job
+
+
+async def _run_and_report(bot, job_id: int):
+    try:
+        job = await run_job(bot, job_id)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"[BROADCAST] Задание {job_id} прервано: {e}")
+        return
+    finally:
+        _running.pop(job_id, None)
+    if job and job.get('created_by'):
+        try:
+            await bot.send_message(job['created_by'], format_job_report(job))
+        except Exception as e:
+            logger.error(f"[BROADCAST] Не удалось отправить отчёт по заданию {job_id}: {e}")
+
+
+def start_job(bot, job_id: int) -> asyncio.Task:
+    """Запускает задание в фоне (повторный запуск того же задания не создаёт второй задачи)"""
+    task = _running.get(job_id)
+    if task is None or task.done():
+        task = asyncio.create_task(_run_and_report(bot, job_id))
+        _running[job_id] = task
+    return task
+
+
+async def create_broadcast(bot, text: str, markup: Optional[InlineKeyboardMarkup] = None,
+                           photo_id: Optional[str] = None, created_by: Optional[int] = None) -> dict:
+    """Сохраняет задание рассылки и запускает его. Возвращает задание"""
+    kind = 'photo' if photo_id else 'text'
+    job_id = await aio.run_write(db.create_broadcast_job, kind, text, photo_id, _markup_to_json(markup), created_by)
+    job = await aio.run_read(db.get_broadcast_job, job_id)
+    start_job(bot, job_id)
+    return job
+
+
+async def resume_broadcasts(bot) -> int:
+    """Продолжает незавершённые задания (при старте бота). Возвращает их число"""
+    jobs = await aio.run_read(db.get_unfinished_broadcast_jobs)
+    for job in jobs:
+        logger.info(f"[BROADCAST] Продолжаю задание {job['id']} "
+                    f"({job['delivered'] + job['failed'] + job['blocked']}/{job['total']})")
+        start_job(bot, job['id'])
+    return len(jobs)
+
+
+def format_job_report(job: dict) -> str:
+    progress = Progress(job)
+    return (f"📬 Рассылка #{job['id']} завершена\n"
+            f"✅ Доставлено: {job['delivered']}\n"
+            f"🚫 Заблокировали бота: {job['blocked']}\n"
+            f"❌ Ошибки: {job['failed']}\n"
+            f"⏱ Время: {format_duration(job['run_seconds'])} ({progress.rate:.1f} сообщ./с)")
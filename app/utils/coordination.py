@@ -0,0 +1,286 @@
+"""
+Координация процессов бота
+
+Когда бот запущен несколькими процессами (app/cluster.py), общее для них состояние
+хранится здесь, а не в памяти процесса:
+  - блокировки с арендой (lock): задание рассылки или обслуживание БД выполняет
+    только один процесс; аренда продлевается, пока блокировка удерживается, и
+    истекает сама, если процесс упал;
+  - флаги админ-панели (flag/set_flag): проверка подписки, рефералы. Чтение — из
+    снимка в памяти, снимок обновляется фоновой задачей раз в COORD_POLL_INTERVAL;
+  - темы изменений (publish/on_change): процесс, изменивший чёрный список или призы
+    слот-машины, увеличивает версию темы, остальные процессы по смене версии
+    перечитывают свои кэши.
+
+LocalCoordinator — всё в памяти, для одного процесса (по умолчанию).
+SQLiteCoordinator — общий файл COORD_DB_PATH для процессов на одной машине.
+Другая реализация (например, Redis) должна унаследовать Coordinator и реализовать
+_acquire/_release/_store_flag/_publish/_refresh.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, List, Optional
+
+import aiosqlite
+
+from app.config import COORD_BACKEND, COORD_DB_PATH, COORD_POLL_INTERVAL, COORD_LOCK_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class LockNotAcquired(Exception):
+    """Блокировку держит другой процесс"""
+
+
+class Coordinator:
+    """Общий интерфейс координации: блокировки, флаги, темы изменений"""
+
+    def __init__(self, poll_interval: float = COORD_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._flags: Dict[str, bool] = {}
+        self._versions: Dict[str, int] = {}
+        self._callbacks: Dict[str, List[Callable]] = defaultdict(list)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    # --- жизненный цикл ---
+
+    async def start(self):
+        """Читает текущее состояние и запускает слежение за изменениями других процессов"""
+        self._loop = asyncio.get_running_loop()
+        await self._refresh(notify=False)
+        if self.poll_interval > 0 and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._refresh(notify=True)
+            except Exception as e:
+                logger.error(f"[COORD] Ошибка чтения общего состояния: {e}")
+
+    # --- флаги ---
+
+    def flag(self, name: str, default: bool = False) -> bool:
+        return self._flags.get(name, default)
+
+    async def set_flag(self, name: str, value: bool):
+        await self._store_flag(name, bool(value))
+        self._flags[name] = bool(value)
+
+    # --- блокировки ---
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: float = 0, ttl: float = COORD_LOCK_TTL):
+        """Блокировка name между процессами. timeout=0 — не ждать (LockNotAcquired сразу)"""
+        token = f"{self.process_id}:{uuid.uuid4().hex[:8]}"
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while not await self._acquire(name, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockNotAcquired(name)
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 1.0)
+        renewer = asyncio.create_task(self._renew(name, token, ttl))
+        try:
+            yield
+        finally:
+            renewer.cancel()
+            await self._release(name, token)
+
+    async def _renew(self, name: str, token: str, ttl: float):
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if not await self._acquire(name, token, ttl):
+                    logger.error(f"[COORD] Аренда блокировки {name} потеряна")
+                    return
+            except Exception as e:
+                logger.error(f"[COORD] Не удалось продлить блокировку {name}: {e}")
+
+    # --- темы изменений ---
+
+    def on_change(self, topic: str, callback: Callable):
+        """callback() вызывается, когда тему изменил другой процесс"""
+        self._callbacks[topic].append(callback)
+
+    async def publish(self, topic: str):
+        previous = self._versions.get(topic, 0)
+        self._versions[topic] = version = await self._publish(topic)
+        if version > previous + 1 and previous:
+            # Между нашими изменениями тему менял и другой процесс
+            await self._changed(topic)
+
+    def notify(self, topic: str):
+        """publish() из синхронного кода, в том числе из потоков пула БД"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._publish_quietly(topic)))
+
+    async def _publish_quietly(self, topic: str):
+        try:
+            await self.publish(topic)
+        except Exception as e:
+            logger.error(f"[COORD] Не удалось опубликовать изменение {topic}: {e}")
+
+    async def _changed(self, topic: str):
+        logger.info(f"[COORD] {topic} изменён другим процессом")
+        for callback in self._callbacks.get(topic, ()):
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"[COORD] Ошибка обработки изменения {topic}: {e}")
+
+    # --- реализация хранилища ---
+
+    async def _acquire(self, name: str, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def _release(self, name: str, token: str):
+        raise NotImplementedError
+
+    async def _store_flag(self, name: str, value: bool):
+        raise NotImplementedError
+
+    async def _publish(self, topic: str) -> int:
+        raise NotImplementedError
+
+    async def _refresh(self, notify: bool):
+        raise NotImplementedError
+
+
+class LocalCoordinator(Coordinator):
+    """Один процесс: состояние только в памяти"""
+
+    def __init__(self):
+        super().__init__(poll_interval=0)
+        self._locks: Dict[str, tuple] = {}
+
+    async def _acquire(self, name: str, token: str, ttl: float) -> bool:
+        owner, expires_at = self._locks.get(name, (None, 0.0))
+        if owner not in (None, token) and expires_at > time.monotonic():
+            return False
+        self._locks[name] = (token, time.monotonic() + ttl)
+        return True
+
+    async def _release(self, name: str, token: str):
+        if self._locks.get(name, (None,))[0] == token:
+            del self._locks[name]
+
+    async def _store_flag(self, name: str, value: bool):
+        pass
+
+    async def _publish(self, topic: str) -> int:
+        return self._versions.get(topic, 0) + 1
+
+    async def _refresh(self, notify: bool):
+        pass
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS coord_locks (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS coord_flags (name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS coord_topics (topic TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+)
+
+
+class SQLiteCoordinator(Coordinator):
+    """Процессы на одной машине: общий файл SQLite в режиме WAL"""
+
+    def __init__(self, path: str = COORD_DB_PATH, poll_interval: float = COORD_POLL_INTERVAL):
+        super().__init__(poll_interval)
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._db is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                # Автокоммит: каждая операция — отдельная короткая транзакция
+                db = await aiosqlite.connect(self.path, isolation_level=None)
+                await db.execute('PRAGMA journal_mode=WAL')
+                await db.execute('PRAGMA busy_timeout=5000')
+                for statement in SCHEMA:
+                    await db.execute(statement)
+                self._db = db
+        return self._db
+
+    async def close(self):
+        await super().close()
+        if self._db is not None:
+            db, self._db = self._db, None
+            await db.close()
+
+    async def _acquire(self, name: str, token: str, ttl: float) -> bool:
+        db = await self._connection()
+        now = time.time()
+        # Свободна, истекла или уже наша (продление аренды)
+        cursor = await db.execute(
+            'INSERT INTO coord_locks (name, owner, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+            'WHERE coord_locks.expires_at < ? OR coord_locks.owner = excluded.owner',
+            (name, token, now + ttl, now))
+        return cursor.rowcount == 1
+
+    async def _release(self, name: str, token: str):
+        db = await self._connection()
+        await db.execute('DELETE FROM coord_locks WHERE name = ? AND owner = ?', (name, token))
+
+    async def _store_flag(self, name: str, value: bool):
+        db = await self._connection()
+        await db.execute('INSERT OR REPLACE INTO coord_flags (name, value) VALUES (?, ?)', (name, int(value)))
+
+    async def _publish(self, topic: str) -> int:
+        db = await self._connection()
+        async with db.execute('INSERT INTO coord_topics (topic, version) VALUES (?, 1) '
+                              'ON CONFLICT(topic) DO UPDATE SET version = version + 1 RETURNING version',
+                              (topic,)) as cursor:
+            row = await cursor.fetchone()
+        return row[0]
+
+    async def _refresh(self, notify: bool):
+        db = await self._connection()
+        async with db.execute('SELECT name, value FROM coord_flags') as cursor:
+            self._flags = {name: bool(value) for name, value in await cursor.fetchall()}
+        async with db.execute('SELECT topic, version FROM coord_topics') as cursor:
+            versions = dict(await cursor.fetchall())
+        changed = [topic for topic, version in versions.items() if version != self._versions.get(topic, 0)]
+        self._versions.update(versions)
+        if notify:
+            for topic in changed:
+                await self._changed(topic)
+
+
+def create_coordinator(backend: str = COORD_BACKEND) -> Coordinator:
+    """Реализация координации по настройке: local или sqlite"""
+    if backend == 'sqlite':
+        return SQLiteCoordinator()
+    if backend != 'local':
+        logger.warning(f"[COORD] Неизвестный COORD_BACKEND={backend}, использую local")
+    return LocalCoordinator()
+
+
+coordinator = create_coordinator()
@@ -0,0 +1,279 @@
+"""
+Хранилище FSM, переживающее перезапуск бота
+
+SQLiteStorage — реализация aiogram BaseStorage поверх отдельного файла FSM_DB_PATH
+(data/fsm.db) в режиме WAL:
+  - состояния и данные держатся в LRU-кэше (до FSM_CACHE_SIZE ключей), чтение из кэша
+    не трогает диск;
+  - запись меняет кэш и помечает ключ «грязным», фоновая задача раз в
+    FSM_FLUSH_INTERVAL секунд пишет все изменения одной транзакцией (write-behind).
+    FSM_FLUSH_INTERVAL=0 — запись сразу при каждом изменении;
+  - состояние, не менявшееся дольше FSM_STATE_TTL, считается брошенным: при чтении
+    возвращается пустым, в БД периодически удаляется.
+Кэш принадлежит процессу: при нескольких процессах запросы одного пользователя должны
+попадать в один и тот же процесс.
+
+create_storage() выбирает реализацию по FSM_STORAGE: sqlite, memory или redis://...
+(RedisStorage из aiogram, нужен пакет redis).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Set
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.config import FSM_STORAGE, FSM_DB_PATH, FSM_CACHE_SIZE, FSM_STATE_TTL, FSM_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS fsm_states '
+    '(key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, updated_at REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states(updated_at)',
+)
+PURGE_INTERVAL = 600  # сек между удалениями просроченных состояний из БД
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'updated_at')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None, updated_at: float = 0.0):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.updated_at = updated_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM в SQLite с LRU-кэшем и отложенной записью"""
+
+    def __init__(self, path: str = FSM_DB_PATH, cache_size: int = FSM_CACHE_SIZE, ttl: float = FSM_STATE_TTL,
+                 flush_interval: float = FSM_FLUSH_INTERVAL, key_builder: Optional[KeyBuilder] = None):
+        self.path = path
+        self.cache_size = max(1, cache_size)
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: 'OrderedDict[str, _Record]' = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._db: Optional[aiosqlite.Connection] = None
+        self._open_lock: Optional[asyncio.Lock] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.written = 0
+
+    # --- соединение ---
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+            self._flush_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._db is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = await aiosqlite.connect(self.path)
+                await db.execute('PRAGMA journal_mode=WAL')
+                await db.execute('PRAGMA synchronous=NORMAL')
+                for statement in SCHEMA:
+                    await db.execute(statement)
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def close(self) -> None:
+        """Пишет несохранённые изменения и закрывает соединение. Можно вызывать повторно"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        if self._db is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            db, self._db = self._db, None
+            await db.close()
+            self._cache.clear()
+
+    # --- кэш ---
+
+    def _expired(self, record: _Record, now: float) -> bool:
+        return bool(self.ttl) and not record.empty and now - record.updated_at > self.ttl
+
+    async def _record(self, key: StorageKey) -> tuple:
+        cache_key = self.key_builder.build(key)
+        now = time.time()
+        record = self._cache.get(cache_key)
+        if record is not None:
+            self.hits += 1
+            self._cache.move_to_end(cache_key)
+        else:
+            self.misses += 1
+            db = await self._connection()
+            async with db.execute('SELECT state, data, updated_at FROM fsm_states WHERE key = ?',
+                                  (cache_key,)) as cursor:
+                row = await cursor.fetchone()
+            # Пока ждали БД, ключ могли записать — кэш важнее
+            record = self._cache.get(cache_key)
+            if record is None:
+                record = _Record(row[0], json.loads(row[1]), row[2]) if row else _Record()
+                self._cache[cache_key] = record
+                self._evict()
+        if self._expired(record, now):
+            logger.info(f"[FSM] Состояние {cache_key} ({record.state}) устарело, сбрасываю")
+            record.state, record.data = None, {}
+            self._dirty.add(cache_key)
+        return cache_key, record
+
+    def _evict(self):
+        """Выкидывает самые старые сохранённые записи; несохранённые ждут записи в БД"""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        # Последняя запись — та, с которой сейчас работают
+        for cache_key in list(self._cache)[:-1]:
+            if excess <= 0:
+                break
+            if cache_key not in self._dirty:
+                del self._cache[cache_key]
+                excess -= 1
+
+    async def _changed(self, cache_key: str, record: _Record):
+        record.updated_at = time.time()
+        self._dirty.add(cache_key)
+        self._evict()
+        if self.flush_interval <= 0:
+            await self.flush()
+        elif self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    # --- интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        cache_key, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        await self._changed(cache_key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, not {type(data).__name__}")
+        cache_key, record = await self._record(key)
+        record.data = data.copy()
+        await self._changed(cache_key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    # --- запись в БД ---
+
+    async def flush(self) -> int:
+        """Пишет все несохранённые ключи одной транзакцией. Возвращает их число"""
+        if not self._dirty:
+            return 0
+        db = await self._connection()
+        async with self._flush_lock:
+            keys, self._dirty = self._dirty, set()
+            upserts, deletes = [], []
+            for cache_key in keys:
+                record = self._cache.get(cache_key)
+                if record is None or record.empty:
+                    deletes.append((cache_key,))
+                    continue
+                try:
+                    upserts.append((cache_key, record.state, json.dumps(record.data, ensure_ascii=False),
+                                    record.updated_at))
+                except (TypeError, ValueError) as e:
+                    logger.error(f"[FSM] Данные {cache_key} не сериализуются в JSON, не сохранены: {e}")
+            try:
+                if upserts:
+                    await db.executemany('INSERT OR REPLACE INTO fsm_states (key, state, data, updated_at) '
+                                         'VALUES (?, ?, ?, ?)', upserts)
+                if deletes:
+                    await db.executemany('DELETE FROM fsm_states WHERE key = ?', deletes)
+                await db.commit()
+            except BaseException:
+                # Повторим при следующей записи (в том числе если запись прервала остановка)
+                self._dirty |= keys
+                raise
+            self.flushes += 1
+            self.written += len(keys)
+        self._evict()
+        return len(keys)
+
+    async def purge_expired(self) -> int:
+        """Удаляет из БД состояния старше TTL"""
+        if not self.ttl:
+            return 0
+        db = await self._connection()
+        cursor = await db.execute('DELETE FROM fsm_states WHERE updated_at < ?', (time.time() - self.ttl,))
+        await db.commit()
+        if cursor.rowcount:
+            logger.info(f"[FSM] Удалено устаревших состояний: {cursor.rowcount}")
+        return cursor.rowcount
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_purge > PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    await self.purge_expired()
+            except Exception as e:
+                logger.error(f"[FSM] Ошибка записи состояний: {e}")
+            if not self._dirty:
+                # Следующая запись снова запустит задачу
+                self._flusher = None
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'cached': len(self._cache),
+            'dirty': len(self._dirty),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'flushes': self.flushes,
+            'written': self.written,
+        }
+
+
+def create_storage(backend: str = FSM_STORAGE) -> BaseStorage:
+    """Хранилище FSM по настройке: sqlite, memory или redis://host:port/db"""
+    if backend.startswith(('redis://', 'rediss://')):
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as e:
+            raise RuntimeError("Для FSM_STORAGE=redis:// нужен пакет redis (pip install redis)") from e
+        return RedisStorage.from_url(backend, key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True))
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend != 'sqlite':
+        logger.warning(f"[FSM] Неизвестное FSM_STORAGE={backend}, использую sqlite")
+    return SQLiteStorage()
+
+
+fsm_storage = create_storage()
@@ -0,0 +1,274 @@
+"""
+Реестр file_id картинок меню
+
+Меню отправляют фото по URL (настройки *_photo или ссылки imgur в коде), и
+Telegram скачивает картинку заново при каждом показе. Реестр хранит file_id
+уже загруженной картинки по URL, а MediaRequestMiddleware (middleware сессии
+бота) подставляет его в sendPhoto/editMessageMedia вместо URL — обработчики
+менять не нужно.
+
+Откуда берутся file_id:
+  - при старте prewarm() скачивает все картинки меню, считает sha256 и, если
+    такой пары (URL, хэш) ещё нет в media_files, загружает файл один раз в
+    MEDIA_UPLOAD_CHAT_ID (служебный чат, задаётся явно; без него prewarm не
+    запускается). Из процессов кластера prewarm выполняет один;
+  - если картинка ушла по URL (реестр её ещё не знал), file_id берётся из ответа
+    Telegram, а хэш считается в фоне;
+  - при смене фото в админке новый URL разрешается сразу (schedule_resolve).
+Если Telegram отклонил file_id, он удаляется и фото отправляется по URL.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, Optional, Set
+
+import aiohttp
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageMedia, SendPhoto
+from aiogram.types import BufferedInputFile
+
+from app.config import MEDIA_UPLOAD_CHAT_ID, MEDIA_DOWNLOAD_TIMEOUT, MEDIA_MAX_BYTES
+from app.utils.coordination import coordinator, LockNotAcquired
+from app.database import aio
+from app.database import media as db
+
+logger = logging.getLogger(__name__)
+
+# Картинки, которые обработчики используют по умолчанию, если настройка *_photo пуста
+DEFAULT_PHOTO_URLS = (
+    'https://imgur.com/a/TkOPe7c.jpeg',
+    'https://imgur.com/a/0Tx7psa.jpeg',
+    'https://imgur.com/a/3ZZOHNJ.jpeg',
+    'https://imgur.com/a/VJU8JNk.jpeg',
+    'https://imgur.com/a/taqnUZN.jpeg',
+    'https://imgur.com/a/5cDMyX0.jpeg',
+    'https://imgur.com/a/nG1DXzq.jpeg',
+)
+
+
+def is_url(value) -> bool:
+    return isinstance(value, str) and value.startswith(('http://', 'https://'))
+
+
+class MediaRegistry:
+    """URL -> file_id в памяти поверх таблицы media_files"""
+
+    def __init__(self, upload_chat_id: Optional[int] = MEDIA_UPLOAD_CHAT_ID):
+        self.upload_chat_id = upload_chat_id
+        self._file_ids: Dict[str, str] = {}
+        self._hashing: Set[str] = set()
+        self._resolving: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self.invalidated = 0
+
+    def load(self):
+        """Последние известные file_id из БД (при старте, до prewarm)"""
+        self._file_ids.update(db.get_latest_media_file_ids())
+        logger.info(f"[MEDIA] Загружено file_id: {len(self._file_ids)}")
+
+    def file_id_for(self, url: str) -> Optional[str]:
+        return self._file_ids.get(url)
+
+    def forget(self, url: str, file_id: str):
+        if self._file_ids.get(url) == file_id:
+            del self._file_ids[url]
+        self.invalidated += 1
+        logger.warning(f"[MEDIA] Telegram не принял file_id для {url}, отправка по URL")
+        _spawn(aio.run_write(db.delete_media_file, url, file_id))
+
+    def remember(self, url: str, file_id: str):
+        """file_id из ответа на отправку по URL; хэш содержимого считается в фоне"""
+        self._file_ids[url] = file_id
+        if url not in self._hashing:
+            self._hashing.add(url)
+            _spawn(self._persist(url, file_id))
+
+    async def _persist(self, url: str, file_id: str):
+        try:
+            async with aiohttp.ClientSession() as session:
+                content = await _download(session, url)
+            await aio.run_write(db.save_media_file, url, _hash(content), file_id)
+        except Exception as e:
+            logger.warning(f"[MEDIA] Не удалось сохранить file_id для {url}: {e}")
+        finally:
+            self._hashing.discard(url)
+
+    async def resolve(self, bot, url: str, session: Optional[aiohttp.ClientSession] = None) -> Optional[str]:
+        """
+        Скачивает картинку и находит file_id для (URL, хэш); если такой пары нет —
+        загружает файл в Telegram. Возвращает file_id или None при ошибке.
+        """
+        try:
+            if session is None:
+                async with aiohttp.ClientSession() as own_session:
+                    content = await _download(own_session, url)
+            else:
+                content = await _download(session, url)
+        except Exception as e:
+            logger.warning(f"[MEDIA] Не удалось скачать {url}: {e}")
+            return self._file_ids.get(url)
+
+        content_hash = _hash(content)
+        file_id = await aio.run_read(db.get_media_file_id, url, content_hash)
+        if file_id is None:
+            if self.upload_chat_id is None:
+                return self._file_ids.get(url)
+            try:
+                file_id = await self._upload(bot, content)
+            except Exception as e:
+                logger.warning(f"[MEDIA] Не удалось загрузить {url} в Telegram: {e}")
+                return self._file_ids.get(url)
+            await aio.run_write(db.save_media_file, url, content_hash, file_id)
+            logger.info(f"[MEDIA] Загружено {url} ({len(content)} байт)")
+        self._file_ids[url] = file_id
+        return file_id
+
+    async def _upload(self, bot, content: bytes) -> str:
+        message = await bot.send_photo(self.upload_chat_id, BufferedInputFile(content, filename='photo.jpg'),
+                                       disable_notification=True)
+        self.uploads += 1
+        try:
+            await bot.delete_message(self.upload_chat_id, message.message_id)
+        except Exception:
+            pass
+        return message.photo[-1].file_id
+
+    def schedule_resolve(self, bot, url: str) -> Optional[asyncio.Task]:
+        """Разрешить URL в фоне (после смены фото в админке)"""
+        if not is_url(url):
+            return None
+        task = self._resolving.get(url)
+        if task is None or task.done():
+            task = _spawn(self.resolve(bot, url))
+            self._resolving[url] = task
+        return task
+
+    async def prewarm(self, bot, urls: Optional[Iterable[str]] = None, concurrency: int = 4) -> int:
+        """Разрешает все картинки меню; возвращает число URL с file_id"""
+        if self.upload_chat_id is None:
+            logger.info("[MEDIA] MEDIA_UPLOAD_CHAT_ID не задан, картинки меню при старте не загружаются")
+            return 0
+        try:
+            async with coordinator.lock('media_prewarm'):
+                return await self._prewarm(bot, urls, concurrency)
+        except LockNotAcquired:
+            logger.info("[MEDIA] Картинки меню загружает другой процесс")
+            return 0
+
+    async def _prewarm(self, bot, urls: Optional[Iterable[str]], concurrency: int) -> int:
+        if urls is None:
+            urls = await aio.run_read(menu_photo_urls)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(url, session):
+            async with semaphore:
+                return await self.resolve(bot, url, session)
+
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*(one(url, session) for url in urls))
+        resolved = sum(1 for file_id in results if file_id)
+        logger.info(f"[MEDIA] Картинки меню: {resolved} из {len(results)} с file_id")
+        return resolved
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'uploads': self.uploads,
+            'invalidated': self.invalidated,
+            'known': len(self._file_ids),
+        }
+
+
+def _hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+async def _download(session: aiohttp.ClientSession, url: str) -> bytes:
+    timeout = aiohttp.ClientTimeout(total=MEDIA_DOWNLOAD_TIMEOUT)
+    async with session.get(url, timeout=timeout) as response:
+        response.raise_for_status()
+        content = await response.content.read(MEDIA_MAX_BYTES + 1)
+    if len(content) > MEDIA_MAX_BYTES:
+        raise ValueError(f"файл больше {MEDIA_MAX_BYTES} байт")
+    return content
+
+
+_background: Set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    # Ссылка на задачу держится до её завершения, иначе её может собрать GC
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def menu_photo_urls() -> list:
+    """URL из настроек *_photo и картинки по умолчанию"""
+    from app.database.models import get_all_admin_settings
+
+    urls = [value for key, value, _ in get_all_admin_settings() if key.endswith('_photo') and is_url(value)]
+    return list(dict.fromkeys(urls + list(DEFAULT_PHOTO_URLS)))
+
+
+media_registry = MediaRegistry()
+
+
+def _photo_url(method) -> Optional[str]:
+    if isinstance(method, SendPhoto) and is_url(method.photo):
+        return method.photo
+    if isinstance(method, EditMessageMedia) and getattr(method.media, 'type', None) == 'photo' \
+            and is_url(method.media.media):
+        return method.media.media
+    return None
+
+
+def _set_photo(method, value: str):
+    if isinstance(method, SendPhoto):
+        method.photo = value
+    else:
+        method.media.media = value
+
+
+def _sent_file_id(result) -> Optional[str]:
+    photo = getattr(result, 'photo', None)
+    return photo[-1].file_id if photo else None
+
+
+class MediaRequestMiddleware(BaseRequestMiddleware):
+    """Подменяет URL фото на file_id из реестра и запоминает file_id из ответов"""
+
+    def __init__(self, registry: MediaRegistry = media_registry):
+        self.registry = registry
+
+    async def __call__(self, make_request, bot, method):
+        url = _photo_url(method)
+        if url is None:
+            return await make_request(bot, method)
+
+        file_id = self.registry.file_id_for(url)
+        if file_id:
+            _set_photo(method, file_id)
+            try:
+                response = await make_request(bot, method)
+                self.registry.hits += 1
+                return response
+            except TelegramBadRequest as e:
+                if 'file' not in str(e).lower():
+                    raise
+                self.registry.forget(url, file_id)
+                _set_photo(method, url)
+
+        self.registry.misses += 1
+        response = await make_request(bot, method)
+        file_id = _sent_file_id(response.result)
+        if file_id:
+            self.registry.remember(url, file_id)
+        return response
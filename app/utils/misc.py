@@ -7,30 +7,21 @@ from typing import Optional, List, Dict, Any
 from aiogram import Bot
 
 from app.config import ADMINS
+from app.utils.admin_notify import admin_notifier
 from app.database.models import add_referral_bonus_for_order_async, get_flag
 
 logger = logging.getLogger(__name__)
 
 async def notify_admins(bot: Bot, text: str, reply_markup=None, parse_mode=None, document=None, document_caption=None):
-    """Отправляет уведомление всем админам"""
-    if not ADMINS:
-        logger.warning("Список администраторов пуст")
-        return
-    
-    success_count = 0
-    for admin_id in ADMINS:
-        try:
-            if document:
-                await bot.send_document(admin_id, document, caption=document_caption, reply_markup=reply_markup, parse_mode=parse_mode)
-            else:
-                await bot.send_message(admin_id, text, reply_markup=reply_markup, parse_mode=parse_mode)
-            success_count += 1
-            logger.debug(f"Уведомление отправлено админу {admin_id}")
-        except Exception as e:
-            logger.error(f"Ошибка отправки уведомления админу {admin_id}: {e}")
-            continue
-    
-    logger.info(f"Уведомления отправлены {success_count}/{len(ADMINS)} админам")
+    """
+    Отправляет уведомление всем админам
+
+    Уведомление ставится в очереди админов (app/utils/admin_notify.py) и
+    доставляется в фоне — вызывающий обработчик не ждёт отправок.
+    """
+    queued = admin_notifier.enqueue(bot, text, reply_markup=reply_markup, parse_mode=parse_mode,
+                                    document=document, document_caption=document_caption)
+    logger.debug(f"Уведомление поставлено в очередь {queued} админам")
 
 async def notify_admin(bot, admin_id: int, text: str, reply_markup=None, parse_mode="HTML"):
     """Отправляет уведомление конкретному админу"""
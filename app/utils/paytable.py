@@ -0,0 +1,99 @@
+"""
+Скомпилированная таблица выплат слот-машины
+
+Строится один раз из строк slot_config и отвечает на два вопроса без обращения к БД
+и без перебора конфигураций:
+  - какой результат выпал (кумулятивная таблица шансов + bisect, один random на спин);
+  - выигрышна ли комбинация (словарь комбинация -> конфигурация).
+
+Проигрышные тройки (все тройки символов, кроме выигрышных) вычисляются заранее,
+проигрыш — это random.choice из этого списка. Распределение то же, что давала
+прежняя выборка «случайная тройка, пока не проигрышная».
+
+spin_dice() — результат по значению кубика Telegram 🎰 (1–64). Значение определяет,
+что покажет клиент: value - 1 в четверичной записи — левый, средний и правый барабан
+(младший разряд — левый) из BAR, 🍇, 🍋, 7️⃣. Тройка барабанов ищется в той же таблице
+комбинаций, так что выигрыш совпадает с анимацией (64 — 7️⃣7️⃣7️⃣). Шансы при этом задаёт
+Telegram (каждая тройка — 1/64), а не chance_percent; призы на других символах в этом
+режиме не выпадают.
+"""
+import bisect
+import itertools
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Эмодзи для слот-машины (должны соответствовать эмодзи в БД)
+SLOT_EMOJIS = ["🍒", "🍋", "🍊", "🍇", "⭐️", "💎", "🔔", "💰", "🎰", "7️⃣"]
+# Символы барабана кубика 🎰 в Telegram по порядку разрядов значения
+DICE_REELS = ["BAR", "🍇", "🍋", "7️⃣"]
+DICE_FACES = len(DICE_REELS) ** 3  # значений у кубика 🎰 в Telegram
+
+
+def dice_reels(value: int) -> Tuple[str, str, str]:
+    """Тройка барабанов (левый, средний, правый), которую клиент показывает для значения кубика"""
+    if not 1 <= value <= DICE_FACES:
+        raise ValueError(f"Значение кубика {value} вне 1..{DICE_FACES}")
+    value -= 1
+    size = len(DICE_REELS)
+    return DICE_REELS[value % size], DICE_REELS[value // size % size], DICE_REELS[value // size ** 2 % size]
+
+
+class Paytable:
+    """
+    configs — строки slot_config в порядке get_slot_configs():
+    (id, combination, reward_type, reward_amount, chance_percent, emoji, name)
+    """
+
+    def __init__(self, configs: Sequence[Tuple], symbols: Sequence[str] = SLOT_EMOJIS, version=None):
+        self.version = version
+        self.configs: List[Tuple] = list(configs)
+        self.symbols = list(symbols)
+
+        # Кумулятивные шансы в процентах: r из [0, 100] попадает в i-ю конфигурацию,
+        # если cumulative[i-1] < r <= cumulative[i]; r > total_chance — проигрыш
+        self.cumulative: List[float] = list(itertools.accumulate(float(c[4] or 0) for c in self.configs))
+        self.total_chance = self.cumulative[-1] if self.cumulative else 0.0
+        self.win_triples = [(c[5], c[5], c[5]) for c in self.configs]
+
+        # Комбинация -> конфигурация. Как и в прежней проверке, при совпадении
+        # нескольких конфигураций побеждает та, что раньше в списке
+        self.by_combination: Dict[str, Tuple] = {}
+        for config in reversed(self.configs):
+            combination, emoji = config[1], config[5]
+            if emoji:
+                self.by_combination[emoji * 3] = config
+            if combination:
+                self.by_combination[combination] = config
+
+        self.losing_triples = [
+            triple for triple in itertools.product(self.symbols, repeat=3)
+            if ''.join(triple) not in self.by_combination
+        ]
+
+    def __len__(self):
+        return len(self.configs)
+
+    def spin(self, rng: random.Random = random) -> Tuple[Tuple[str, str, str], Optional[Tuple]]:
+        """Возвращает (тройка символов, конфигурация выигрыша или None)"""
+        if not self.configs:
+            return (rng.choice(self.symbols), rng.choice(self.symbols), rng.choice(self.symbols)), None
+        r = rng.uniform(0, 100)
+        index = bisect.bisect_left(self.cumulative, r)
+        if index < len(self.configs):
+            return self.win_triples[index], self.configs[index]
+        return self.losing_triple(rng), None
+
+    def spin_dice(self, value: int) -> Tuple[Tuple[str, str, str], Optional[Tuple]]:
+        """Результат, который показывает кубик 🎰 со значением value: его тройка и её приз"""
+        triple = dice_reels(value)
+        return triple, self.lookup(*triple)
+
+    def losing_triple(self, rng: random.Random = random) -> Tuple[str, str, str]:
+        if not self.losing_triples:
+            # Все тройки выигрышные — вернуть проигрыш невозможно
+            return rng.choice(self.symbols), rng.choice(self.symbols), rng.choice(self.symbols)
+        return rng.choice(self.losing_triples)
+
+    def lookup(self, slot1: str, slot2: str, slot3: str) -> Optional[Tuple]:
+        """Конфигурация выигрыша для комбинации или None"""
+        return self.by_combination.get(slot1 + slot2 + slot3)
@@ -0,0 +1,229 @@
+"""
+Курсы криптовалют в рублях
+
+Цена монеты = цена в USDT (Binance) × курс USD/RUB (ЦБ). PriceOracle держит одну
+aiohttp-сессию на процесс, запрашивает оба источника параллельно и кэширует
+каждый со своим TTL: курс ЦБ меняется раз в день, цена на бирже — постоянно.
+  - Курс старше ttl отдаётся сразу, а новый запрашивается в фоне
+    (stale-while-revalidate). Старше max_stale — запрос ждёт ответа источника.
+  - Пока источник недоступен, отдаётся последний полученный курс (не старше
+    max_stale); если такого нет — PriceUnavailable.
+  - Одновременные запросы одного курса объединяются в один HTTP-запрос.
+  - start() запускает фоновое обновление PRICE_SYMBOLS до истечения TTL, чтобы
+    ввод суммы пользователем не ждал сети.
+Источник курса — подкласс PriceSource с методом fetch(session, key).
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import aiohttp
+
+from app.config import (
+    PRICE_BINANCE_URL, PRICE_CBR_URL, PRICE_SYMBOLS, PRICE_CRYPTO_TTL, PRICE_FIAT_TTL,
+    PRICE_CRYPTO_MAX_STALE, PRICE_FIAT_MAX_STALE, PRICE_TIMEOUT, PRICE_REFRESH_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PriceUnavailable(Exception):
+    """Нет ни свежего, ни допустимо старого курса"""
+
+
+class PriceSource:
+    """Источник курса со своими ttl и max_stale"""
+
+    name = "source"
+
+    def __init__(self, ttl: float, max_stale: float):
+        self.ttl = ttl
+        self.max_stale = max(ttl, max_stale)
+
+    async def fetch(self, session: aiohttp.ClientSession, key: str) -> float:
+        raise NotImplementedError
+
+
+class BinanceSource(PriceSource):
+    """Цена монеты в USDT: /api/v3/ticker/price?symbol=<KEY>USDT"""
+
+    name = "binance"
+
+    def __init__(self, base_url: str = PRICE_BINANCE_URL, ttl: float = PRICE_CRYPTO_TTL,
+                 max_stale: float = PRICE_CRYPTO_MAX_STALE):
+        super().__init__(ttl, max_stale)
+        self.base_url = base_url.rstrip('/')
+
+    async def fetch(self, session: aiohttp.ClientSession, key: str) -> float:
+        async with session.get(f"{self.base_url}/api/v3/ticker/price", params={'symbol': f"{key}USDT"}) as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+        return float(data['price'])
+
+
+class CbrSource(PriceSource):
+    """Курс валюты <KEY> в рублях по данным ЦБ (daily_json.js)"""
+
+    name = "cbr"
+
+    def __init__(self, url: str = PRICE_CBR_URL, ttl: float = PRICE_FIAT_TTL, max_stale: float = PRICE_FIAT_MAX_STALE):
+        super().__init__(ttl, max_stale)
+        self.url = url
+
+    async def fetch(self, session: aiohttp.ClientSession, key: str) -> float:
+        async with session.get(self.url) as resp:
+            resp.raise_for_status()
+            # Отдаётся как application/javascript
+            data = json.loads(await resp.text())
+        valute = data['Valute'][key]
+        return float(valute['Value']) / float(valute.get('Nominal') or 1)
+
+
+class _Quote:
+    def __init__(self, value: float, fetched_at: float):
+        self.value = value
+        self.fetched_at = fetched_at
+
+
+class PriceOracle:
+    def __init__(self, crypto_source: Optional[PriceSource] = None, fiat_source: Optional[PriceSource] = None,
+                 symbols: Iterable[str] = PRICE_SYMBOLS, timeout: float = PRICE_TIMEOUT,
+                 refresh_interval: float = PRICE_REFRESH_INTERVAL, clock=time.monotonic):
+        self.crypto = crypto_source or BinanceSource()
+        self.fiat = fiat_source or CbrSource()
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.timeout = timeout
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._quotes: Dict[Tuple[str, str], _Quote] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop = None
+        self._refresher: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Новый event loop (перезапуск, тесты): сессия и запросы старого к нему не относятся
+            self._loop = loop
+            self._inflight = {}
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _fetch(self, source: PriceSource, key: str) -> float:
+        self.fetches += 1
+        try:
+            value = await source.fetch(self._get_session(), key)
+            if not value > 0:
+                raise ValueError(f"некорректный курс {value!r}")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"[PRICES] Не удалось получить курс {source.name} {key}: {e}")
+            raise
+        self._quotes[(source.name, key)] = _Quote(value, self._clock())
+        return value
+
+    def _refresh(self, source: PriceSource, key: str) -> asyncio.Future:
+        """Запрос курса; уже идущий запрос того же курса переиспользуется"""
+        self._get_session()
+        cache_key = (source.name, key)
+        future = self._inflight.get(cache_key)
+        if future is not None:
+            self.coalesced += 1
+            return future
+        future = asyncio.ensure_future(self._fetch(source, key))
+        self._inflight[cache_key] = future
+
+        def done(f):
+            if self._inflight.get(cache_key) is f:
+                del self._inflight[cache_key]
+            # Ошибка фонового обновления уже залогирована в _fetch
+            if not f.cancelled():
+                f.exception()
+
+        future.add_done_callback(done)
+        return future
+
+    async def quote(self, source: PriceSource, key: str) -> float:
+        """Курс из кэша источника или, если его нет или он слишком старый, — от источника"""
+        quote = self._quotes.get((source.name, key))
+        age = self._clock() - quote.fetched_at if quote is not None else None
+        if age is not None and age < source.ttl:
+            self.hits += 1
+            return quote.value
+        if age is not None and age < source.max_stale:
+            self.stale_hits += 1
+            self._refresh(source, key)
+            return quote.value
+        self.misses += 1
+        try:
+            # shield: отмена одного ожидающего не отменяет запрос для остальных
+            return await asyncio.shield(self._refresh(source, key))
+        except Exception as e:
+            raise PriceUnavailable(f"Нет курса {source.name} {key}: {e}") from e
+
+    async def rub_price(self, symbol: str) -> float:
+        """Цена одной монеты в рублях"""
+        price_usdt, usd_rub = await asyncio.gather(
+            self.quote(self.crypto, symbol.upper()), self.quote(self.fiat, 'USD'))
+        return price_usdt * usd_rub
+
+    def _due(self, source: PriceSource, key: str) -> bool:
+        quote = self._quotes.get((source.name, key))
+        # Обновляем заранее, чтобы к следующему проходу курс ещё не устарел
+        return quote is None or self._clock() - quote.fetched_at + self.refresh_interval >= source.ttl
+
+    async def refresh_due(self):
+        """Один проход фонового обновления: курсы, которые устареют до следующего прохода"""
+        pending = [(self.crypto, symbol) for symbol in self.symbols] + [(self.fiat, 'USD')]
+        futures = [self._refresh(source, key) for source, key in pending if self._due(source, key)]
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh_due()
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Фоновое обновление курсов PRICE_SYMBOLS (при refresh_interval > 0)"""
+        if self.refresh_interval > 0 and (self._refresher is None or self._refresher.done()):
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        now = self._clock()
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_ratio': round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+            'coalesced': self.coalesced,
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'ages': {f"{name}:{key}": round(now - quote.fetched_at, 1) for (name, key), quote in self._quotes.items()},
+        }
+
+
+price_oracle = PriceOracle()
+
+
+async def get_crypto_rub_price(symbol: str) -> float:
+    """Цена монеты (TON, NOT, DOGS) в рублях; PriceUnavailable — курса нет"""
+    return await price_oracle.rub_price(symbol)
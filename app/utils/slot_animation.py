@@ -0,0 +1,155 @@
+"""
+Анимация вращения слот-машины
+
+Результат решается до анимации (generate_slot_result), анимация только показывает его:
+  - begin()  — первое сообщение (кадр или кубик 🎰), возвращает SlotSpin;
+  - reveal() — оставшиеся кадры, барабаны останавливаются на уже известном результате;
+  - finish() — сообщение с результатом и клавиатурой.
+
+Режимы (SLOT_ANIMATION):
+  frames   — SLOT_ANIMATION_FRAMES кадров: sendMessage + (кадров - 1) editMessageText + итог;
+  adaptive — то же, но кадров меньше, чем выше текущая скорость запросов к Bot API
+             (api_rate); при SLOT_API_RATE_LIMIT запросов/с остаётся один кадр;
+  dice     — нативный кубик 🎰 (sendDice): анимацию рисует клиент Telegram, результат —
+             тройка барабанов, которую показывает значение кубика (dice_reels), приз —
+             по таблице выплат для этой тройки (Paytable.spin_dice), итог — отдельным сообщением;
+  none     — один кадр «крутится» и итог.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Optional, Tuple
+
+from app.config import SLOT_ANIMATION, SLOT_ANIMATION_FRAMES, SLOT_FRAME_DELAY, SLOT_API_RATE_LIMIT
+from app.middlewares.api_rate import api_rate
+from app.utils.paytable import SLOT_EMOJIS
+from app.utils.slot_machine import CENTERED_FRAME
+
+logger = logging.getLogger(__name__)
+
+DICE_EMOJI = "🎰"
+DICE_ANIMATION_SECONDS = 2.0  # столько клиент Telegram крутит кубик 🎰
+
+
+class SlotSpin:
+    """Одно вращение: сообщение анимации и значение кубика (для режима dice)"""
+
+    def __init__(self, message, frames: int = 1, dice_value: Optional[int] = None):
+        self.message = message
+        self.frames = frames
+        self.dice_value = dice_value
+        self.started_at = time.monotonic()
+
+
+def render_frame(reels, frame: int, frames: int) -> str:
+    return (
+        f"🎰 <b>СЛОТ-МАШИНА КРУТИТСЯ...</b> 🎰\n\n"
+        + CENTERED_FRAME.format(s1=reels[0], s2=reels[1], s3=reels[2])
+        + f"\n\n🎯 Ожидайте результат... <b>({frame}/{frames})</b>"
+    )
+
+
+def frame_reels(triple: Optional[Tuple[str, str, str]], stopped: int) -> Tuple[str, str, str]:
+    """Первые stopped барабанов — результат, остальные — случайные символы"""
+    return tuple(triple[i] if triple and i < stopped else random.choice(SLOT_EMOJIS) for i in range(3))
+
+
+class SlotAnimation:
+    """Базовая стратегия: один кадр и итог в том же сообщении"""
+
+    name = "none"
+
+    def frame_count(self) -> int:
+        return 1
+
+    async def begin(self, message) -> SlotSpin:
+        frames = self.frame_count()
+        sent = await message.answer(render_frame(frame_reels(None, 0), 1, frames), parse_mode="HTML")
+        return SlotSpin(sent, frames=frames)
+
+    async def reveal(self, spin: SlotSpin, triple: Tuple[str, str, str]):
+        pass
+
+    async def finish(self, spin: SlotSpin, text: str, reply_markup=None):
+        try:
+            await spin.message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+        except Exception as e:
+            logger.error(f"[SLOT] Ошибка отображения результата: {e}")
+            await spin.message.answer(text, reply_markup=reply_markup, parse_mode="HTML")
+
+
+class FramesAnimation(SlotAnimation):
+    """Несколько кадров; в кадре i остановлены первые i*3/frames барабанов"""
+
+    name = "frames"
+
+    def __init__(self, frames: int = SLOT_ANIMATION_FRAMES, delay: float = SLOT_FRAME_DELAY):
+        self.frames = max(1, frames)
+        self.delay = delay
+
+    def frame_count(self) -> int:
+        return self.frames
+
+    async def reveal(self, spin: SlotSpin, triple: Tuple[str, str, str]):
+        for i in range(1, spin.frames):
+            await asyncio.sleep(self.delay)
+            try:
+                await spin.message.edit_text(
+                    render_frame(frame_reels(triple, i * 3 // spin.frames), i + 1, spin.frames),
+                    parse_mode="HTML",
+                )
+            except Exception as e:
+                logger.error(f"[SLOT] Ошибка кадра анимации {i + 1}: {e}")
+        if spin.frames > 1:
+            await asyncio.sleep(self.delay)
+
+
+class AdaptiveAnimation(FramesAnimation):
+    """Кадров от frames (бот простаивает) до одного (rate_limit запросов/с и больше)"""
+
+    name = "adaptive"
+
+    def __init__(self, frames: int = SLOT_ANIMATION_FRAMES, delay: float = SLOT_FRAME_DELAY,
+                 rate_limit: float = SLOT_API_RATE_LIMIT, meter=api_rate):
+        super().__init__(frames, delay)
+        self.rate_limit = rate_limit
+        self.meter = meter
+
+    def frame_count(self) -> int:
+        load = min(1.0, self.meter.rate() / self.rate_limit) if self.rate_limit > 0 else 1.0
+        return 1 + int((self.frames - 1) * (1 - load))
+
+
+class DiceAnimation(SlotAnimation):
+    """Кубик 🎰: одна отправка, анимация на стороне клиента"""
+
+    name = "dice"
+
+    def __init__(self, duration: float = DICE_ANIMATION_SECONDS):
+        self.duration = duration
+
+    async def begin(self, message) -> SlotSpin:
+        sent = await message.answer_dice(emoji=DICE_EMOJI)
+        return SlotSpin(sent, dice_value=sent.dice.value)
+
+    async def reveal(self, spin: SlotSpin, triple: Tuple[str, str, str]):
+        # Итог не должен появиться раньше, чем кубик остановится
+        left = self.duration - (time.monotonic() - spin.started_at)
+        if left > 0:
+            await asyncio.sleep(left)
+
+    async def finish(self, spin: SlotSpin, text: str, reply_markup=None):
+        await spin.message.answer(text, reply_markup=reply_markup, parse_mode="HTML")
+
+
+def get_slot_animation(mode: str = SLOT_ANIMATION) -> SlotAnimation:
+    if mode == "dice":
+        return DiceAnimation()
+    if mode == "frames":
+        return FramesAnimation()
+    if mode == "none":
+        return SlotAnimation()
+    if mode != "adaptive":
+        logger.warning(f"[SLOT] Неизвестный режим анимации {mode!r}, используется adaptive")
+    return AdaptiveAnimation()
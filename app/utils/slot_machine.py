@@ -8,20 +8,19 @@ import random
 from typing import Tuple, Optional, List
 
 from app.database.models import (
-    get_slot_configs, get_user_slot_spins, use_slot_spin, 
+    get_slot_configs, get_slot_config_version, get_user_slot_spins, use_slot_spin, 
     create_slot_win, should_reset_daily_attempts, reset_slot_spins,
     get_admin_setting, get_slot_wins, get_slot_win_by_id, add_ton_slot_win,
-    get_or_create_user, create_order, get_user_profile, update_balance
+    get_or_create_user, create_order, get_user_profile, update_balance, get_slot_user_stats
 )
+from app.database import aio
 from app.keyboards.main import slot_win_admin_kb
 from app.utils.misc import notify_admins
+from app.utils.paytable import Paytable, SLOT_EMOJIS
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Эмодзи для слот-машины (должны соответствовать эмодзи в БД)
-SLOT_EMOJIS = ["🍒", "🍋", "🍊", "🍇", "⭐️", "💎", "🔔", "💰", "🎰", "7️⃣"]
-
 # Центрированная рамка для слотов (точно по размеру 3 эмодзи)
 CENTERED_FRAME = (
     "┌───────────────┐\n"
@@ -29,174 +28,149 @@ CENTERED_FRAME = (
     "└───────────────┘"
 )
 
-async def generate_slot_result() -> Tuple[str, str, str]:
+_paytable: Optional[Paytable] = None
+
+
+def get_paytable() -> Paytable:
     """
-    НОВАЯ ЛОГИКА ГЕНЕРАЦИИ РЕЗУЛЬТАТОВ СЛОТ-МАШИНЫ
+    Таблица выплат, скомпилированная из slot_config.
+    Пересобирается только после изменения конфигураций (add_slot_config,
+    delete_slot_config, очистка/восстановление призов).
+    """
+    global _paytable
+    version = get_slot_config_version()
+    if _paytable is None or _paytable.version != version:
+        _paytable = Paytable(get_slot_configs(), SLOT_EMOJIS, version=version)
+        logger.info(f"[SLOT] Таблица выплат пересобрана: {len(_paytable)} комбинаций, "
+                    f"общий шанс выигрыша {_paytable.total_chance:.4f}%")
+    return _paytable
 
-    Использует правильную систему вероятностей:
-    1. Сначала определяется, будет ли выигрыш (общий шанс ~13%)
-    2. Если выигрыш - выбирается конкретная комбинация по индивидуальным шансам
-    3. Если проигрыш - генерируется случайная невыигрышная комбинация
 
-    Это предотвращает частые выигрыши и обеспечивает правильный баланс.
+async def generate_slot_result(dice_value: Optional[int] = None) -> Tuple[str, str, str]:
     """
-    configs = get_slot_configs()
+    Генерация результата слот-машины
 
-    if not configs:
+    Одно случайное число из [0, 100] ищется в кумулятивной таблице шансов:
+    попадание в интервал комбинации — выигрыш этой комбинацией (тройка её эмодзи),
+    больше общего шанса — случайная невыигрышная тройка.
+    dice_value — значение кубика 🎰 (режим анимации dice): результат — показанная
+    кубиком тройка барабанов.
+    """
+    paytable = get_paytable()
+    if not len(paytable):
         # Если нет конфигураций, возвращаем случайные символы
         logger.warning("[SLOT] Нет конфигураций слот-машины, возвращаем случайные символы")
-        return random.choice(SLOT_EMOJIS), random.choice(SLOT_EMOJIS), random.choice(SLOT_EMOJIS)
-
-    # Вычисляем общий процент выигрышей
-    total_win_chance = sum(config[4] for config in configs)  # config[4] = chance_percent
-    logger.debug(f"[SLOT] Общий шанс выигрыша: {total_win_chance:.2f}%")
-
-    # Генерируем случайное число от 0 до 100
-    random_num = random.uniform(0, 100)
-    logger.debug(f"[SLOT] Сгенерировано случайное число: {random_num:.4f}")
-
-    # ЭТАП 1: Определяем, будет ли выигрыш
-    if random_num <= total_win_chance:
-        # ВЫИГРЫШ! Теперь выбираем конкретную комбинацию
-        logger.info(f"[SLOT] Выигрыш! ({random_num:.4f} <= {total_win_chance:.2f}%)")
-
-        # Генерируем новое случайное число для выбора конкретной комбинации
-        win_random = random.uniform(0, total_win_chance)
-        current_chance = 0
-
-        for config in configs:
-            config_id, combination, reward_type, reward_amount, chance_percent, emoji, name = config
-            current_chance += chance_percent
-
-            if win_random <= current_chance:
-                logger.info(f"[SLOT] Выбрана выигрышная комбинация: {name} ({emoji}{emoji}{emoji})")
-                logger.info(f"[SLOT] Приз: {reward_amount} {reward_type}")
-                return emoji, emoji, emoji
-
-        # Если по какой-то причине не выбрали комбинацию, берем первую
-        first_config = configs[0]
-        emoji = first_config[5]
-        logger.warning(f"[SLOT] Fallback к первой комбинации: {emoji}{emoji}{emoji}")
-        return emoji, emoji, emoji
 
+    if dice_value is None:
+        triple, config = paytable.spin()
     else:
-        # ПРОИГРЫШ - генерируем невыигрышную комбинацию
-        logger.debug(f"[SLOT] Проигрыш ({random_num:.4f} > {total_win_chance:.2f}%)")
-        return await _generate_losing_combination(configs)
+        triple, config = paytable.spin_dice(dice_value)
+    if config:
+        logger.info(f"[SLOT] Выбрана выигрышная комбинация: {config[6]} ({config[5]}{config[5]}{config[5]})")
+        logger.info(f"[SLOT] Приз: {config[3]} {config[2]}")
+    return triple
 
 
-async def _generate_losing_combination(configs) -> Tuple[str, str, str]:
-    """
-    Генерирует гарантированно проигрышную комбинацию
+async def check_win_combination(slot1: str, slot2: str, slot3: str) -> Optional[Tuple]:
     """
-    max_attempts = 100  # Увеличиваем количество попыток
-    attempts = 0
-
-    # Создаем множество выигрышных эмодзи для быстрой проверки
-    winning_emojis = {config[5] for config in configs}  # config[5] = emoji
-
-    while attempts < max_attempts:
-        slot1 = random.choice(SLOT_EMOJIS)
-        slot2 = random.choice(SLOT_EMOJIS)
-        slot3 = random.choice(SLOT_EMOJIS)
-
-        # Проверяем, что это НЕ тройка одинаковых выигрышных эмодзи
-        if not (slot1 == slot2 == slot3 and slot1 in winning_emojis):
-            # Дополнительно проверяем точные комбинации из БД
-            combination = slot1 + slot2 + slot3
-            is_winning = any(config[1] == combination for config in configs)
-
-            if not is_winning:
-                logger.debug(f"[SLOT] Сгенерирована проигрышная комбинация: {slot1}{slot2}{slot3} (попытка {attempts + 1})")
-                return slot1, slot2, slot3
-
-        attempts += 1
+    Проверка выигрышной комбинации
 
-    # Если не удалось сгенерировать проигрышную комбинацию, создаем принудительно
-    logger.warning(f"[SLOT] Не удалось сгенерировать проигрышную комбинацию за {max_attempts} попыток")
-
-    # Принудительно создаем проигрышную комбинацию
-    # Берем 3 разных эмодзи, чтобы гарантированно не было тройки
-    available_emojis = [e for e in SLOT_EMOJIS if e not in winning_emojis]
-
-    if len(available_emojis) >= 3:
-        # Если есть достаточно неwyигрышных эмодзи
-        selected = random.sample(available_emojis, 3)
-        logger.debug(f"[SLOT] Принудительная проигрышная комбинация (неwyигрышные эмодзи): {selected[0]}{selected[1]}{selected[2]}")
-        return selected[0], selected[1], selected[2]
+    Ищет комбинацию в таблице выплат: точные комбинации из БД и тройки
+    одинаковых эмодзи конфигураций.
+    """
+    config = get_paytable().lookup(slot1, slot2, slot3)
+    if config:
+        logger.info(f"[SLOT] ✅ Найдена выигрышная комбинация: {config[6]}")
+        logger.info(f"[SLOT] 🎁 Приз: {config[3]} {config[2]}")
     else:
-        # Если неwyигрышных эмодзи мало, создаем смешанную комбинацию
-        slot1 = random.choice(SLOT_EMOJIS)
-        slot2 = random.choice([s for s in SLOT_EMOJIS if s != slot1])
-        slot3 = random.choice([s for s in SLOT_EMOJIS if s != slot1 and s != slot2])
-        logger.debug(f"[SLOT] Принудительная проигрышная комбинация (смешанная): {slot1}{slot2}{slot3}")
-        return slot1, slot2, slot3
+        logger.debug(f"[SLOT] ❌ Комбинация {slot1}{slot2}{slot3} не является выигрышной")
+    return config
 
-async def check_win_combination(slot1: str, slot2: str, slot3: str) -> Optional[Tuple]:
+def format_reward_text(reward_type: str, reward_amount) -> str:
+    """Текст награды для пользователя"""
+    if reward_type == "stars":
+        return f"{int(reward_amount)}⭐ звезд"
+    if reward_type == "money":
+        return f"{int(reward_amount)}₽"
+    if reward_type == "ton":
+        return f"{reward_amount} TON"
+    return "Специальный приз"
+
+
+class SpinResult:
+    """Итог спина: что выпало, что записано и сколько попыток осталось"""
+
+    def __init__(self, status: str, daily_attempts: int, triple: Tuple[str, str, str] = None,
+                 config: Optional[Tuple] = None, win_id: Optional[int] = None, order_id: Optional[int] = None,
+                 attempts_used: int = 0, bonus_attempts: int = 0):
+        self.status = status
+        self.daily_attempts = daily_attempts
+        self.triple = triple
+        self.config = config
+        self.win_id = win_id
+        self.order_id = order_id
+        self.attempts_used = attempts_used
+        self.bonus_attempts = bonus_attempts
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    @property
+    def is_win(self) -> bool:
+        return self.config is not None
+
+    @property
+    def reward_type(self) -> Optional[str]:
+        return self.config[2] if self.config else None
+
+    @property
+    def reward_amount(self):
+        return self.config[3] if self.config else 0
+
+    @property
+    def prize_name(self) -> str:
+        return self.config[6] if self.config else ""
+
+    @property
+    def reward_text(self) -> str:
+        return format_reward_text(self.reward_type, self.reward_amount) if self.config else ""
+
+    @property
+    def combination(self) -> str:
+        return ''.join(self.triple) if self.triple else ""
+
+    @property
+    def remaining_standard(self) -> int:
+        return max(0, self.daily_attempts - self.attempts_used)
+
+    @property
+    def remaining(self) -> int:
+        return self.remaining_standard + self.bonus_attempts
+
+
+async def spin(tg_id: int, dice_value: Optional[int] = None) -> SpinResult:
     """
-    УЛУЧШЕННАЯ ПРОВЕРКА ВЫИГРЫШНЫХ КОМБИНАЦИЙ
-
-    Проверяет комбинацию на соответствие выигрышным конфигурациям из БД.
-    Поддерживает как точные комбинации, так и тройки одинаковых эмодзи.
+    Спин слот-машины: списание попытки, результат, запись и начисление —
+    одна транзакция (play_slot_spin). dice_value — значение кубика 🎰 в режиме dice.
+    Обработчику остаётся только показать SpinResult.
     """
-    combination = slot1 + slot2 + slot3
-    configs = get_slot_configs()
-
-    logger.debug(f"[SLOT] Проверяем комбинацию: {combination} ({slot1} {slot2} {slot3})")
-
-    if not configs:
-        logger.warning("[SLOT] Нет конфигураций для проверки выигрышей")
-        return None
-
-    for config in configs:
-        config_id, combo, reward_type, reward_amount, chance_percent, emoji, name = config
+    daily_attempts = int(get_admin_setting('slot_daily_attempts', '5'))
+    paytable = get_paytable()
 
-        # Проверяем точное совпадение комбинации (если задано)
-        if combo and combo == combination:
-            logger.info(f"[SLOT] ✅ Найдена выигрышная комбинация (точное совпадение): {name}")
-            logger.info(f"[SLOT] 🎁 Приз: {reward_amount} {reward_type}")
-            return config
+    def roll():
+        return paytable.spin() if dice_value is None else paytable.spin_dice(dice_value)
 
-        # Проверяем тройку одинаковых эмодзи
-        if slot1 == slot2 == slot3 == emoji:
-            logger.info(f"[SLOT] ✅ Найдена выигрышная комбинация (тройка эмодзи): {name}")
-            logger.info(f"[SLOT] 🎁 Приз: {reward_amount} {reward_type}")
-            return config
+    data = await aio.play_slot_spin(tg_id, daily_attempts, roll)
+    result = SpinResult(daily_attempts=daily_attempts, **data) if data['status'] == 'ok' else \
+        SpinResult(data['status'], daily_attempts)
+    if result.is_win:
+        logger.info(f"[SLOT] 🎰 tg_id={tg_id}: {result.combination} — {result.prize_name}, "
+                    f"приз {result.reward_text}, win_id={result.win_id}")
+    elif result.ok:
+        logger.debug(f"[SLOT] tg_id={tg_id}: {result.combination} — проигрыш")
+    return result
 
-    logger.debug(f"[SLOT] ❌ Комбинация {combination} не является выигрышной")
-    return None
-
-async def animate_slot_machine(message, callback) -> Tuple[str, str, str]:
-    """Анимирует вращение слот-машины"""
-    animation_steps = 12
-    
-    for i in range(animation_steps):
-        try:
-            # Генерируем случайные символы для анимации
-            slot1 = random.choice(SLOT_EMOJIS)
-            slot2 = random.choice(SLOT_EMOJIS) 
-            slot3 = random.choice(SLOT_EMOJIS)
-            
-            # Обновляем сообщение с красивой анимацией
-            anim = (
-                f"🎰 <b>СЛОТ-МАШИНА КРУТИТСЯ...</b> 🎰\n\n"
-                + CENTERED_FRAME.format(s1=slot1, s2=slot2, s3=slot3)
-                + f"\n\n🎯 Ожидайте результат... <b>({i+1}/12)</b>"
-            )
-            
-            await message.edit_text(anim, parse_mode="HTML")
-            await asyncio.sleep(0.18 + 0.04 * (i / animation_steps))
-        except Exception as e:
-            logger.error(f"Error in animation step {i+1}: {e}")
-            await asyncio.sleep(0.2)
-    
-    # Финальный результат
-    try:
-        final_slot1, final_slot2, final_slot3 = await generate_slot_result()
-        return final_slot1, final_slot2, final_slot3
-    except Exception as e:
-        logger.error(f"Error generating final result: {e}")
-        return random.choice(SLOT_EMOJIS), random.choice(SLOT_EMOJIS), random.choice(SLOT_EMOJIS)
 
 async def process_slot_win(user_id: int, config: Tuple) -> Tuple[str, Optional[int]]:
     """
@@ -382,9 +356,7 @@ def get_user_slot_stats(tg_id: int):
     """Возвращает статистику пользователя по слот-машине с учётом бонусных попыток"""
     spins_used, last_reset = get_user_slot_spins(tg_id)
     daily_attempts = int(get_admin_setting('slot_daily_attempts', '5'))
-    # Используем синхронную версию для совместимости
-    wins = get_slot_wins("completed")
-    user_wins = [w for w in wins if w[2] == tg_id]
+    stats = get_slot_user_stats(tg_id)
     # Корректно считаем оставшиеся попытки
     if spins_used < 0:
         bonus = abs(spins_used)
@@ -395,20 +367,23 @@ def get_user_slot_stats(tg_id: int):
         'spins_used': spins_used,
         'daily_attempts': daily_attempts,
         'remaining': remaining,
-        'total_wins': len(user_wins),
+        'total_spins': stats['spins'],
+        'total_wins': stats['wins'],
         'last_reset': last_reset,
         'attempts_text': format_attempts_text(spins_used, daily_attempts)
     }
 
 def get_last_slot_results(tg_id: int, limit: int = 10):
-    """Возвращает последние результаты слот-машины пользователя"""
-    # Используем синхронную версию для совместимости
-    wins = get_slot_wins("completed")
-    user_wins = [w for w in wins if w[2] == tg_id]
-    return user_wins[-limit:] if user_wins else []
-
-async def notify_admins_slot_win(user_id: int, combination: str, reward_type: str, reward_amount: float, bot=None):
-    """Уведомляет админов о выигрыше в слот-машине"""
+    """
+    Последние спины пользователя из slot_user_stats, новые первыми (не больше
+    SLOT_STATS_LAST_RESULTS): словари id, combination, reward_type, reward_amount,
+    is_win, created_at
+    """
+    return get_slot_user_stats(tg_id)['last_results'][:limit]
+
+async def notify_admins_slot_win(user_id: int, combination: str, reward_type: str, reward_amount: float, bot=None,
+                                 win_id: Optional[int] = None):
+    """Уведомляет админов о выигрыше в слот-машине (win_id известен после spin())"""
     user = get_user_profile(user_id)
     if user:
         tg_id = user['tg_id']  # Используем ключи словаря
@@ -452,9 +427,8 @@ async def notify_admins_slot_win(user_id: int, combination: str, reward_type: st
             f"#слот {hashtag}"
         )
 
-        # Получаем win_id для создания клавиатуры для всех типов наград
-        wins = get_slot_wins("pending")
-        win_id = None
+        # Без win_id ищем только что созданную запись среди ожидающих
+        wins = get_slot_wins("pending") if win_id is None else []
         for w in wins:
             # w[2] = tg_id, w[5] = reward_type, w[6] = reward_amount
             if w[2] == user_id and w[5] == reward_type and float(w[6]) == float(reward_amount):
@@ -0,0 +1,253 @@
+"""
+Симулятор таблицы выплат слот-машины
+
+Точный расчёт (без NumPy) и векторизованный Монте-Карло (NumPy) по той же логике
+выбора, что и generate_slot_result(): одно число r из [0, 100] ищется в кумулятивной
+таблице шансов Paytable (bisect_left / searchsorted side='left').
+
+Запуск:
+    python -m app.utils.slot_simulator --spins 100000000 --users 1000 --spins-per-user 5
+
+Отчёт: доля выигрышей по комбинациям, ожидаемая выплата за спин в ₽/⭐/TON,
+дисперсия и «хвост» (p95/p99/максимум) суммарной выплаты за день для N пользователей.
+"""
+import argparse
+import math
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from app.utils.paytable import Paytable
+
+try:
+    import numpy as np
+except ImportError:  # Монте-Карло недоступен, точный расчёт работает без NumPy
+    np = None
+
+REWARD_TYPES = ('money', 'stars', 'ton')
+REWARD_UNITS = {'money': '₽', 'stars': '⭐', 'ton': 'TON'}
+
+# Квантили стандартного нормального распределения для оценки хвоста
+_Z = {95: 1.6449, 99: 2.3263}
+
+
+def combination_probabilities(paytable: Paytable) -> List[float]:
+    """
+    Вероятность выпадения каждой конфигурации (в долях).
+    Шансы сверх 100% в сумме обрезаются так же, как при выборе r из [0, 100].
+    """
+    probabilities = []
+    previous = 0.0
+    for cumulative in paytable.cumulative:
+        upper = min(max(cumulative, previous), 100.0)
+        probabilities.append((upper - previous) / 100)
+        previous = upper
+    return probabilities
+
+
+def _payout_matrix(paytable: Paytable) -> List[List[float]]:
+    """Строка на конфигурацию: выплата по каждому типу из REWARD_TYPES"""
+    matrix = []
+    for config in paytable.configs:
+        reward_type, amount = config[2], float(config[3] or 0)
+        matrix.append([amount if reward_type == t else 0.0 for t in REWARD_TYPES])
+    return matrix
+
+
+def exact_expectation(paytable: Paytable) -> dict:
+    """
+    Точные значения на один спин:
+    win_rate, per_combination [(name, p)], mean/variance по типам наград.
+    """
+    probabilities = combination_probabilities(paytable)
+    payouts = _payout_matrix(paytable)
+    mean = {t: 0.0 for t in REWARD_TYPES}
+    second = {t: 0.0 for t in REWARD_TYPES}
+    for p, row in zip(probabilities, payouts):
+        for t, amount in zip(REWARD_TYPES, row):
+            mean[t] += p * amount
+            second[t] += p * amount * amount
+    return {
+        'win_rate': sum(probabilities),
+        'per_combination': [(c[6], p) for c, p in zip(paytable.configs, probabilities)],
+        'mean': mean,
+        'variance': {t: second[t] - mean[t] ** 2 for t in REWARD_TYPES},
+    }
+
+
+def daily_risk(expectation: dict, users: int, spins_per_user: int) -> dict:
+    """
+    Суммарная выплата за день для users пользователей по spins_per_user спинов:
+    среднее, стандартное отклонение и p95/p99 в нормальном приближении.
+    """
+    spins = users * spins_per_user
+    result = {}
+    for t in REWARD_TYPES:
+        mean = expectation['mean'][t] * spins
+        std = math.sqrt(max(expectation['variance'][t], 0.0) * spins)
+        result[t] = {'mean': mean, 'std': std,
+                     'p95': mean + _Z[95] * std, 'p99': mean + _Z[99] * std}
+    return result
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Для Монте-Карло нужен NumPy: pip install numpy")
+
+
+def simulate_spins(paytable: Paytable, spins: int, seed: Optional[int] = None,
+                   chunk: int = 10_000_000) -> dict:
+    """
+    Монте-Карло: spins спинов пачками по chunk. Возвращает counts (по конфигурациям,
+    последний элемент — проигрыши), win_rate, mean и variance выплаты на спин по типам.
+    """
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    cumulative = np.asarray(paytable.cumulative, dtype=np.float64)
+    counts = np.zeros(len(paytable) + 1, dtype=np.int64)
+    done = 0
+    while done < spins:
+        size = min(chunk, spins - done)
+        r = rng.uniform(0, 100, size)
+        index = np.searchsorted(cumulative, r, side='left')
+        counts += np.bincount(index, minlength=len(paytable) + 1)
+        done += size
+
+    payouts = np.asarray(_payout_matrix(paytable), dtype=np.float64).reshape(len(paytable), len(REWARD_TYPES))
+    wins = counts[:-1].astype(np.float64)
+    totals = wins @ payouts
+    squares = wins @ (payouts ** 2)
+    mean = totals / spins
+    variance = squares / spins - mean ** 2
+    return {
+        'spins': spins,
+        'counts': counts.tolist(),
+        'win_rate': float(wins.sum() / spins),
+        'per_combination': [(c[6], float(n) / spins) for c, n in zip(paytable.configs, counts[:-1])],
+        'mean': dict(zip(REWARD_TYPES, mean.tolist())),
+        'variance': dict(zip(REWARD_TYPES, variance.tolist())),
+    }
+
+
+def simulate_days(paytable: Paytable, users: int, spins_per_user: int, days: int = 10_000,
+                  seed: Optional[int] = None) -> dict:
+    """
+    Монте-Карло по дням: для каждого дня число выпадений комбинаций берётся из
+    мультиномиального распределения (users * spins_per_user спинов). Возвращает по
+    каждому типу среднее, std, p95, p99 и максимум выплаты за день.
+    """
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    probabilities = combination_probabilities(paytable)
+    probabilities.append(max(0.0, 1.0 - sum(probabilities)))
+    counts = rng.multinomial(users * spins_per_user, probabilities, size=days)
+    payouts = np.asarray(_payout_matrix(paytable), dtype=np.float64).reshape(len(paytable), len(REWARD_TYPES))
+    per_day = counts[:, :-1] @ payouts
+    result = {}
+    for i, t in enumerate(REWARD_TYPES):
+        column = per_day[:, i]
+        result[t] = {
+            'mean': float(column.mean()), 'std': float(column.std()),
+            'p95': float(np.percentile(column, 95)), 'p99': float(np.percentile(column, 99)),
+            'max': float(column.max()),
+        }
+    return result
+
+
+def _fmt(value: float, reward_type: str) -> str:
+    digits = 4 if reward_type == 'ton' else 2
+    return f"{value:.{digits}f}{REWARD_UNITS[reward_type]}"
+
+
+def format_expectation(expectation: dict) -> str:
+    """Короткая сводка точного расчёта (для сообщений админу)"""
+    lines = [f"Шанс выигрыша: {expectation['win_rate'] * 100:.4f}%"]
+    for t in REWARD_TYPES:
+        if expectation['mean'][t]:
+            lines.append(f"Выплата за спин: {_fmt(expectation['mean'][t], t)} "
+                         f"(σ {_fmt(math.sqrt(max(expectation['variance'][t], 0)), t)})")
+    return "\n".join(lines)
+
+
+def format_cost_preview(configs: Sequence[Tuple], candidate: Tuple, users: int, spins_per_user: int) -> str:
+    """
+    Сравнение стоимости текущей таблицы и таблицы с новой конфигурацией
+    (для админского сценария добавления комбинации, до сохранения)
+    """
+    before = exact_expectation(Paytable(configs))
+    after = exact_expectation(Paytable(list(configs) + [candidate]))
+    before_day = daily_risk(before, users, spins_per_user)
+    after_day = daily_risk(after, users, spins_per_user)
+    lines = [
+        f"📊 <b>Оценка стоимости</b> ({users} игроков × {spins_per_user} спинов в день)",
+        f"Шанс выигрыша: {before['win_rate'] * 100:.4f}% → {after['win_rate'] * 100:.4f}%",
+    ]
+    for t in REWARD_TYPES:
+        if before['mean'][t] or after['mean'][t]:
+            lines.append(f"{REWARD_UNITS[t]} в день: {_fmt(before_day[t]['mean'], t)} → "
+                         f"{_fmt(after_day[t]['mean'], t)} (p99 {_fmt(after_day[t]['p99'], t)})")
+    return "\n".join(lines)
+
+
+def format_report(paytable: Paytable, exact: dict, simulated: Optional[dict],
+                  day_exact: dict, day_simulated: Optional[dict]) -> str:
+    lines = ["🎰 Таблица выплат", "-" * 60]
+    empirical = dict(simulated['per_combination']) if simulated else {}
+    for config, (name, p) in zip(paytable.configs, exact['per_combination']):
+        line = f"{config[5]} {name:<20} {config[3]:>8} {config[2]:<6} точно {p * 100:9.5f}%"
+        if name in empirical:
+            line += f"  симуляция {empirical[name] * 100:9.5f}%"
+        lines.append(line)
+    lines.append("-" * 60)
+    lines.append(f"Шанс выигрыша: точно {exact['win_rate'] * 100:.5f}%"
+                 + (f", симуляция {simulated['win_rate'] * 100:.5f}% ({simulated['spins']} спинов)" if simulated else ""))
+    for t in REWARD_TYPES:
+        line = f"Выплата за спин {REWARD_UNITS[t]}: точно {exact['mean'][t]:.6f} (дисперсия {exact['variance'][t]:.6f})"
+        if simulated:
+            line += f", симуляция {simulated['mean'][t]:.6f}"
+        lines.append(line)
+    lines.append("")
+    lines.append("За день:")
+    for t in REWARD_TYPES:
+        d = day_exact[t]
+        line = (f"  {REWARD_UNITS[t]}: среднее {d['mean']:.2f}, σ {d['std']:.2f}, "
+                f"p95 {d['p95']:.2f}, p99 {d['p99']:.2f} (нормальное приближение)")
+        lines.append(line)
+        if day_simulated:
+            s = day_simulated[t]
+            lines.append(f"       симуляция: p95 {s['p95']:.2f}, p99 {s['p99']:.2f}, максимум {s['max']:.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Симулятор таблицы выплат слот-машины")
+    parser.add_argument('--db', default=None, help="файл БД (по умолчанию DB_PATH)")
+    parser.add_argument('--spins', type=int, default=100_000_000)
+    parser.add_argument('--users', type=int, default=1000, help="активных пользователей в день")
+    parser.add_argument('--spins-per-user', type=int, default=5)
+    parser.add_argument('--days', type=int, default=10_000, help="дней для симуляции хвоста")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from app.database.models import get_slot_configs
+    from app.database.pool import configure_pool
+
+    if args.db:
+        configure_pool(args.db)
+    paytable = Paytable(get_slot_configs())
+    exact = exact_expectation(paytable)
+    day_exact = daily_risk(exact, args.users, args.spins_per_user)
+
+    simulated = day_simulated = None
+    if np is not None and args.spins > 0:
+        started = time.perf_counter()
+        simulated = simulate_spins(paytable, args.spins, args.seed)
+        day_simulated = simulate_days(paytable, args.users, args.spins_per_user, args.days, args.seed)
+        print(f"Симуляция заняла {time.perf_counter() - started:.1f} с")
+    elif np is None:
+        print("NumPy не установлен — только точный расчёт")
+
+    print(format_report(paytable, exact, simulated, day_exact, day_simulated))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Проверка подписки на канал
+
+Один сервис на весь бот вместо отдельных check_subscription в каждом модуле
+обработчиков. Результат хранится в памяти по user_id: положительный —
+SUBSCRIPTION_TTL секунд, отрицательный — SUBSCRIPTION_NEGATIVE_TTL (короче, чтобы
+только что подписавшийся пользователь не ждал). Одновременные проверки одного
+пользователя объединяются в один запрос к Telegram. Обновления chat_member
+канала (приходят, если бот — администратор канала) сразу обновляют кэш.
+Ошибки API не кэшируются.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.config import SUBSCRIPTION_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CACHE_SIZE
+from app.constants import CHANNEL_ID, CHANNEL_USERNAME
+
+logger = logging.getLogger(__name__)
+
+NOT_SUBSCRIBED_STATUSES = ('left', 'kicked')
+
+
+def is_member_status(status) -> bool:
+    # В aiogram status — ChatMemberStatus (str enum), в тестах может быть строкой
+    return getattr(status, 'value', status) not in NOT_SUBSCRIBED_STATUSES
+
+
+class SubscriptionService:
+    """Кэш подписок с объединением одновременных запросов"""
+
+    def __init__(self, ttl: float = SUBSCRIPTION_TTL, negative_ttl: float = SUBSCRIPTION_NEGATIVE_TTL,
+                 max_size: int = SUBSCRIPTION_CACHE_SIZE, chats=(CHANNEL_ID, CHANNEL_USERNAME),
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.chats = tuple(chats)
+        self._clock = clock
+        # user_id -> (подписан, истекает в)
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.api_calls = 0
+        self.api_errors = 0
+        self.updates = 0
+
+    def _get_cached(self, user_id: int) -> Optional[bool]:
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        subscribed, expires = entry
+        if self._clock() >= expires:
+            del self._cache[user_id]
+            return None
+        self._cache.move_to_end(user_id)
+        return subscribed
+
+    def _store(self, user_id: int, subscribed: bool):
+        ttl = self.ttl if subscribed else self.negative_ttl
+        self._cache[user_id] = (subscribed, self._clock() + ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, bot, user_id: int) -> Optional[bool]:
+        """
+        Запрос к Telegram: сначала по CHANNEL_ID (надежнее), при ошибке или
+        отрицательном ответе — по CHANNEL_USERNAME. None — ни один запрос не удался.
+        """
+        result = None
+        for chat_id in self.chats:
+            self.api_calls += 1
+            try:
+                member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+            except Exception as e:
+                self.api_errors += 1
+                logger.warning(f"[SUBSCRIPTION] Ошибка проверки подписки {user_id} в {chat_id}: {e}")
+                continue
+            result = is_member_status(member.status)
+            if result:
+                return True
+        return result
+
+    async def _lookup(self, bot, user_id: int) -> Optional[bool]:
+        result = await self._fetch(bot, user_id)
+        if result is not None:
+            self._store(user_id, result)
+        return result
+
+    async def is_subscribed(self, bot, user_id: int, force: bool = False) -> bool:
+        """
+        Подписан ли пользователь на канал.
+        force=True — игнорировать кэш (кнопка «Проверить подписку»).
+        """
+        if not force:
+            cached = self._get_cached(user_id)
+            if cached is not None:
+                self.hits += 1
+                return cached
+        self.misses += 1
+
+        future = self._inflight.get(user_id)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(self._lookup(bot, user_id))
+            self._inflight[user_id] = future
+            future.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        result = await asyncio.shield(future)
+        return bool(result)
+
+    def set_status(self, user_id: int, subscribed: bool):
+        """Статус из обновления chat_member"""
+        self.updates += 1
+        self._store(user_id, subscribed)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        if user_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'coalesced': self.coalesced,
+            'api_calls': self.api_calls,
+            'api_errors': self.api_errors,
+            'updates': self.updates,
+            'cached': len(self._cache),
+            'inflight': len(self._inflight),
+        }
+
+
+subscription_service = SubscriptionService()
+
+
+async def check_subscription(user_id: int, bot, force: bool = False) -> bool:
+    """Проверка подписки пользователя на канал"""
+    return await subscription_service.is_subscribed(bot, user_id, force=force)
+
+
+def handle_chat_member_update(update) -> None:
+    """Обновление chat_member канала: меняет кэш без запроса к Telegram"""
+    user = update.new_chat_member.user
+    subscription_service.set_status(user.id, is_member_status(update.new_chat_member.status))
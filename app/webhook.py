@@ -0,0 +1,190 @@
+"""
+Режим webhook: aiohttp-сервер вместо getUpdates
+
+Telegram присылает обновления POST-запросом на WEBHOOK_BASE_URL + WEBHOOK_PATH.
+  - Заголовок X-Telegram-Bot-Api-Secret-Token сверяется с WEBHOOK_SECRET
+    (если секрет не задан, он генерируется при каждом запуске и передаётся в setWebhook).
+  - Обновление обрабатывается в фоне, одновременно не больше WEBHOOK_CONCURRENCY
+    обработчиков; когда все заняты, ответ Telegram задерживается до освобождения места.
+  - GET HEALTH_PATH — состояние для балансировщика/мониторинга.
+  - При остановке (SIGTERM/SIGINT) новые обновления получают 503 (Telegram повторит
+    их после перезапуска), начатые обработчики дорабатывают до WEBHOOK_DRAIN_TIMEOUT.
+Webhook при остановке не удаляется: обновления копятся у Telegram до следующего запуска.
+"""
+import asyncio
+import logging
+import secrets
+import signal
+import time
+from contextlib import suppress
+from typing import Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from app.config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT,
+    WEBHOOK_CONCURRENCY, WEBHOOK_MAX_CONNECTIONS, WEBHOOK_DRAIN_TIMEOUT, HEALTH_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook с ограничением параллельности и ожиданием начатых обновлений"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 concurrency: int = WEBHOOK_CONCURRENCY, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+                 close_bot_session: bool = True, **data):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.concurrency = max(1, concurrency)
+        self.drain_timeout = drain_timeout
+        self.close_bot_session = close_bot_session
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self.draining = False
+        self.started_at = time.monotonic()
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.unauthorized = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.draining:
+            return web.Response(status=503, text="Shutting down")
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            self.unauthorized += 1
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json(loads=bot.session.json_loads)
+        self.received += 1
+        # Все обработчики заняты — Telegram ждёт ответа (его max_connections ограничит поток)
+        await self._slots.acquire()
+        if self.draining:
+            self._slots.release()
+            return web.Response(status=503, text="Shutting down")
+        task = asyncio.create_task(self._process(bot, update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    async def _process(self, bot: Bot, update: dict):
+        try:
+            result = await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+            if isinstance(result, TelegramMethod):
+                await self.dispatcher.silent_call_request(bot=bot, result=result)
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"[WEBHOOK] Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: Optional[float] = None) -> int:
+        """Перестаёт принимать обновления и ждёт начатые. Возвращает число прерванных"""
+        self.draining = True
+        timeout = self.drain_timeout if timeout is None else timeout
+        pending = set(self._tasks)
+        if pending:
+            logger.info(f"[WEBHOOK] Ожидание {len(pending)} обработчиков (до {timeout} с)")
+            done, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"[WEBHOOK] Прервано обработчиков: {len(pending)}")
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    async def close(self) -> None:
+        await self.drain()
+        if self.close_bot_session:
+            await self.bot.session.close()
+
+    def health(self) -> dict:
+        return {
+            'status': 'draining' if self.draining else 'ok',
+            'mode': 'webhook',
+            'uptime': round(time.monotonic() - self.started_at, 1),
+            'in_flight': self.in_flight,
+            'concurrency': self.concurrency,
+            'received': self.received,
+            'processed': self.processed,
+            'failed': self.failed,
+            'unauthorized': self.unauthorized,
+        }
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, secret_token: Optional[str],
+                      path: str = WEBHOOK_PATH, health_path: str = HEALTH_PATH,
+                      **handler_kwargs) -> web.Application:
+    """aiohttp-приложение: webhook, health и события startup/shutdown диспетчера"""
+    app = web.Application()
+    handler = DrainingRequestHandler(dp, bot, secret_token=secret_token, **handler_kwargs)
+    # register() добавляет close() в on_shutdown раньше emit_shutdown диспетчера
+    handler.register(app, path=path)
+
+    async def health(request: web.Request) -> web.Response:
+        data = handler.health()
+        return web.json_response(data, status=503 if handler.draining else 200)
+
+    app.router.add_get(health_path, health)
+    app['webhook_handler'] = handler
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def serve_app(app: web.Application, host: str, port: int, stop_event: Optional[asyncio.Event] = None,
+                    on_started=None):
+    """Запускает aiohttp-приложение и работает до SIGINT/SIGTERM (или stop_event)"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError, RuntimeError):
+            loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        if on_started is not None:
+            await on_started()
+        await stop_event.wait()
+        logger.info("[WEBHOOK] Остановка: дожидаюсь начатых обработчиков")
+    finally:
+        handler = app.get('webhook_handler')
+        if handler is not None:
+            handler.draining = True
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with suppress(NotImplementedError, RuntimeError):
+                loop.remove_signal_handler(sig)
+        # cleanup() вызывает on_shutdown: drain() и закрытие сессии бота
+        await runner.cleanup()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, base_url: str = WEBHOOK_BASE_URL,
+                      host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                      secret_token: Optional[str] = WEBHOOK_SECRET or None,
+                      stop_event: Optional[asyncio.Event] = None, **handler_kwargs):
+    """Запускает сервер, регистрирует webhook и работает до сигнала остановки"""
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    app = build_webhook_app(dp, bot, secret_token, path=path, **handler_kwargs)
+    url = base_url.rstrip('/') + path
+
+    async def register_webhook():
+        await bot.set_webhook(
+            url,
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info(f"[WEBHOOK] Слушаю {host}:{port}, webhook {url}")
+
+    await serve_app(app, host, port, stop_event, on_started=register_webhook)
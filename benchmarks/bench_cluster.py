@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест многопроцессного режима: пропускная способность от числа воркеров
+
+Заглушка Bot API (benchmarks/fake_bot_api.py) отдаёт обновления через getUpdates,
+приёмник app.cluster раздаёт их воркерам по tg_id. Воркеры — отдельные процессы
+(run_worker из app.cluster) с обработчиком, который занимает процессор на
+--handler-ms (шаблоны, JSON, SQLite — то, что в одном asyncio-процессе не
+распараллелить) и отвечает sendMessage. Результат имеет смысл на машине с
+несколькими ядрами: воркеры, приёмник и заглушка делят процессор.
+
+Запуск:
+    python -m benchmarks.bench_cluster --workers 1,2,4 --updates 2000 --handler-ms 2
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from app.cluster import UpdateRouter, poll_updates, run_worker, worker_url, stop_workers
+from benchmarks.bench_webhook import percentile
+from benchmarks.fake_bot_api import FakeBotAPI, TOKEN
+
+SECRET = "bench-cluster-secret"
+
+
+def burn(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def serve_worker(args):
+    dp = Dispatcher()
+
+    @dp.message()
+    async def handle(message: types.Message):
+        burn(args.handler_ms / 1000)
+        await message.answer(f"re:{message.text}")
+
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(args.api_url)))
+    await run_worker(dp, bot, index=args.serve_worker, secret_token=SECRET, base_port=args.base_port)
+
+
+async def run(workers: int, args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    base_url = await api.start()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    processes = [subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_cluster', '--serve-worker', str(i),
+                                   '--api-url', base_url, '--base-port', str(args.base_port),
+                                   '--handler-ms', str(args.handler_ms)], env=env)
+                 for i in range(workers)]
+    router = UpdateRouter([worker_url(i, base_port=args.base_port) for i in range(workers)], SECRET)
+    await router.start()
+    front_bot = api.make_bot()
+    stop_event = asyncio.Event()
+    try:
+        if not await router.wait_ready(30):
+            raise RuntimeError("воркеры не запустились")
+        front = asyncio.create_task(poll_updates(front_bot, router, stop_event, ['message'], timeout=5))
+        pushed = {}
+        started = time.perf_counter()
+        for i in range(args.updates):
+            text = f"u{i}"
+            pushed[f"re:{text}"] = time.perf_counter()
+            await api.push_update(api.message_update(user_id=10000 + i % args.users, text=text))
+        deadline = time.perf_counter() + 120
+        while len(api.sent) < args.updates and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        latencies = [entry['time'] - pushed[entry['text']] for entry in api.sent if entry['text'] in pushed]
+        stop_event.set()
+        await front
+    finally:
+        await router.close()
+        await front_bot.session.close()
+        stop_workers(processes, timeout=10)
+        await api.stop()
+    return {
+        'workers': workers,
+        'replies': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'per_worker': router.stats()['forwarded'],
+    }
+
+
+async def main_async(args):
+    results = []
+    for workers in [int(n) for n in args.workers.split(',')]:
+        results.append(await run(workers, args))
+    print(f"Обновлений: {args.updates}, пользователей: {args.users}, обработчик {args.handler_ms} мс CPU, "
+          f"ядер: {os.cpu_count()}")
+    print(f"{'воркеров':>8} {'ответов':>8} {'обн/с':>8} {'p50':>9} {'p95':>9}  по воркерам")
+    base = results[0]['throughput'] if results else 0
+    for r in results:
+        print(f"{r['workers']:>8} {r['replies']:>8} {r['throughput']:>8.1f} {r['p50'] * 1000:>7.0f}мс "
+              f"{r['p95'] * 1000:>7.0f}мс  {r['per_worker']}  x{r['throughput'] / base:.2f}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пропускная способность app.cluster от числа воркеров")
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--handler-ms', type=float, default=2)
+    parser.add_argument('--api-latency', type=float, default=20, help="RTT до Bot API, мс")
+    parser.add_argument('--base-port', type=int, default=18100)
+    parser.add_argument('--serve-worker', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--api-url', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve_worker is not None:
+        # Процесс воркера: SIGTERM обрабатывает serve_app
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        asyncio.run(serve_worker(args))
+        return None
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк слоя БД: updates/sec при N одновременных пользователях
+
+Сравнивает два режима на одной и той же временной БД:
+  before — как было: новое sqlite3.connect на каждый вызов, вызовы прямо в event loop
+  after  — пул соединений + выполнение в пуле потоков (app.database.aio)
+
+Каждое "обновление" повторяет типичный тап: профиль, несколько настроек,
+запись спина, начисление баланса и имитация запроса к Bot API.
+
+Запуск:
+    python -m benchmarks.bench_db_pool --users 500 --updates 4
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import models, aio
+from app.database.pool import configure_pool
+
+BOT_API_LATENCY = 0.005  # имитация сетевого вызова Bot API
+
+
+async def update_sync(tg_id: int):
+    """Обработка апдейта в старом стиле: синхронные вызовы в event loop"""
+    models.get_user_profile(tg_id)
+    for key in ('main_photo', 'main_description', 'slot_daily_attempts'):
+        models.get_admin_setting(key, '')
+    await asyncio.sleep(BOT_API_LATENCY)
+    models.create_slot_win(tg_id, '🍒🍋🍊', 'none', 0, False)
+    models.update_balance(tg_id, 1)
+    await asyncio.sleep(BOT_API_LATENCY)
+
+
+async def update_async(tg_id: int):
+    """Та же обработка через aio: БД не блокирует event loop"""
+    await aio.get_user_profile(tg_id)
+    for key in ('main_photo', 'main_description', 'slot_daily_attempts'):
+        await aio.get_admin_setting(key, '')
+    await asyncio.sleep(BOT_API_LATENCY)
+    await aio.create_slot_win(tg_id, '🍒🍋🍊', 'none', 0, False)
+    await aio.update_balance(tg_id, 1)
+    await asyncio.sleep(BOT_API_LATENCY)
+
+
+async def run_users(handler, users: int, updates: int) -> float:
+    async def user_session(tg_id):
+        for _ in range(updates):
+            await handler(tg_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[user_session(100000 + i) for i in range(users)])
+    elapsed = time.perf_counter() - started
+    return users * updates / elapsed
+
+
+def prepare_db(path: str, users: int):
+    configure_pool(path)
+    models.init_db()
+    for i in range(users):
+        models.get_or_create_user(100000 + i, f"Bench {i}", f"bench{i}", "2025-01-01")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--updates', type=int, default=4, help='апдейтов на пользователя')
+    args = parser.parse_args()
+
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    try:
+        prepare_db(db_path, args.users)
+
+        def legacy_connection():
+            return sqlite3.connect(db_path, timeout=30)
+
+        with patch.object(models, 'get_db_connection', legacy_connection), \
+             patch.object(models, 'get_read_connection', legacy_connection):
+            before = asyncio.run(run_users(update_sync, args.users, args.updates))
+
+        after = asyncio.run(run_users(update_async, args.users, args.updates))
+
+        print(f"Пользователей: {args.users}, апдейтов на пользователя: {args.updates}")
+        print(f"before (connect на вызов, в event loop): {before:8.1f} updates/sec")
+        print(f"after  (пул + пул потоков):               {after:8.1f} updates/sec")
+        print(f"Ускорение: x{after / before:.2f}")
+    finally:
+        aio.shutdown()
+        configure_pool()
+        os.unlink(db_path)
+
+
+if __name__ == '__main__':
+    main()
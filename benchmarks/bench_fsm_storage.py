@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк хранилищ FSM: MemoryStorage против SQLiteStorage
+
+Каждое «обновление» повторяет работу aiogram и обработчика шага сценария:
+get_state (FSMContextMiddleware), get_data, update_data, set_state. Пользователи
+идут вперемешку, как в реальном потоке обновлений. Сравниваются:
+  memory        — MemoryStorage (как было, ничего не переживает перезапуск)
+  sqlite        — SQLiteStorage с отложенной записью (FSM_FLUSH_INTERVAL)
+  sqlite-sync   — SQLiteStorage с записью при каждом изменении (FSM_FLUSH_INTERVAL=0)
+  sqlite-cold   — отложенная запись, кэш меньше числа пользователей (чтения с диска)
+
+Запуск:
+    python -m benchmarks.bench_fsm_storage --users 2000 --updates 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.utils.fsm_storage import SQLiteStorage
+
+STATES = ('StarsStates:waiting_recipient', 'StarsStates:waiting_amount', 'CryptoPayStates:waiting_receipt', None)
+
+
+async def run(name: str, storage, users: int, updates: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(updates):
+        user_id = rnd.randrange(users)
+        key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+        t0 = time.perf_counter()
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.update_data(key, {'amount': i, 'recipient': f'user{user_id}'})
+        await storage.set_state(key, STATES[i % len(STATES)])
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    await storage.close()
+    latencies.sort()
+    return {
+        'name': name,
+        'updates_per_sec': updates / elapsed,
+        'mean_us': statistics.mean(latencies) * 1e6,
+        'p50_us': latencies[len(latencies) // 2] * 1e6,
+        'p99_us': latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+    }
+
+
+async def main_async(args):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [
+            ('memory', lambda: MemoryStorage()),
+            ('sqlite', lambda: SQLiteStorage(os.path.join(tmp, 'behind.db'), flush_interval=args.flush_interval)),
+            ('sqlite-sync', lambda: SQLiteStorage(os.path.join(tmp, 'sync.db'), flush_interval=0)),
+            ('sqlite-cold', lambda: SQLiteStorage(os.path.join(tmp, 'cold.db'), cache_size=max(1, args.users // 10),
+                                                  flush_interval=args.flush_interval)),
+        ]
+        for name, factory in variants:
+            if args.only and name not in args.only.split(','):
+                continue
+            results.append(await run(name, factory(), args.users, args.updates, args.seed))
+
+    print(f"Пользователей: {args.users}, обновлений: {args.updates} (get_state + get_data + update_data + set_state)")
+    print(f"{'хранилище':<12} {'обн/с':>10} {'среднее':>10} {'p50':>10} {'p99':>10}")
+    for r in results:
+        print(f"{r['name']:<12} {r['updates_per_sec']:>10.0f} {r['mean_us']:>8.1f}мкс "
+              f"{r['p50_us']:>8.1f}мкс {r['p99_us']:>8.1f}мкс")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Латентность операций FSM-хранилищ")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=20000)
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--only', default='', help="через запятую: memory,sqlite,sqlite-sync,sqlite-cold")
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
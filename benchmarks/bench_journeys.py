@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон сценариев пользователей на настоящем диспетчере бота
+
+Диспетчер собирается так же, как в боте (app.main.build_dispatcher: все роутеры и
+middleware), и получает обновления long polling'ом от заглушки Bot API
+(benchmarks/fake_bot_api.py). Виртуальные пользователи параллельно проходят
+сценарии: /start, главное меню, слот-машина, отметка активности, профиль,
+покупка звёзд с PDF-чеком, обращение в поддержку. Каждый шаг ждёт окончания
+обработки своего обновления.
+
+Два прохода:
+  - калибровка: один пользователь проходит каждый сценарий в одиночку — точное
+    число SQL-запросов, синхронных коммитов и вызовов Bot API на обновление по
+    сценариям (включая уведомления админам, отправленные в фоне);
+  - нагрузка: --users пользователей по --rounds кругов всех сценариев —
+    латентность обработки обновления (от входа в диспетчер до выхода,
+    p50/p95/p99), обновлений в секунду, запросов, коммитов (с пачками журнала
+    отложенной записи, JOURNAL_ENABLED) и вызовов на обновление.
+
+Регрессии: --save-baseline сохраняет метрики в JSON, --baseline сравнивает с
+сохранёнными и завершается с кодом 1, если p50/p95 выросли больше
+--latency-tolerance, запросов или вызовов Bot API на обновление стало больше
+--count-tolerance, или появились ошибки/необработанные обновления.
+
+БД, FSM и чёрный список — во временном каталоге (процесс переходит в него),
+анимация слотов выключена, фоновое обновление курсов не запускается.
+
+Запуск:
+    python -m benchmarks.bench_journeys --users 50 --rounds 3 --api-latency 20
+    python -m benchmarks.bench_journeys --baseline benchmarks/baselines/journeys.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Окружение бота задаётся до импорта app.config
+BENCH_ENV = {
+    'FSM_STORAGE': 'memory',
+    'COORD_BACKEND': 'local',
+    'SLOT_ANIMATION': 'none',
+    'PRICE_REFRESH_INTERVAL': '0',
+    'DB_MAINTENANCE_INTERVAL': '0',
+    'ADMINS': '1',
+    'ADMIN_NOTIFY_DIGEST_WINDOW': '0',
+    # Базовая линия снята с журналом отложенной записи; JOURNAL_ENABLED=0 — замер без него
+    'JOURNAL_ENABLED': '1',
+}
+for _key, _value in BENCH_ENV.items():
+    os.environ.setdefault(_key, _value)
+
+from aiogram.dispatcher.event.bases import UNHANDLED
+
+from app.database import aio, models
+from app.database.journal import journal
+from app.database.pool import get_pool, statement_counter
+from app.config import JOURNAL_ENABLED, JOURNAL_FLUSH_INTERVAL
+from app.main import build_dispatcher
+from app.utils.admin_notify import admin_notifier
+from app.utils.blacklist import blacklist
+from benchmarks.bench_webhook import percentile
+from benchmarks.fake_bot_api import FakeBotAPI
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baselines', 'journeys.json')
+# Служебные вызовы long polling не относятся к обработке обновлений
+POLLING_METHODS = {'getupdates', 'getme', 'deletewebhook'}
+FIRST_USER = 100000
+
+
+def msg(text):
+    return ('message', text)
+
+
+def cb(data):
+    return ('callback', data)
+
+
+def doc(file_name):
+    return ('document', file_name)
+
+
+JOURNEYS = {
+    'start': [msg('/start')],
+    'main_menu': [cb('main_menu')],
+    'spin_slot': [cb('slot_machine'), cb('spin_slot')],
+    'mark_activity': [cb('activity_calendar'), cb('mark_activity')],
+    'profile': [cb('profile')],
+    'buy_stars': [cb('stars'), cb('stars_50'), cb('stars_pay_sbp_50_85'), cb('stars_upload_receipt_50_85'),
+                  doc('receipt.pdf'), msg('мне')],
+    'support': [cb('support'), cb('support_contact'), msg('Здравствуйте, не пришли звёзды по заказу')],
+}
+
+
+class UpdateTimer:
+    """Outer middleware обновлений: время обработки, ошибки и необработанные обновления"""
+
+    def __init__(self):
+        self.finished = {}
+        self._waiters = {}
+        self.errors = 0
+        self.unhandled = Counter()
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await handler(event, data)
+            return result
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            if result is UNHANDLED:
+                self.unhandled[_describe(event)] += 1
+            future = self._waiters.pop(event.update_id, None)
+            if future is not None and not future.done():
+                future.set_result(elapsed)
+            else:
+                self.finished[event.update_id] = elapsed
+
+    async def wait(self, update_id: int, timeout: float) -> float:
+        if update_id in self.finished:
+            return self.finished.pop(update_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[update_id] = future
+        return await asyncio.wait_for(future, timeout)
+
+
+def _describe(update) -> str:
+    if update.callback_query:
+        return f"callback {update.callback_query.data}"
+    if update.message:
+        return f"message {update.message.text or 'document'}"
+    return update.event_type
+
+
+class Harness:
+    def __init__(self, api: FakeBotAPI, timer: UpdateTimer, timeout: float, think: float):
+        self.api = api
+        self.timer = timer
+        self.timeout = timeout
+        self.think = think
+
+    def _update(self, user_id: int, step) -> dict:
+        kind, value = step
+        if kind == 'callback':
+            return self.api.callback_update(user_id, value)
+        if kind == 'document':
+            return self.api.document_update(user_id, file_name=value)
+        return self.api.message_update(user_id, value)
+
+    async def step(self, user_id: int, step) -> float:
+        update_id = await self.api.push_update(self._update(user_id, step))
+        return await self.timer.wait(update_id, self.timeout)
+
+    async def journey(self, user_id: int, name: str, latencies: dict):
+        for step in JOURNEYS[name]:
+            latencies[name].append(await self.step(user_id, step))
+            if self.think:
+                await asyncio.sleep(self.think)
+
+    def api_calls(self) -> Counter:
+        return Counter({method: count for method, count in self.api.calls.items() if method not in POLLING_METHODS})
+
+    async def settle(self):
+        """Ждёт фоновые отправки (уведомления админам) и ответы Bot API в пути"""
+        await admin_notifier.flush(10)
+        await asyncio.sleep(self.api.latency + 0.01)
+
+
+async def calibrate(harness: Harness) -> dict:
+    """Один пользователь, сценарии по очереди: запросы и вызовы Bot API на обновление"""
+    user_id = FIRST_USER - 1
+    result = {}
+    for name, steps in JOURNEYS.items():
+        await harness.settle()
+        queries, calls = statement_counter.count, harness.api_calls()
+        commits, flushes, events = statement_counter.commits, journal.flushes, journal.appended
+        await harness.journey(user_id, name, defaultdict(list))
+        await harness.settle()
+        if journal.active:
+            # Фоновая запись на калибровке стоит — пачка сценария в его же подсчёте
+            await aio.run_write(journal.flush)
+        methods = harness.api_calls() - calls
+        result[name] = {
+            'updates': len(steps),
+            'queries_per_update': round((statement_counter.count - queries) / len(steps), 2),
+            # Синхронные коммиты сценария; пачки журнала общие для всех — их доля в load
+            'commits_per_update': round((statement_counter.commits - commits - (journal.flushes - flushes))
+                                        / len(steps), 2),
+            'journal_events_per_update': round((journal.appended - events) / len(steps), 2),
+            'api_calls_per_update': round(sum(methods.values()) / len(steps), 2),
+            'api_methods': dict(sorted(methods.items())),
+        }
+    return result
+
+
+async def load(harness: Harness, users: int, rounds: int) -> dict:
+    latencies = defaultdict(list)
+
+    async def user_session(user_id: int):
+        await harness.journey(user_id, 'start', latencies)
+        for _ in range(rounds):
+            for name in JOURNEYS:
+                await harness.journey(user_id, name, latencies)
+
+    await harness.settle()
+    queries, calls = statement_counter.count, harness.api_calls()
+    commits, events = statement_counter.commits, journal.appended
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(FIRST_USER + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    await harness.settle()
+    if journal.active:
+        await aio.run_write(journal.flush)
+    updates = sum(len(values) for values in latencies.values())
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        'updates': updates,
+        'elapsed': round(elapsed, 3),
+        'updates_per_sec': round(updates / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': _latency(everything),
+        'queries_per_update': round((statement_counter.count - queries) / updates, 2) if updates else 0.0,
+        'api_calls_per_update': round(sum((harness.api_calls() - calls).values()) / updates, 2) if updates else 0.0,
+        # Все коммиты, включая пачки журнала, — на обновление и на событие журнала
+        'commits_per_update': round((statement_counter.commits - commits) / updates, 2) if updates else 0.0,
+        'journal_events': journal.appended - events,
+        'journeys_latency_ms': {name: _latency(values) for name, values in latencies.items()},
+    }
+
+
+def _latency(values: list) -> dict:
+    return {
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p95': round(percentile(values, 95) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'max': round(max(values, default=0.0) * 1000, 2),
+    }
+
+
+def prepare_db():
+    os.makedirs('data', exist_ok=True)
+    models.init_db()
+    # Спины не упираются в дневной лимит — иначе после пятого круга сценарий другой
+    models.update_admin_setting('slot_daily_attempts', '100000')
+
+
+async def run(args) -> dict:
+    prepare_db()
+    if JOURNAL_ENABLED:
+        journal.flush_interval = 3600
+        journal.start()
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    bot = api.make_bot()
+    dp = build_dispatcher()
+    timer = UpdateTimer()
+    dp.update.outer_middleware(timer)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    harness = Harness(api, timer, timeout=args.timeout, think=args.think_ms / 1000)
+    try:
+        await asyncio.sleep(0.2)
+        journeys = await calibrate(harness)
+        if JOURNAL_ENABLED:
+            await journal.close()
+            journal.flush_interval = JOURNAL_FLUSH_INTERVAL
+            journal.start()
+        summary = await load(harness, args.users, args.rounds)
+    finally:
+        await dp.stop_polling()
+        await polling
+        await journal.close()
+        await admin_notifier.close()
+        await bot.session.close()
+        await blacklist.close()
+        await api.stop()
+    for name, values in summary.pop('journeys_latency_ms').items():
+        journeys[name]['latency_ms'] = values
+    return {
+        'config': {'users': args.users, 'rounds': args.rounds, 'api_latency_ms': args.api_latency,
+                   'think_ms': args.think_ms, 'journal': JOURNAL_ENABLED},
+        **summary,
+        'errors': timer.errors,
+        'unhandled': dict(timer.unhandled),
+        'journeys': journeys,
+    }
+
+
+def compare(result: dict, baseline: dict, latency_tolerance: float, count_tolerance: float) -> list:
+    """Регрессии относительно baseline: список строк, пустой — регрессий нет"""
+    problems = []
+    for key in ('p50', 'p95'):
+        now, before = result['latency_ms'][key], baseline['latency_ms'][key]
+        if now > before * (1 + latency_tolerance):
+            problems.append(f"латентность {key}: {now:.1f} мс, было {before:.1f} мс")
+    for name, before in baseline['journeys'].items():
+        now = result['journeys'].get(name)
+        if now is None:
+            continue
+        for key, label in (('queries_per_update', 'SQL-запросов'), ('api_calls_per_update', 'вызовов Bot API'),
+                           ('commits_per_update', 'коммитов')):
+            if key not in before:
+                continue
+            # +0.5 — чтобы одиночный запрос в коротком сценарии не считался регрессией из-за округления
+            if now[key] > before[key] * (1 + count_tolerance) + 0.5:
+                problems.append(f"{name}: {label} на обновление {now[key]}, было {before[key]}")
+    if result['errors'] > baseline.get('errors', 0):
+        problems.append(f"ошибок в обработчиках: {result['errors']}, было {baseline.get('errors', 0)}")
+    new_unhandled = set(result['unhandled']) - set(baseline.get('unhandled', {}))
+    if new_unhandled:
+        problems.append(f"необработанные обновления: {', '.join(sorted(new_unhandled))}")
+    return problems
+
+
+def print_results(result: dict):
+    config = result['config']
+    print(f"Пользователей: {config['users']}, кругов: {config['rounds']}, задержка сети {config['api_latency_ms']} мс, "
+          f"пауза между шагами {config['think_ms']} мс")
+    latency = result['latency_ms']
+    print(f"Обновлений: {result['updates']} за {result['elapsed']:.2f} с — {result['updates_per_sec']:.1f} обн/с; "
+          f"p50 {latency['p50']:.1f} мс, p95 {latency['p95']:.1f} мс, p99 {latency['p99']:.1f} мс")
+    print(f"На обновление: SQL-запросов {result['queries_per_update']}, вызовов Bot API {result['api_calls_per_update']}, "
+          f"коммитов {result.get('commits_per_update', '-')} (событий журнала {result.get('journal_events', 0)}); "
+          f"ошибок {result['errors']}, необработанных {sum(result['unhandled'].values())}")
+    print(f"\n{'сценарий':<14} {'шагов':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'SQL/обн':>8} {'API/обн':>8} "
+          f"{'COMMIT/обн':>10}  методы")
+    for name, journey in result['journeys'].items():
+        lat = journey.get('latency_ms', {})
+        methods = ", ".join(f"{method} {count}" for method, count in journey['api_methods'].items())
+        print(f"{name:<14} {journey['updates']:>5} {lat.get('p50', 0):>6.1f}мс {lat.get('p95', 0):>6.1f}мс "
+              f"{lat.get('p99', 0):>6.1f}мс {journey['queries_per_update']:>8} {journey['api_calls_per_update']:>8} "
+              f"{journey.get('commits_per_update', '-'):>10}  {methods}")
+    for description, count in result['unhandled'].items():
+        print(f"Не обработано: {description} ×{count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сценарии пользователей на настоящем диспетчере и заглушке Bot API")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=3, help="кругов всех сценариев на пользователя")
+    parser.add_argument('--api-latency', type=float, default=20, help="RTT до Bot API, мс")
+    parser.add_argument('--think-ms', type=float, default=0, help="пауза пользователя между шагами, мс")
+    parser.add_argument('--timeout', type=float, default=30, help="сек на обработку одного обновления")
+    parser.add_argument('--json', help="сохранить результат в файл")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help="сохранить как baseline")
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE, help="сравнить с baseline")
+    parser.add_argument('--latency-tolerance', type=float, default=0.5, help="допустимый рост p50/p95, доля")
+    parser.add_argument('--count-tolerance', type=float, default=0.1, help="допустимый рост запросов/вызовов, доля")
+    parser.add_argument('--verbose', action='store_true', help="логи бота (по умолчанию только ошибки)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='bench-journeys-')
+    os.chdir(workdir)
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        aio.shutdown(wait=True)
+        get_pool().close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(result)
+    for path in filter(None, (args.json, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nСохранено: {path}")
+    if baseline is not None:
+        problems = compare(result, baseline, args.latency_tolerance, args.count_tolerance)
+        if problems:
+            print("\nРЕГРЕССИИ:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\nРегрессий относительно baseline нет")
+    return result
+
+
+if __name__ == '__main__':
+    main()
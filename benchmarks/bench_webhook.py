@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк получения обновлений: long polling против webhook
+
+Бот (настоящие aiogram Bot и Dispatcher) работает с заглушкой Bot API
+(benchmarks/fake_bot_api.py), у которой задана сетевая задержка. Заглушка выдаёт
+обновления с заданной частотой от нескольких пользователей, обработчик имитирует
+работу (handler-ms) и отвечает sendMessage. Латентность — время от появления
+обновления на «сервере Telegram» до прихода ответа бота.
+
+Запуск:
+    python -m benchmarks.bench_webhook --updates 1000 --rate 200 --api-latency 40
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Dispatcher, types
+from aiohttp import web
+
+from app.webhook import build_webhook_app
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+def make_dispatcher(handler_seconds: float) -> Dispatcher:
+    dp = Dispatcher()
+
+    @dp.message()
+    async def echo(message: types.Message):
+        if handler_seconds:
+            await asyncio.sleep(handler_seconds)
+        await message.answer(f"re:{message.text}")
+
+    return dp
+
+
+async def drive(api: FakeBotAPI, updates: int, users: int, rate: float) -> list:
+    """Отправляет обновления и ждёт ответы; возвращает латентности в секундах"""
+    pushed = {}
+    interval = 1 / rate if rate > 0 else 0
+    started = time.perf_counter()
+    for i in range(updates):
+        if interval:
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        text = f"u{i}"
+        pushed[f"re:{text}"] = time.perf_counter()
+        await api.push_update(api.message_update(user_id=1000 + i % users, text=text))
+
+    deadline = time.perf_counter() + 60
+    while len(api.sent) < updates and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    return [entry['time'] - pushed[entry['text']] for entry in api.sent if entry['text'] in pushed]
+
+
+async def run_polling(args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    bot = api.make_bot()
+    dp = make_dispatcher(args.handler_ms / 1000)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    await asyncio.sleep(0.2)
+    try:
+        started = time.perf_counter()
+        latencies = await drive(api, args.updates, args.users, args.rate)
+        elapsed = time.perf_counter() - started
+        # ответ на последний sendMessage ещё в пути
+        await asyncio.sleep(args.api_latency / 1000 + 0.05)
+    finally:
+        await dp.stop_polling()
+        await polling
+        await bot.session.close()
+        await api.stop()
+    return summarize('polling', latencies, elapsed, api)
+
+
+async def run_webhook(args) -> dict:
+    api = FakeBotAPI(latency=args.api_latency / 1000)
+    await api.start()
+    bot = api.make_bot()
+    dp = make_dispatcher(args.handler_ms / 1000)
+    app = build_webhook_app(dp, bot, secret_token="bench-secret", concurrency=args.concurrency)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    await bot.set_webhook(f"http://127.0.0.1:{port}/webhook", secret_token="bench-secret",
+                          max_connections=args.max_connections)
+    try:
+        started = time.perf_counter()
+        latencies = await drive(api, args.updates, args.users, args.rate)
+        elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+        await api.stop()
+    return summarize('webhook', latencies, elapsed, api)
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(mode: str, latencies: list, elapsed: float, api: FakeBotAPI) -> dict:
+    return {
+        'mode': mode,
+        'replies': len(latencies),
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'mean': statistics.mean(latencies) if latencies else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'get_updates': api.calls['getupdates'],
+    }
+
+
+def print_results(results: list, args):
+    print(f"Обновлений: {args.updates}, пользователей: {args.users}, частота: "
+          f"{args.rate or 'пачкой'}/с, задержка сети {args.api_latency} мс, обработчик {args.handler_ms} мс")
+    print(f"{'режим':<8} {'ответов':>8} {'обн/с':>8} {'среднее':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'getUpdates':>11}")
+    for r in results:
+        print(f"{r['mode']:<8} {r['replies']:>8} {r['throughput']:>8.1f} {r['mean'] * 1000:>7.1f}мс "
+              f"{r['p50'] * 1000:>6.1f}мс {r['p95'] * 1000:>6.1f}мс {r['p99'] * 1000:>6.1f}мс {r['get_updates']:>11}")
+
+
+async def main_async(args):
+    results = []
+    for mode in args.modes.split(','):
+        runner = {'polling': run_polling, 'webhook': run_webhook}[mode.strip()]
+        results.append(await runner(args))
+    print_results(results, args)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Латентность polling и webhook на заглушке Bot API")
+    parser.add_argument('--updates', type=int, default=500)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rate', type=float, default=100, help="обновлений в секунду, 0 — всё сразу")
+    parser.add_argument('--api-latency', type=float, default=40, help="RTT до Bot API, мс")
+    parser.add_argument('--handler-ms', type=float, default=5, help="имитация работы обработчика, мс")
+    parser.add_argument('--concurrency', type=int, default=100, help="WEBHOOK_CONCURRENCY")
+    parser.add_argument('--max-connections', type=int, default=40, help="max_connections для setWebhook")
+    parser.add_argument('--modes', default='polling,webhook')
+    args = parser.parse_args(argv)
+    return asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
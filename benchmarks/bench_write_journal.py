@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк журнала отложенной записи: коммитов на спин и спинов в секунду
+
+N пользователей одновременно крутят слот-машину (aio.play_slot_spin, без выигрыша —
+выигрыши пишутся синхронно в обоих режимах) и отмечают активность:
+  sync    — каждый спин и отметка — своя транзакция с коммитом
+  journal — события в файл журнала и пачками в БД (app.database.journal)
+Коммиты считает trace callback пула (statement_counter.commits), пачки
+журнала входят в подсчёт: очередь записывается до остановки секундомера.
+
+Запуск:
+    python -m benchmarks.bench_write_journal --users 200 --spins 20
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import models, aio
+from app.database.journal import journal
+from app.database.pool import configure_pool, statement_counter
+
+FIRST_USER = 100000
+
+
+def lose():
+    return ('🍒', '🍋', '🍊'), None
+
+
+async def run_users(users: int, spins: int) -> dict:
+    today = datetime.date.today().isoformat()
+
+    async def user_session(tg_id):
+        await aio.mark_activity(tg_id, today, "daily")
+        for _ in range(spins):
+            result = await aio.play_slot_spin(tg_id, spins, lose)
+            assert result['status'] == 'ok', result
+
+    commits = statement_counter.commits
+    started = time.perf_counter()
+    await asyncio.gather(*[user_session(FIRST_USER + i) for i in range(users)])
+    if journal.active:
+        await aio.run_write(journal.flush)
+    elapsed = time.perf_counter() - started
+    return {
+        'spins_per_sec': users * spins / elapsed,
+        'commits_per_spin': (statement_counter.commits - commits) / (users * (spins + 1)),
+        'flushes': journal.flushes,
+    }
+
+
+async def run_journal(users: int, spins: int, path: str) -> dict:
+    journal.start(path=path)
+    try:
+        return await run_users(users, spins)
+    finally:
+        await journal.close()
+
+
+def prepare_db(path: str, users: int):
+    configure_pool(path)
+    models.init_db()
+    for i in range(users):
+        models.get_or_create_user(FIRST_USER + i, f"Bench {i}", f"bench{i}", "2025-01-01")
+
+
+def count_rows() -> tuple:
+    conn = models.get_read_connection()
+    try:
+        return (conn.execute('SELECT COUNT(*) FROM slot_machine').fetchone()[0],
+                conn.execute('SELECT COALESCE(SUM(attempts_used), 0) FROM roulette_attempts').fetchone()[0])
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--spins', type=int, default=20, help='спинов на пользователя')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    results = {}
+    try:
+        for mode in ('sync', 'journal'):
+            prepare_db(os.path.join(workdir, f"{mode}.db"), args.users)
+            if mode == 'sync':
+                results[mode] = asyncio.run(run_users(args.users, args.spins))
+            else:
+                results[mode] = asyncio.run(run_journal(args.users, args.spins,
+                                                        os.path.join(workdir, 'write_journal.log')))
+            rows, attempts = count_rows()
+            # Оба режима записывают одно и то же
+            assert rows == attempts == args.users * args.spins, (mode, rows, attempts)
+
+        print(f"Пользователей: {args.users}, спинов на пользователя: {args.spins} (+ отметка активности)")
+        for mode, result in results.items():
+            print(f"{mode:<8} {result['spins_per_sec']:8.1f} спинов/с, коммитов на событие {result['commits_per_spin']:.3f}")
+        print(f"Пачек журнала: {results['journal']['flushes']}, коммитов меньше в "
+              f"x{results['sync']['commits_per_spin'] / max(results['journal']['commits_per_spin'], 1e-9):.0f}")
+    finally:
+        aio.shutdown()
+        configure_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+Заглушка Bot API для бенчмарков
+
+aiohttp-сервер по адресу http://127.0.0.1:<port>/bot<token>/<method>, к которому
+подключается настоящий aiogram Bot (TelegramAPIServer.from_base). Умеет:
+  - getUpdates с long polling и offset, setWebhook/deleteWebhook — доставка
+    обновлений POST-запросами на webhook с секретным заголовком;
+  - сообщения с текстом, файлом (document_update) и нажатия кнопок;
+  - sendMessage/sendPhoto/editMessage*/answerCallbackQuery и прочие методы —
+    ответ-заглушка, вызов записывается со временем;
+  - latency — имитация сети: половина задержки на пути к серверу, половина на
+    обратном (и на доставку webhook).
+
+Пример:
+    api = FakeBotAPI(latency=0.03)
+    await api.start()
+    bot = api.make_bot()
+    await api.push_update(api.message_update(user_id=1, text="ping"))
+"""
+import asyncio
+import json
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+TOKEN = "123456789:AAFakeTokenForLocalBenchmarks_000000000"
+
+
+class FakeBotAPI:
+    def __init__(self, latency: float = 0.0, token: str = TOKEN, webhook_connections: int = 40):
+        self.latency = latency
+        self.token = token
+        self.webhook_connections = webhook_connections
+        self.calls: Counter = Counter()
+        self.sent: List[dict] = []  # исходящие сообщения бота: method, chat_id, text, time
+        self._updates: List[dict] = []
+        self._update_id = 0
+        self._message_id = 0
+        self._new_updates = asyncio.Event()
+        self._reply_waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_slots: Optional[asyncio.Semaphore] = None
+        self._client: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._push_tasks = set()
+        self.base_url = ""
+
+    # --- сервер ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        self._client = aiohttp.ClientSession()
+        return self.base_url
+
+    async def stop(self):
+        for task in list(self._push_tasks):
+            task.cancel()
+        if self._client:
+            await self._client.close()
+        if self._runner:
+            await self._runner.cleanup()
+
+    def make_bot(self, **kwargs) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token=self.token, session=session, **kwargs)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info['token'] != self.token:
+            return web.json_response({'ok': False, 'error_code': 401, 'description': 'Unauthorized'}, status=401)
+        method = request.match_info['method'].lower()
+        params = await _read_params(request)
+        await self._delay()
+        self.calls[method] += 1
+        api = getattr(self, f"api_{method}", None)
+        result = await api(params) if api else True
+        await self._delay()
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency / 2)
+
+    # --- обновления ---
+
+    def message_update(self, user_id: int, text: str) -> dict:
+        self._message_id += 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        return {'message': {'message_id': self._message_id, 'date': int(time.time()),
+                            'chat': {'id': user_id, 'type': 'private'}, 'from': user, 'text': text}}
+
+    def callback_update(self, user_id: int, data: str) -> dict:
+        self._message_id += 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        message = {'message_id': self._message_id, 'date': int(time.time()),
+                   'chat': {'id': user_id, 'type': 'private'}, 'text': 'menu'}
+        return {'callback_query': {'id': str(self._message_id), 'from': user, 'chat_instance': str(user_id),
+                                   'message': message, 'data': data}}
+
+    def document_update(self, user_id: int, file_name: str = "receipt.pdf", mime_type: str = "application/pdf",
+                        file_size: int = 50_000) -> dict:
+        """Сообщение с файлом (чек об оплате)"""
+        self._message_id += 1
+        user = {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"}
+        document = {'file_id': f"doc-{self._message_id}", 'file_unique_id': f"udoc-{self._message_id}",
+                    'file_name': file_name, 'mime_type': mime_type, 'file_size': file_size}
+        return {'message': {'message_id': self._message_id, 'date': int(time.time()),
+                            'chat': {'id': user_id, 'type': 'private'}, 'from': user, 'document': document}}
+
+    async def push_update(self, update: dict) -> int:
+        """Новое обновление: в очередь getUpdates или POST на webhook"""
+        self._update_id += 1
+        update = {'update_id': self._update_id, **update}
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver_webhook(update))
+            self._push_tasks.add(task)
+            task.add_done_callback(self._push_tasks.discard)
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+        return self._update_id
+
+    async def _deliver_webhook(self, update: dict):
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+        async with self._webhook_slots:
+            await self._delay()
+            # Как Telegram: при ошибке повторяем позже
+            for attempt in range(5):
+                async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                    if response.status == 200:
+                        return
+                await asyncio.sleep(0.1 * (attempt + 1))
+
+    async def wait_reply(self, chat_id: int, timeout: float = 10.0) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self._reply_waiters[chat_id].append(future)
+        return await asyncio.wait_for(future, timeout)
+
+    def _record_sent(self, method: str, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get('chat_id', 0))
+        entry = {'method': method, 'chat_id': chat_id, 'text': params.get('text') or params.get('caption'),
+                 'time': time.perf_counter()}
+        self.sent.append(entry)
+        waiters = self._reply_waiters.get(chat_id)
+        while waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                future.set_result(entry)
+                break
+        return {'message_id': self._message_id, 'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'}, 'text': entry['text'] or ''}
+
+    # --- методы Bot API ---
+
+    async def api_getme(self, params):
+        return {'id': int(self.token.split(':')[0]), 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+
+    async def api_getupdates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = int(params.get('limit') or 100)
+        return self._updates[:limit]
+
+    async def api_setwebhook(self, params):
+        self.webhook_url = params['url']
+        self.webhook_secret = params.get('secret_token')
+        self._webhook_slots = asyncio.Semaphore(int(params.get('max_connections') or self.webhook_connections))
+        return True
+
+    async def api_deletewebhook(self, params):
+        self.webhook_url = None
+        return True
+
+    async def api_sendmessage(self, params):
+        return self._record_sent('sendMessage', params)
+
+    async def api_sendphoto(self, params):
+        result = self._record_sent('sendPhoto', params)
+        result['photo'] = [{'file_id': 'fake-file-id', 'file_unique_id': 'fake', 'width': 1, 'height': 1}]
+        return result
+
+    async def api_senddocument(self, params):
+        result = self._record_sent('sendDocument', params)
+        result['document'] = {'file_id': 'fake-doc-id', 'file_unique_id': 'fake-doc'}
+        return result
+
+    async def api_editmessagetext(self, params):
+        return self._record_sent('editMessageText', params)
+
+    async def api_editmessagecaption(self, params):
+        return self._record_sent('editMessageCaption', params)
+
+    async def api_getchatmember(self, params):
+        return {'status': 'member', 'user': {'id': int(params.get('user_id', 0)), 'is_bot': False, 'first_name': 'U'}}
+
+
+async def _read_params(request: web.Request) -> dict:
+    """aiogram шлёт multipart/form-data; сложные значения — JSON-строки"""
+    if request.content_type == 'application/json':
+        return await request.json()
+    if request.method == 'GET':
+        raw = dict(request.query)
+    else:
+        raw = {key: value for key, value in (await request.post()).items() if isinstance(value, str)}
+    params = {}
+    for key, value in raw.items():
+        if value[:1] in ('{', '[') or value in ('true', 'false'):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        params[key] = value
+    return params
@@ -0,0 +1,70 @@
+"""
+Заглушка источников курсов для тестов и бенчмарков app/utils/prices.py
+
+aiohttp-сервер на 127.0.0.1 с теми же путями, что у настоящих источников:
+  - /api/v3/ticker/price?symbol=TONUSDT — как Binance;
+  - /daily_json.js — как cbr-xml-daily.ru (JSON с типом application/javascript).
+Цены задаются словарями prices (монета -> USDT) и usd_rub, запросы считаются в calls.
+latency — задержка ответа, failing — набор путей ('binance', 'cbr'), отвечающих 500.
+
+Пример:
+    api = FakePriceAPI(prices={'TON': 5.0}, usd_rub=90.0)
+    await api.start()
+    oracle = PriceOracle(BinanceSource(api.base_url), CbrSource(api.cbr_url))
+"""
+import asyncio
+import json
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+
+class FakePriceAPI:
+    def __init__(self, prices: Optional[Dict[str, float]] = None, usd_rub: float = 90.0, latency: float = 0.0):
+        self.prices = dict(prices or {'TON': 5.0, 'NOT': 0.01, 'DOGS': 0.001})
+        self.usd_rub = usd_rub
+        self.latency = latency
+        self.failing = set()
+        self.calls: Counter = Counter()
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    @property
+    def cbr_url(self) -> str:
+        return f"{self.base_url}/daily_json.js"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/api/v3/ticker/price", self._ticker)
+        app.router.add_get("/daily_json.js", self._cbr)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _ticker(self, request: web.Request) -> web.Response:
+        symbol = request.query.get('symbol', '')
+        self.calls[f"binance:{symbol}"] += 1
+        await asyncio.sleep(self.latency)
+        if 'binance' in self.failing:
+            return web.json_response({'code': -1, 'msg': 'Internal error'}, status=500)
+        coin = symbol[:-4] if symbol.endswith('USDT') else symbol
+        if coin not in self.prices:
+            return web.json_response({'code': -1121, 'msg': 'Invalid symbol.'}, status=400)
+        return web.json_response({'symbol': symbol, 'price': f"{self.prices[coin]:.8f}"})
+
+    async def _cbr(self, request: web.Request) -> web.Response:
+        self.calls['cbr'] += 1
+        await asyncio.sleep(self.latency)
+        if 'cbr' in self.failing:
+            return web.Response(status=500, text='error')
+        body = {'Valute': {'USD': {'CharCode': 'USD', 'Nominal': 1, 'Value': self.usd_rub}}}
+        return web.Response(text=json.dumps(body), content_type='application/javascript')
@@ -22,6 +22,7 @@ from app.utils.activity_calendar import (
     can_claim_reward, get_user_activity_for_month, render_best_calendar_format
 )
 from app.handlers.activity_calendar import check_subscription, init_activity_rewards_custom
+from app.utils.subscription import subscription_service
 
 
 class TestActivityCalendarDatabase:
@@ -39,6 +40,7 @@ class TestActivityCalendarDatabase:
             return sqlite3.connect(db_path, timeout=30)
 
         with patch('app.database.models.get_db_connection', mock_get_db_connection), \
+             patch('app.database.models.get_read_connection', mock_get_db_connection), \
              patch('app.utils.activity_calendar.get_user_activity') as mock_utils_activity:
 
             # Патчим функцию в утилитах тоже
@@ -240,6 +242,13 @@ class TestActivityCalendarUtils:
 
 class TestActivityCalendarHandlers:
     """Тесты обработчиков календаря активности"""
+
+    @pytest.fixture(autouse=True)
+    def clear_subscription_cache(self):
+        """Результат проверки подписки кэшируется — каждый тест начинает с пустого кэша"""
+        subscription_service.invalidate()
+        yield
+        subscription_service.invalidate()
     
     @pytest.mark.asyncio
     async def test_check_subscription_success(self):
@@ -292,7 +301,8 @@ class TestActivityCalendarEdgeCases:
         def mock_get_db_connection():
             return sqlite3.connect(db_path, timeout=30)
 
-        with patch('app.database.models.get_db_connection', mock_get_db_connection):
+        with patch('app.database.models.get_db_connection', mock_get_db_connection), \
+             patch('app.database.models.get_read_connection', mock_get_db_connection):
             init_db()
             yield db_path
 
@@ -465,7 +475,8 @@ class TestActivityCalendarPerformance:
         def mock_get_db_connection():
             return sqlite3.connect(db_path, timeout=30)
 
-        with patch('app.database.models.get_db_connection', mock_get_db_connection):
+        with patch('app.database.models.get_db_connection', mock_get_db_connection), \
+             patch('app.database.models.get_read_connection', mock_get_db_connection):
             init_db()
             yield db_path
 
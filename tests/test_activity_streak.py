@@ -0,0 +1,109 @@
+"""
+Тесты подсчёта серии активности: один запрос на пользователя и массовый расчёт
+"""
+import datetime
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.models import streak_from_dates, get_user_activity_streak, get_streaks_for_all_users
+from app.database.pool import configure_pool, get_pool
+
+
+def day(offset):
+    return (datetime.date.today() - datetime.timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=2)
+    models.init_db()
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def naive_streak(dates):
+    """Прежний алгоритм: сегодня + дни подряд начиная со вчера, не глубже 364 дней"""
+    dates = set(dates)
+    streak = 1 if day(0) in dates else 0
+    for i in range(1, 365):
+        if day(i) in dates:
+            streak += 1
+        else:
+            break
+    return streak
+
+
+class TestStreakFromDates:
+    @pytest.mark.parametrize("offsets", [
+        [], [0], [1], [0, 1, 2], [1, 2, 3], [0, 2, 3], [0, 1, 3, 4], [2, 3, 4],
+        list(range(0, 400)), list(range(1, 400)), [-1, 0, 1],
+    ])
+    def test_matches_previous_algorithm(self, offsets):
+        dates = sorted({day(o) for o in offsets if o >= 0}, reverse=True)
+        assert streak_from_dates(dates) == naive_streak(dates)
+
+    def test_ignores_bad_dates(self):
+        assert streak_from_dates([day(0), "мусор", day(1)]) == 2
+
+
+class TestStreakQueries:
+    def _fill(self):
+        activity = {
+            1: [0, 1, 2, 3],       # серия 4 включая сегодня
+            2: [1, 2, 5],          # серия 2, сегодня ещё не отмечался
+            3: [0, 2, 3],          # только сегодня
+            4: [3, 4],             # серия прервана
+            5: [],                 # нет активности
+        }
+        for tg_id, offsets in activity.items():
+            models.get_or_create_user(tg_id, f"User {tg_id}", f"user{tg_id}", "2025-01-01")
+            for offset in offsets:
+                models.mark_activity(tg_id, day(offset))
+            if offsets:
+                # Повтор с другим типом не удлиняет серию
+                models.mark_activity(tg_id, day(offsets[0]), "bonus")
+        return {tg_id: naive_streak([day(o) for o in offsets]) for tg_id, offsets in activity.items()}
+
+    def test_single_and_bulk_agree(self, temp_db):
+        expected = self._fill()
+
+        assert {tg_id: get_user_activity_streak(tg_id) for tg_id in expected} == expected
+        bulk = get_streaks_for_all_users()
+        assert {tg_id: bulk.get(tg_id, 0) for tg_id in expected} == expected
+        assert 5 not in bulk
+
+    def test_unknown_user(self, temp_db):
+        assert get_user_activity_streak(999) == 0
+
+    def test_one_query_per_user(self, temp_db):
+        """Серия считается одним SELECT, а не запросом на каждый день"""
+        models.get_or_create_user(1, "User", "user", "2025-01-01")
+        for offset in range(0, 100):
+            models.mark_activity(1, day(offset))
+
+        statements = []
+        original = get_pool().reader
+
+        def tracing_reader():
+            conn = original()
+            conn.set_trace_callback(statements.append)
+            return conn
+
+        get_pool().reader = tracing_reader
+        try:
+            assert get_user_activity_streak(1) == 100
+        finally:
+            get_pool().reader = original
+
+        assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 1
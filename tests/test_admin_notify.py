@@ -0,0 +1,152 @@
+"""
+Тесты фоновых уведомлений админам: очереди, параллельность, сводки, RetryAfter, вытеснение
+"""
+import asyncio
+import os
+import sys
+import time
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.admin_notify import AdminNotifier
+
+KB = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="✅", callback_data="ok")]])
+
+
+class FakeBot:
+    """Бот без сети: задержка отправки, RetryAfter для первых N отправок админу, заблокировавшие"""
+
+    def __init__(self, latency=0.0, retry_after=None, blocked=()):
+        self.latency = latency
+        self.retry_after = dict(retry_after or {})
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        method = SendMessage(chat_id=chat_id, text=text)
+        await asyncio.sleep(self.latency)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        if self.retry_after.get(chat_id):
+            self.retry_after[chat_id] -= 1
+            raise TelegramRetryAfter(method=method, message="Flood control", retry_after=0)
+        self.sent.append((chat_id, text, reply_markup))
+
+    async def send_document(self, chat_id, document, caption=None, reply_markup=None, parse_mode=None):
+        self.sent.append((chat_id, caption, reply_markup))
+
+
+def run(notifier, scenario):
+    async def wrapper():
+        try:
+            return await scenario()
+        finally:
+            await notifier.close(timeout=5)
+    return asyncio.run(wrapper())
+
+
+class TestAdminNotifier:
+    def test_enqueue_returns_immediately_and_admins_are_parallel(self):
+        notifier = AdminNotifier(admins=[1, 2, 3], digest_window=0)
+        bot = FakeBot(latency=0.2)
+
+        async def scenario():
+            started = time.monotonic()
+            assert notifier.enqueue(bot, "Новый заказ") == 3
+            enqueue_time = time.monotonic() - started
+            assert await notifier.flush(5)
+            return enqueue_time, time.monotonic() - started
+
+        enqueue_time, total = run(notifier, scenario)
+
+        assert enqueue_time < 0.05
+        # Три админа по 0.2 с — параллельно, а не 0.6 с подряд
+        assert total < 0.45
+        assert sorted(chat_id for chat_id, _, _ in bot.sent) == [1, 2, 3]
+
+    def test_burst_is_coalesced_into_digest(self):
+        notifier = AdminNotifier(admins=[1], digest_window=0.05, digest_max=20)
+        bot = FakeBot()
+
+        async def scenario():
+            for i in range(10):
+                notifier.enqueue(bot, f"Новый пользователь {i}")
+            notifier.enqueue(bot, "Выигрыш ⭐", reply_markup=KB)
+            await notifier.flush(5)
+
+        run(notifier, scenario)
+
+        assert len(bot.sent) == 2
+        digest, with_buttons = bot.sent
+        assert digest[1].startswith("🗂 Сводка: 10 уведомлений")
+        assert all(f"Новый пользователь {i}" in digest[1] for i in range(10))
+        # Уведомление с кнопками не объединяется и приходит после сводки
+        assert with_buttons == (1, "Выигрыш ⭐", KB)
+        stats = notifier.stats()
+        assert stats['sent'] == 11 and stats['digests'] == 1
+
+    def test_retry_after_is_honoured(self):
+        notifier = AdminNotifier(admins=[1, 2], digest_window=0)
+        bot = FakeBot(retry_after={1: 2})
+
+        async def scenario():
+            notifier.enqueue(bot, "Заказ", reply_markup=KB)
+            await notifier.flush(5)
+
+        run(notifier, scenario)
+
+        assert sorted(chat_id for chat_id, _, _ in bot.sent) == [1, 2]
+        assert notifier.stats()['retries'] == 2
+
+    def test_blocked_admin_does_not_stop_others(self):
+        notifier = AdminNotifier(admins=[1, 2], digest_window=0)
+        bot = FakeBot(blocked={1})
+
+        async def scenario():
+            notifier.enqueue(bot, "Заказ", reply_markup=KB)
+            await notifier.flush(5)
+
+        run(notifier, scenario)
+
+        assert [chat_id for chat_id, _, _ in bot.sent] == [2]
+        assert notifier.stats()['failed'] == 1
+
+    def test_full_queue_evicts_informational_first(self):
+        notifier = AdminNotifier(admins=[1], queue_size=3, digest_window=0, digest_max=1)
+        bot = FakeBot(latency=0.05)
+
+        async def scenario():
+            notifier.enqueue(bot, "первое")
+            await asyncio.sleep(0.01)  # первое уже отправляется
+            notifier.enqueue(bot, "инфо")
+            notifier.enqueue(bot, "заказ 1", reply_markup=KB)
+            notifier.enqueue(bot, "заказ 2", reply_markup=KB)
+            notifier.enqueue(bot, "заказ 3", reply_markup=KB)
+            depth = notifier.stats()['max_depth']
+            await notifier.flush(5)
+            return depth
+
+        depth = run(notifier, scenario)
+
+        assert depth == 3
+        assert [text for _, text, _ in bot.sent] == ["первое", "заказ 1", "заказ 2", "заказ 3"]
+        assert notifier.stats()['dropped'] == 1
+
+    def test_stats_latency(self):
+        notifier = AdminNotifier(admins=[1], digest_window=0)
+        bot = FakeBot(latency=0.05)
+
+        async def scenario():
+            notifier.enqueue(bot, "a", reply_markup=KB)
+            notifier.enqueue(bot, "b", reply_markup=KB)
+            await notifier.flush(5)
+
+        run(notifier, scenario)
+
+        stats = notifier.stats()
+        assert stats['queued'] == 0
+        assert 0.04 <= stats['latency_p50'] <= stats['latency_max'] < 0.5
@@ -0,0 +1,146 @@
+"""
+Тесты очереди заявок в админке: счётчики по статусам, keyset-страницы, фильтры в SQL
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.migrations import apply_migrations
+from app.database.pool import configure_pool
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=1)
+    models.init_db()
+    models.get_or_create_user(1001, "Первый", "first", "2025-01-01")
+    models.get_or_create_user(1002, "Второй", "second", "2025-01-01")
+    first = models.get_user_profile(1001)['id']
+    second = models.get_user_profile(1002)['id']
+    # 12 заявок: чётные — stars у первого, нечётные — withdraw у второго; день = номер заявки
+    for i in range(1, 13):
+        user_id, order_type = (first, 'stars') if i % 2 == 0 else (second, 'withdraw')
+        order_id = models.create_order(user_id, order_type, i * 10, 'pending')
+        execute('UPDATE orders SET created_at = ? WHERE id = ?', f'2025-03-{i:02d} 12:00:00', order_id)
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def execute(sql, *params):
+    with models.db_lock:
+        conn = models.get_db_connection()
+        conn.execute(sql, params)
+        conn.commit()
+        conn.close()
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+class TestOrderStatusCounts:
+    def test_triggers_follow_insert_update_delete(self, db_path):
+        assert models.get_order_status_counts() == {'pending': 12}
+
+        models.update_order_status(1, status='completed')
+        models.update_order_status(2, status='rejected')
+        models.update_order_status(3, admin_msg_id=555)
+        assert models.get_order_status_counts() == {'pending': 10, 'completed': 1, 'rejected': 1}
+
+        models.delete_order(1)
+        assert models.get_order_status_counts() == {'pending': 10, 'rejected': 1}
+
+        models.clear_all_orders()
+        assert models.get_order_status_counts() == {}
+
+    def test_backfill_for_existing_orders(self, db_path):
+        conn = sqlite3.connect(db_path)
+        for trigger in ('ins', 'del', 'upd'):
+            conn.execute(f'DROP TRIGGER trg_order_status_counts_{trigger}')
+        conn.execute('DROP TABLE order_status_counts')
+        conn.execute("UPDATE orders SET status = 'completed' WHERE id <= 4")
+        conn.execute('PRAGMA user_version = 4')
+        conn.commit()
+        apply_migrations(conn)
+        conn.close()
+
+        assert models.get_order_status_counts() == {'pending': 8, 'completed': 4}
+
+
+class TestOrdersPage:
+    def test_keyset_pages_cover_all_orders_newest_first(self, db_path):
+        pages, before_id = [], None
+        while True:
+            page = models.get_orders_page(before_id=before_id, limit=5)
+            if not page:
+                break
+            pages.append(ids(page))
+            before_id = page[-1][0]
+
+        assert pages == [[12, 11, 10, 9, 8], [7, 6, 5, 4, 3], [2, 1]]
+        assert len(models.get_orders_page(limit=1)[0]) == 9
+
+    def test_previous_page(self, db_path):
+        second = models.get_orders_page(before_id=8, limit=5)
+        previous = models.get_orders_page(after_id=second[0][0], limit=5)
+
+        assert ids(previous) == [12, 11, 10, 9, 8]
+
+    def test_filters(self, db_path):
+        models.update_order_status(4, status='completed')
+        models.update_order_status(6, status='completed')
+
+        assert ids(models.get_orders_page(status='completed')) == [6, 4]
+        assert ids(models.get_orders_page(order_type='withdraw', limit=3)) == [11, 9, 7]
+        assert ids(models.get_orders_page(tg_id=1001, status='pending', limit=10)) == [12, 10, 8, 2]
+        assert ids(models.get_orders_page(date_from='2025-03-03', date_to='2025-03-05')) == [5, 4, 3]
+        assert models.get_orders_page(tg_id=42) == []
+
+    def test_filters_use_indexes(self, db_path):
+        conn = sqlite3.connect(db_path)
+        plan = ' '.join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM orders WHERE status = ? ORDER BY id DESC LIMIT 6", ('pending',)))
+        conn.close()
+        assert 'idx_orders_status' in plan
+
+
+class TestOrdersQueue:
+    def test_parse_filters(self):
+        from app.handlers.admin import parse_order_filters
+
+        assert parse_order_filters("pending stars user=1001 from=2025-03-01 to=2025-03-31") == {
+            'status': 'pending', 'order_type': 'stars', 'tg_id': 1001,
+            'date_from': '2025-03-01', 'date_to': '2025-03-31',
+        }
+        assert parse_order_filters("") == {}
+        for bad in ("user=abc", "from=01.03.2025", "limit=5"):
+            with pytest.raises(ValueError):
+                parse_order_filters(bad)
+
+    def test_page_text_and_buttons(self, db_path):
+        from app.handlers.admin import build_orders_page
+
+        models.update_order_status(12, status='completed')
+        text, kb = asyncio.run(build_orders_page({'status': 'pending'}))
+
+        assert "⏳ Ожидают: 11" in text and "✅ Выполнены: 1" in text and "Всего: 12" in text
+        assert "Стр. 1 из 3" in text
+        assert "ЗАКАЗ #11" in text and "ЗАКАЗ #7" in text and "ЗАКАЗ #12" not in text
+        callbacks = [button.callback_data for row in kb.inline_keyboard for button in row]
+        assert "admin_orders_page:1:<7" in callbacks
+        assert not any(data.startswith("admin_orders_page:0") for data in callbacks)
+
+        text, kb = asyncio.run(build_orders_page({'status': 'pending'}, page=1, after_id=7))
+        assert "ЗАКАЗ #11" in text and "ЗАКАЗ #6" not in text
@@ -0,0 +1,101 @@
+"""
+Тесты просмотра базы пользователей в админке: keyset-страницы, число рефералов, поиск
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.pool import configure_pool
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=1)
+    models.init_db()
+    # 12 пользователей; пользователь 1 пригласил 2..4, пользователь 2 — 5
+    for i in range(1, 13):
+        referrer = 1 if 2 <= i <= 4 else 2 if i == 5 else None
+        models.get_or_create_user(1000 + i, f"User {i}", f"User{i}" if i != 7 else None, "2025-01-01", referrer)
+    models.get_or_create_user(2000, "Alice", "AliceSmith", "2025-01-01")
+    models.get_or_create_user(2001, "Alice 2", "alice", "2025-01-01")
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestUsersPage:
+    def test_keyset_pages_cover_all_users(self, db_path):
+        pages, after_id = [], 0
+        while True:
+            page = models.get_users_page(after_id=after_id, limit=5)
+            if not page:
+                break
+            pages.append(page)
+            after_id = page[-1]['id']
+
+        ids = [user['id'] for page in pages for user in page]
+        assert [len(page) for page in pages] == [5, 5, 4]
+        assert ids == sorted(ids) and len(ids) == 14
+        referrals = {user['tg_id']: user['referrals'] for page in pages for user in page}
+        assert referrals[1001] == 3 and referrals[1002] == 1 and referrals[1003] == 0
+
+    def test_previous_page(self, db_path):
+        second = models.get_users_page(after_id=models.get_user_id_at(5) - 1, limit=5)
+        previous = models.get_users_page(before_id=second[0]['id'], limit=5)
+
+        assert previous == models.get_users_page(after_id=0, limit=5)
+
+    def test_count_is_cached_and_reset_on_new_user(self, db_path):
+        assert models.count_users() == 14
+        conn = sqlite3.connect(db_path)
+        conn.execute("INSERT INTO users (tg_id, full_name, username, reg_date) VALUES (1, 'x', 'x', '2025-01-01')")
+        conn.commit()
+        conn.close()
+        # Вставка в обход models — число из кэша
+        assert models.count_users() == 14
+        assert models.count_users(max_age=0) == 15
+        models.get_or_create_user(3000, "New", "new", "2025-01-01")
+        assert models.count_users() == 16
+
+
+class TestSearchUsers:
+    def test_by_tg_id(self, db_path):
+        found = models.search_users("1003")
+        assert [user['tg_id'] for user in found] == [1003]
+
+    def test_username_case_insensitive_exact_first(self, db_path):
+        found = models.search_users("@ALICE")
+        assert [user['username'] for user in found] == ['alice', 'AliceSmith']
+
+    def test_username_prefix(self, db_path):
+        found = models.search_users("user1")
+        assert {user['username'] for user in found} == {'User1', 'User10', 'User11', 'User12'}
+        assert found[0]['username'] == 'User1'
+        assert models.search_users("nobody") == []
+        assert models.search_users("@") == []
+
+    def test_search_uses_indexes(self, db_path):
+        conn = sqlite3.connect(db_path)
+        plans = [
+            ' '.join(row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+            for sql, params in [
+                ('SELECT id FROM users WHERE tg_id = ?', (1,)),
+                ('SELECT id FROM users WHERE LOWER(username) >= ? AND LOWER(username) < ?', ('a', 'b')),
+            ]
+        ]
+        conn.close()
+        assert all('USING' in plan and 'INDEX' in plan for plan in plans), plans
+
+    def test_referrals(self, db_path):
+        inviter = models.get_user_profile(1001)
+        assert [tg_id for _, tg_id, _ in models.get_user_referrals(inviter['id'])] == [1002, 1003, 1004]
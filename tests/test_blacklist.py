@@ -0,0 +1,117 @@
+"""
+Тесты чёрного списка: загрузка при старте, write-through, middleware
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.config import ADMINS
+from app.middlewares import BlacklistMiddleware
+from app.utils.blacklist import Blacklist
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    yield path
+    os.unlink(path)
+
+
+class FakeMessage:
+    def __init__(self, user_id):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text, reply_markup=None, parse_mode=None):
+        self.answers.append(text)
+
+
+class TestBlacklist:
+    def test_write_through_and_reload(self, db_path):
+        """Изменения видны сразу и сохраняются в файле"""
+        async def scenario():
+            bl = Blacklist(db_path)
+            await bl.load()
+            assert await bl.get_reason(1) is None
+            await bl.add(1, "спам")
+            await bl.add(2, "мошенничество")
+            assert bl.reason_for(1) == "спам"
+            await bl.remove(2)
+            assert bl.reason_for(2) is None
+            await bl.close()
+
+            reloaded = Blacklist(db_path)
+            await reloaded.load()
+            rows = await reloaded.rows()
+            await reloaded.close()
+            return rows
+        rows = asyncio.run(scenario())
+
+        assert [(tg_id, reason) for tg_id, reason, _ in rows] == [(1, "спам")]
+
+    def test_lookup_does_not_touch_db(self, db_path):
+        """После загрузки проверка не обращается к соединению"""
+        async def scenario():
+            bl = Blacklist(db_path)
+            await bl.add(5, "причина")  # первый вызов загружает список
+            db = bl._db
+            bl._db = SimpleNamespace()  # любое обращение к БД упадёт
+            try:
+                return [await bl.get_reason(5) for _ in range(100)], await bl.get_reason(6)
+            finally:
+                bl._db = db
+                await bl.close()
+        reasons, missing = asyncio.run(scenario())
+
+        assert reasons == ["причина"] * 100
+        assert missing is None
+
+
+class TestBlacklistMiddleware:
+    def _run(self, bl, user_id):
+        called = []
+
+        async def handler(event, data):
+            called.append(event)
+            return "ok"
+
+        message = FakeMessage(user_id)
+
+        async def scenario():
+            result = await BlacklistMiddleware(bl)(handler, message, {})
+            await bl.close()
+            return result
+        return asyncio.run(scenario()), called, message
+
+    def test_blocks_blacklisted_user(self, db_path):
+        bl = Blacklist(db_path)
+        asyncio.run(bl.add(10, "спам"))
+        asyncio.run(bl.close())
+
+        result, called, message = self._run(Blacklist(db_path), 10)
+
+        assert result is None and not called
+        assert "спам" in message.answers[0]
+
+    def test_passes_other_users(self, db_path):
+        result, called, message = self._run(Blacklist(db_path), 11)
+
+        assert result == "ok" and len(called) == 1
+        assert not message.answers
+
+    def test_admins_not_checked(self, db_path):
+        admin_id = next(iter(ADMINS))
+        bl = Blacklist(db_path)
+        asyncio.run(bl.add(admin_id, "тест"))
+        asyncio.run(bl.close())
+
+        result, called, _ = self._run(Blacklist(db_path), admin_id)
+
+        assert result == "ok" and called
@@ -0,0 +1,131 @@
+"""
+Тесты рассылок: ограничитель скорости, доставка с повторами, продолжение после сбоя
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import broadcasts as db
+from app.database import models
+from app.database.pool import configure_pool
+from app.utils.broadcast import RateLimiter, Progress, estimate_eta, run_job, _markup_to_json
+
+
+class FakeBot:
+    """Бот без сети: блокировавшие пользователи, разовый RetryAfter"""
+
+    def __init__(self, blocked=(), retry_after_for=()):
+        self.sent = []
+        self.blocked = set(blocked)
+        self.retry_after_for = set(retry_after_for)
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        method = SendMessage(chat_id=chat_id, text=text)
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+        if chat_id in self.retry_after_for:
+            self.retry_after_for.discard(chat_id)
+            raise TelegramRetryAfter(method=method, message="Flood control", retry_after=0)
+        self.sent.append((chat_id, text, reply_markup))
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=2)
+    models.init_db()
+    for tg_id in range(1, 31):
+        models.get_or_create_user(tg_id, f"User {tg_id}", f"user{tg_id}", "2025-01-01")
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestRateLimiter:
+    """Тесты token bucket"""
+
+    def test_rate_is_limited(self):
+        async def scenario():
+            limiter = RateLimiter(rate=100, per_chat_interval=0)
+            started = time.monotonic()
+            for _ in range(150):
+                await limiter.acquire()
+            return time.monotonic() - started
+
+        # 100 токенов доступны сразу, ещё 50 — за 0.5 с
+        assert asyncio.run(scenario()) >= 0.45
+
+    def test_pause_blocks_tokens(self):
+        async def scenario():
+            limiter = RateLimiter(rate=1000, per_chat_interval=0)
+            limiter.pause(0.2)
+            started = time.monotonic()
+            await limiter.acquire()
+            return time.monotonic() - started
+
+        assert asyncio.run(scenario()) >= 0.19
+
+    def test_per_chat_interval(self):
+        async def scenario():
+            limiter = RateLimiter(rate=1000, per_chat_interval=0.2)
+            await limiter.acquire(1)
+            started = time.monotonic()
+            await limiter.acquire(2)
+            other_chat = time.monotonic() - started
+            await limiter.acquire(1)
+            return other_chat, time.monotonic() - started
+
+        other_chat, same_chat = asyncio.run(scenario())
+        assert other_chat < 0.05
+        assert same_chat >= 0.15
+
+
+class TestBroadcastJob:
+    """Тесты исполнения задания"""
+
+    def test_job_delivers_and_counts(self, temp_db):
+        markup = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Меню", callback_data="generalmenu")]])
+        job_id = db.create_broadcast_job('text', 'Привет', None, _markup_to_json(markup), None)
+        bot = FakeBot(blocked={3, 7}, retry_after_for={5})
+
+        job = asyncio.run(run_job(bot, job_id, RateLimiter(rate=1000, per_chat_interval=0), page_size=8))
+
+        assert job['status'] == 'done'
+        assert (job['delivered'], job['blocked'], job['failed']) == (28, 2, 0)
+        assert job['last_tg_id'] == 30
+        assert sorted(chat_id for chat_id, _, _ in bot.sent) == [i for i in range(1, 31) if i not in (3, 7)]
+        assert bot.sent[0][2].inline_keyboard[0][0].callback_data == "generalmenu"
+        assert [row[0] for row in db.get_broadcast_deliveries(job_id, 'blocked')] == [3, 7]
+
+    def test_resume_skips_already_processed(self, temp_db):
+        """После сбоя задание продолжается, уже получившим не отправляется повторно"""
+        job_id = db.create_broadcast_job('text', 'Привет', None, None, None)
+        db.set_broadcast_job_status(job_id, 'running')
+        # Сбой посреди страницы: часть получателей записана, курсор не сдвинут
+        for tg_id in (1, 2, 4):
+            db.record_broadcast_delivery(job_id, tg_id, 'delivered')
+        bot = FakeBot()
+
+        job = asyncio.run(run_job(bot, job_id, RateLimiter(rate=1000, per_chat_interval=0)))
+
+        assert sorted(chat_id for chat_id, _, _ in bot.sent) == [i for i in range(1, 31) if i not in (1, 2, 4)]
+        assert job['delivered'] == 30
+
+    def test_eta_uses_measured_rate(self, temp_db):
+        job = {'total': 1000, 'delivered': 400, 'failed': 50, 'blocked': 50, 'run_seconds': 50.0}
+        assert Progress(job).rate == 10
+        assert estimate_eta(job) == pytest.approx(50)
+        new_job = dict(job, delivered=0, failed=0, blocked=0, run_seconds=0)
+        assert estimate_eta(new_job, previous_rate=20) == pytest.approx(50)
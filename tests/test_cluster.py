@@ -0,0 +1,221 @@
+"""
+Тесты многопроцессного режима: выбор воркера по tg_id, пересылка, приём через getUpdates
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+
+from aiogram import Dispatcher, types
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.cluster import UpdateRouter, poll_updates, shard_for, update_user_id, WORKER_PATH
+from app.webhook import build_webhook_app
+from benchmarks.fake_bot_api import FakeBotAPI
+
+SECRET = "cluster-secret"
+
+
+def message(update_id, user_id, text="hi"):
+    user = {'id': user_id, 'is_bot': False, 'first_name': 'U'}
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                'chat': {'id': user_id, 'type': 'private'}, 'from': user}}
+
+
+def recording_worker(received, index, fail_first=0):
+    """Воркер-заглушка: запоминает (index, update), первые fail_first запросов отвечает 503"""
+    app = web.Application()
+    failures = {'left': fail_first}
+
+    async def handle(request):
+        assert request.headers['X-Telegram-Bot-Api-Secret-Token'] == SECRET
+        if failures['left']:
+            failures['left'] -= 1
+            return web.Response(status=503)
+        received.append((index, await request.json()))
+        return web.json_response({})
+
+    app.router.add_post(WORKER_PATH, handle)
+    return app
+
+
+class TestRouting:
+    def test_update_user_id(self):
+        user = {'id': 42, 'is_bot': False, 'first_name': 'U'}
+        assert update_user_id(message(1, 42)) == 42
+        assert update_user_id({'update_id': 2, 'callback_query': {'id': '1', 'from': user, 'data': 'x'}}) == 42
+        member = {'chat': {'id': -100, 'type': 'channel'}, 'from': {'id': 7}, 'date': 0,
+                  'old_chat_member': {'status': 'left', 'user': user},
+                  'new_chat_member': {'status': 'member', 'user': user}}
+        assert update_user_id({'update_id': 3, 'chat_member': member}) == 42
+        assert update_user_id({'update_id': 4, 'channel_post': {'chat': {'id': -100}}}) == -100
+        assert update_user_id({'update_id': 5}) is None
+
+    def test_shard_for(self):
+        assert all(shard_for(user_id, 1) == 0 for user_id in range(100))
+        assert shard_for(None, 4) == 0
+        assert [shard_for(123456789, 4) for _ in range(3)] == [shard_for(123456789, 4)] * 3
+        spread = Counter(shard_for(user_id, 4) for user_id in range(100000, 110000))
+        assert len(spread) == 4
+        assert min(spread.values()) > 2000
+
+    def test_router_keeps_user_on_one_worker_in_order(self):
+        async def scenario():
+            received = []
+            servers = [TestServer(recording_worker(received, index)) for index in range(3)]
+            for server in servers:
+                await server.start_server()
+            router = UpdateRouter([str(server.make_url('')).rstrip('/') for server in servers], SECRET)
+            await router.start()
+            updates = [message(i, user_id=1000 + i % 7) for i in range(1, 43)]
+            failed = await router.forward_batch(updates)
+            await router.close()
+            for server in servers:
+                await server.close()
+            return failed, received, router.stats()
+        failed, received, stats = asyncio.run(scenario())
+
+        assert failed == []
+        assert sum(stats['forwarded']) == 42
+        workers_by_user, ids_by_user = {}, {}
+        for index, update in received:
+            user_id = update['message']['from']['id']
+            workers_by_user.setdefault(user_id, set()).add(index)
+            ids_by_user.setdefault(user_id, []).append(update['update_id'])
+        assert all(len(workers) == 1 for workers in workers_by_user.values())
+        assert all(ids == sorted(ids) for ids in ids_by_user.values())
+
+    def test_router_retries_restarting_worker(self):
+        async def scenario():
+            received = []
+            server = TestServer(recording_worker(received, 0, fail_first=2))
+            await server.start_server()
+            router = UpdateRouter([str(server.make_url('')).rstrip('/')], SECRET)
+            await router.start()
+            ok = await router.forward(message(1, 5))
+            await router.close()
+            await server.close()
+            return ok, received, router.stats()
+        ok, received, stats = asyncio.run(scenario())
+
+        assert ok
+        assert len(received) == 1
+        assert stats['retries'] == 2 and stats['failed'] == 0
+
+
+class TestPollingFront:
+    def test_updates_reach_workers_and_are_confirmed(self):
+        """getUpdates → приёмник → воркеры (настоящие диспетчеры) → ответы в Bot API"""
+        async def scenario():
+            api = FakeBotAPI()
+            await api.start()
+            handled = []
+            servers, bots = [], []
+            for index in range(2):
+                dp = Dispatcher()
+
+                @dp.message()
+                async def echo(msg: types.Message, index=index):
+                    handled.append((index, msg.from_user.id))
+                    await msg.answer(f"re:{msg.text}")
+
+                bot = api.make_bot()
+                bots.append(bot)
+                server = TestServer(build_webhook_app(dp, bot, SECRET, path=WORKER_PATH))
+                await server.start_server()
+                servers.append(server)
+
+            router = UpdateRouter([str(server.make_url('')).rstrip('/') for server in servers], SECRET)
+            await router.start()
+            front_bot = api.make_bot()
+            stop_event = asyncio.Event()
+            front = asyncio.create_task(poll_updates(front_bot, router, stop_event, ['message'], timeout=1))
+            for i in range(20):
+                await api.push_update(api.message_update(user_id=500 + i % 5, text=f"m{i}"))
+            for _ in range(200):
+                if len(api.sent) == 20:
+                    break
+                await asyncio.sleep(0.02)
+            stop_event.set()
+            await front
+            pending = list(api._updates)
+            await router.close()
+            for server in servers:
+                await server.close()
+            await front_bot.session.close()
+            await api.stop()
+            return handled, len(api.sent), pending
+        handled, replies, pending = asyncio.run(scenario())
+
+        assert replies == 20
+        assert pending == []
+        workers_by_user = {}
+        for index, user_id in handled:
+            workers_by_user.setdefault(user_id, set()).add(index)
+        assert all(len(workers) == 1 for workers in workers_by_user.values())
+
+    def test_failing_worker_updates_are_retried(self):
+        """Пока воркер недоступен, его обновления не подтверждаются; остальные не дублируются"""
+        users = {}
+        for user_id in range(700, 800):
+            users.setdefault(shard_for(user_id, 2), user_id)
+
+        def worker(received, state):
+            app = web.Application()
+
+            async def handle(request):
+                if state['down']:
+                    return web.Response(status=503)
+                received.append((await request.json())['update_id'])
+                return web.json_response({})
+
+            app.router.add_post(WORKER_PATH, handle)
+            return app
+
+        async def wait_for(condition):
+            for _ in range(300):
+                if condition():
+                    return
+                await asyncio.sleep(0.02)
+
+        async def scenario():
+            api = FakeBotAPI()
+            await api.start()
+            received = [[], []]
+            states = [{'down': False}, {'down': True}]
+            servers = [TestServer(worker(received[index], states[index])) for index in range(2)]
+            for server in servers:
+                await server.start_server()
+            router = UpdateRouter([str(server.make_url('')).rstrip('/') for server in servers], SECRET, attempts=1)
+            await router.start()
+            front_bot = api.make_bot()
+            stop_event = asyncio.Event()
+            front = asyncio.create_task(poll_updates(front_bot, router, stop_event, ['message'], timeout=1))
+            pushed = [[], []]
+            for i in range(10):
+                index = i % 2
+                pushed[index].append(await api.push_update(api.message_update(user_id=users[index], text=f"m{i}")))
+
+            await wait_for(lambda: len(received[0]) == 5 and router.failed >= 3)
+            # Недоставленные остаются в очереди getUpdates, начиная с первого
+            waiting = [update['update_id'] for update in api._updates]
+            states[1]['down'] = False
+            await wait_for(lambda: len(received[1]) == 5)
+            stop_event.set()
+            await front
+            pending = list(api._updates)
+            await router.close()
+            for server in servers:
+                await server.close()
+            await front_bot.session.close()
+            await api.stop()
+            return pushed, received, waiting, pending
+        pushed, received, waiting, pending = asyncio.run(scenario())
+
+        assert received[0] == pushed[0]
+        assert received[1] == pushed[1]
+        assert set(pushed[1]) <= set(waiting)
+        assert pending == []
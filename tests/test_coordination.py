@@ -0,0 +1,153 @@
+"""
+Тесты координатора процессов: блокировки с арендой, общие флаги, оповещения об изменениях
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.coordination import LocalCoordinator, LockNotAcquired, SQLiteCoordinator
+
+
+@pytest.fixture
+def db_path():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestLocks:
+    def test_lock_is_exclusive_between_processes(self, db_path):
+        """Два координатора на одном файле — как два процесса бота"""
+        async def scenario():
+            first, second = SQLiteCoordinator(db_path, poll_interval=0), SQLiteCoordinator(db_path, poll_interval=0)
+            events = []
+            async with first.lock('broadcast:1'):
+                with pytest.raises(LockNotAcquired):
+                    async with second.lock('broadcast:1'):
+                        events.append('second inside')
+                # Другие блокировки не мешают
+                async with second.lock('broadcast:2'):
+                    events.append('other lock')
+            async with second.lock('broadcast:1'):
+                events.append('after release')
+            await first.close()
+            await second.close()
+            return events
+        assert asyncio.run(scenario()) == ['other lock', 'after release']
+
+    def test_waiting_for_lock(self, db_path):
+        async def scenario():
+            first, second = SQLiteCoordinator(db_path, poll_interval=0), SQLiteCoordinator(db_path, poll_interval=0)
+            order = []
+
+            async def holder():
+                async with first.lock('job'):
+                    order.append('first')
+                    await asyncio.sleep(0.2)
+
+            async def waiter():
+                await asyncio.sleep(0.05)
+                async with second.lock('job', timeout=2):
+                    order.append('second')
+
+            await asyncio.gather(holder(), waiter())
+            await first.close()
+            await second.close()
+            return order
+        assert asyncio.run(scenario()) == ['first', 'second']
+
+    def test_lease_is_renewed_while_held(self, db_path):
+        async def scenario():
+            first, second = SQLiteCoordinator(db_path, poll_interval=0), SQLiteCoordinator(db_path, poll_interval=0)
+            async with first.lock('job', ttl=0.3):
+                await asyncio.sleep(0.7)
+                with pytest.raises(LockNotAcquired):
+                    async with second.lock('job'):
+                        pass
+            await first.close()
+            await second.close()
+        asyncio.run(scenario())
+
+    def test_expired_lease_is_taken_over(self, db_path):
+        """Процесс упал, не отпустив блокировку — после истечения аренды её берёт другой"""
+        async def scenario():
+            crashed, second = SQLiteCoordinator(db_path, poll_interval=0), SQLiteCoordinator(db_path, poll_interval=0)
+            assert await crashed._acquire('job', 'crashed-token', 0.1)
+            await asyncio.sleep(0.15)
+            async with second.lock('job'):
+                taken = True
+            await crashed.close()
+            await second.close()
+            return taken
+        assert asyncio.run(scenario())
+
+    def test_local_lock(self):
+        async def scenario():
+            coordinator = LocalCoordinator()
+            async with coordinator.lock('job'):
+                with pytest.raises(LockNotAcquired):
+                    async with coordinator.lock('job'):
+                        pass
+            async with coordinator.lock('job'):
+                return True
+        assert asyncio.run(scenario())
+
+
+class TestSharedState:
+    def test_flags_are_shared(self, db_path):
+        async def scenario():
+            first = SQLiteCoordinator(db_path, poll_interval=0.05)
+            second = SQLiteCoordinator(db_path, poll_interval=0.05)
+            await first.start()
+            await second.start()
+            before = second.flag('proverka', False)
+            await first.set_flag('proverka', True)
+            await asyncio.sleep(0.15)
+            after = second.flag('proverka', False), first.flag('proverka', False)
+            await first.close()
+            await second.close()
+            return before, after
+        before, after = asyncio.run(scenario())
+
+        assert before is False
+        assert after == (True, True)
+
+    def test_changes_notify_other_processes_only(self, db_path):
+        async def scenario():
+            first = SQLiteCoordinator(db_path, poll_interval=0.05)
+            second = SQLiteCoordinator(db_path, poll_interval=0.05)
+            calls = {'first': 0, 'second': 0}
+
+            async def second_reload():
+                calls['second'] += 1
+
+            first.on_change('blacklist', lambda: calls.__setitem__('first', calls['first'] + 1))
+            second.on_change('blacklist', second_reload)
+            await first.start()
+            await second.start()
+            await first.publish('blacklist')
+            await asyncio.sleep(0.15)
+            await first.close()
+            await second.close()
+            return calls
+        assert asyncio.run(scenario()) == {'first': 0, 'second': 1}
+
+    def test_notify_from_thread(self, db_path):
+        """notify() вызывается из синхронного кода моделей, в том числе из потоков пула БД"""
+        async def scenario():
+            first = SQLiteCoordinator(db_path, poll_interval=0)
+            await first.start()
+            await asyncio.to_thread(first.notify, 'slot_config')
+            await asyncio.sleep(0.1)
+            version = first._versions.get('slot_config')
+            await first.close()
+            return version
+        assert asyncio.run(scenario()) == 1
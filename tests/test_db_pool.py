@@ -0,0 +1,155 @@
+"""
+Тесты пула соединений и асинхронных обёрток БД
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models, aio
+from app.database.pool import ConnectionPool, configure_pool
+
+
+class TestConnectionPool:
+    """Тесты ConnectionPool"""
+
+    @pytest.fixture
+    def pool(self):
+        db_fd, db_path = tempfile.mkstemp()
+        os.close(db_fd)
+        pool = ConnectionPool(db_path, readers=2, timeout=1)
+        conn = pool.writer()
+        conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+        conn.commit()
+        conn.close()
+        yield pool
+        pool.close()
+        os.unlink(db_path)
+
+    def test_writer_is_reused(self, pool):
+        """Соединение для записи открывается один раз"""
+        first = pool.writer()
+        raw = first._conn
+        first.close()
+        second = pool.writer()
+        assert second._conn is raw
+        second.close()
+
+    def test_close_is_idempotent(self, pool):
+        """Повторный close() не ломает счётчик выданных соединений"""
+        conn = pool.writer()
+        conn.close()
+        conn.close()
+        assert pool.stats()['writer_leases'] == 0
+
+    def test_uncommitted_write_rolled_back_on_close(self, pool):
+        """Незакоммиченные изменения откатываются, как при закрытии обычного соединения"""
+        conn = pool.writer()
+        conn.execute("INSERT INTO t (v) VALUES ('lost')")
+        conn.close()
+
+        reader = pool.reader()
+        count = reader.execute('SELECT COUNT(*) FROM t').fetchone()[0]
+        reader.close()
+        assert count == 0
+
+    def test_nested_writer_does_not_rollback_outer(self, pool):
+        """Вложенный вызов не откатывает транзакцию внешнего"""
+        outer = pool.writer()
+        outer.execute("INSERT INTO t (v) VALUES ('kept')")
+        inner = pool.writer()
+        inner.close()
+        outer.commit()
+        outer.close()
+
+        reader = pool.reader()
+        assert reader.execute('SELECT COUNT(*) FROM t').fetchone()[0] == 1
+        reader.close()
+
+    def test_reader_is_read_only(self, pool):
+        """Соединения для чтения не могут писать"""
+        reader = pool.reader()
+        with pytest.raises(sqlite3.OperationalError):
+            reader.execute("INSERT INTO t (v) VALUES ('x')")
+        reader.close()
+
+    def test_readers_limited_and_reused(self, pool):
+        """Открывается не больше readers соединений, освобождённые переиспользуются"""
+        a, b = pool.reader(), pool.reader()
+        assert pool.stats()['readers_open'] == 2
+
+        got = []
+        t = threading.Thread(target=lambda: got.append(pool.reader()))
+        t.start()
+        a.close()
+        t.join(timeout=2)
+        assert got and got[0]._conn is a._conn
+        got[0].close()
+        b.close()
+        assert pool.stats()['readers_open'] == 2
+
+    def test_leaked_lease_released_by_gc(self, pool):
+        """Забытое соединение возвращается в пул сборщиком мусора"""
+        conn = pool.writer()
+        conn.execute("INSERT INTO t (v) VALUES ('leak')")
+        del conn
+        assert pool.stats()['writer_leases'] == 0
+
+
+class TestAsyncWrappers:
+    """Тесты асинхронных версий функций models"""
+
+    @pytest.fixture
+    def temp_db(self):
+        db_fd, db_path = tempfile.mkstemp()
+        os.close(db_fd)
+        configure_pool(db_path, readers=2)
+        models.init_db()
+        yield db_path
+        configure_pool()
+        os.unlink(db_path)
+
+    def test_wrappers_exist_for_helpers(self):
+        """Для всех перечисленных функций есть асинхронная версия"""
+        for name in aio.READ_FUNCTIONS + aio.WRITE_FUNCTIONS:
+            assert hasattr(models, name), name
+            assert asyncio.iscoroutinefunction(getattr(aio, name)), name
+
+    def test_concurrent_updates(self, temp_db):
+        """Параллельные запись и чтение через пулы потоков"""
+        async def scenario():
+            await asyncio.gather(*[
+                aio.get_or_create_user(1000 + i, f"User {i}", f"user{i}", "2025-01-01")
+                for i in range(50)
+            ])
+            await asyncio.gather(*[aio.update_balance(1000 + i % 5, 1) for i in range(100)])
+            return await asyncio.gather(*[aio.get_user_profile(1000 + i) for i in range(5)])
+
+        profiles = asyncio.run(scenario())
+        assert [p['balance'] for p in profiles] == [20] * 5
+        assert len(models.get_all_users()) == 50
+
+    def test_failed_write_is_rolled_back_at_once(self, temp_db):
+        """Незакоммиченное упавшей функцией не коммитит следующая запись в том же соединении"""
+        models.get_or_create_user(2000, "User", "user", "2025-01-01")
+
+        def broken_update():
+            with models.db_lock:
+                conn = models.get_db_connection()
+                conn.execute('UPDATE users SET balance = 999 WHERE tg_id = ?', (2000,))
+                raise RuntimeError("сбой посреди транзакции")
+
+        async def scenario():
+            with pytest.raises(RuntimeError):
+                await aio.run_write(broken_update)
+            await aio.run_write(models.set_flag, 'maintenance', True)
+
+        asyncio.run(scenario())
+        assert models.get_user_profile(2000)['balance'] == 0
+        assert models.get_flag('maintenance')
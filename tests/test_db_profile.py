@@ -0,0 +1,90 @@
+"""
+Тесты профиля SQLite (PRAGMA на каждом соединении, обслуживание WAL)
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.pool import ConnectionPool, configure_pool
+from app.database.profile import apply_profile, effective_settings, profile_report, run_maintenance
+
+PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -4000,
+    'mmap_size': 0,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 1234,
+}
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    yield path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestDbProfile:
+    """Тесты применения профиля"""
+
+    def test_profile_applied_to_writer_and_readers(self, db_path):
+        """Профиль действует и на соединение для записи, и на соединения для чтения"""
+        pool = ConnectionPool(db_path, readers=1, timeout=1, profile=PROFILE)
+        writer = pool.writer()
+        reader = pool.reader()
+        try:
+            for conn in (writer, reader):
+                settings = effective_settings(conn)
+                assert settings['journal_mode'] == 'wal'
+                assert settings['synchronous'] == 1  # NORMAL
+                assert settings['cache_size'] == -4000
+                assert settings['temp_store'] == 2  # MEMORY
+                assert settings['busy_timeout'] == 1234
+        finally:
+            writer.close()
+            reader.close()
+            pool.close()
+
+    def test_invalid_value_rejected(self, db_path):
+        """Значения PRAGMA из окружения не подставляются в SQL как есть"""
+        pool = ConnectionPool(db_path, readers=1, timeout=1, profile={})
+        conn = pool.writer()
+        try:
+            with pytest.raises(ValueError):
+                apply_profile(conn, {'synchronous': 'OFF; DROP TABLE users'})
+        finally:
+            conn.close()
+            pool.close()
+
+    def test_report_marks_mismatch(self, db_path):
+        """В отчёте видно, если SQLite не принял запрошенное значение"""
+        pool = ConnectionPool(db_path, readers=1, timeout=1, profile={})
+        conn = pool.writer()
+        try:
+            report = profile_report(conn, {'journal_mode': 'WAL'})
+        finally:
+            conn.close()
+            pool.close()
+        assert 'journal_mode = delete (запрошено WAL)' in report
+
+    def test_maintenance_checkpoints_wal(self, db_path):
+        """wal_checkpoint(TRUNCATE) переносит весь WAL в основной файл"""
+        configure_pool(db_path, readers=1, profile=PROFILE)
+        try:
+            models.init_db()
+            models.get_or_create_user(1, "User", "user", "2025-01-01")
+            result = run_maintenance('TRUNCATE')
+            assert result['busy'] == 0
+            assert result['log_frames'] == result['checkpointed']
+            assert os.path.getsize(db_path + '-wal') == 0
+        finally:
+            configure_pool()
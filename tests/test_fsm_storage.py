@@ -0,0 +1,166 @@
+"""
+Тесты хранилища FSM в SQLite: сохранение между перезапусками, отложенная запись, TTL, LRU
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.fsm_storage import SQLiteStorage
+
+
+class PurchaseStates(StatesGroup):
+    waiting_receipt = State()
+
+
+def key(user_id: int, destiny: str = 'default') -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id, destiny=destiny)
+
+
+@pytest.fixture
+def db_path():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    yield path
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT key, state FROM fsm_states').fetchall()
+    finally:
+        conn.close()
+
+
+class TestSQLiteStorage:
+    def test_state_survives_restart(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, flush_interval=10)
+            await storage.set_state(key(1), PurchaseStates.waiting_receipt)
+            await storage.update_data(key(1), {'tariff': '3m', 'price': 1199.0})
+            await storage.close()
+
+            restarted = SQLiteStorage(db_path)
+            result = await restarted.get_state(key(1)), await restarted.get_data(key(1))
+            await restarted.close()
+            return result
+        state, data = asyncio.run(scenario())
+
+        assert state == PurchaseStates.waiting_receipt.state
+        assert data == {'tariff': '3m', 'price': 1199.0}
+
+    def test_write_behind(self, db_path):
+        """Запись попадает в БД пачкой, чтение до записи идёт из кэша"""
+        async def scenario():
+            storage = SQLiteStorage(db_path, flush_interval=0.05)
+            for user_id in range(5):
+                await storage.set_state(key(user_id), 'Flow:step')
+            before = rows(db_path)
+            cached = await storage.get_state(key(3))
+            await asyncio.sleep(0.15)
+            after = rows(db_path)
+            stats = storage.stats()
+            await storage.close()
+            return before, cached, after, stats
+        before, cached, after, stats = asyncio.run(scenario())
+
+        assert before == []
+        assert cached == 'Flow:step'
+        assert len(after) == 5
+        assert stats['flushes'] == 1 and stats['dirty'] == 0
+
+    def test_write_through(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, flush_interval=0)
+            await storage.set_state(key(1), 'Flow:step')
+            written = rows(db_path)
+            await storage.set_state(key(1), None)
+            cleared = rows(db_path)
+            await storage.close()
+            return written, cleared
+        written, cleared = asyncio.run(scenario())
+
+        assert len(written) == 1
+        # Пустое состояние удаляется из БД
+        assert cleared == []
+
+    def test_stale_state_expires(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, ttl=60, flush_interval=0)
+            await storage.set_state(key(1), 'Flow:step')
+            await storage.set_data(key(1), {'amount': 5})
+            storage._cache[storage.key_builder.build(key(1))].updated_at = time.time() - 120
+            result = await storage.get_state(key(1)), await storage.get_data(key(1))
+            await storage.flush()
+            await storage.close()
+            return result
+        state, data = asyncio.run(scenario())
+
+        assert state is None and data == {}
+        assert rows(db_path) == []
+
+    def test_purge_expired(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, ttl=60, flush_interval=0)
+            await storage.set_state(key(1), 'Flow:old')
+            await storage.set_state(key(2), 'Flow:new')
+            db = await storage._connection()
+            await db.execute('UPDATE fsm_states SET updated_at = ? WHERE state = ?', (time.time() - 120, 'Flow:old'))
+            await db.commit()
+            purged = await storage.purge_expired()
+            await storage.close()
+            return purged
+        assert asyncio.run(scenario()) == 1
+        assert [state for _, state in rows(db_path)] == ['Flow:new']
+
+    def test_lru_keeps_unsaved_entries(self, db_path):
+        """Вытесняются только сохранённые записи, несохранённые остаются до записи в БД"""
+        async def scenario():
+            storage = SQLiteStorage(db_path, cache_size=3, flush_interval=10)
+            for user_id in range(5):
+                await storage.set_state(key(user_id), f'Flow:{user_id}')
+            unsaved = storage.stats()['cached']
+            await storage.flush()
+            saved = storage.stats()['cached']
+            # Вытесненный ключ читается из БД
+            state = await storage.get_state(key(0))
+            await storage.close()
+            return unsaved, saved, state
+        unsaved, saved, state = asyncio.run(scenario())
+
+        assert unsaved == 5
+        assert saved == 3
+        assert state == 'Flow:0'
+
+    def test_destinies_are_separate(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, flush_interval=0)
+            await storage.set_data(key(1, 'support_reply'), {'ticket_id': 7})
+            await storage.set_state(key(1), None)
+            await storage.set_data(key(1), {})
+            result = await storage.get_data(key(1, 'support_reply'))
+            await storage.close()
+            return result
+        assert asyncio.run(scenario()) == {'ticket_id': 7}
+
+    def test_returned_data_is_a_copy(self, db_path):
+        async def scenario():
+            storage = SQLiteStorage(db_path, flush_interval=0)
+            await storage.set_data(key(1), {'a': 1})
+            data = await storage.get_data(key(1))
+            data['a'] = 2
+            result = await storage.get_data(key(1))
+            await storage.close()
+            return result
+        assert asyncio.run(scenario()) == {'a': 1}
@@ -0,0 +1,278 @@
+"""
+Тесты журнала отложенной записи: пачки, восстановление после падения, учёт очереди при чтении
+"""
+import asyncio
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.journal import journal
+from app.database.pool import configure_pool, statement_counter
+
+TG_ID = 555
+
+
+def lose():
+    return ('🍒', '🍋', '🍊'), None
+
+
+def win(amount):
+    config = (1, '🍒🍒🍒', 'money', amount, 1.0, '🍒', 'Вишни')
+    return lambda: (('🍒', '🍒', '🍒'), config)
+
+
+def scalar(sql, params=()):
+    conn = models.get_read_connection()
+    try:
+        return conn.execute(sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def crash():
+    """Процесс упал: очередь в памяти потеряна, файл журнала остался"""
+    journal._task.cancel()
+    journal._file.close()
+    journal._file = None
+    journal._pending = []
+    journal.active = False
+
+
+@pytest.fixture
+def workdir():
+    path = tempfile.mkdtemp()
+    configure_pool(os.path.join(path, 'users.db'), readers=2)
+    models.init_db()
+    models.get_or_create_user(TG_ID, "Journal", "journal", "2025-01-01")
+    yield path
+    configure_pool()
+    shutil.rmtree(path)
+
+
+def run_with_journal(workdir, scenario):
+    async def wrapper():
+        journal.start(path=os.path.join(workdir, 'write_journal.log'))
+        try:
+            return await scenario()
+        finally:
+            await journal.close()
+    return asyncio.run(wrapper())
+
+
+class TestBatching:
+    def test_spins_are_written_in_one_commit(self, workdir):
+        async def scenario():
+            commits = statement_counter.commits
+            results = [models.play_slot_spin(TG_ID, 100, lose) for _ in range(50)]
+            queued_commits = statement_counter.commits - commits
+            assert scalar('SELECT COUNT(*) FROM slot_machine') == 0
+            assert journal.flush() == 50
+            return results, queued_commits, statement_counter.commits - commits
+
+        results, queued_commits, commits = run_with_journal(workdir, scenario)
+
+        assert queued_commits == 0 and commits == 1
+        assert [r['attempts_used'] for r in results] == list(range(1, 51))
+        assert all(r['win_id'] is None for r in results)
+        assert scalar('SELECT COUNT(*) FROM slot_machine WHERE reward_type = ?', ('none',)) == 50
+        assert scalar('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == 50
+        assert models.get_slot_user_stats(TG_ID)['spins'] == 50
+
+    def test_full_batch_wakes_flusher(self, workdir, monkeypatch):
+        monkeypatch.setattr(journal, 'batch_size', 5)
+        monkeypatch.setattr(journal, 'flush_interval', 60)
+
+        async def scenario():
+            for _ in range(5):
+                models.create_slot_win(TG_ID, '🍒🍋🍊', 'none', 0, False)
+            for _ in range(50):
+                if not journal.stats()['pending']:
+                    break
+                await asyncio.sleep(0.01)
+            return scalar('SELECT COUNT(*) FROM slot_machine')
+
+        assert run_with_journal(workdir, scenario) == 5
+
+    def test_without_journal_writes_are_synchronous(self, workdir):
+        win_id = models.create_slot_win(TG_ID, '🍒🍋🍊', 'none', 0, False)
+        assert win_id is not None
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 1
+
+
+class TestReadsSeeQueue:
+    def test_attempts_are_not_overspent(self, workdir):
+        async def scenario():
+            results = [models.play_slot_spin(TG_ID, 3, lose)['status'] for _ in range(5)]
+            return results, models.get_slot_attempts(TG_ID)
+
+        statuses, attempts = run_with_journal(workdir, scenario)
+
+        assert statuses == ['ok', 'ok', 'ok', 'no_attempts', 'no_attempts']
+        assert attempts == (3, 0)
+        assert scalar('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == 3
+
+    def test_bonus_attempts_are_spent_first(self, workdir):
+        with models.db_lock:
+            conn = models.get_db_connection()
+            conn.execute('INSERT INTO bonus_attempts (user_id, attempts) VALUES (?, 2)', (TG_ID,))
+            conn.commit()
+            conn.close()
+
+        async def scenario():
+            return [models.play_slot_spin(TG_ID, 1, lose)['bonus_attempts'] for _ in range(3)]
+
+        assert run_with_journal(workdir, scenario) == [1, 0, 0]
+        assert models.get_slot_attempts(TG_ID) == (1, 0)
+
+    def test_activity_read_your_writes(self, workdir):
+        today = datetime.date.today().isoformat()
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        models.mark_activity(TG_ID, yesterday)
+
+        async def scenario():
+            models.mark_activity(TG_ID, today, "daily")
+            models.mark_activity(TG_ID, today, "daily")
+            return (models.get_user_activity(TG_ID, today), models.get_user_activity(TG_ID)[0][2],
+                    models.get_user_activity_streak(TG_ID), models.get_streaks_for_all_users(),
+                    scalar('SELECT COUNT(*) FROM activity_calendar'))
+
+        rows, latest, streak, streaks, written = run_with_journal(workdir, scenario)
+
+        assert len(rows) == 1 and rows[0][2] == today and latest == today
+        assert streak == 2 and streaks == {TG_ID: 2}
+        assert written == 1
+        assert scalar('SELECT COUNT(*) FROM activity_calendar') == 2
+
+    def test_win_flushes_queue_first(self, workdir):
+        async def scenario():
+            models.play_slot_spin(TG_ID, 10, lose)
+            result = models.play_slot_spin(TG_ID, 10, win(25))
+            return result, journal.stats()['pending']
+
+        result, pending = run_with_journal(workdir, scenario)
+
+        assert result['win_id'] is not None and result['attempts_used'] == 2 and pending == 0
+        assert models.get_user_profile(TG_ID)['balance'] == 25
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 2
+
+
+class TestReplay:
+    def test_events_survive_crash(self, workdir):
+        async def scenario():
+            for _ in range(3):
+                models.play_slot_spin(TG_ID, 10, lose)
+            models.mark_activity(TG_ID, datetime.date.today().isoformat())
+            crash()
+
+        run_with_journal(workdir, scenario)
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 0
+
+        async def restart():
+            return journal.stats()['replayed']
+
+        replayed = journal.replayed
+        assert run_with_journal(workdir, restart) - replayed == 4
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 3
+        assert scalar('SELECT COUNT(*) FROM activity_calendar') == 1
+        assert models.get_slot_attempts(TG_ID) == (3, 0)
+
+    def test_applied_events_are_not_replayed(self, workdir):
+        path = os.path.join(workdir, 'write_journal.log')
+
+        async def scenario():
+            for _ in range(3):
+                models.play_slot_spin(TG_ID, 10, lose)
+            with open(path, encoding='utf-8') as f:
+                lines = f.read()
+            journal.flush()
+            # Падение после коммита пачки, но до обрезки файла
+            crash()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(lines + '{"seq": 1000000, "kind": "slot_sp')
+
+        run_with_journal(workdir, scenario)
+        last_seq = scalar('SELECT last_seq FROM journal_state')
+
+        async def restart():
+            models.play_slot_spin(TG_ID, 10, lose)
+            journal.flush()
+
+        run_with_journal(workdir, restart)
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 4
+        assert scalar('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == 4
+        assert scalar('SELECT last_seq FROM journal_state') == last_seq + 1
+
+
+class TestCrossMidnight:
+    def test_yesterdays_spin_keeps_todays_attempts(self, workdir):
+        today = datetime.date.today().isoformat()
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+
+        async def scenario():
+            models.play_slot_spin(TG_ID, 10, lose)
+            # Спин из журнала, записанного до сброса, доходит до БД после сегодняшних
+            pending = journal.pending('slot_spin', TG_ID)[0]
+            pending['date'] = yesterday
+            for _ in range(3):
+                models.play_slot_spin(TG_ID, 10, lose)
+            journal._pending.remove(pending)
+            journal.flush()
+            journal._pending.append(pending)
+            journal.flush()
+
+        run_with_journal(workdir, scenario)
+
+        assert scalar('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == 3
+        assert scalar('SELECT last_reset FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == today
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 4
+
+
+class TestFailures:
+    def test_failing_event_is_set_aside(self, workdir, monkeypatch):
+        def broken(cursor, event):
+            raise ValueError("сломанное событие")
+
+        monkeypatch.setitem(journal._appliers, 'broken', broken)
+
+        async def scenario():
+            models.play_slot_spin(TG_ID, 10, lose)
+            bad = journal.append('broken', tg_id=TG_ID)
+            models.play_slot_spin(TG_ID, 10, lose)
+            assert journal.flush() == 3
+            # Отложенное событие не повторяется
+            assert journal.flush() == 0
+            return bad, journal.stats()
+
+        bad, stats = run_with_journal(workdir, scenario)
+
+        assert stats['pending'] == 0 and stats['rejected'] >= 1
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 2
+        assert scalar('SELECT attempts_used FROM roulette_attempts WHERE user_id = ?', (TG_ID,)) == 2
+        assert scalar('SELECT last_seq FROM journal_state') == bad['seq'] + 1
+        with open(os.path.join(workdir, 'write_journal.log.rejected'), encoding='utf-8') as f:
+            rejected = [json.loads(line) for line in f]
+        assert [event['seq'] for event in rejected] == [bad['seq']]
+        assert 'сломанное событие' in rejected[0]['error']
+
+    def test_queue_is_capped(self, workdir, monkeypatch):
+        monkeypatch.setattr(journal, 'flush_interval', 60)
+        monkeypatch.setattr(journal, 'max_pending', 5)
+
+        async def scenario():
+            sizes = []
+            for _ in range(12):
+                models.play_slot_spin(TG_ID, 20, lose)
+                sizes.append(journal.stats()['pending'])
+            return sizes
+
+        assert max(run_with_journal(workdir, scenario)) == 5
+        assert scalar('SELECT COUNT(*) FROM slot_machine') == 12
+
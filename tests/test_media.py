@@ -0,0 +1,179 @@
+"""
+Тесты реестра file_id картинок: загрузка по хэшу, подмена URL в запросах, сброс file_id
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto, SendMessage
+from aiogram.methods.base import Response
+from aiogram.types import Chat, Message, PhotoSize
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import media as db
+from app.database import models
+from app.database.pool import configure_pool
+from app.utils import media
+from app.utils.coordination import coordinator
+from app.utils.media import MediaRegistry, MediaRequestMiddleware
+
+URL = 'https://example.com/menu.jpeg'
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=2)
+    models.init_db()
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+@pytest.fixture
+def content(monkeypatch):
+    """Содержимое «удалённых» картинок: url -> bytes, без сети"""
+    files = {URL: b'picture-v1'}
+
+    async def fake_download(session, url):
+        if url not in files:
+            raise OSError("404")
+        return files[url]
+
+    monkeypatch.setattr(media, '_download', fake_download)
+    return files
+
+
+class FakeBot:
+    def __init__(self):
+        self.uploads = []
+        self.deleted = []
+
+    async def send_photo(self, chat_id, photo, disable_notification=None):
+        self.uploads.append((chat_id, photo.data))
+        file_id = f"file-{len(self.uploads)}"
+        return SimpleNamespace(message_id=len(self.uploads), photo=[SimpleNamespace(file_id=file_id)])
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+def photo_message(file_id):
+    return Message(message_id=1, date=datetime.datetime.now(), chat=Chat(id=1, type='private'),
+                   photo=[PhotoSize(file_id=file_id, file_unique_id='u', width=1, height=1)])
+
+
+class TestResolve:
+    def test_uploads_once_per_content(self, temp_db, content):
+        """Та же картинка не загружается повторно, изменённая по тому же URL — загружается"""
+        bot = FakeBot()
+
+        async def scenario():
+            registry = MediaRegistry(upload_chat_id=42)
+            first = await registry.resolve(bot, URL)
+            again = await MediaRegistry(upload_chat_id=42).resolve(bot, URL)
+            content[URL] = b'picture-v2'
+            changed = await registry.resolve(bot, URL)
+            return first, again, changed, registry.file_id_for(URL)
+        first, again, changed, current = asyncio.run(scenario())
+
+        assert first == again == 'file-1'
+        assert changed == current == 'file-2'
+        assert [data for _, data in bot.uploads] == [b'picture-v1', b'picture-v2']
+        assert bot.deleted == [1, 2]
+
+    def test_download_failure_keeps_known_file_id(self, temp_db, content):
+        """imgur недоступен — используем последний сохранённый file_id"""
+        db.save_media_file('https://example.com/down.jpeg', 'abc', 'old-file')
+        registry = MediaRegistry(upload_chat_id=42)
+        registry.load()
+
+        assert asyncio.run(registry.resolve(FakeBot(), 'https://example.com/down.jpeg')) == 'old-file'
+
+    def test_prewarm(self, temp_db, content):
+        content['https://example.com/2.jpeg'] = b'other'
+        registry = MediaRegistry(upload_chat_id=42)
+        resolved = asyncio.run(registry.prewarm(FakeBot(), [URL, 'https://example.com/2.jpeg',
+                                                            'https://example.com/missing.jpeg']))
+        assert resolved == 2
+
+    def test_prewarm_needs_upload_chat(self, temp_db, content):
+        bot = FakeBot()
+        assert asyncio.run(MediaRegistry(upload_chat_id=None).prewarm(bot, [URL])) == 0
+        assert bot.uploads == []
+
+    def test_prewarm_runs_in_one_process(self, temp_db, content):
+        """Пока другой процесс загружает картинки, этот их не трогает"""
+        bot = FakeBot()
+
+        async def scenario():
+            async with coordinator.lock('media_prewarm'):
+                return await MediaRegistry(upload_chat_id=42).prewarm(bot, [URL])
+
+        assert asyncio.run(scenario()) == 0
+        assert bot.uploads == []
+
+
+class TestMiddleware:
+    def _call(self, registry, method, fail_file_ids=()):
+        sent = []
+
+        async def make_request(bot, m):
+            photo = m.photo if isinstance(m, SendPhoto) else None
+            sent.append(photo)
+            if photo in fail_file_ids:
+                raise TelegramBadRequest(method=m, message="Bad Request: wrong file identifier/HTTP URL specified")
+            file_id = photo if photo and not media.is_url(photo) else 'captured-id'
+            return Response(ok=True, result=photo_message(file_id))
+
+        async def scenario():
+            response = await MediaRequestMiddleware(registry)(make_request, None, method)
+            # фоновое сохранение хэша
+            await asyncio.sleep(0)
+            await asyncio.gather(*list(media._background))
+            return response
+        return asyncio.run(scenario()), sent
+
+    def test_substitutes_known_file_id(self, temp_db, content):
+        registry = MediaRegistry()
+        registry._file_ids[URL] = 'known-id'
+        _, sent = self._call(registry, SendPhoto(chat_id=1, photo=URL))
+        assert sent == ['known-id']
+        assert registry.stats()['hits'] == 1
+
+    def test_captures_file_id_from_url_send(self, temp_db, content):
+        registry = MediaRegistry()
+        _, sent = self._call(registry, SendPhoto(chat_id=1, photo=URL))
+        assert sent == [URL]
+        assert registry.file_id_for(URL) == 'captured-id'
+        # file_id сохранён в БД вместе с хэшем содержимого
+        assert db.get_latest_media_file_ids() == {URL: 'captured-id'}
+
+    def test_rejected_file_id_falls_back_to_url(self, temp_db, content):
+        registry = MediaRegistry()
+        registry._file_ids[URL] = 'stale-id'
+        _, sent = self._call(registry, SendPhoto(chat_id=1, photo=URL), fail_file_ids={'stale-id'})
+        assert sent == ['stale-id', URL]
+        assert registry.file_id_for(URL) == 'captured-id'
+        assert registry.stats()['invalidated'] == 1
+
+    def test_other_methods_untouched(self, temp_db, content):
+        registry = MediaRegistry()
+        calls = []
+
+        async def make_request(bot, m):
+            calls.append(m)
+            return Response(ok=True, result=True)
+
+        asyncio.run(MediaRequestMiddleware(registry)(make_request, None, SendMessage(chat_id=1, text="hi")))
+        assert len(calls) == 1
+        assert registry.stats()['misses'] == 0
@@ -0,0 +1,111 @@
+"""
+Тесты скомпилированной таблицы выплат слот-машины
+"""
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.pool import configure_pool
+from app.utils.paytable import Paytable, SLOT_EMOJIS, dice_reels
+
+CONFIGS = [
+    (1, '🍒🍒🍒', 'money', 5, 20.0, '🍒', 'Вишни'),
+    (2, '🍋🍋🍋', 'money', 10, 15.0, '🍋', 'Лимон'),
+    (3, '🍇🍇🍇', 'stars', 13, 5.0, '🍇', 'Виноград'),
+    (4, '7️⃣7️⃣7️⃣', 'stars', 100, 0.05, '7️⃣', 'Счастливая семерка'),
+]
+
+
+class TestPaytable:
+    """Тесты Paytable"""
+
+    def test_distribution_matches_chances(self):
+        """Частоты выигрышей соответствуют chance_percent"""
+        paytable = Paytable(CONFIGS)
+        rng = random.Random(42)
+        spins = 100000
+        counter = Counter(''.join(paytable.spin(rng)[0]) for _ in range(spins))
+        for config in CONFIGS:
+            actual = counter[config[1]] / spins * 100
+            assert abs(actual - config[4]) < max(0.5, config[4] * 0.05), config[6]
+        losses = spins - sum(counter[c[1]] for c in CONFIGS)
+        assert abs(losses / spins * 100 - (100 - paytable.total_chance)) < 1
+
+    def test_dice_matches_animation(self):
+        """Результат кубика 🎰 — та тройка, которую показывает клиент Telegram"""
+        paytable = Paytable(CONFIGS)
+        assert dice_reels(1) == ('BAR', 'BAR', 'BAR')
+        assert dice_reels(22) == ('🍇', '🍇', '🍇')
+        assert dice_reels(2) == ('🍇', 'BAR', 'BAR')
+        assert paytable.spin_dice(64) == (('7️⃣', '7️⃣', '7️⃣'), CONFIGS[3])
+        assert paytable.spin_dice(43) == (('🍋', '🍋', '🍋'), CONFIGS[1])
+        # Разные барабаны — проигрыш
+        assert paytable.spin_dice(63) == (('🍋', '7️⃣', '7️⃣'), None)
+        # BAR в таблице нет — три BAR тоже проигрыш
+        assert paytable.spin_dice(1)[1] is None
+        assert sum(paytable.spin_dice(value)[1] is not None for value in range(1, 65)) == 3
+        with pytest.raises(ValueError):
+            paytable.spin_dice(65)
+
+    def test_losing_triples_are_not_wins(self):
+        """Проигрышные тройки не пересекаются с выигрышными комбинациями"""
+        paytable = Paytable(CONFIGS)
+        assert len(paytable.losing_triples) == len(SLOT_EMOJIS) ** 3 - len(CONFIGS)
+        assert all(paytable.lookup(*triple) is None for triple in paytable.losing_triples)
+
+    def test_lookup(self):
+        """Выигрыш находится по тройке эмодзи и по точной комбинации"""
+        configs = CONFIGS + [(5, '🍒🍋🍇', 'money', 1, 0.1, '💎', 'Фруктовый салат')]
+        paytable = Paytable(configs)
+        assert paytable.lookup('🍒', '🍒', '🍒')[6] == 'Вишни'
+        assert paytable.lookup('🍒', '🍋', '🍇')[6] == 'Фруктовый салат'
+        assert paytable.lookup('💎', '💎', '💎')[6] == 'Фруктовый салат'
+        assert paytable.lookup('🍒', '🍋', '🍊') is None
+
+    def test_earlier_config_wins_on_conflict(self):
+        """При совпадении побеждает конфигурация, стоящая раньше (как при переборе)"""
+        configs = [(1, '', 'money', 5, 1.0, '🍒', 'Первая'), (2, '🍒🍒🍒', 'stars', 50, 0.5, '🍒', 'Вторая')]
+        assert Paytable(configs).lookup('🍒', '🍒', '🍒')[6] == 'Первая'
+
+    def test_empty_configs(self):
+        """Без конфигураций спин всегда проигрышный"""
+        triple, config = Paytable([]).spin(random.Random(1))
+        assert config is None and len(triple) == 3
+
+
+class TestPaytableRebuild:
+    """Пересборка таблицы только после изменения slot_config"""
+
+    @pytest.fixture
+    def temp_db(self):
+        db_fd, path = tempfile.mkstemp()
+        os.close(db_fd)
+        configure_pool(path, readers=1)
+        models.init_db()
+        yield path
+        configure_pool()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+    def test_rebuilt_on_add_and_delete(self, temp_db):
+        from app.utils.slot_machine import get_paytable
+
+        first = get_paytable()
+        assert get_paytable() is first
+
+        models.add_slot_config('🍒🍋🍊', 'money', 1, 0.5, '🍒', 'Микс')
+        second = get_paytable()
+        assert second is not first
+        config = second.lookup('🍒', '🍋', '🍊')
+        assert config[6] == 'Микс'
+
+        models.delete_slot_config(config[0])
+        assert get_paytable().lookup('🍒', '🍋', '🍊') is None
@@ -0,0 +1,150 @@
+"""
+Тесты курсов криптовалют: кэш по источникам, stale-while-revalidate, объединение запросов
+"""
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.prices import BinanceSource, CbrSource, PriceOracle, PriceSource, PriceUnavailable
+from benchmarks.fake_price_api import FakePriceAPI
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(scenario, latency=0.0, **oracle_kwargs):
+    """scenario(api, oracle, clock) на локальной заглушке источников"""
+    async def wrapper():
+        api = FakePriceAPI(prices={'TON': 5.0, 'NOT': 0.01}, usd_rub=90.0, latency=latency)
+        await api.start()
+        clock = Clock()
+        oracle = PriceOracle(BinanceSource(api.base_url, ttl=30, max_stale=600),
+                             CbrSource(api.cbr_url, ttl=3600, max_stale=86400),
+                             symbols=['TON', 'NOT'], clock=clock, **oracle_kwargs)
+        try:
+            return await scenario(api, oracle, clock)
+        finally:
+            await oracle.close()
+            await api.stop()
+    return asyncio.run(wrapper())
+
+
+class TestPriceOracle:
+    def test_price_and_concurrent_sources(self):
+        async def scenario(api, oracle, clock):
+            started = time.monotonic()
+            price = await oracle.rub_price('ton')
+            return price, time.monotonic() - started, dict(api.calls)
+
+        price, elapsed, calls = run(scenario, latency=0.15)
+
+        assert price == pytest.approx(450.0)
+        # Binance и ЦБ запрашиваются параллельно, а не 0.3 с подряд
+        assert elapsed < 0.28
+        assert calls == {'binance:TONUSDT': 1, 'cbr': 1}
+
+    def test_each_source_has_its_own_ttl(self):
+        async def scenario(api, oracle, clock):
+            await oracle.rub_price('TON')
+            await oracle.rub_price('TON')
+            assert dict(api.calls) == {'binance:TONUSDT': 1, 'cbr': 1}
+            # Цена биржи устарела, курс ЦБ — нет
+            clock.now += 60
+            await oracle.rub_price('TON')
+            await asyncio.sleep(0.05)
+            return dict(api.calls)
+
+        assert run(scenario) == {'binance:TONUSDT': 2, 'cbr': 1}
+
+    def test_stale_is_served_while_revalidating(self):
+        async def scenario(api, oracle, clock):
+            await oracle.rub_price('TON')
+            api.prices['TON'] = 6.0
+            clock.now += 60
+            started = time.monotonic()
+            stale = await oracle.rub_price('TON')
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(0.3)
+            return stale, elapsed, await oracle.rub_price('TON'), oracle.stats()
+
+        stale, elapsed, fresh, stats = run(scenario, latency=0.1)
+
+        assert stale == pytest.approx(450.0) and elapsed < 0.05
+        assert fresh == pytest.approx(540.0)
+        assert stats['stale_hits'] == 1
+
+    def test_last_good_price_survives_source_outage(self):
+        async def scenario(api, oracle, clock):
+            await oracle.rub_price('TON')
+            api.failing.add('binance')
+            clock.now += 120
+            served = await oracle.rub_price('TON')
+            await asyncio.sleep(0.05)
+            clock.now += 600
+            with pytest.raises(PriceUnavailable):
+                await oracle.rub_price('TON')
+            return served, oracle.stats()['errors']
+
+        served, errors = run(scenario)
+
+        assert served == pytest.approx(450.0)
+        assert errors == 2
+
+    def test_no_price_at_all(self):
+        async def scenario(api, oracle, clock):
+            api.failing.add('cbr')
+            with pytest.raises(PriceUnavailable):
+                await oracle.rub_price('TON')
+            with pytest.raises(PriceUnavailable):
+                await oracle.rub_price('BTC')
+
+        run(scenario)
+
+    def test_concurrent_requests_are_coalesced(self):
+        async def scenario(api, oracle, clock):
+            prices = await asyncio.gather(*(oracle.rub_price('TON') for _ in range(20)))
+            return prices, dict(api.calls)
+
+        prices, calls = run(scenario, latency=0.05)
+
+        assert prices == [pytest.approx(450.0)] * 20
+        assert calls == {'binance:TONUSDT': 1, 'cbr': 1}
+
+    def test_refresher_keeps_cache_warm(self):
+        async def scenario(api, oracle, clock):
+            await oracle.refresh_due()
+            assert dict(api.calls) == {'binance:TONUSDT': 1, 'binance:NOTUSDT': 1, 'cbr': 1}
+            clock.now += 15
+            await oracle.refresh_due()
+            calls = dict(api.calls)
+            await oracle.rub_price('NOT')
+            return calls, oracle.stats()
+
+        calls, stats = run(scenario, refresh_interval=20)
+
+        # Цены биржи обновлены до истечения TTL, курс ЦБ ещё свежий
+        assert calls == {'binance:TONUSDT': 2, 'binance:NOTUSDT': 2, 'cbr': 1}
+        assert stats['hits'] == 2 and stats['misses'] == 0
+
+    def test_pluggable_source(self):
+        class FixedRate(PriceSource):
+            name = "fixed"
+
+            async def fetch(self, session, key):
+                return 100.0
+
+        async def scenario(api, oracle, clock):
+            oracle.fiat = FixedRate(ttl=60, max_stale=60)
+            return await oracle.rub_price('NOT')
+
+        assert run(scenario) == pytest.approx(1.0)
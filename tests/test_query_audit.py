@@ -0,0 +1,222 @@
+"""
+Тесты миграции индексов и аудита планов запросов
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.migrations import MIGRATIONS, get_schema_version
+from app.database.pool import configure_pool
+from app.database.query_audit import audit, collect_statements, explain, format_report
+from app.config import QUERY_AUDIT_MIN_ROWS
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=1)
+    models.init_db()
+    # Колонку content в reviews добавляет миграция, которую бот вызывает при работе с отзывами
+    models.migrate_reviews_table()
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestIndexMigration:
+    """Тесты версионированной миграции индексов"""
+
+    def test_indexes_created_and_version_set(self, db_path):
+        """После init_db версия схемы последняя, индексы на месте"""
+        conn = sqlite3.connect(db_path)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        version = get_schema_version(conn)
+        conn.close()
+        assert version == MIGRATIONS[-1][0]
+        assert {'idx_users_referrer_id', 'idx_slot_machine_user_status_created',
+                'idx_activity_calendar_user_date_type', 'idx_orders_status_created',
+                'idx_withdrawals_status', 'idx_support_tickets_status'} <= indexes
+
+    def test_init_db_is_idempotent(self, db_path):
+        """Повторный init_db не применяет миграции заново"""
+        models.init_db()
+        conn = sqlite3.connect(db_path)
+        assert get_schema_version(conn) == MIGRATIONS[-1][0]
+        conn.close()
+
+
+class TestQueryAudit:
+    """Тесты аудита EXPLAIN QUERY PLAN"""
+
+    def test_collects_statements_with_functions(self):
+        """Запросы находятся вместе с именем функции"""
+        functions = {s.function for s in collect_statements()}
+        assert {'get_referrals_count', 'get_slot_wins', 'mark_activity'} <= functions
+
+    def test_fstring_queries_rendered(self, db_path):
+        """SQL из f-строк собирается целиком, каждый вариант подстановки — отдельный запрос"""
+        statements = collect_statements()
+        assert [s for s in statements if s.error] == []
+        functions = {s.function for s in statements}
+        assert {'get_users_page', 'search_users', 'get_orders_page', 'update_review_status',
+                'update_order_status', '_archived_slot_wins'} <= functions
+        orders = [s.sql for s in statements if s.function == 'get_orders_page']
+        assert any('FROM orders  ORDER BY id DESC' in sql for sql in orders)
+        assert any('WHERE status = ? AND id < ? ORDER BY id DESC' in sql for sql in orders)
+        conn = sqlite3.connect(db_path)
+        for statement in statements:
+            if statement.function in ('get_users_page', 'search_users', 'get_orders_page'):
+                assert explain(conn, statement.sql)
+        conn.close()
+
+    def test_unrendered_fstring_is_skipped(self, tmp_path):
+        """f-строка с неизвестным выражением не проходит аудит молча"""
+        source = tmp_path / 'models.py'
+        source.write_text("def f(table):\n    return f'SELECT * FROM {table} WHERE id = ?'\n", encoding='utf-8')
+        statements = collect_statements(source)
+        assert len(statements) == 1 and statements[0].error
+
+        conn = sqlite3.connect(':memory:')
+        report = audit(conn, min_rows=-1, statements=statements)
+        conn.close()
+        assert report['checked'] == 0
+        assert [s.function for s, _ in report['skipped']] == ['f']
+
+    def test_no_full_scans_after_migration(self, db_path):
+        """После миграции ни один запрос не просматривает таблицы целиком (кроме допустимых)"""
+        conn = sqlite3.connect(db_path)
+        report = audit(conn, min_rows=-1)
+        conn.close()
+        assert report['checked'] > 100
+        # order_status_counts — строка на статус, см. test_order_queries_on_large_table
+        violations = {(s.function, table) for s, table, _, _ in report['violations']}
+        assert violations <= {('get_order_status_counts', 'order_status_counts')}, format_report(report, -1)
+        # Пропуск допустим только для ошибок из проверенных списков
+        assert report['skipped'] == [], format_report(report, -1)
+
+    def test_full_scan_detected_without_index(self, db_path):
+        """Без индекса по referrer_id запрос подсчёта рефералов помечается"""
+        conn = sqlite3.connect(db_path)
+        conn.execute('DROP INDEX idx_users_referrer_id')
+        conn.executemany('INSERT INTO users (tg_id, full_name, username, reg_date) VALUES (?, ?, ?, ?)',
+                         [(i, f'User {i}', f'user{i}', '2025-01-01') for i in range(10)])
+        conn.commit()
+        statements = [s for s in collect_statements() if s.function == 'get_referrals_count']
+
+        report = audit(conn, min_rows=5, statements=statements)
+        assert [table for _, table, _, _ in report['violations']] == ['users']
+
+        report = audit(conn, min_rows=100, statements=statements)
+        assert report['violations'] == []
+        conn.close()
+
+
+def _insert_orders(path, count):
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO orders (user_id, order_type, amount, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                     [(i % 50, ('stars', 'ton')[i % 2], 100, ('pending', 'completed', 'rejected')[i % 3],
+                       f'2025-01-{i % 28 + 1:02d} 12:00:00') for i in range(count)])
+    conn.commit()
+    conn.close()
+
+
+def _vm_steps(conn, sql, params):
+    """Число шагов виртуальной машины SQLite на выполнение запроса (схема уже прочитана)"""
+    conn.execute(sql, params).fetchall()
+    steps = [0]
+
+    def count():
+        steps[0] += 1
+        return 0
+
+    conn.set_progress_handler(count, 1)
+    conn.execute(sql, params).fetchall()
+    conn.set_progress_handler(None, 1)
+    return steps[0]
+
+
+class TestOrderQueryPlans:
+    """Планы запросов очереди заявок на большой таблице"""
+
+    def test_order_queries_on_large_table(self, db_path):
+        """Фильтры очереди идут по индексам, счётчики статусов не растут с числом заявок"""
+        _insert_orders(db_path, 3000)
+        statements = [s for s in collect_statements()
+                      if s.function in ('get_orders_page', 'get_order_status_counts')]
+        conn = sqlite3.connect(db_path)
+        report = audit(conn, min_rows=QUERY_AUDIT_MIN_ROWS, statements=statements)
+        status_rows = conn.execute('SELECT COUNT(*) FROM order_status_counts').fetchone()[0]
+        date_plan = next(explain(conn, s.sql) for s in statements if 'WHERE created_at >= ?' in s.sql)
+        conn.close()
+
+        assert report['violations'] == [] and report['allowed'] == [], format_report(report, QUERY_AUDIT_MIN_ROWS)
+        assert status_rows == 3
+        assert any('idx_orders_created' in detail for detail in date_plan)
+        # Без фильтров — просмотр по id с LIMIT
+        assert {s.function for s, _, _, _ in report['bounded']} == {'get_orders_page'}
+
+    def test_unfiltered_orders_page_reads_limit_rows(self, db_path):
+        """Страница без фильтров стоит одинаково на 100 и на 5000 заявках"""
+        sql = next(s.sql for s in collect_statements()
+                   if s.function == 'get_orders_page' and 'FROM orders  ORDER BY id DESC' in s.sql)
+        _insert_orders(db_path, 100)
+        conn = sqlite3.connect(db_path)
+        small = _vm_steps(conn, sql, (5,))
+        conn.close()
+
+        _insert_orders(db_path, 4900)
+        conn = sqlite3.connect(db_path)
+        large = _vm_steps(conn, sql, (5,))
+        conn.close()
+        assert large <= small * 1.5
+
+
+class TestUserQueryPlans:
+    """Планы запросов базы пользователей в админке"""
+
+    def _insert_users(self, path, start, count):
+        conn = sqlite3.connect(path)
+        conn.executemany('INSERT INTO users (tg_id, full_name, username, reg_date) VALUES (?, ?, ?, ?)',
+                         [(i, f'User {i}', f'user{i}', '2025-01-01') for i in range(start, start + count)])
+        conn.commit()
+        conn.close()
+
+    def test_users_count_maintained_by_triggers(self, db_path):
+        """users_count совпадает с COUNT(*) после вставок и удалений в обход models"""
+        self._insert_users(db_path, 1, 30)
+        conn = sqlite3.connect(db_path)
+        conn.execute('DELETE FROM users WHERE tg_id <= 10')
+        conn.commit()
+        plan = explain(conn, next(s.sql for s in collect_statements() if s.function == 'count_users'))
+        conn.close()
+
+        assert models.count_users(max_age=0) == 20
+        assert plan == ['SEARCH users_count USING INTEGER PRIMARY KEY (rowid=?)']
+
+    def test_user_id_at_cost_depends_on_position(self, db_path):
+        """Переход к странице проходит индекс до позиции, а не всю таблицу"""
+        sql = next(s.sql for s in collect_statements() if s.function == 'get_user_id_at')
+        self._insert_users(db_path, 1, 100)
+        conn = sqlite3.connect(db_path)
+        plan = explain(conn, sql)
+        small = _vm_steps(conn, sql, (10,))
+        conn.close()
+
+        self._insert_users(db_path, 101, 4900)
+        conn = sqlite3.connect(db_path)
+        large = _vm_steps(conn, sql, (10,))
+        far = _vm_steps(conn, sql, (4000,))
+        conn.close()
+        assert plan == ['SCAN users USING COVERING INDEX idx_users_id']
+        assert large <= small * 1.5
+        assert far > large
+        assert models.get_user_id_at(10) == 11
@@ -0,0 +1,207 @@
+"""
+Тесты хранения истории спинов: дневные итоги проигрышей, архив по месяцам, чтение через архив
+"""
+import asyncio
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models, retention
+from app.database.pool import configure_pool
+
+TG_ID = 777
+NOW = datetime.datetime.now()
+
+
+def days_ago(days, hour=12):
+    return (NOW - datetime.timedelta(days=days)).replace(hour=hour).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def add_spin(created_at, is_win=False, reward_type="none", amount=0, status="pending", tg_id=TG_ID):
+    with models.db_lock:
+        conn = models.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO slot_machine (user_id, combination, reward_type, reward_amount, is_win, status, created_at)
+                          VALUES ((SELECT id FROM users WHERE tg_id = ?), '🍒🍋🍊', ?, ?, ?, ?, ?)''',
+                       (tg_id, reward_type, amount, is_win, status, created_at))
+        conn.commit()
+        conn.close()
+        return cursor.lastrowid
+
+
+def live_count():
+    conn = models.get_read_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM slot_machine').fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def workdir(monkeypatch):
+    path = tempfile.mkdtemp()
+    # get_slot_wins_async открывает data/users.db относительно текущего каталога
+    os.makedirs(os.path.join(path, 'data'))
+    monkeypatch.chdir(path)
+    configure_pool(os.path.join(path, 'data', 'users.db'), readers=2)
+    models.init_db()
+    models.get_or_create_user(TG_ID, "Retention", "retention", "2025-01-01")
+    monkeypatch.setattr(retention, 'SLOT_ARCHIVE_DIR', os.path.join(path, 'archive'))
+    yield path
+    configure_pool()
+    shutil.rmtree(path)
+
+
+class TestRollup:
+    def test_old_losses_become_daily_totals(self, workdir):
+        for _ in range(3):
+            add_spin(days_ago(40))
+        add_spin(days_ago(41))
+        add_spin(days_ago(5))
+        add_spin(days_ago(40), is_win=True, reward_type="money", amount=10, status="completed")
+
+        assert retention.rollup_losses(days=30, batch=2) == 4
+
+        conn = models.get_read_connection()
+        try:
+            totals = conn.execute('SELECT day, losses FROM slot_daily_stats ORDER BY day').fetchall()
+        finally:
+            conn.close()
+        assert totals == [(days_ago(41)[:10], 1), (days_ago(40)[:10], 3)]
+        assert live_count() == 2
+
+    def test_daily_stats_combine_live_rolled_up_and_archived(self, workdir):
+        for _ in range(2):
+            add_spin(days_ago(20))
+        add_spin(days_ago(20), is_win=True, reward_type="money", amount=5, status="completed")
+        add_spin(days_ago(1))
+
+        retention.rollup_losses(days=10)
+        retention.archive_rows(days=10)
+
+        assert live_count() == 1
+        assert models.get_slot_daily_stats(TG_ID, days=30) == [(days_ago(1)[:10], 1, 0), (days_ago(20)[:10], 3, 1)]
+
+
+class TestArchive:
+    def test_rows_move_to_monthly_files(self, workdir):
+        old_win = add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed")
+        older_win = add_spin(days_ago(200), is_win=True, reward_type="money", amount=5, status="completed")
+        waiting = add_spin(days_ago(150), is_win=True, reward_type="ton", amount=1, status="pending")
+        recent = add_spin(days_ago(3), is_win=True, reward_type="money", amount=5, status="completed")
+
+        assert retention.archive_rows(days=90, batch=1) == 2
+
+        months = {os.path.basename(path) for path in retention.archive_files()}
+        assert months == {f"slot_machine_{days_ago(120)[:7]}.db", f"slot_machine_{days_ago(200)[:7]}.db"}
+        conn = models.get_read_connection()
+        try:
+            live = {row[0] for row in conn.execute('SELECT id FROM slot_machine')}
+        finally:
+            conn.close()
+        # Выигрыш, ждущий выплаты, остаётся в основной БД
+        assert live == {waiting, recent}
+        assert {row['id'] for row in retention.archived_slot_rows()} == {old_win, older_win}
+
+    def test_reads_include_archive(self, workdir):
+        old_win = add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed")
+        add_spin(days_ago(2), is_win=True, reward_type="money", amount=5, status="completed")
+        add_spin(days_ago(1), is_win=True, reward_type="ton", amount=1, status="pending")
+        retention.archive_rows(days=90)
+
+        history = asyncio.run(models.get_slot_wins_async(user_id=TG_ID))
+        assert [row[5] for row in history] == ["ton", "money", "stars"]
+        assert history[-1][2:4] == (TG_ID, "Retention")
+        assert [row[5] for row in models.get_slot_wins("completed")] == ["money", "stars"]
+        assert [row[5] for row in models.get_slot_wins("pending")] == ["ton"]
+        win = models.get_slot_win_by_id(old_win)
+        assert win[0] == old_win and win[5] == "stars" and win[9] == "completed"
+
+    def test_copy_left_by_crash_is_not_duplicated(self, workdir):
+        win_id = add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed")
+        retention.archive_rows(days=90)
+        # Падение между записью архива и удалением: строка в обоих местах
+        with models.db_lock:
+            conn = models.get_db_connection()
+            conn.execute('''INSERT INTO slot_machine (id, user_id, combination, reward_type, reward_amount, is_win, status, created_at)
+                            VALUES (?, (SELECT id FROM users WHERE tg_id = ?), '🍒🍋🍊', 'stars', 50, 1, 'completed', ?)''',
+                         (win_id, TG_ID, days_ago(120)))
+            conn.commit()
+            conn.close()
+
+        assert [row[0] for row in models.get_slot_wins("completed")] == [win_id]
+        assert retention.archive_rows(days=90) == 1
+        assert live_count() == 0 and len(retention.archived_slot_rows()) == 1
+
+    def test_user_delete_and_clear_reach_archive(self, workdir):
+        models.get_or_create_user(TG_ID + 1, "Other", "other", "2025-01-01")
+        add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed")
+        add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed", tg_id=TG_ID + 1)
+        retention.archive_rows(days=90)
+
+        models.delete_user_everywhere_full(TG_ID)
+        assert [row['user_id'] for row in retention.archived_slot_rows()] == \
+            [models.get_user_profile(TG_ID + 1)['id']]
+
+        models.clear_all_slot_data()
+        assert retention.archive_files() == []
+
+
+    def test_period_reads_open_only_needed_months(self, workdir, monkeypatch):
+        add_spin(days_ago(200), is_win=True, reward_type="money", amount=5, status="completed")
+        add_spin(days_ago(20), is_win=True, reward_type="money", amount=5, status="completed")
+        retention.archive_rows(days=10)
+        assert len(retention.archive_files()) == 2
+
+        opened = []
+        connect = retention.sqlite3.connect
+
+        def tracking_connect(target, *args, **kwargs):
+            opened.append(target)
+            return connect(target, *args, **kwargs)
+
+        monkeypatch.setattr(retention.sqlite3, 'connect', tracking_connect)
+        assert models.get_slot_daily_stats(TG_ID, days=30) == [(days_ago(20)[:10], 1, 1)]
+        assert len(opened) == 1 and f"slot_machine_{days_ago(20)[:7]}.db" in opened[0]
+
+    def test_archive_listing_cached_until_directory_changes(self, workdir, monkeypatch):
+        add_spin(days_ago(120), is_win=True, reward_type="stars", amount=50, status="completed")
+        retention.archive_rows(days=90)
+        directory = retention.SLOT_ARCHIVE_DIR
+        # Каталог изменён давно — листинг можно кэшировать
+        past = datetime.datetime(2025, 1, 1).timestamp()
+        os.utime(directory, (past, past))
+
+        scans = []
+        scan = retention.glob.glob
+        monkeypatch.setattr(retention.glob, 'glob', lambda pattern: scans.append(pattern) or scan(pattern))
+        first = retention.archive_files()
+        assert retention.archive_files() == first and len(scans) == 1
+
+        # Новый файл (в том числе от другого процесса) меняет mtime каталога
+        retention._open_archive(retention.archive_path('2000-01')).close()
+        assert len(retention.archive_files()) == 2 and len(scans) == 2
+
+
+class TestSchedule:
+    def test_retention_is_opt_in(self):
+        """По умолчанию проход не запускается: retention_loop сразу возвращается"""
+        assert retention.SLOT_RETENTION_INTERVAL == 0
+        assert asyncio.run(asyncio.wait_for(retention.retention_loop(), 1)) is None
+
+
+class TestCompact:
+    def test_vacuum_when_many_free_pages(self, workdir):
+        for _ in range(2000):
+            add_spin(days_ago(40))
+        retention.rollup_losses(days=30)
+
+        result = retention.compact(free_ratio=0.2)
+        assert result['vacuumed'] and result['free_pages'] > 0
+        assert retention.compact(free_ratio=0.2)['vacuumed'] is False
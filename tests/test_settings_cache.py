@@ -0,0 +1,111 @@
+"""
+Тесты кэша настроек админки
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.pool import configure_pool
+from app.database.settings_cache import settings_cache
+
+
+@pytest.fixture
+def db_path():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=2)
+    models.init_db()
+    interval = settings_cache.check_interval
+    yield path
+    settings_cache.check_interval = interval
+    settings_cache.invalidate()
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+class TestSettingsCache:
+    """Тесты кэша admin_settings"""
+
+    def test_single_load_for_many_reads(self, db_path):
+        """Все настройки читаются одним запросом, дальше — из памяти"""
+        settings_cache.check_interval = 60
+        settings_cache.invalidate()
+        before = models.get_settings_cache_stats()
+        for _ in range(10):
+            assert models.get_admin_setting('btn_profile') == '👤 Профиль'
+        assert models.get_admin_setting('no_such_key', 'x') == 'x'
+        after = models.get_settings_cache_stats()
+        assert after['reloads'] - before['reloads'] == 1
+        assert after['hits'] - before['hits'] == 10
+
+    def test_write_through(self, db_path):
+        """update_admin_setting и set_flag сразу видны без перечитывания таблицы"""
+        settings_cache.check_interval = 60
+        models.get_admin_setting('btn_profile')
+        reloads = models.get_settings_cache_stats()['reloads']
+
+        models.update_admin_setting('btn_profile', 'Профиль')
+        models.set_flag('ref_active', True)
+        models.update_admin_setting('stars_threshold', 2000)
+
+        assert models.get_admin_setting('btn_profile') == 'Профиль'
+        assert models.get_flag('ref_active') is True
+        assert models.get_admin_setting('stars_threshold') == '2000'
+        assert models.get_settings_cache_stats()['reloads'] == reloads
+
+    def test_external_write_detected_by_version(self, db_path):
+        """Изменение из другого процесса обнаруживается по счётчику версии"""
+        settings_cache.check_interval = 0
+        assert models.get_admin_setting('btn_about') == 'Описание 📝'
+
+        other = sqlite3.connect(db_path)
+        other.execute("UPDATE admin_settings SET value = 'О нас' WHERE key = 'btn_about'")
+        other.commit()
+        other.close()
+
+        assert models.get_admin_setting('btn_about') == 'О нас'
+
+    def test_unchanged_version_does_not_reload(self, db_path):
+        """Сверка версии без изменений не перечитывает таблицу"""
+        settings_cache.check_interval = 0
+        models.get_admin_setting('btn_about')
+        stats = models.get_settings_cache_stats()
+        models.get_admin_setting('btn_about')
+        after = models.get_settings_cache_stats()
+        assert after['reloads'] == stats['reloads']
+        assert after['version_checks'] == stats['version_checks'] + 1
+
+    def test_db_without_version_table(self):
+        """БД без migration 2: настройки читаются без кэша, как раньше"""
+        db_fd, path = tempfile.mkstemp()
+        os.close(db_fd)
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE admin_settings (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT INTO admin_settings (key, value) VALUES ('slot_reset_hour', '3')")
+        conn.commit()
+        conn.close()
+        configure_pool(path, readers=2)
+        settings_cache.invalidate()
+        try:
+            assert models.get_admin_setting('slot_reset_hour', '0') == '3'
+            assert models.get_admin_setting('missing', 'default') == 'default'
+            models.update_admin_setting('slot_reset_hour', '5')
+            assert models.get_admin_setting('slot_reset_hour', '0') == '5'
+            # Запись мимо бота видна сразу — кэша нет
+            conn = sqlite3.connect(path)
+            conn.execute("UPDATE admin_settings SET value = '7' WHERE key = 'slot_reset_hour'")
+            conn.commit()
+            conn.close()
+            assert models.get_admin_setting('slot_reset_hour', '0') == '7'
+        finally:
+            settings_cache.invalidate()
+            configure_pool()
+            os.unlink(path)
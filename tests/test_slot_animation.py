@@ -0,0 +1,100 @@
+"""
+Тесты анимации слот-машины: число запросов к Bot API, кадры, кубик 🎰, адаптивный режим
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.middlewares.api_rate import ApiRateMeter
+from app.utils.slot_animation import (
+    AdaptiveAnimation, DiceAnimation, FramesAnimation, SlotAnimation, get_slot_animation,
+)
+
+TRIPLE = ('🍇', '🍋', '7️⃣')
+
+
+class FakeMessage:
+    """Сообщение-заглушка: записывает вызовы Bot API в общий список"""
+
+    def __init__(self, calls, dice_value=None):
+        self.calls = calls
+        self.dice = SimpleNamespace(value=dice_value) if dice_value else None
+
+    async def answer(self, text, **kwargs):
+        self.calls.append(('sendMessage', text))
+        return FakeMessage(self.calls)
+
+    async def answer_dice(self, emoji):
+        self.calls.append(('sendDice', emoji))
+        return FakeMessage(self.calls, dice_value=42)
+
+    async def edit_text(self, text, **kwargs):
+        self.calls.append(('editMessageText', text))
+
+
+def run_spin(animation):
+    async def scenario():
+        calls = []
+        spin = await animation.begin(FakeMessage(calls))
+        await animation.reveal(spin, TRIPLE)
+        await animation.finish(spin, "итог")
+        return spin, calls
+    return asyncio.run(scenario())
+
+
+class TestAnimations:
+    def test_frames_reveal_result_reel_by_reel(self):
+        spin, calls = run_spin(FramesAnimation(frames=3, delay=0))
+
+        assert [method for method, _ in calls] == ['sendMessage', 'editMessageText', 'editMessageText',
+                                                   'editMessageText']
+        assert calls[-1][1] == "итог"
+        # Кадр 2 — остановлен первый барабан, кадр 3 — два первых
+        assert '🍇' in calls[1][1] and '(2/3)' in calls[1][1]
+        assert all(symbol in calls[2][1] for symbol in TRIPLE[:2]) and '(3/3)' in calls[2][1]
+
+    def test_single_frame(self):
+        spin, calls = run_spin(SlotAnimation())
+        assert [method for method, _ in calls] == ['sendMessage', 'editMessageText']
+
+    def test_dice(self):
+        spin, calls = run_spin(DiceAnimation(duration=0))
+
+        assert spin.dice_value == 42
+        assert calls == [('sendDice', '🎰'), ('sendMessage', 'итог')]
+
+    def test_adaptive_frames_follow_api_rate(self):
+        meter = ApiRateMeter(window=5)
+        animation = AdaptiveAnimation(frames=3, delay=0, rate_limit=20, meter=meter)
+        assert animation.frame_count() == 3
+
+        for _ in range(50):  # 10 запросов/с — половина лимита
+            meter.hit()
+        assert animation.frame_count() == 2
+
+        for _ in range(100):
+            meter.hit()
+        assert animation.frame_count() == 1
+        spin, calls = run_spin(animation)
+        assert len(calls) == 2
+
+    def test_get_slot_animation(self):
+        assert isinstance(get_slot_animation('dice'), DiceAnimation)
+        assert type(get_slot_animation('frames')) is FramesAnimation
+        assert type(get_slot_animation('none')) is SlotAnimation
+        assert isinstance(get_slot_animation('unknown'), AdaptiveAnimation)
+
+
+class TestApiRateMeter:
+    def test_window(self):
+        meter = ApiRateMeter(window=5)
+        for second in range(10):
+            for _ in range(second):
+                meter.hit(now=second)
+        # Окно — секунды 5..9
+        assert meter.rate(now=9) == (5 + 6 + 7 + 8 + 9) / 5
+        assert meter.rate(now=100) == 0
+        assert meter.total == sum(range(10))
@@ -0,0 +1,68 @@
+"""
+Тесты симулятора таблицы выплат
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.paytable import Paytable
+from app.utils.slot_simulator import (
+    combination_probabilities, daily_risk, exact_expectation, format_cost_preview,
+)
+
+CONFIGS = [
+    (1, '🍒🍒🍒', 'money', 5, 10.0, '🍒', 'Вишни'),
+    (2, '🍋🍋🍋', 'stars', 20, 2.0, '🍋', 'Лимон'),
+    (3, '💎💎💎', 'ton', 0.5, 0.5, '💎', 'Алмаз'),
+]
+
+
+class TestExactExpectation:
+    """Точный расчёт"""
+
+    def test_mean_and_variance(self):
+        exact = exact_expectation(Paytable(CONFIGS))
+        assert exact['win_rate'] == pytest.approx(0.125)
+        assert exact['mean']['money'] == pytest.approx(0.5)
+        assert exact['mean']['stars'] == pytest.approx(0.4)
+        assert exact['mean']['ton'] == pytest.approx(0.0025)
+        assert exact['variance']['money'] == pytest.approx(0.1 * 25 - 0.25)
+
+    def test_chances_over_100_are_capped(self):
+        """Сумма шансов больше 100% обрезается, как при выборе r из [0, 100]"""
+        configs = [(1, 'a', 'money', 1, 80.0, 'a', 'A'), (2, 'b', 'money', 1, 50.0, 'b', 'B')]
+        assert combination_probabilities(Paytable(configs)) == pytest.approx([0.8, 0.2])
+
+    def test_daily_risk_scales_with_spins(self):
+        exact = exact_expectation(Paytable(CONFIGS))
+        day = daily_risk(exact, users=100, spins_per_user=5)
+        assert day['money']['mean'] == pytest.approx(250)
+        assert day['money']['p99'] > day['money']['p95'] > day['money']['mean']
+
+    def test_cost_preview(self):
+        candidate = (None, '🔔🔔🔔', 'money', 100, 1.0, None, 'Новая')
+        text = format_cost_preview(CONFIGS, candidate, users=100, spins_per_user=5)
+        assert '12.5000% → 13.5000%' in text
+        assert '250.00₽ → 750.00₽' in text
+
+
+class TestMonteCarlo:
+    """Векторизованная симуляция согласуется с точным расчётом"""
+
+    def test_simulation_matches_exact(self):
+        pytest.importorskip('numpy')
+        from app.utils.slot_simulator import simulate_spins, simulate_days
+
+        paytable = Paytable(CONFIGS)
+        exact = exact_expectation(paytable)
+        simulated = simulate_spins(paytable, 2_000_000, seed=1, chunk=500_000)
+        assert sum(simulated['counts']) == 2_000_000
+        assert simulated['win_rate'] == pytest.approx(exact['win_rate'], rel=0.01)
+        assert simulated['mean']['money'] == pytest.approx(exact['mean']['money'], rel=0.02)
+
+        days = simulate_days(paytable, users=100, spins_per_user=5, days=2000, seed=1)
+        assert days['money']['mean'] == pytest.approx(250, rel=0.05)
+        assert days['money']['max'] >= days['money']['p99'] >= days['money']['p95']
@@ -0,0 +1,229 @@
+"""
+Тесты спина слот-машины одной транзакцией: списание, запись, начисление, гонки
+"""
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.pool import configure_pool
+
+TG_ID = 777
+MONEY = (1, '🍒🍒🍒', 'money', 50, 20.0, '🍒', 'Вишни')
+STARS = (2, '🍇🍇🍇', 'stars', 13, 5.0, '🍇', 'Виноград')
+LOSS = (('🍒', '🍋', '🍊'), None)
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=2)
+    models.init_db()
+    models.get_or_create_user(TG_ID, "Игрок", "player", "2024-01-01")
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def fixed(triple, config):
+    return lambda: (triple, config)
+
+
+def query(sql, *params):
+    conn = models.get_read_connection()
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+class TestPlaySlotSpin:
+    def test_money_win_is_credited(self, temp_db):
+        result = models.play_slot_spin(TG_ID, 5, fixed(('🍒', '🍒', '🍒'), MONEY))
+
+        assert result['status'] == 'ok'
+        assert result['attempts_used'] == 1 and result['bonus_attempts'] == 0
+        assert models.get_user_profile(TG_ID)['balance'] == 50
+        win = models.get_slot_win_by_id(result['win_id'])
+        assert win is not None
+        assert query('SELECT status, is_win FROM slot_machine WHERE id = ?', result['win_id']) == [('completed', 1)]
+        assert result['order_id'] is None
+
+    def test_stars_win_creates_order(self, temp_db):
+        result = models.play_slot_spin(TG_ID, 5, fixed(('🍇', '🍇', '🍇'), STARS))
+
+        assert query('SELECT status FROM slot_machine WHERE id = ?', result['win_id']) == [('pending',)]
+        order = models.get_order_by_id(result['order_id'])
+        assert order is not None
+        assert query('SELECT order_type, amount, status FROM orders WHERE id = ?', result['order_id']) == \
+            [('slot_win', 13, 'pending')]
+        assert models.get_user_profile(TG_ID)['balance'] == 0
+
+    def test_loss_is_recorded(self, temp_db):
+        result = models.play_slot_spin(TG_ID, 5, fixed(*LOSS))
+
+        assert result['config'] is None
+        assert query('SELECT combination, reward_type, is_win FROM slot_machine WHERE id = ?', result['win_id']) == \
+            [('🍒🍋🍊', 'none', 0)]
+
+    def test_bonus_attempts_are_spent_first(self, temp_db):
+        with models.db_lock:
+            conn = models.get_db_connection()
+            conn.execute('INSERT INTO bonus_attempts (user_id, attempts) VALUES (?, 1)', (TG_ID,))
+            conn.commit()
+            conn.close()
+
+        first = models.play_slot_spin(TG_ID, 1, fixed(*LOSS))
+        second = models.play_slot_spin(TG_ID, 1, fixed(*LOSS))
+        third = models.play_slot_spin(TG_ID, 1, fixed(*LOSS))
+
+        assert (first['attempts_used'], first['bonus_attempts']) == (0, 0)
+        assert (second['attempts_used'], second['bonus_attempts']) == (1, 0)
+        assert third == {'status': 'no_attempts'}
+        assert len(query('SELECT id FROM slot_machine')) == 2
+
+    def test_no_attempts_rolls_back(self, temp_db):
+        rolled = []
+        models.play_slot_spin(TG_ID, 1, fixed(*LOSS))
+        result = models.play_slot_spin(TG_ID, 1, lambda: rolled.append(1) or LOSS)
+
+        assert result == {'status': 'no_attempts'}
+        assert rolled == []
+        assert models.get_slot_attempts(TG_ID) == (1, 0)
+
+    def test_new_day_resets_attempts(self, temp_db):
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        with models.db_lock:
+            conn = models.get_db_connection()
+            conn.execute('INSERT INTO roulette_attempts (user_id, attempts_used, last_reset) VALUES (?, 5, ?)',
+                         (TG_ID, yesterday))
+            conn.commit()
+            conn.close()
+        assert models.get_slot_attempts(TG_ID) == (0, 0)
+
+        result = models.play_slot_spin(TG_ID, 5, fixed(*LOSS))
+        assert result['attempts_used'] == 1
+
+    def test_unknown_user(self, temp_db):
+        assert models.play_slot_spin(42, 5, fixed(*LOSS)) == {'status': 'no_user'}
+
+    def test_roll_error_rolls_back_debit(self, temp_db):
+        def broken():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            models.play_slot_spin(TG_ID, 5, broken)
+        assert models.get_slot_attempts(TG_ID) == (0, 0)
+
+    def test_concurrent_spins_do_not_overspend(self, temp_db):
+        """Параллельные нажатия «Крутить» не тратят больше дневного лимита"""
+        results = []
+
+        def worker():
+            results.append(models.play_slot_spin(TG_ID, 3, fixed(*LOSS))['status'])
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count('ok') == 3
+        assert len(query('SELECT id FROM slot_machine')) == 3
+
+
+def frozen_now(moment):
+    """datetime.datetime, у которого now() — moment"""
+    class FrozenDatetime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return moment
+    return FrozenDatetime
+
+
+class TestDailyReset:
+    def set_last_reset(self, moment):
+        with models.db_lock:
+            conn = models.get_db_connection()
+            conn.execute('UPDATE users SET slot_last_reset = ? WHERE tg_id = ?', (moment, TG_ID))
+            conn.commit()
+            conn.close()
+
+    def test_after_reset_hour(self, temp_db, monkeypatch):
+        models.update_admin_setting('slot_reset_hour', '12')
+        monkeypatch.setattr(datetime, 'datetime', frozen_now(datetime.datetime(2025, 3, 10, 13, 0)))
+
+        self.set_last_reset('2025-03-10 12:30:00')
+        assert not models.should_reset_daily_attempts(TG_ID)
+        self.set_last_reset('2025-03-09 18:00:00')
+        assert models.should_reset_daily_attempts(TG_ID)
+
+    def test_reset_earlier_today_before_reset_hour_is_stale(self, temp_db, monkeypatch):
+        """Сброс сегодня в 9:00 был до границы 12:00 — после неё попытки сбрасываются снова"""
+        models.update_admin_setting('slot_reset_hour', '12')
+        monkeypatch.setattr(datetime, 'datetime', frozen_now(datetime.datetime(2025, 3, 10, 13, 0)))
+
+        self.set_last_reset('2025-03-10 09:00:00')
+        assert models.should_reset_daily_attempts(TG_ID)
+        # Старая запись только с датой читается как полночь — тоже до границы
+        self.set_last_reset('2025-03-10')
+        assert models.should_reset_daily_attempts(TG_ID)
+
+    def test_before_reset_hour(self, temp_db, monkeypatch):
+        models.update_admin_setting('slot_reset_hour', '12')
+        monkeypatch.setattr(datetime, 'datetime', frozen_now(datetime.datetime(2025, 3, 10, 9, 0)))
+
+        # Сегодняшний сброс ещё не наступил — вчерашний в 12:00 действует
+        self.set_last_reset('2025-03-09 12:00:00')
+        assert not models.should_reset_daily_attempts(TG_ID)
+        self.set_last_reset('2025-03-09 11:59:59')
+        assert models.should_reset_daily_attempts(TG_ID)
+
+    def test_reset_once_per_day(self, temp_db, monkeypatch):
+        models.update_admin_setting('slot_reset_hour', '12')
+        monkeypatch.setattr(datetime, 'datetime', frozen_now(datetime.datetime(2025, 3, 10, 9, 0)))
+        assert models.should_reset_daily_attempts(TG_ID)
+        models.reset_slot_spins(TG_ID)
+        assert not models.should_reset_daily_attempts(TG_ID)
+
+        # После часа сброса — ещё один сброс, и снова только один
+        monkeypatch.setattr(datetime, 'datetime', frozen_now(datetime.datetime(2025, 3, 10, 12, 0)))
+        assert models.should_reset_daily_attempts(TG_ID)
+        models.reset_slot_spins(TG_ID)
+        assert not models.should_reset_daily_attempts(TG_ID)
+
+
+class TestSpinService:
+    def test_spin_returns_result(self, temp_db):
+        from app.utils.slot_machine import spin
+
+        for config in models.get_slot_configs():
+            models.delete_slot_config(config[0])
+        models.add_slot_config('🍒🍒🍒', 'money', 10, 100.0, '🍒', 'Всегда')
+        result = asyncio.run(spin(TG_ID))
+
+        assert result.ok and result.is_win
+        assert result.triple == ('🍒', '🍒', '🍒')
+        assert result.reward_text == "10₽"
+        assert result.remaining == result.daily_attempts - 1
+        assert models.get_slot_win_by_id(result.win_id) is not None
+        assert models.get_user_profile(TG_ID)['balance'] == 10
+
+    def test_spin_without_attempts(self, temp_db):
+        from app.utils.slot_machine import spin
+
+        models.update_admin_setting('slot_daily_attempts', '0')
+        result = asyncio.run(spin(TG_ID))
+
+        assert not result.ok
+        assert result.status == 'no_attempts'
@@ -0,0 +1,112 @@
+"""
+Тесты сводной статистики слотов: обновление в транзакции спина, последние спины, заполнение
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.database import models
+from app.database.migrations import apply_migrations
+from app.database.pool import configure_pool
+
+TG_ID = 777
+MONEY = (1, '🍒🍒🍒', 'money', 50, 20.0, '🍒', 'Вишни')
+STARS = (2, '🍇🍇🍇', 'stars', 30, 5.0, '🍇', 'Виноград')
+LOSS = (('🍒', '🍋', '🍊'), None)
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(path, readers=1)
+    models.init_db()
+    models.get_or_create_user(TG_ID, "Игрок", "player", "2024-01-01")
+    yield path
+    configure_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+
+
+def fixed(triple, config):
+    return lambda: (triple, config)
+
+
+class TestSlotUserStats:
+    def test_empty_for_new_user(self, temp_db):
+        stats = models.get_slot_user_stats(TG_ID)
+
+        assert (stats['spins'], stats['wins'], stats['win_rate']) == (0, 0, 0.0)
+        assert stats['biggest_type'] is None and stats['last_results'] == []
+
+    def test_spins_update_stats(self, temp_db):
+        models.play_slot_spin(TG_ID, 10, fixed(*LOSS))
+        models.play_slot_spin(TG_ID, 10, fixed(('🍒', '🍒', '🍒'), MONEY))
+        # 30 звёзд «дороже» 50₽ (ценность звезды — 2)
+        models.play_slot_spin(TG_ID, 10, fixed(('🍇', '🍇', '🍇'), STARS))
+        models.play_slot_spin(TG_ID, 10, fixed(('🍒', '🍒', '🍒'), MONEY))
+
+        stats = models.get_slot_user_stats(TG_ID)
+        assert (stats['spins'], stats['wins'], stats['win_rate']) == (4, 3, 75.0)
+        assert (stats['biggest_type'], stats['biggest_amount']) == ('stars', 30)
+        assert [res['combination'] for res in stats['last_results']] == ['🍒🍒🍒', '🍇🍇🍇', '🍒🍒🍒', '🍒🍋🍊']
+        assert stats['last_results'][-1]['is_win'] == 0
+
+    def test_last_results_are_capped(self, temp_db):
+        win_ids = [models.play_slot_spin(TG_ID, 100, fixed(*LOSS))['win_id'] for _ in range(15)]
+
+        stats = models.get_slot_user_stats(TG_ID)
+        assert stats['spins'] == 15
+        assert [res['id'] for res in stats['last_results']] == win_ids[::-1][:models.SLOT_STATS_LAST_RESULTS]
+
+    def test_create_slot_win_updates_stats(self, temp_db):
+        models.create_slot_win(TG_ID, '💎💎💎', 'ton', 0.5, True)
+
+        stats = models.get_slot_user_stats(TG_ID)
+        assert (stats['spins'], stats['wins'], stats['biggest_type']) == (1, 1, 'ton')
+
+    def test_failed_spin_does_not_count(self, temp_db):
+        def broken():
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            models.play_slot_spin(TG_ID, 5, broken)
+        models.play_slot_spin(TG_ID, 0, fixed(*LOSS))
+
+        assert models.get_slot_user_stats(TG_ID)['spins'] == 0
+
+    def test_clear_all_slot_data_resets_stats(self, temp_db):
+        models.play_slot_spin(TG_ID, 5, fixed(*LOSS))
+        models.clear_all_slot_data()
+
+        assert models.get_slot_user_stats(TG_ID)['spins'] == 0
+
+    def test_backfill_from_existing_spins(self, temp_db):
+        models.play_slot_spin(TG_ID, 10, fixed(*LOSS))
+        models.play_slot_spin(TG_ID, 10, fixed(('🍒', '🍒', '🍒'), MONEY))
+        models.play_slot_spin(TG_ID, 10, fixed(('🍇', '🍇', '🍇'), STARS))
+        expected = models.get_slot_user_stats(TG_ID)
+
+        conn = sqlite3.connect(temp_db)
+        conn.execute('DROP TABLE slot_user_stats')
+        conn.execute('PRAGMA user_version = 5')
+        conn.commit()
+        apply_migrations(conn)
+        conn.close()
+
+        assert models.get_slot_user_stats(TG_ID) == expected
+
+    def test_utils_read_stats_row(self, temp_db):
+        from app.utils.slot_machine import get_last_slot_results, get_user_slot_stats
+
+        models.play_slot_spin(TG_ID, 10, fixed(('🍒', '🍒', '🍒'), MONEY))
+        models.play_slot_spin(TG_ID, 10, fixed(*LOSS))
+
+        assert get_user_slot_stats(TG_ID)['total_wins'] == 1
+        assert [res['is_win'] for res in get_last_slot_results(TG_ID, limit=1)] == [0]
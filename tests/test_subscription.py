@@ -0,0 +1,156 @@
+"""
+Тесты сервиса проверки подписки: TTL, объединение запросов, chat_member
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils.subscription import SubscriptionService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBot:
+    """get_chat_member без сети; statuses: user_id -> статус, errors — чаты с ошибкой"""
+
+    def __init__(self, statuses=None, errors=(), delay=0.0):
+        self.statuses = statuses or {}
+        self.errors = set(errors)
+        self.delay = delay
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append((chat_id, user_id))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if chat_id in self.errors:
+            raise RuntimeError("chat not found")
+        return SimpleNamespace(status=self.statuses.get(user_id, 'left'))
+
+
+def make_service(**kwargs):
+    clock = FakeClock()
+    service = SubscriptionService(ttl=600, negative_ttl=30, chats=(-100, '@channel'), clock=clock, **kwargs)
+    return service, clock
+
+
+class TestSubscriptionService:
+    def test_positive_result_is_cached(self):
+        """Подписчик проверяется в Telegram один раз за TTL"""
+        service, clock = make_service()
+        bot = FakeBot({1: 'member'})
+
+        async def scenario():
+            assert await service.is_subscribed(bot, 1)
+            assert await service.is_subscribed(bot, 1)
+            clock.now = 599
+            assert await service.is_subscribed(bot, 1)
+        asyncio.run(scenario())
+
+        assert bot.calls == [(-100, 1)]
+        stats = service.stats()
+        assert stats['hits'] == 2 and stats['misses'] == 1 and stats['api_calls'] == 1
+
+    def test_negative_result_has_short_ttl(self):
+        """Отрицательный ответ живёт negative_ttl, затем проверяется заново (ID, затем username)"""
+        service, clock = make_service()
+        bot = FakeBot({1: 'left'})
+
+        async def scenario():
+            assert not await service.is_subscribed(bot, 1)
+            clock.now = 29
+            assert not await service.is_subscribed(bot, 1)
+            assert len(bot.calls) == 2
+            bot.statuses[1] = 'member'
+            clock.now = 31
+            assert await service.is_subscribed(bot, 1)
+        asyncio.run(scenario())
+
+        assert bot.calls == [(-100, 1), ('@channel', 1), (-100, 1)]
+
+    def test_errors_are_not_cached(self):
+        """Если оба запроса упали — False, но следующий вызов снова идёт в Telegram"""
+        service, _ = make_service()
+        bot = FakeBot({1: 'member'}, errors=(-100, '@channel'))
+
+        async def scenario():
+            assert not await service.is_subscribed(bot, 1)
+            bot.errors.clear()
+            assert await service.is_subscribed(bot, 1)
+        asyncio.run(scenario())
+
+        assert service.stats()['api_errors'] == 2
+
+    def test_fallback_to_username(self):
+        """Ошибка по CHANNEL_ID — проверка по CHANNEL_USERNAME"""
+        service, _ = make_service()
+        bot = FakeBot({1: 'administrator'}, errors=(-100,))
+        assert asyncio.run(service.is_subscribed(bot, 1))
+        assert bot.calls == [(-100, 1), ('@channel', 1)]
+
+    def test_concurrent_lookups_coalesced(self):
+        """Одновременные проверки одного пользователя — один запрос"""
+        service, _ = make_service()
+        bot = FakeBot({1: 'member', 2: 'member'}, delay=0.01)
+
+        async def scenario():
+            return await asyncio.gather(*(service.is_subscribed(bot, 1) for _ in range(10)),
+                                        service.is_subscribed(bot, 2))
+        results = asyncio.run(scenario())
+
+        assert all(results)
+        assert sorted(bot.calls) == [(-100, 1), (-100, 2)]
+        assert service.stats()['coalesced'] == 9
+        assert service.stats()['inflight'] == 0
+
+    def test_force_bypasses_cache(self):
+        """Кнопка «Проверить подписку» не ждёт истечения отрицательного TTL"""
+        service, _ = make_service()
+        bot = FakeBot({1: 'left'})
+
+        async def scenario():
+            assert not await service.is_subscribed(bot, 1)
+            bot.statuses[1] = 'member'
+            assert not await service.is_subscribed(bot, 1)
+            assert await service.is_subscribed(bot, 1, force=True)
+            assert await service.is_subscribed(bot, 1)
+        asyncio.run(scenario())
+
+    def test_chat_member_update_sets_status(self):
+        """Обновление chat_member меняет кэш без запроса"""
+        service, _ = make_service()
+        bot = FakeBot({1: 'member'})
+
+        async def scenario():
+            assert await service.is_subscribed(bot, 1)
+            service.set_status(1, False)
+            assert not await service.is_subscribed(bot, 1)
+            service.invalidate(1)
+            assert await service.is_subscribed(bot, 1)
+        asyncio.run(scenario())
+
+        assert len(bot.calls) == 2
+        assert service.stats()['updates'] == 1
+
+    def test_cache_size_bounded(self):
+        """Старые записи вытесняются при превышении max_size"""
+        service, _ = make_service(max_size=3)
+        bot = FakeBot({i: 'member' for i in range(5)})
+
+        async def scenario():
+            for i in range(5):
+                await service.is_subscribed(bot, i)
+            await service.is_subscribed(bot, 0)
+        asyncio.run(scenario())
+
+        assert service.stats()['cached'] == 3
+        assert bot.calls.count((-100, 0)) == 2
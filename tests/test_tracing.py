@@ -0,0 +1,229 @@
+"""
+Тесты трассировки обновлений: SQL и Bot API в трассе, метки обработчиков, метрики
+"""
+import asyncio
+import logging
+import os
+import socket
+import sys
+import tempfile
+
+import aiohttp
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiogram import Dispatcher, F, Router, types
+
+from app.database import aio, models
+from app.database.pool import configure_pool, connect_async
+from app.middlewares.tracing import ApiTracingMiddleware, setup_tracing
+from app.tracing import (
+    TraceMetrics, UpdateTrace, callback_prefix, current_trace, finish_trace, start_metrics_server,
+)
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+def count_users():
+    conn = models.get_read_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def referrals_of(tg_id):
+    conn = models.get_read_connection()
+    try:
+        return conn.cursor().execute('SELECT COUNT(*) FROM users WHERE referrer_id = ?', (tg_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def temp_db():
+    db_fd, db_path = tempfile.mkstemp()
+    os.close(db_fd)
+    configure_pool(db_path, readers=2)
+    models.init_db()
+    yield db_path
+    configure_pool()
+    os.unlink(db_path)
+
+
+class TestTrace:
+    def test_callback_prefix(self):
+        assert callback_prefix("stars_pay_sbp_50_85") == "stars_pay_sbp"
+        assert callback_prefix("admin_orders_page:1:<5") == "admin_orders_page"
+        assert callback_prefix("spin_slot") == "spin_slot"
+        assert callback_prefix("123") == "other"
+
+    def test_pool_queries_are_traced_through_executor(self, temp_db):
+        """Запросы из потоков aio.run_read попадают в трассу вызывающего обновления"""
+        async def scenario():
+            trace = UpdateTrace(1)
+            token = current_trace.set(trace)
+            try:
+                await aio.run_read(count_users)
+                await asyncio.gather(*(aio.run_read(referrals_of, i) for i in range(3)))
+            finally:
+                current_trace.reset(token)
+            # Вне обновления — не в трассе
+            await aio.run_read(count_users)
+            return trace
+
+        trace = asyncio.run(scenario())
+
+        assert trace.sql_count == 4
+        assert trace.sql_seconds > 0
+        assert [count for count, _ in trace.statements.values()] == [1, 3]
+
+    def test_aiosqlite_queries_are_traced(self, temp_db):
+        async def scenario():
+            trace = UpdateTrace(1)
+            token = current_trace.set(trace)
+            try:
+                async with connect_async(temp_db) as db:
+                    cursor = await db.execute('SELECT COUNT(*) FROM users')
+                    await cursor.fetchone()
+                    await db.execute('UPDATE users SET balance = 0 WHERE tg_id = -1')
+                    await db.commit()
+            finally:
+                current_trace.reset(token)
+            return trace
+
+        trace = asyncio.run(scenario())
+
+        assert trace.sql_count == 3
+        assert set(trace.statements) == {'SELECT COUNT(*) FROM users',
+                                          'UPDATE users SET balance = 0 WHERE tg_id = -1', 'COMMIT'}
+
+    def test_finished_trace_ignores_late_writes(self):
+        """Фоновая задача, пережившая обновление, не меняет его трассу"""
+        trace = UpdateTrace(1)
+        trace.add_sql('SELECT 1', 0.001)
+        finish_trace(trace, registry=TraceMetrics())
+        trace.add_sql('SELECT 1', 0.001)
+        trace.add_api('sendMessage', 0.01)
+        assert trace.sql_count == 1 and trace.api_count == 0
+
+    def test_slow_update_and_repeated_query_are_logged(self, caplog):
+        trace = UpdateTrace(7, callback='admin_db_page')
+        trace.router, trace.handler = 'user', 'handle_db_page'
+        for _ in range(5):
+            trace.add_sql('SELECT COUNT(*) FROM users WHERE referrer_id = ?', 0.002)
+        trace.add_api('editMessageText', 0.05)
+        registry = TraceMetrics()
+        with caplog.at_level(logging.WARNING, logger='app.tracing'):
+            finish_trace(trace, registry=registry, slow_ms=0.001, repeated_sql=5)
+
+        messages = [record.getMessage() for record in caplog.records]
+        assert any('N+1' in text and '5× ' in text and 'referrer_id' in text for text in messages)
+        slow = next(text for text in messages if 'Медленное обновление 7' in text)
+        assert 'user:handle_db_page [admin_db_page]' in slow and 'editMessageText 1×' in slow
+        stats = registry.handlers()[('user', 'handle_db_page', 'admin_db_page')]
+        assert stats['slow'] == 1 and stats['repeated_sql'] == 1 and stats['sql_per_update'] == 5
+
+
+class TestMetrics:
+    def test_prometheus_text(self):
+        registry = TraceMetrics(buckets=(0.1, 1.0))
+        for duration in (0.05, 0.5, 2.0):
+            trace = UpdateTrace(1, callback='x"y')
+            trace.router, trace.handler = 'user', 'start'
+            trace.add_sql('SELECT 1', 0.01)
+            trace.finish()
+            trace.duration = duration
+            registry.observe(trace)
+        registry.observe_api('sendMessage', 0.2)
+        registry.register_collector(lambda: [('bot_custom', 'gauge', "Тест", [({}, 3)])])
+
+        text = registry.render()
+
+        labels = 'router="user",handler="start",callback="x\\"y"'
+        assert f'bot_update_duration_seconds_bucket{{{labels},le="0.1"}} 1' in text
+        assert f'bot_update_duration_seconds_bucket{{{labels},le="1.0"}} 2' in text
+        assert f'bot_update_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in text
+        assert f'bot_update_duration_seconds_count{{{labels}}} 3' in text
+        assert f'bot_update_sql_statements_total{{{labels}}} 3' in text
+        assert 'bot_api_requests_total{method="sendMessage"} 1' in text
+        assert 'bot_custom 3' in text
+        assert '# TYPE bot_update_duration_seconds histogram' in text
+
+    def test_label_cardinality_is_bounded(self):
+        registry = TraceMetrics(max_labels=2)
+        for i in range(5):
+            trace = UpdateTrace(i, callback=f"cb{i}")
+            trace.finish()
+            registry.observe(trace)
+        assert set(registry.handlers()) == {('-', 'unhandled', 'cb0'), ('-', 'unhandled', 'cb1'),
+                                            ('other', 'other', 'other')}
+
+    def test_metrics_server(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        async def scenario():
+            runner = await start_metrics_server('127.0.0.1', port)
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(f"http://127.0.0.1:{port}/metrics") as resp:
+                        return resp.status, resp.headers['Content-Type'], await resp.text()
+            finally:
+                await runner.cleanup()
+
+        status, content_type, text = asyncio.run(scenario())
+        assert status == 200 and content_type.startswith('text/plain')
+        # Общий реестр: показатели пула БД, уведомлений админам и курсов
+        assert '# TYPE bot_update_duration_seconds histogram' in text
+        assert 'bot_db_statements_total ' in text
+        assert 'bot_price_requests_total{result="hit"}' in text
+
+
+router = Router()
+
+
+@router.callback_query(F.data.startswith("page:"))
+async def list_page(callback: types.CallbackQuery):
+    # N+1: запрос на каждую строку страницы
+    for tg_id in range(6):
+        await aio.run_read(referrals_of, tg_id)
+    await callback.answer()
+    await callback.message.edit_text("page")
+
+
+class TestDispatcherTracing:
+    def test_update_is_traced_end_to_end(self, temp_db, caplog):
+        async def scenario():
+            api = FakeBotAPI()
+            await api.start()
+            bot = api.make_bot()
+            bot.session.middleware(ApiTracingMiddleware())
+            dp = Dispatcher()
+            setup_tracing(dp)
+            dp.include_router(router)
+            captured = []
+
+            async def capture(handler, event, data):
+                result = await handler(event, data)
+                captured.append(current_trace.get())
+                return result
+
+            dp.update.middleware(capture)
+            try:
+                update = {'update_id': 1, **api.callback_update(100, "page:2:>40")}
+                with caplog.at_level(logging.WARNING, logger='app.tracing'):
+                    await dp.feed_raw_update(bot, update)
+            finally:
+                await bot.session.close()
+                await api.stop()
+            return captured[0], caplog.records
+
+        trace, records = asyncio.run(scenario())
+
+        assert trace.labels == ('test_tracing', 'list_page', 'page')
+        assert trace.sql_count == 6
+        assert set(trace.api_methods) == {'answerCallbackQuery', 'editMessageText'}
+        assert trace.finished
+        assert any('N+1 в обновлении 1 (test_tracing:list_page [page])' in r.getMessage() for r in records)
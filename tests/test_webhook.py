@@ -0,0 +1,109 @@
+"""
+Тесты webhook-режима: секрет, health, ограничение параллельности, остановка с ожиданием
+"""
+import asyncio
+import os
+import sys
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp.test_utils import TestClient, TestServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.webhook import build_webhook_app
+
+TOKEN = "123456789:AAFakeTokenForTests_0000000000000000"
+SECRET = "test-secret"
+
+
+def message_update(update_id: int, text: str = "hi") -> dict:
+    user = {'id': 1, 'is_bot': False, 'first_name': 'A'}
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                'chat': {'id': 1, 'type': 'private'}, 'from': user}}
+
+
+def make_app(handler_delay: float = 0.0, concurrency: int = 10):
+    dp = Dispatcher()
+    state = {'active': 0, 'max_active': 0, 'done': []}
+
+    @dp.message()
+    async def slow(message: types.Message):
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+        try:
+            await asyncio.sleep(handler_delay)
+            state['done'].append(message.text)
+        finally:
+            state['active'] -= 1
+
+    bot = Bot(token=TOKEN)
+    app = build_webhook_app(dp, bot, SECRET, concurrency=concurrency, drain_timeout=5)
+    return app, state
+
+
+async def post(client, update, secret=SECRET):
+    return await client.post('/webhook', json=update, headers={'X-Telegram-Bot-Api-Secret-Token': secret})
+
+
+class TestWebhook:
+    def test_secret_token_checked(self):
+        async def scenario():
+            app, state = make_app()
+            async with TestClient(TestServer(app)) as client:
+                bad = await post(client, message_update(1), secret="wrong")
+                good = await post(client, message_update(2, "ok"))
+                await asyncio.sleep(0.05)
+                health = await (await client.get('/health')).json()
+            return bad.status, good.status, state, health
+        bad, good, state, health = asyncio.run(scenario())
+
+        assert bad == 401 and good == 200
+        assert state['done'] == ["ok"]
+        assert health['status'] == 'ok'
+        assert health['processed'] == 1 and health['unauthorized'] == 1
+
+    def test_concurrency_limit(self):
+        """Одновременно работает не больше concurrency обработчиков, остальные ждут"""
+        async def scenario():
+            app, state = make_app(handler_delay=0.05, concurrency=3)
+            async with TestClient(TestServer(app)) as client:
+                responses = await asyncio.gather(*(post(client, message_update(i, str(i))) for i in range(10)))
+                await asyncio.sleep(0.3)
+            return [r.status for r in responses], state
+        statuses, state = asyncio.run(scenario())
+
+        assert statuses == [200] * 10
+        assert len(state['done']) == 10
+        assert state['max_active'] == 3
+
+    def test_shutdown_drains_in_flight_handlers(self):
+        """Остановка дожидается начатых обработчиков, новые обновления получают 503"""
+        async def scenario():
+            app, state = make_app(handler_delay=0.2)
+            handler = app['webhook_handler']
+            async with TestClient(TestServer(app)) as client:
+                accepted = await post(client, message_update(1, "in-flight"))
+                assert handler.in_flight == 1
+                drain = asyncio.create_task(handler.drain())
+                await asyncio.sleep(0)
+                rejected = await post(client, message_update(2, "late"))
+                health = await client.get('/health')
+                interrupted = await drain
+            return accepted.status, rejected.status, health.status, interrupted, state
+        accepted, rejected, health, interrupted, state = asyncio.run(scenario())
+
+        assert accepted == 200 and rejected == 503 and health == 503
+        assert interrupted == 0
+        assert state['done'] == ["in-flight"]
+
+    def test_drain_timeout_cancels_stuck_handlers(self):
+        async def scenario():
+            app, state = make_app(handler_delay=10)
+            handler = app['webhook_handler']
+            async with TestClient(TestServer(app)) as client:
+                await post(client, message_update(1))
+                return await handler.drain(timeout=0.05), handler.in_flight
+        interrupted, in_flight = asyncio.run(scenario())
+
+        assert interrupted == 1
+        assert in_flight == 0